@@ -2,15 +2,43 @@ import os
 import subprocess
 from time import sleep
 import re
+import sys
+import json
+import socket
 
 EXPERIMENTS_FILE = 'tools/experiments/experiments.txt'
 EXPERIMENTS_ITERATIONS = 10
 EXPERIMENTS_SLEEP_AFTER = 2
 
+# keep mininet and the switches running for all iterations of an experiment (see P4NetworkRunModes.WARM_EXPERIMENT)
+EXPERIMENTS_WARM_TOPOLOGY = '--warm' in sys.argv
+EXPERIMENTS_CONTROL_SOCKET = '/tmp/p4runner.sock'
+EXPERIMENTS_CONTROL_SOCKET_TIMEOUT = 600
+
 TRAFFIC_PROFILES_DIR = 'tools/traffic_profiles/profiles/'
 
 DEV_NULL = open(os.devnull, 'w')
 
+
+def connect_control_socket():
+    for _ in range(EXPERIMENTS_CONTROL_SOCKET_TIMEOUT):
+        if os.path.exists(EXPERIMENTS_CONTROL_SOCKET):
+            control_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                control_socket.connect(EXPERIMENTS_CONTROL_SOCKET)
+                return control_socket
+            except socket.error:
+                control_socket.close()
+        sleep(1)
+    raise RuntimeError('control socket {} not available'.format(EXPERIMENTS_CONTROL_SOCKET))
+
+
+def send_command(control_file, command):
+    control_file.write(json.dumps(command) + '\n')
+    control_file.flush()
+    return json.loads(control_file.readline())
+
+
 with open(EXPERIMENTS_FILE, 'r') as cmd_file:
     for cmd in cmd_file:
         traffic_profile_pattern = re.search(r'--traffic_profile\s(\w*)\s', cmd).group(1)
@@ -23,6 +51,15 @@ with open(EXPERIMENTS_FILE, 'r') as cmd_file:
             pass
 
         print('#begin experiment')
+        runner, control_file = None, None
+        if EXPERIMENTS_WARM_TOPOLOGY:
+            warm_cmd = cmd.strip().replace('--run_mode experiment', '--run_mode warm_experiment')
+            warm_cmd = warm_cmd.replace(traffic_profile_pattern, traffic_profile_files[0])
+            warm_cmd += ' --control_socket {}'.format(EXPERIMENTS_CONTROL_SOCKET)
+            print('#experiment runner: {}'.format(warm_cmd))
+            runner = subprocess.Popen(warm_cmd, shell=True, stdout=DEV_NULL, stderr=DEV_NULL)
+            control_file = connect_control_socket().makefile('rw')
+
         for experiment_iteration in range(EXPERIMENTS_ITERATIONS):
             if experiment_iteration > len(traffic_profile_files) - 1:
                 # multiple seeds but less than number of experiment iterations
@@ -31,6 +68,17 @@ with open(EXPERIMENTS_FILE, 'r') as cmd_file:
             exp_cmd = cmd.strip() + ' --exp_iter {}'.format(experiment_iteration)
             exp_cmd = exp_cmd.replace(traffic_profile_pattern, traffic_profile_files[experiment_iteration])
             print('#experiment command: {}'.format(exp_cmd))
-            subprocess.call(exp_cmd, shell=True, stdout=DEV_NULL, stderr=DEV_NULL)
+            if EXPERIMENTS_WARM_TOPOLOGY:
+                response = send_command(control_file, {'command': 'iteration',
+                                                       'args': exp_cmd.split('p4runner.py', 1)[1]})
+                print('#experiment iteration result: {}'.format(response))
+            else:
+                subprocess.call(exp_cmd, shell=True, stdout=DEV_NULL, stderr=DEV_NULL)
+                sleep(EXPERIMENTS_SLEEP_AFTER)
+
+        if EXPERIMENTS_WARM_TOPOLOGY:
+            send_command(control_file, {'command': 'shutdown'})
+            control_file.close()
+            runner.wait()
             sleep(EXPERIMENTS_SLEEP_AFTER)
         print('#end experiment\n')
@@ -25,20 +25,27 @@ from scapy.layers.inet import IP, TCP, UDP
 
 from itertools import product
 
-from tools.log.log import log
+from tools.log.log import get_logger, LogSubsystem
 
 from enum import Enum
 
 import time
+import json
+import threading
 from functools import wraps
 import numpy as np
 
 import hashlib
 
-from p4monitors.p4monitor import PathLinkData, TimeScales
+from p4monitors.p4monitor import PathLinkData, DataRates
+from tools.flow_hash import PROBE_UDP_PORT
+from tools.histogram import LatencyHistograms, measure_ns
 
 import os
 import csv
+import logging
+
+log = get_logger(LogSubsystem.CONTROLLER)
 
 
 # https://stackoverflow.com/questions/5929107/decorators-with-parameters
@@ -49,11 +56,8 @@ def time_measure_factory(measurement):
             if not self.time_measurement:
                 return function(*args, **kwargs)
 
-            start_timestamp = time.time()
-            function_result = function(*args, **kwargs)
-            stop_timestamp = time.time()
-            elapsed_time = int(round((stop_timestamp - start_timestamp) * TimeScales.MILLISECOND.value))
-            self.times[measurement.value].append(elapsed_time)
+            function_result, elapsed_time = measure_ns(function, *args, **kwargs)
+            self.time_measures.record(measurement.value, elapsed_time)
             return function_result
 
         return wrapper
@@ -74,6 +78,7 @@ class ShortestPathMetrics(Enum):
     LOAD_PORT_COUNTER = 'load_port_counter'
     LOAD_PROBING = 'load_probing'
     LATENCY_PROBING = 'latency_probing'
+    LATENCY_INT = 'latency_int'
 
 
 class ECMPMetrics(Enum):
@@ -135,7 +140,20 @@ bind_layers(UDP, CPUHeader)
 
 class FlowForwardingController(P4ControllerCPU):
     ETHERTYPE_IPV4 = 0x800
-    SNIFF_FILTER = 'ether proto {}'.format(ETHERTYPE_IPV4)
+    # probes of the ProbingMonitor are forwarded by their own entries and never handled as flows
+    SNIFF_FILTER = 'ether proto {} and not udp dst port {}'.format(ETHERTYPE_IPV4, PROBE_UDP_PORT)
+
+    TIME_MEASURE_FILE = 'time_measure.csv'
+    TIME_MEASURE_HISTOGRAMS_FILE = 'time_measure_histograms.json'
+    TIME_MEASURE_HEADER = ['timestamp', 'scope', 'strategy', 'metric', 'stage',
+                           'count', 'mean_us', 'p50_us', 'p90_us', 'p99_us', 'max_us']
+    TIME_MEASURE_INTERVAL = 'interval'
+    TIME_MEASURE_TOTAL = 'total'
+    TIME_MEASURE_SCALE = 1000.0  # ns -> us
+
+    # flow prediction (duration, bytes): shorter or smaller flows are routed on the shortest path
+    FLOW_PREDICTION_DURATION_MIN = 10.0  # s
+    FLOW_PREDICTION_BYTES_MIN = 10 ** 6
 
     P4_CONTROLLER_PACKET_SRC_MAC = '99:99:99:99:99:99'
 
@@ -237,9 +255,13 @@ class FlowForwardingController(P4ControllerCPU):
         self.flow_forwarding_metric = mapping_flow_routing_strategy_and_metric[strategy](metric)
 
         self.time_measurement = kwargs['time_measurement']
+        self.time_measurement_interval = kwargs['time_measurement_interval']
 
         if self.time_measurement:
-            self.times = {measurement.value: [] for measurement in TimeMeasurements}
+            # per stage latency histograms (ns), exported per interval and in total at shutdown
+            self.time_measures = LatencyHistograms([measurement.value for measurement in TimeMeasurements])
+            self.time_measure_export_event = threading.Event()
+            self.time_measure_export_thread = None
 
         # ECMP flow hash
         # ecmp_base is 2 because port id 0 is not used and port id 1 belongs to the associated host network
@@ -257,6 +279,7 @@ class FlowForwardingController(P4ControllerCPU):
 
             self.output_file = None
             self.csv_writer = None
+            self.exp_dir = None
         else:
             self.csv_output = False
 
@@ -294,26 +317,25 @@ class FlowForwardingController(P4ControllerCPU):
 
         self._program_icmp_paths()
 
-        if self.csv_output:
-            self.init_csv_output(self.exp_id, self.exp_iter)
+        if self.time_measurement:
+            if self.csv_output:
+                self.init_csv_output(self.exp_id, self.exp_iter)
+            if self.time_measurement_interval > 0:
+                self.time_measure_export_thread = threading.Thread(target=self._run_time_measure_export)
+                self.time_measure_export_thread.daemon = True
+                self.time_measure_export_thread.start()
 
     def stop_controller(self, *args, **kwargs):
         super(FlowForwardingController, self)._stop_cpu_port_handler()
 
-        if self.csv_output:
-            self.write_csv_output([np.mean(self.times[TimeMeasurements.FLOW_FORWARDING.value]),
-                                   np.median(self.times[TimeMeasurements.FLOW_FORWARDING.value]),
-                                   np.mean(self.times[TimeMeasurements.PACKET_DISASSEMBLY.value]),
-                                   np.median(self.times[TimeMeasurements.PACKET_DISASSEMBLY.value]),
-                                   np.mean(self.times[TimeMeasurements.PATH_DETERMINATION.value]),
-                                   np.median(self.times[TimeMeasurements.PATH_DETERMINATION.value]),
-                                   np.mean(self.times[TimeMeasurements.PATH_PROGRAMMING.value]),
-                                   np.median(self.times[TimeMeasurements.PATH_PROGRAMMING.value]),
-                                   np.mean(self.times[TimeMeasurements.PACKET_REASSEMBLY.value]),
-                                   np.median(self.times[TimeMeasurements.PACKET_REASSEMBLY.value]),
-                                   np.mean(self.times[TimeMeasurements.PACKET_SENDING.value]),
-                                   np.median(self.times[TimeMeasurements.PACKET_SENDING.value])])
-            self.output_file.close()
+        if self.time_measurement:
+            if self.time_measure_export_thread is not None:
+                self.time_measure_export_event.set()
+                self.time_measure_export_thread.join()
+            self._export_time_measures(self.TIME_MEASURE_INTERVAL, self.time_measures.get_interval_snapshot())
+            self._export_time_measures(self.TIME_MEASURE_TOTAL, self.time_measures.get_total_snapshot())
+            if self.csv_output:
+                self.output_file.close()
 
     def _configure_ecmp_result_table(self, sw, ecmp_base, ecmp_count):
         ecmp_result_rule = self.P4_ECMP_RESULT_RULE_PATTERN.copy()
@@ -350,7 +372,10 @@ class FlowForwardingController(P4ControllerCPU):
                                                                  flow_5_tuple['src_port'],
                                                                  flow_5_tuple['dst_port'])).hexdigest()
 
-                self.forwarding_rules[sw][flow_hash] = flow
+                # the rule pattern dicts are shared and the port is rewritten per switch, store a copy
+                self.forwarding_rules[sw][flow_hash] = dict(flow, match=dict(flow['match']),
+                                                            action_params=dict(flow['action_params']),
+                                                            flow_5_tuple=flow_5_tuple)
 
     def _program_icmp_paths(self):
         icmp_rule = self.P4_ICMP_RULE_PATTERN.copy()
@@ -448,7 +473,7 @@ class FlowForwardingController(P4ControllerCPU):
         if self.flow_forwarding_strategy == FlowForwardingStrategy.SHORTEST_PATH:  # shortest path routing
             if self.flow_forwarding_metric == ShortestPathMetrics.HOPS:  # switch hop number
                 path = self.p4monitor.get_shortest_path_hops(src_host, dst_host)
-            else:  # BANDWIDTH, LOAD_PORT_COUNTER, LOAD_PROBING, LATENCY_PROBING (link level properties)
+            else:  # BANDWIDTH, LOAD_PORT_COUNTER, LOAD_PROBING, LATENCY_PROBING, LATENCY_INT (link level properties)
                 path = self.p4monitor.get_shortest_path_property(src_host, dst_host, self.flow_forwarding_metric.value)
         elif self.flow_forwarding_strategy == FlowForwardingStrategy.ECMP:  # ECMP routing
             switch_pathes = self.p4monitor.get_all_simple_paths(src_host, dst_host)
@@ -485,39 +510,64 @@ class FlowForwardingController(P4ControllerCPU):
                                                  "as well as path latencies collected by probing for routing based on "
                                                  "path criteria (snapshots) is not implemented yet")
         elif self.flow_forwarding_strategy == FlowForwardingStrategy.FLOW_PREDICTION:  # flow prediction
+            # bytes and durations of finished flows are recorded by the FlowMonitor
+            flow_size_estimate = None
+            if hasattr(self.p4monitor, 'get_flow_size_estimate'):
+                flow_size_estimate = self.p4monitor.get_flow_size_estimate(flow_5_tuple)
+
             if self.flow_forwarding_metric == FlowPredictionMetrics.THROUGHPUT:  # flow throughput
-                flow_hash = hashlib.sha1('{}_{}_{}_{}_{}'.format(flow_5_tuple['src_ip'],
-                                                                 flow_5_tuple['dst_ip'],
-                                                                 flow_5_tuple['protocol'],
-                                                                 flow_5_tuple['src_port'],
-                                                                 flow_5_tuple['dst_port'])).hexdigest()
-                flow_throughput, flow_throughput_unit = self.traffic_manager.get_flow_throughput_prediction(flow_hash)
-                path, flow_load = self.p4monitor.get_path_pfr(src_host, dst_host,
-                                                              PathLinkData.LOAD_PORT_COUNTER,
-                                                              flow_throughput[2],
-                                                              flow_throughput_unit)
-
-                path_ = path[1:-1]
-                for i, sw in enumerate(path_[:-1]):
-                    sw_neighbor = path_[i + 1]
-                    link_load = self.p4monitor.get_link_property(sw, sw_neighbor, PathLinkData.LOAD_PORT_COUNTER)
-                    self.p4monitor.update_link_property(sw, sw_neighbor, PathLinkData.LOAD_PORT_COUNTER,
-                                                        link_load + flow_load)
+                path = self._determine_path_pfr(src_host, dst_host, *self._get_flow_throughput(flow_5_tuple))
             elif self.flow_forwarding_metric == FlowPredictionMetrics.DURATION:  # flow duration
-                raise NotImplementedYetException("consideration of a flow's predicted duration "
-                                                 "in the context of routing based on flow predictions "
-                                                 "is not implemented yet")
+                # short flows end before their load is considered, they are routed on the shortest path
+                if flow_size_estimate and flow_size_estimate[1] < self.FLOW_PREDICTION_DURATION_MIN:
+                    path = self.p4monitor.get_shortest_path_hops(src_host, dst_host)
+                else:
+                    path = self._determine_path_pfr(src_host, dst_host, *self._get_flow_throughput(flow_5_tuple))
             elif self.flow_forwarding_metric == FlowPredictionMetrics.BYTES:  # flow bytes
-                raise NotImplementedYetException("consideration of a flow's predicted number of bytes "
-                                                 "in the context of routing based on flow predictions "
-                                                 "is not implemented yet")
+                # small flows (mice) are routed on the shortest path
+                if flow_size_estimate and flow_size_estimate[0] < self.FLOW_PREDICTION_BYTES_MIN:
+                    path = self.p4monitor.get_shortest_path_hops(src_host, dst_host)
+                else:
+                    path = self._determine_path_pfr(src_host, dst_host, *self._get_flow_throughput(flow_5_tuple))
             elif self.flow_forwarding_metric == FlowPredictionMetrics.COMBINED:  # flow bytes and duration => throughput
-                raise NotImplementedYetException("combined consideration of a flow's predicted number of bytes and "
-                                                 "its duration in the context of routing based on flow predictions "
-                                                 "is not implemented yet")
+                if flow_size_estimate and flow_size_estimate[1] > 0:
+                    flow_throughput = flow_size_estimate[0] * 8 / flow_size_estimate[1] / DataRates.KILOBIT.value
+                    path = self._determine_path_pfr(src_host, dst_host, flow_throughput, DataRates.KILOBIT)
+                else:
+                    path = self._determine_path_pfr(src_host, dst_host, *self._get_flow_throughput(flow_5_tuple))
 
         return path
 
+    def _get_flow_throughput(self, flow_5_tuple):
+        # throughputs of finished flows (FlowMonitor) are preferred over the traffic profile predictions
+        flow_throughput_estimate = None
+        if hasattr(self.p4monitor, 'get_flow_throughput_estimate'):
+            flow_throughput_estimate = self.p4monitor.get_flow_throughput_estimate(flow_5_tuple)
+        if flow_throughput_estimate:
+            return flow_throughput_estimate
+
+        flow_hash = hashlib.sha1('{}_{}_{}_{}_{}'.format(flow_5_tuple['src_ip'],
+                                                         flow_5_tuple['dst_ip'],
+                                                         flow_5_tuple['protocol'],
+                                                         flow_5_tuple['src_port'],
+                                                         flow_5_tuple['dst_port'])).hexdigest()
+        flow_throughput, flow_throughput_unit = self.traffic_manager.get_flow_throughput_prediction(flow_hash)
+        return flow_throughput[2], flow_throughput_unit
+
+    def _determine_path_pfr(self, src_host, dst_host, flow_throughput, flow_throughput_unit):
+        path, flow_load = self.p4monitor.get_path_pfr(src_host, dst_host,
+                                                      PathLinkData.LOAD_PORT_COUNTER,
+                                                      flow_throughput,
+                                                      flow_throughput_unit)
+
+        path_ = path[1:-1]
+        for i, sw in enumerate(path_[:-1]):
+            sw_neighbor = path_[i + 1]
+            link_load = self.p4monitor.get_link_property(sw, sw_neighbor, PathLinkData.LOAD_PORT_COUNTER)
+            self.p4monitor.update_link_property(sw, sw_neighbor, PathLinkData.LOAD_PORT_COUNTER,
+                                                link_load + flow_load)
+        return path
+
     @time_measure_factory(TimeMeasurements.PATH_PROGRAMMING)
     def _program_flow_forwarding_path(self, flow_5_tuple, path, cpu_header):
         def _encode_flow_hash(flow_hash, match_num_elements):
@@ -532,12 +582,14 @@ class FlowForwardingController(P4ControllerCPU):
         forwarding_rule['match'][self.P4_FORWARDING_MATCH2] = _encode_flow_hash(flow_hash_two,
                                                                                 self.P4_FORWARDING_MATCH2_NUM_ELEMENTS)
 
-        log.info('programming path: {} - '
-                 'flow 5-tuple: {}/{},{}/{},{} - '
-                 'flow hashes:{}/{}'.format([str(x) for x in path[1:-1]],
-                                            flow_5_tuple['src_ip'], flow_5_tuple['dst_ip'], flow_5_tuple['protocol'],
-                                            flow_5_tuple['src_port'], flow_5_tuple['dst_port'],
-                                            flow_hash_one, flow_hash_two))
+        if log.isEnabledFor(logging.INFO):
+            log.info('programming path: {} - '
+                     'flow 5-tuple: {}/{},{}/{},{} - '
+                     'flow hashes:{}/{}'.format([str(x) for x in path[1:-1]],
+                                                flow_5_tuple['src_ip'], flow_5_tuple['dst_ip'],
+                                                flow_5_tuple['protocol'],
+                                                flow_5_tuple['src_port'], flow_5_tuple['dst_port'],
+                                                flow_hash_one, flow_hash_two))
 
         self._program_path(path, forwarding_rule, forwarding_flow=True, flow_5_tuple=flow_5_tuple)
 
@@ -552,6 +604,34 @@ class FlowForwardingController(P4ControllerCPU):
         sendp(packet, iface=intf, verbose=False)
         # sendpfast(packet, iface=intf)  # requires 'tcpreplay'
 
+    def _run_time_measure_export(self):
+        while not self.time_measure_export_event.wait(self.time_measurement_interval):
+            self._export_time_measures(self.TIME_MEASURE_INTERVAL, self.time_measures.get_interval_snapshot())
+
+    def _export_time_measures(self, scope, histograms):
+        timestamp = time.time()
+        for stage, histogram in histograms.items():
+            if not histogram.total_count:
+                continue
+            summary = histogram.get_summary(scale=self.TIME_MEASURE_SCALE)
+            if self.csv_output:
+                self.csv_writer.writerow([timestamp, scope, self.flow_forwarding_strategy.value,
+                                          self.flow_forwarding_metric.value, stage] + list(summary.values()))
+            else:
+                log.info('time measure ({}) {}: {}'.format(scope, stage, ', '.join(
+                    '{}={}'.format(key, value if key == 'count' else '{:.1f}us'.format(value))
+                    for key, value in summary.items())))
+        if self.csv_output:
+            self.output_file.flush()
+            if scope == self.TIME_MEASURE_TOTAL:
+                # raw histograms for merging the iterations of an experiment, a list of strategy/metric entries as
+                # in the merged file (see experiments_time_measure.py)
+                with open(os.path.join(self.exp_dir, self.TIME_MEASURE_HISTOGRAMS_FILE), 'w') as histograms_file:
+                    json.dump([{'strategy': self.flow_forwarding_strategy.value,
+                                'metric': self.flow_forwarding_metric.value,
+                                'histograms': dict((stage, histogram.to_dict())
+                                                   for stage, histogram in histograms.items())}], histograms_file)
+
     def init_csv_output(self, exp_id, exp_iter):
         output_dir = os.path.join('p4controllers', 'results')
         if not os.path.isdir(output_dir):
@@ -566,13 +646,11 @@ class FlowForwardingController(P4ControllerCPU):
         except:
             pass
 
-        output_file = os.path.join(exp_dir, 'time_measure.csv')
+        self.exp_dir = exp_dir
+        output_file = os.path.join(exp_dir, self.TIME_MEASURE_FILE)
         self.output_file = open(output_file, 'w')
         self.csv_writer = csv.writer(self.output_file)
-
-    def write_csv_output(self, time_measures):
-        self.csv_writer.writerow(time_measures)
-        self.output_file.flush()
+        self.csv_writer.writerow(self.TIME_MEASURE_HEADER)
 
 
 class P4FlowForwardingMappingException(Exception):
@@ -23,11 +23,13 @@
 from p4controllers.p4controller_cpu import P4ControllerCPU
 from p4controllers.l2_learn_stuff import L2LearnController
 
-from tools.log.log import log
+from tools.log.log import get_logger, LogSubsystem
 
 from scapy.all import Packet, BitField
 from scapy.layers.l2 import Ether
 
+log = get_logger(LogSubsystem.CONTROLLER)
+
 
 class CPUHeader(Packet):
     name = 'CPUPacket'
@@ -23,10 +23,13 @@
 from p4controllers.p4controller_digest import P4ControllerDigest
 from p4controllers.l2_learn_stuff import L2LearnController
 
-from tools.log.log import log
+from tools.log.log import get_logger, LogSubsystem
 
+import logging
 import struct
 
+log = get_logger(LogSubsystem.CONTROLLER)
+
 
 class L2LearnControllerDigest(P4ControllerDigest, L2LearnController):
     # https://docs.python.org/2.7/library/struct.html?highlight=unpack#struct.unpack
@@ -47,14 +50,17 @@ class L2LearnControllerDigest(P4ControllerDigest, L2LearnController):
     def _unpack_message_digest(self, p4switch, message, num_samples):
         digest = []
         sample_lower_limit = 0
+        log_samples = log.isEnabledFor(logging.INFO)
         for sample in range(num_samples):
             sample_upper_limit = (sample + 1) * self.DIGEST_SAMPLE_LENGTH
             src_mac_part1, src_mac_part2, ingress_port = struct.unpack(self.DIGEST_SAMPLE_STRUCTURE,
                                                                        message[sample_lower_limit:sample_upper_limit])
             src_mac = (src_mac_part1 << 16) + src_mac_part2
             digest.append([src_mac, ingress_port, p4switch])
-            log.info('digest contained mac_addr: {:012X}, ingress_port: {}, switch: {}'.format(src_mac, ingress_port,
-                                                                                               p4switch))
+            if log_samples:
+                log.info('digest contained mac_addr: {:012X}, ingress_port: {}, switch: {}'.format(src_mac,
+                                                                                                   ingress_port,
+                                                                                                   p4switch))
             sample_lower_limit = sample_upper_limit
 
         return digest
@@ -76,5 +82,5 @@ class L2LearnControllerDigest(P4ControllerDigest, L2LearnController):
                                                                   show=False)
 
                 self.learned_mac_src_addresses[sw][mac_addr] = ingress_port
-            else:
+            elif log.isEnabledFor(logging.DEBUG):
                 log.debug('mac: {:012X} already learned for port {} on {}'.format(mac_addr, ingress_port, sw))
@@ -23,11 +23,26 @@
 
 import threading
 
+import numpy as np
+
 from p4runtime.runtimeAPI import helper as p4info_help, switch, runtime_API
 from p4runtime.runtimeCLI import runtime_CLI
 from p4runtime.runtimeCLI import simple_switch_API
+from p4runtime import switch_snapshot
+
+from tools.log.log import get_logger, LogSubsystem
+from tools.metrics import REGISTRY
+
+log = get_logger(LogSubsystem.CONTROLLER)
 
-from tools.log.log import log
+grpc_request_seconds = REGISTRY.summary('p4_grpc_request_seconds', 'latency of P4Runtime requests',
+                                        ['connector', 'switch', 'operation'])
+table_entries_inserted = REGISTRY.counter('p4_table_entries_inserted_total', 'inserted table entries',
+                                          ['connector', 'switch', 'table'])
+table_entries_deleted = REGISTRY.counter('p4_table_entries_deleted_total', 'deleted table entries',
+                                         ['connector', 'switch', 'table'])
+table_entries = REGISTRY.gauge('p4_table_entries', 'installed table entries (default actions excluded)',
+                               ['connector', 'switch', 'table'])
 
 
 class P4Connector(threading.Thread):
@@ -55,6 +70,8 @@ class P4Connector(threading.Thread):
                 p4switch_connection_grpc = switch.Bmv2SwitchConnection(switch_addr=sw_grpc_server_addr,
                                                                        device_id=sw_conf['device_id'],
                                                                        runtime_gRPC_log=sw_conf['runtime_gRPC_log'],
+                                                                       runtime_gRPC_log_binary=sw_conf[
+                                                                           'runtime_gRPC_log_binary'],
                                                                        name=sw)
                 self.p4switch_connections_gRPC[sw] = p4switch_connection_grpc
             if sw not in self.p4switch_p4info_helper:
@@ -66,33 +83,107 @@ class P4Connector(threading.Thread):
         for p4switch_connection in self.p4switch_connections_gRPC.values():
             p4switch_connection.shutdown()
 
+    def _time_grpc_request(self, p4switch_name, operation):
+        return grpc_request_seconds.labels(self.__class__.__name__, p4switch_name, operation).time()
+
     def insert_table_entry(self, p4switch_name, flow):
-        runtime_API.insert_table_entry(self.p4switch_connections_gRPC[p4switch_name],
-                                       self.p4switch_p4info_helper[p4switch_name], flow)
+        with self._time_grpc_request(p4switch_name, 'insert_table_entry'):
+            runtime_API.insert_table_entry(self.p4switch_connections_gRPC[p4switch_name],
+                                           self.p4switch_p4info_helper[p4switch_name], flow)
+        table_entries_inserted.labels(self.__class__.__name__, p4switch_name, flow['table']).inc()
+        if not flow.get('default_action', False):
+            table_entries.labels(self.__class__.__name__, p4switch_name, flow['table']).inc()
 
     def delete_table_entry(self, p4switch_name, flow):
-        runtime_API.delete_table_entry(self.p4switch_connections_gRPC[p4switch_name],
-                                       self.p4switch_p4info_helper[p4switch_name], flow)
+        with self._time_grpc_request(p4switch_name, 'delete_table_entry'):
+            runtime_API.delete_table_entry(self.p4switch_connections_gRPC[p4switch_name],
+                                           self.p4switch_p4info_helper[p4switch_name], flow)
+        table_entries_deleted.labels(self.__class__.__name__, p4switch_name, flow['table']).inc()
+        table_entries.labels(self.__class__.__name__, p4switch_name, flow['table']).dec()
 
     def insert_multicast_group_entry(self, p4switch_name, rule):
-        runtime_API.insert_multicast_group_entry(self.p4switch_connections_gRPC[p4switch_name],
-                                                 self.p4switch_p4info_helper[p4switch_name], rule)
+        with self._time_grpc_request(p4switch_name, 'insert_multicast_group_entry'):
+            runtime_API.insert_multicast_group_entry(self.p4switch_connections_gRPC[p4switch_name],
+                                                     self.p4switch_p4info_helper[p4switch_name], rule)
 
     def delete_multicast_group_entry(self, p4switch_name, rule):
-        runtime_API.delete_multicast_group_entry(self.p4switch_connections_gRPC[p4switch_name],
-                                                 self.p4switch_p4info_helper[p4switch_name], rule)
+        with self._time_grpc_request(p4switch_name, 'delete_multicast_group_entry'):
+            runtime_API.delete_multicast_group_entry(self.p4switch_connections_gRPC[p4switch_name],
+                                                     self.p4switch_p4info_helper[p4switch_name], rule)
 
     def get_table_entries(self, p4switch_name, table_name, show=False):
-        table_entries = runtime_API.get_table_entries(self.p4switch_connections_gRPC[p4switch_name],
-                                                      self.p4switch_p4info_helper[p4switch_name], table_name)
+        with self._time_grpc_request(p4switch_name, 'get_table_entries'):
+            table_entries = runtime_API.get_table_entries(self.p4switch_connections_gRPC[p4switch_name],
+                                                          self.p4switch_p4info_helper[p4switch_name], table_name)
         if show:
             print(table_entries)
         return table_entries
 
     def get_counters(self, p4switch_name, counter_name, index=None, show=False):
-        counters = runtime_API.get_counters(self.p4switch_connections_gRPC[p4switch_name],
-                                            self.p4switch_p4info_helper[p4switch_name],
-                                            counter_name, index)
+        with self._time_grpc_request(p4switch_name, 'get_counters'):
+            counters = runtime_API.get_counters(self.p4switch_connections_gRPC[p4switch_name],
+                                                self.p4switch_p4info_helper[p4switch_name],
+                                                counter_name, index)
         if show:
             print(counters)
         return counters
+
+    def read_direct_counters(self, p4switch_name, table_name):
+        # (table entry keys, byte counts, packet counts), direct counters are only read via P4Runtime
+        if p4switch_name not in self.p4switch_connections_gRPC:
+            log.warning('direct counters of {} not read, no P4Runtime connection'.format(p4switch_name))
+            return [], np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        with self._time_grpc_request(p4switch_name, 'read_direct_counters'):
+            return runtime_API.read_direct_counters(self.p4switch_connections_gRPC[p4switch_name],
+                                                    self.p4switch_p4info_helper[p4switch_name], table_name)
+
+    def get_table_entry_key(self, p4switch_name, flow):
+        return runtime_API.get_table_entry_key(self.p4switch_p4info_helper[p4switch_name], flow)
+
+    def read_register(self, p4switch_name, register_name, index=None):
+        # numpy array of the register cells, via P4Runtime (one wildcard read) if available, otherwise via thrift
+        if p4switch_name not in self.p4switch_connections_gRPC:
+            return self.read_register_thrift(p4switch_name, register_name, index)
+        with self._time_grpc_request(p4switch_name, 'read_register'):
+            return runtime_API.read_register(self.p4switch_connections_gRPC[p4switch_name],
+                                             self.p4switch_p4info_helper[p4switch_name], register_name, index)
+
+    def read_register_thrift(self, p4switch_name, register_name, index=None):
+        # one thrift call for all cells, the i64 values of thrift are returned as uint64 (cells up to 64 bit)
+        client = self.p4switch_connections_thrift[p4switch_name].client
+        if index is not None:
+            values = [client.bm_register_read(0, register_name, index)]
+        else:
+            values = client.bm_register_read_all(0, register_name)
+        return np.array(values, dtype=np.int64).view(np.uint64)
+
+    def write_register(self, p4switch_name, register_name, values, index=0):
+        if p4switch_name not in self.p4switch_connections_gRPC:
+            client = self.p4switch_connections_thrift[p4switch_name].client
+            for i, value in enumerate(values):
+                client.bm_register_write(0, register_name, index + i, int(value))
+            return
+        with self._time_grpc_request(p4switch_name, 'write_register'):
+            runtime_API.write_register(self.p4switch_connections_gRPC[p4switch_name],
+                                       self.p4switch_p4info_helper[p4switch_name], register_name, values, index)
+
+    def reset_register(self, p4switch_name, register_name):
+        # all cells to 0 with one thrift call (P4Runtime has no wildcard register write)
+        self.p4switch_connections_thrift[p4switch_name].client.bm_register_reset(0, register_name)
+
+    def take_snapshot(self, p4switch_name):
+        return switch_snapshot.take_snapshot(p4switch_name, self.p4switch_connections_thrift[p4switch_name],
+                                             self.p4switch_connections_gRPC.get(p4switch_name, None),
+                                             self.p4switch_p4info_helper.get(p4switch_name, None))
+
+    def restore_snapshot(self, snapshot):
+        switch_snapshot.restore_snapshot(snapshot, self.p4switch_connections_thrift[snapshot.switch_name],
+                                         self.p4switch_connections_gRPC.get(snapshot.switch_name, None),
+                                         self.p4switch_p4info_helper.get(snapshot.switch_name, None))
+
+    def take_snapshots(self):
+        return {p4switch_name: self.take_snapshot(p4switch_name) for p4switch_name in self.p4switch_connections_thrift}
+
+    def restore_snapshots(self, snapshots):
+        for snapshot in snapshots.values():
+            self.restore_snapshot(snapshot)
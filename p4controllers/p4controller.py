@@ -14,12 +14,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from tools.log.log import log
+from tools.log.log import get_logger, LogSubsystem
 
 from abc import abstractmethod
 
 from p4controllers.p4connector import P4Connector
 
+log = get_logger(LogSubsystem.CONTROLLER)
+
 
 class P4Controller(P4Connector):
 
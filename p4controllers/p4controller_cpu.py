@@ -25,10 +25,22 @@ from enum import Enum
 from scapy.sendrecv import AsyncSniffer
 import threading
 
-from tools.log.log import log
+from tools.log.log import get_logger, LogSubsystem
+from tools.metrics import REGISTRY
 from p4runtime.runtimeAPI import error_utils
 import traceback
 
+log = get_logger(LogSubsystem.CONTROLLER)
+
+packet_in_total = REGISTRY.counter('p4controller_packet_in_total', 'packets received on the CPU ports',
+                                   ['controller', 'interface'])
+packet_in_pending = REGISTRY.gauge('p4controller_packet_in_pending',
+                                   'received CPU packets waiting for the packet handler', ['controller'])
+packet_in_seconds = REGISTRY.summary('p4controller_packet_in_seconds', 'handling time of CPU packets',
+                                     ['controller'])
+controller_errors = REGISTRY.counter('p4controller_errors_total', 'failed packet/digest handlings',
+                                     ['controller'])
+
 
 class SnifferMode(Enum):
     SINGLE_SNIFFER = 0
@@ -65,17 +77,27 @@ class P4ControllerCPU(P4Controller):
         pass
 
     def _receive_cpu_packet(self, cpu_packet):
+        controller = self.__class__.__name__
+        packet_in_total.labels(controller, getattr(cpu_packet, 'sniffed_on', None)).inc()
+        pending = packet_in_pending.labels(controller)
+        pending.inc()
+        if self.sniffer_mode == SnifferMode.SWITCH_LEVEL_SNIFFER:
+            self.lock.acquire()
+        pending.dec()
         try:
-            if self.sniffer_mode == SnifferMode.SWITCH_LEVEL_SNIFFER:
-                self.lock.acquire()
-            self._handle_cpu_packet(cpu_packet)
-            if self.sniffer_mode == SnifferMode.SWITCH_LEVEL_SNIFFER:
-                self.lock.release()
+            with packet_in_seconds.labels(controller).time():
+                self._handle_cpu_packet(cpu_packet)
         except grpc.RpcError as error:
+            controller_errors.labels(controller).inc()
             error_utils.print_grpc_error(error)
         except Exception:
+            controller_errors.labels(controller).inc()
             log.error('terminate p4controller: {}'.format(self.__class__.__name__))
             log.error(traceback.format_exc())
+        finally:
+            # a failed packet must not block the sniffers of the other switches
+            if self.sniffer_mode == SnifferMode.SWITCH_LEVEL_SNIFFER:
+                self.lock.release()
 
     def _run_sniffer(self, sniff_filter=None):
         if self.sniffer_mode == SnifferMode.SINGLE_SNIFFER:
@@ -19,13 +19,27 @@ import threading
 
 from p4controllers.p4controller import P4Controller
 
-from tools.log.log import log
+from tools.log.log import get_logger, LogSubsystem
+from tools.metrics import REGISTRY
 from p4runtime.runtimeAPI import error_utils
 import traceback
 
+from tools.clock import monotonic_ns
+
 import grpc
 import nnpy
 import struct
+import logging
+
+log = get_logger(LogSubsystem.CONTROLLER)
+
+digests_total = REGISTRY.counter('p4controller_digests_total', 'received digest messages', ['controller', 'switch'])
+digest_samples_total = REGISTRY.counter('p4controller_digest_samples_total', 'received digest samples',
+                                        ['controller', 'switch'])
+digest_seconds = REGISTRY.summary('p4controller_digest_seconds', 'handling time of digest messages',
+                                  ['controller', 'switch'])
+controller_errors = REGISTRY.counter('p4controller_errors_total', 'failed packet/digest handlings',
+                                     ['controller'])
 
 
 class P4ControllerDigest(P4Controller):
@@ -61,18 +75,24 @@ class P4ControllerDigest(P4Controller):
                 pass
 
     def _handle_message_digest(self, p4switch, message):
+        controller = self.__class__.__name__
+        digests_total.labels(controller, p4switch).inc()
+        start_timestamp = monotonic_ns()
         try:
             # https://github.com/p4lang/behavioral-model/blob/master/include/bm/bm_sim/learning.h#L56
             # http://lists.p4.org/pipermail/p4-dev_lists.p4.org/2017-September/003110.html
             topic, device_id, cxt_id, list_id, buffer_id, num = struct.unpack(self.DIGEST_HEADER_STRUCTURE,
                                                                               message[:self.DIGEST_HEADER_LENGTH])
-            log.info('received notification topic:'
-                     '{}, device_id: {}, ctx_id: {}, list_id: {}, buffer_if: {}, num: {}'.format(topic,
-                                                                                                 device_id,
-                                                                                                 cxt_id,
-                                                                                                 list_id,
-                                                                                                 buffer_id,
-                                                                                                 num))
+            if log.isEnabledFor(logging.INFO):
+                log.info('received notification topic:'
+                         '{}, device_id: {}, ctx_id: {}, list_id: {}, buffer_if: {}, num: {}'.format(topic,
+                                                                                                     device_id,
+                                                                                                     cxt_id,
+                                                                                                     list_id,
+                                                                                                     buffer_id,
+                                                                                                     num))
+
+            digest_samples_total.labels(controller, p4switch).inc(num)
 
             message = message[self.DIGEST_HEADER_LENGTH:]
             messages = self._unpack_message_digest(p4switch, message, num)
@@ -81,10 +101,14 @@ class P4ControllerDigest(P4Controller):
             self.p4switch_connections_thrift[p4switch].client.bm_learning_ack_buffer(cxt_id, list_id, buffer_id)
 
         except grpc.RpcError as error:
+            controller_errors.labels(controller).inc()
             error_utils.print_grpc_error(error)
         except Exception:
+            controller_errors.labels(controller).inc()
             log.error('terminate p4controller: {}'.format(self.__class__.__name__))
             log.error(traceback.format_exc())
+        finally:
+            digest_seconds.labels(controller, p4switch).observe(monotonic_ns() - start_timestamp)
 
     def _run_digest_handler(self):
         for p4switch in self.p4switch_configurations:
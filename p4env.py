@@ -16,23 +16,52 @@
 
 from enum import Enum
 
-from p4nodes.p4host import P4Host
-from p4nodes.p4switch import P4Switch, P4RuntimeSwitch
+import importlib
+import sys
+import time
 
-from p4controllers.flow_forwarding import FlowForwardingController
-from p4controllers.l2_learn_cpu import L2LearnControllerCPU
-from p4controllers.l2_learn_digest import L2LearnControllerDigest
+# plugin classes (hosts, switches, controllers, monitors) are registered by their import path and imported only when
+# selected, importing p4env (parser, tools, experiment scripts) does not load scapy, grpc, networkx, ...
+PLUGIN_CLASSES = {}  # import path --> class
+PLUGIN_IMPORT_TIMES = {}  # import path --> (import duration in seconds, number of newly imported modules)
 
-from p4monitors.p4monitor import P4Monitor
-from p4monitors.p4port_counter import PortCounterMonitor
-from p4monitors.p4probing import ProbingMonitor
-from p4monitors.p4int import INTMonitor
-from p4monitors.p4flow import FlowMonitor
+
+def load_plugin_class(import_path):
+    if import_path not in PLUGIN_CLASSES:
+        module_name, class_name = import_path.rsplit('.', 1)
+        num_modules = len(sys.modules)
+        start_time = time.time()
+        module = importlib.import_module(module_name)
+        PLUGIN_IMPORT_TIMES[import_path] = (time.time() - start_time, len(sys.modules) - num_modules)
+        PLUGIN_CLASSES[import_path] = getattr(module, class_name)
+    return PLUGIN_CLASSES[import_path]
+
+
+def get_import_report():
+    # plugins sorted by import duration, modules shared with previously loaded plugins are attributed to those
+    return sorted([(import_path, duration, num_modules)
+                   for import_path, (duration, num_modules) in PLUGIN_IMPORT_TIMES.items()],
+                  key=lambda entry: entry[1], reverse=True)
+
+
+class P4Plugins(Enum):
+
+    def load(self):
+        return load_plugin_class(self.value)
+
+    def is_class(self, plugin_class):
+        return plugin_class is not None and plugin_class.__name__ == self.name
 
 
 class P4NetworkRunModes(Enum):
     CLI = 'CLI'
     EXPERIMENT = 'experiment'
+    WARM_EXPERIMENT = 'warm_experiment'
+
+
+class WarmRunnerCommands(Enum):
+    ITERATION = 'iteration'
+    SHUTDOWN = 'shutdown'
 
 
 class P4Topologies(Enum):
@@ -44,13 +73,13 @@ class P4Topologies(Enum):
     FLOW_ROUTING2 = 'flow_routing_2'
 
 
-class P4Hosts(Enum):
-    P4Host = P4Host
+class P4Hosts(P4Plugins):
+    P4Host = 'p4nodes.p4host.P4Host'
 
 
-class P4Switches(Enum):
-    P4Switch = P4Switch
-    P4RuntimeSwitch = P4RuntimeSwitch
+class P4Switches(P4Plugins):
+    P4Switch = 'p4nodes.p4switch.P4Switch'
+    P4RuntimeSwitch = 'p4nodes.p4switch.P4RuntimeSwitch'
 
 
 class P4SwitchInit(Enum):
@@ -71,18 +100,24 @@ class P4Programs(Enum):
     L3_FORWARDING_STATIC = 'l3_forwarding_static'
 
 
-class P4Controllers(Enum):
-    FlowForwardingController = FlowForwardingController
-    L2LearnControllerCPU = L2LearnControllerCPU
-    L2LearnControllerDigest = L2LearnControllerDigest
+class P4Controllers(P4Plugins):
+    FlowForwardingController = 'p4controllers.flow_forwarding.FlowForwardingController'
+    L2LearnControllerCPU = 'p4controllers.l2_learn_cpu.L2LearnControllerCPU'
+    L2LearnControllerDigest = 'p4controllers.l2_learn_digest.L2LearnControllerDigest'
+
 
+class P4Monitors(P4Plugins):
+    P4Monitor = 'p4monitors.p4monitor.P4Monitor'
+    PortCounterMonitor = 'p4monitors.p4port_counter.PortCounterMonitor'
+    ProbingMonitor = 'p4monitors.p4probing.ProbingMonitor'
+    INTMonitor = 'p4monitors.p4int.INTMonitor'
+    FlowMonitor = 'p4monitors.p4flow.FlowMonitor'
+    HeavyHitterMonitor = 'p4monitors.p4heavy_hitter.HeavyHitterMonitor'
 
-class P4Monitors(Enum):
-    P4Monitor = P4Monitor
-    PortCounterMonitor = PortCounterMonitor
-    ProbingMonitor = ProbingMonitor
-    INTMonitor = INTMonitor
-    FlowMonitor = FlowMonitor
+
+class TrafficGenerators(Enum):
+    IPERF = 'iperf'  # one iperf process per flow
+    AGENT = 'agent'  # one traffic agent per host, flows are handed over in batches
 
 
 class LinkConfig(Enum):
@@ -93,3 +128,12 @@ class LinkConfig(Enum):
 class HostNetwork(Enum):
     INDIVIDUAL = 'individual'
     SHARED = 'shared'
+
+
+if __name__ == '__main__':
+    # import-time report: python p4env.py
+    for plugins in [P4Hosts, P4Switches, P4Controllers, P4Monitors]:
+        for plugin in plugins:
+            plugin.load()
+    for import_path, duration, num_modules in get_import_report():
+        print('{:>8.1f} ms {:>5} modules  {}'.format(duration * 1000, num_modules, import_path))
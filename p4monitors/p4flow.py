@@ -14,24 +14,284 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from p4monitors.p4monitor import P4Monitor
+# flow export collection
+#
+# the switches (flow_forwarding P4 program) keep a flow state per cell of the first flow hash and export flow-start
+# and flow-end summaries as digests (FLOW_EXPORT_DTYPE, bmv2 notifications via nanomsg): flow-start with the first
+# packet of a flow, flow-end with the next packet of the cell if the flow is idle (FLOW_EXPORT_IDLE_TIMEOUT) or another
+# flow uses the cell; the samples of a digest are decoded at once (numpy) and finished flows are kept in a
+# FlowRecordStore (see p4flow_store.py) for p4monitor_flow_partitions partitions of p4monitor_flow_partition_duration
+# seconds
+#
+# idle flows without a next packet of their cell are exported by the monitor: per partition duration the flow state
+# registers are read (one thrift call per register) and idle cells are exported and cleared; packets of such a cell
+# between the read and the clear are not counted
+#
+# get_flow_throughput_estimate and get_flow_size_estimate provide the throughput, bytes and duration of previous flows
+# with the same 5-tuple or host pair, e.g. for routing based on flow predictions (FlowForwardingController)
+
+from time import sleep, time
+
+import struct
+import threading
+import traceback
+
+from enum import Enum
+
+import nnpy
+import numpy as np
+
+from p4monitors.p4monitor import P4Monitor, DataRates
+from p4monitors.p4flow_store import FlowRecordStore, FLOW_RECORD_DTYPE, get_throughputs
+
+from tools.metrics import REGISTRY
+
+from tools.log.log import get_logger, LogSubsystem
+
+log = get_logger(LogSubsystem.MONITOR)
+
+# https://github.com/p4lang/behavioral-model/blob/master/include/bm/bm_sim/learning.h#L56
+DIGEST_HEADER_STRUCTURE = struct.Struct('<iQiiQi')
+DIGEST_HEADER_LENGTH = 32  # bytes
+
+# digest fields are byte aligned and in network byte order, timestamps in us (48 bit)
+FLOW_EXPORT_DTYPE = np.dtype([('event', 'u1'),
+                              ('src_ip', '>u4'), ('dst_ip', '>u4'),
+                              ('src_port', '>u2'), ('dst_port', '>u2'), ('protocol', 'u1'),
+                              ('packets', '>u4'), ('bytes', '>u4'),
+                              ('first_timestamp_high', '>u2'), ('first_timestamp_low', '>u4'),
+                              ('last_timestamp_high', '>u2'), ('last_timestamp_low', '>u4')])
+FLOW_EXPORT_TIMESTAMP_SCALE = 10 ** 6  # us -> s
+FLOW_EXPORT_IDLE_TIMEOUT = 2 * 10 ** 6  # us, see preambel.p4 of the flow_forwarding P4 program
+
+flow_exports_total = REGISTRY.counter('p4monitor_flow_exports_total', 'received flow-start/flow-end exports',
+                                      ['monitor', 'event'])
+flow_records = REGISTRY.gauge('p4monitor_flow_records', 'stored flow records', ['monitor'])
+active_flows = REGISTRY.gauge('p4monitor_active_flows', 'flows with flow-start but without flow-end export',
+                              ['monitor'])
+
+
+class FlowExportEvent(Enum):
+    FLOW_START = 0
+    FLOW_END = 1
 
 
 class FlowMonitor(P4Monitor):
+    P4_FLOW_EXPORT_ADDRESSES = 'FlowForwardingIngress.flow_export_addresses'
+    P4_FLOW_EXPORT_PORTS = 'FlowForwardingIngress.flow_export_ports'
+    P4_FLOW_EXPORT_PACKETS = 'FlowForwardingIngress.flow_export_packets'
+    P4_FLOW_EXPORT_BYTES = 'FlowForwardingIngress.flow_export_bytes'
+    P4_FLOW_EXPORT_FIRST_TIMESTAMP = 'FlowForwardingIngress.flow_export_first_timestamp'
+    P4_FLOW_EXPORT_LAST_TIMESTAMP = 'FlowForwardingIngress.flow_export_last_timestamp'
+    P4_FLOW_EXPORT_REGISTERS = [P4_FLOW_EXPORT_ADDRESSES, P4_FLOW_EXPORT_PORTS, P4_FLOW_EXPORT_PACKETS,
+                                P4_FLOW_EXPORT_BYTES, P4_FLOW_EXPORT_FIRST_TIMESTAMP, P4_FLOW_EXPORT_LAST_TIMESTAMP]
 
     def __init__(self, *args, **kwargs):
         P4Monitor.__init__(self, *args, **kwargs)
 
-        raise NotImplementedYetException('FlowMonitor with P4-based flow management/export not implemented yet')
+        self.partition_duration = kwargs['p4monitor_flow_partition_duration']
+        self.partition_number = kwargs['p4monitor_flow_partitions']
+
+        self.flow_records = FlowRecordStore(self.partition_duration, self.partition_number)
+
+        self.active_flows_lock = threading.Lock()
+        self.active_flows = dict()  # (switch id, 5-tuple) --> start time
+
+        self.notifications_sockets = dict()
+        self.notifications_handler = dict()
+        self.export_listen_flag = True
+
+        flow_records.labels(self.__class__.__name__).set_function(self.flow_records.get_size)
+        active_flows.labels(self.__class__.__name__).set_function(lambda: len(self.active_flows))
 
     def run_monitor(self, *args, **kwargs):
-        pass
+        self._run_export_handler()
+
+        export_switches = []
+        for p4switch in sorted(self.switches):
+            register_arrays = self.p4switch_connections_thrift[p4switch].get_register_arrays()
+            missing_registers = [register for register in self.P4_FLOW_EXPORT_REGISTERS
+                                 if register not in register_arrays]
+            if missing_registers:
+                log.warning('no export of idle flows of {} because the flow export registers are missing '
+                            '(flow_forwarding P4 program required)'.format(p4switch))
+                continue
+            export_switches.append(p4switch)
+
+        while self.monitor_flag:
+            sleep(self.partition_duration)
+
+            for p4switch in export_switches:
+                try:
+                    self._export_idle_flows(p4switch)
+                except Exception:
+                    log.error('exporting idle flows of {} failed'.format(p4switch))
+                    log.error(traceback.format_exc())
+
+            timestamp = time()
+            self.flow_records.expire(timestamp)
+            with self.active_flows_lock:
+                retention = timestamp - self.partition_duration * self.partition_number
+                for flow, start_time in list(self.active_flows.items()):
+                    if start_time < retention:
+                        del self.active_flows[flow]
+
+            log.debug('flow records: {}, active flows: {}'.format(self.flow_records.get_size(),
+                                                                  len(self.active_flows)))
+
+            self.traffic_generation_event.set()
+
+    def stop_monitor(self):
+        super(FlowMonitor, self).stop_monitor()
+
+        self.export_listen_flag = False
+        for notifications_socket in self.notifications_sockets.values():
+            notifications_socket.close()
+        for notifications_handler in self.notifications_handler.values():
+            notifications_handler.join()
+
+    def get_active_flows(self):
+        with self.active_flows_lock:
+            return dict(self.active_flows)
+
+    def get_flow_throughput_estimate(self, flow_5_tuple, window=None):
+        # (throughput, data rate) of the finished flows with the same 5-tuple or otherwise the same host pair
+        # (within the last window seconds), None without such flows
+        throughputs = get_throughputs(self._query_flow_records(flow_5_tuple, window, with_duration=True))
+        if not len(throughputs):
+            return None
+        return float(np.mean(throughputs)) / DataRates.KILOBIT.value, DataRates.KILOBIT
+
+    def get_flow_size_estimate(self, flow_5_tuple, window=None):
+        # (bytes, duration in s) of the finished flows with the same 5-tuple or otherwise the same host pair
+        # (within the last window seconds), None without such flows
+        records = self._query_flow_records(flow_5_tuple, window)
+        if not len(records):
+            return None
+        return float(np.mean(records['bytes'])), float(np.mean(records['end_time'] - records['start_time']))
+
+    def _query_flow_records(self, flow_5_tuple, window=None, with_duration=False):
+        start_time = time() - window if window else 0.0
+        records = self.flow_records.query_flow(flow_5_tuple['src_ip'], flow_5_tuple['dst_ip'],
+                                               flow_5_tuple['src_port'], flow_5_tuple['dst_port'],
+                                               flow_5_tuple['protocol'], start_time=start_time)
+        if with_duration:
+            records = records[records['end_time'] > records['start_time']]
+        if not len(records):
+            records = self.flow_records.query_host_pair(flow_5_tuple['src_ip'], flow_5_tuple['dst_ip'],
+                                                        start_time=start_time)
+            if with_duration:
+                records = records[records['end_time'] > records['start_time']]
+        return records
+
+    def _export_idle_flows(self, p4switch):
+        # flow-end exports of the idle cells of a switch (cells without a next packet after the idle timeout)
+        client = self.p4switch_connections_thrift[p4switch].client
+        now = self.p4switch_connections_thrift[p4switch].get_time_elapsed()
+        packets = self.read_register_thrift(p4switch, self.P4_FLOW_EXPORT_PACKETS)
+        last_timestamps = self.read_register_thrift(p4switch, self.P4_FLOW_EXPORT_LAST_TIMESTAMP)
+        cells = np.flatnonzero((packets != 0) & (last_timestamps.astype(np.int64) + FLOW_EXPORT_IDLE_TIMEOUT < now))
+        if not len(cells):
+            return
+
+        addresses = self.read_register_thrift(p4switch, self.P4_FLOW_EXPORT_ADDRESSES)[cells]
+        ports = self.read_register_thrift(p4switch, self.P4_FLOW_EXPORT_PORTS)[cells]
+        byte_counts = self.read_register_thrift(p4switch, self.P4_FLOW_EXPORT_BYTES)[cells]
+        first_timestamps = self.read_register_thrift(p4switch, self.P4_FLOW_EXPORT_FIRST_TIMESTAMP)[cells]
+        # the next packet of a cleared cell starts a new flow
+        for cell in cells:
+            client.bm_register_write(0, self.P4_FLOW_EXPORT_PACKETS, int(cell), 0)
+
+        exports = np.zeros(len(cells), dtype=FLOW_EXPORT_DTYPE)
+        exports['event'] = FlowExportEvent.FLOW_END.value
+        exports['src_ip'] = addresses >> np.uint64(32)
+        exports['dst_ip'] = addresses & np.uint64(0xFFFFFFFF)
+        exports['src_port'] = ports >> np.uint64(24)
+        exports['dst_port'] = (ports >> np.uint64(8)) & np.uint64(0xFFFF)
+        exports['protocol'] = ports & np.uint64(0xFF)
+        exports['packets'] = packets[cells]
+        exports['bytes'] = byte_counts
+        exports['first_timestamp_high'] = first_timestamps >> np.uint64(32)
+        exports['first_timestamp_low'] = first_timestamps & np.uint64(0xFFFFFFFF)
+        exports['last_timestamp_high'] = last_timestamps[cells] >> np.uint64(32)
+        exports['last_timestamp_low'] = last_timestamps[cells] & np.uint64(0xFFFFFFFF)
+
+        # the flows ended with their last packet, not at the time of the export
+        idle_times = (now - last_timestamps[cells].astype(np.int64)) / float(FLOW_EXPORT_TIMESTAMP_SCALE)
+        self._process_flow_exports(int(self.get_switch(p4switch)['device_id']), exports, time(), idle_times)
+
+    def _run_export_handler(self):
+        for p4switch, p4switch_config in self.get_switches().items():
+            notifications = p4switch_config['notifications_ipc']
+            if not notifications:
+                log.warning('no flow export of {} because notifications support is disabled'.format(p4switch))
+                continue
+
+            notifications_socket = nnpy.Socket(nnpy.AF_SP, nnpy.SUB)
+            notifications_socket.connect(str(notifications))
+            notifications_socket.setsockopt(nnpy.SUB, nnpy.SUB_SUBSCRIBE, '')
+            self.notifications_sockets[p4switch] = notifications_socket
+
+            notifications_handler = threading.Thread(target=self._listen_flow_exports, kwargs={'sw': p4switch})
+            notifications_handler.start()
+            self.notifications_handler[p4switch] = notifications_handler
+
+    def _listen_flow_exports(self, *args, **kwargs):
+        p4switch = kwargs['sw']
+
+        while self.export_listen_flag:
+            try:
+                message = self.notifications_sockets[p4switch].recv()
+            except Exception:
+                continue
+            try:
+                self._handle_flow_exports(p4switch, message, time())
+            except Exception:
+                log.error('handling flow exports of {} failed'.format(p4switch))
+                log.error(traceback.format_exc())
+
+    def _handle_flow_exports(self, p4switch, message, receive_time):
+        if len(message) < DIGEST_HEADER_LENGTH:
+            return
+        _, device_id, cxt_id, list_id, buffer_id, num = DIGEST_HEADER_STRUCTURE.unpack(message[:DIGEST_HEADER_LENGTH])
+        # digests of other field lists (e.g. learning) are left to their consumers
+        if len(message) - DIGEST_HEADER_LENGTH != num * FLOW_EXPORT_DTYPE.itemsize:
+            return
+
+        exports = np.frombuffer(message, dtype=FLOW_EXPORT_DTYPE, count=num, offset=DIGEST_HEADER_LENGTH)
+        self.p4switch_connections_thrift[p4switch].client.bm_learning_ack_buffer(cxt_id, list_id, buffer_id)
+
+        self._process_flow_exports(device_id, exports, receive_time)
+
+    def _process_flow_exports(self, device_id, exports, receive_time, idle_times=None):
+        # idle_times: time (s) between the last packet and the export per flow, 0 if not known (digests)
+        first_timestamps = (exports['first_timestamp_high'].astype(np.int64) << 32) | \
+            exports['first_timestamp_low'].astype(np.int64)
+        last_timestamps = (exports['last_timestamp_high'].astype(np.int64) << 32) | \
+            exports['last_timestamp_low'].astype(np.int64)
+        # switch timestamps are relative to the switch start, flows are placed by the receive time
+        durations = np.maximum(last_timestamps - first_timestamps, 0) / float(FLOW_EXPORT_TIMESTAMP_SCALE)
+
+        flow_starts = exports['event'] == FlowExportEvent.FLOW_START.value
+        flow_ends = exports['event'] == FlowExportEvent.FLOW_END.value
+        flow_exports_total.labels(self.__class__.__name__, 'flow_start').inc(int(np.count_nonzero(flow_starts)))
+        flow_exports_total.labels(self.__class__.__name__, 'flow_end').inc(int(np.count_nonzero(flow_ends)))
 
-    def _handle_cpu_packet(self, cpu_packet):
-        pass
+        with self.active_flows_lock:
+            for i in np.flatnonzero(flow_starts):
+                self.active_flows[(device_id, get_flow_key(exports[i]))] = receive_time - durations[i]
+            for i in np.flatnonzero(flow_ends):
+                self.active_flows.pop((device_id, get_flow_key(exports[i])), None)
 
+        records = np.empty(np.count_nonzero(flow_ends), dtype=FLOW_RECORD_DTYPE)
+        records['switch_id'] = device_id
+        for field in ['src_ip', 'dst_ip', 'src_port', 'dst_port', 'protocol', 'packets', 'bytes']:
+            records[field] = exports[field][flow_ends]
+        records['end_time'] = receive_time if idle_times is None else receive_time - idle_times[flow_ends]
+        records['start_time'] = records['end_time'] - durations[flow_ends]
+        self.flow_records.append(records)
 
-class NotImplementedYetException(Exception):
 
-    def __init__(self, message):
-        super(NotImplementedYetException, self).__init__(self.__class__.__name__ + ': ' + message)
+def get_flow_key(flow_export):
+    return (int(flow_export['src_ip']), int(flow_export['dst_ip']),
+            int(flow_export['src_port']), int(flow_export['dst_port']), int(flow_export['protocol']))
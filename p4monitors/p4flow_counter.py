@@ -0,0 +1,102 @@
+# Copyright 2020-present Christoph Hardegen
+#                        (christoph.hardegen@cs.hs-fulda.de)
+#                        Fulda University of Applied Sciences
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# per-flow statistics from the direct counters of the flow forwarding rules
+#
+# the direct counters of all entries of flow_forwarding_table are read with one wildcard read per switch and joined
+# to the forwarding rules of the FlowForwardingController (flow hash --> rule) by their table entry keys; byte counts
+# and timestamps are kept per switch in arrays indexed by flow rows, rates are computed for all flows of a switch at
+# once (a flow has a rate from its second read on)
+
+import numpy as np
+
+from tools.clock import monotonic_ns
+
+
+class FlowCounterCollector(object):
+    P4_FLOW_FORWARDING_TABLE = 'FlowForwardingIngress.flow_forwarding_table'
+    FLOW_ROWS_INITIAL = 64
+
+    def __init__(self, connector, table_name=P4_FLOW_FORWARDING_TABLE):
+        self.connector = connector
+        self.table_name = table_name
+
+        self.flow_rows = dict()  # switch --> {table entry key: row}
+        self.flow_hashes = dict()  # switch --> [flow hash per row]
+        self.flow_hashes_known = dict()  # switch --> {flow hash}
+        self.flow_ports = dict()  # switch --> egress port per row
+        self.byte_counts = dict()  # switch --> last byte count per row
+        self.timestamps = dict()  # switch --> time (ns) of the last byte count per row, 0: not read yet
+
+    def collect(self, switch, forwarding_rules):
+        # flow hashes, egress ports and rates (bit/s) of the flows of a switch, nan for flows without a previous read
+        self._add_flows(switch, forwarding_rules)
+
+        entry_keys, byte_counts, _ = self.connector.read_direct_counters(switch, self.table_name)
+        timestamp = monotonic_ns()
+
+        flow_rows = self.flow_rows[switch]
+        rows = np.array([flow_rows.get(entry_key, -1) for entry_key in entry_keys], dtype=np.int64)
+        read = rows >= 0
+        rows, byte_counts = rows[read], byte_counts[read]
+
+        flow_number = len(self.flow_hashes[switch])
+        last_byte_counts = self.byte_counts[switch][rows]
+        last_timestamps = self.timestamps[switch][rows]
+
+        # counters below the last byte count were reset (rule reinstalled), they are counted from 0
+        byte_diffs = np.where(byte_counts >= last_byte_counts, byte_counts - last_byte_counts, byte_counts)
+        rates = np.full(flow_number, np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates[rows] = np.where(last_timestamps > 0,
+                                   byte_diffs.astype(np.float64) * 8 * 10 ** 9 / (timestamp - last_timestamps), np.nan)
+
+        self.byte_counts[switch][rows] = byte_counts
+        self.timestamps[switch][rows] = timestamp
+
+        return list(self.flow_hashes[switch]), self.flow_ports[switch][:flow_number].copy(), rates
+
+    def _add_flows(self, switch, forwarding_rules):
+        if switch not in self.flow_rows:
+            self.flow_rows[switch] = dict()
+            self.flow_hashes[switch] = list()
+            self.flow_hashes_known[switch] = set()
+            self.flow_ports[switch] = np.zeros(self.FLOW_ROWS_INITIAL, dtype=np.int64)
+            self.byte_counts[switch] = np.zeros(self.FLOW_ROWS_INITIAL, dtype=np.int64)
+            self.timestamps[switch] = np.zeros(self.FLOW_ROWS_INITIAL, dtype=np.int64)
+
+        flow_hashes = self.flow_hashes[switch]
+        flow_hashes_known = self.flow_hashes_known[switch]
+        new_flows = [(flow_hash, forwarding_rule) for flow_hash, forwarding_rule in list(forwarding_rules.items())
+                     if flow_hash not in flow_hashes_known]
+        if not new_flows:
+            return
+
+        capacity = len(self.flow_ports[switch])
+        required = len(flow_hashes) + len(new_flows)
+        if required > capacity:
+            while capacity < required:
+                capacity *= 2
+            for arrays in [self.flow_ports, self.byte_counts, self.timestamps]:
+                arrays[switch] = np.concatenate([arrays[switch],
+                                                 np.zeros(capacity - len(arrays[switch]), dtype=np.int64)])
+
+        for flow_hash, forwarding_rule in new_flows:
+            row = len(flow_hashes)
+            self.flow_rows[switch][self.connector.get_table_entry_key(switch, forwarding_rule)] = row
+            flow_hashes.append(flow_hash)
+            flow_hashes_known.add(flow_hash)
+            self.flow_ports[switch][row] = forwarding_rule['action_params']['port']
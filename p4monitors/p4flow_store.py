@@ -0,0 +1,139 @@
+# Copyright 2020-present Christoph Hardegen
+#                        (christoph.hardegen@cs.hs-fulda.de)
+#                        Fulda University of Applied Sciences
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# in-memory store of flow records (FlowMonitor), one column (numpy array) per field and partitions per time interval
+# (flow end), records are appended in batches (digests) and old partitions are dropped as a whole
+
+import socket
+import struct
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+FLOW_RECORD_DTYPE = np.dtype([('switch_id', np.uint16),
+                              ('src_ip', np.uint32), ('dst_ip', np.uint32),
+                              ('src_port', np.uint16), ('dst_port', np.uint16), ('protocol', np.uint8),
+                              ('packets', np.uint64), ('bytes', np.uint64),
+                              ('start_time', np.float64), ('end_time', np.float64)])  # s
+
+PARTITION_CAPACITY = 1024  # initial records per partition, doubled when full
+
+
+class FlowRecordPartition(object):
+
+    def __init__(self, start_time, end_time):
+        self.start_time = start_time
+        self.end_time = end_time
+
+        self.columns = dict((field, np.empty(PARTITION_CAPACITY, dtype=FLOW_RECORD_DTYPE[field]))
+                            for field in FLOW_RECORD_DTYPE.names)
+        self.size = 0
+
+    def append(self, records):
+        size = self.size + len(records)
+        capacity = len(self.columns['start_time'])
+        if size > capacity:
+            while capacity < size:
+                capacity *= 2
+            for field, column in self.columns.items():
+                self.columns[field] = np.resize(column, capacity)
+        for field in FLOW_RECORD_DTYPE.names:
+            self.columns[field][self.size:size] = records[field]
+        self.size = size
+
+    def select(self, mask_function, start_time, end_time):
+        columns = dict((field, column[:self.size]) for field, column in self.columns.items())
+        mask = (columns['end_time'] >= start_time) & (columns['start_time'] <= end_time)
+        if mask_function:
+            mask &= mask_function(columns)
+        records = np.empty(np.count_nonzero(mask), dtype=FLOW_RECORD_DTYPE)
+        for field in FLOW_RECORD_DTYPE.names:
+            records[field] = columns[field][mask]
+        return records
+
+
+class FlowRecordStore(object):
+
+    def __init__(self, partition_duration, partition_number):
+        self.partition_duration = partition_duration
+        self.partition_number = partition_number
+
+        self.lock = threading.Lock()
+        self.partitions = OrderedDict()  # partition index --> partition
+
+    def append(self, records):
+        # records: numpy array of FLOW_RECORD_DTYPE, partitioned by their end time
+        if not len(records):
+            return
+        partition_indices = (records['end_time'] // self.partition_duration).astype(np.int64)
+        with self.lock:
+            for partition_index in np.unique(partition_indices):
+                partition = self.partitions.get(partition_index, None)
+                if partition is None:
+                    partition = FlowRecordPartition(partition_index * self.partition_duration,
+                                                    (partition_index + 1) * self.partition_duration)
+                    self.partitions[partition_index] = partition
+                    self.partitions = OrderedDict(sorted(self.partitions.items()))
+                partition.append(records[partition_indices == partition_index])
+
+    def expire(self, timestamp):
+        # drops the partitions older than the retention time (partition number x partition duration)
+        oldest_partition = int(timestamp // self.partition_duration) - self.partition_number + 1
+        with self.lock:
+            for partition_index in list(self.partitions.keys()):
+                if partition_index < oldest_partition:
+                    del self.partitions[partition_index]
+
+    def get_size(self):
+        with self.lock:
+            return sum(partition.size for partition in self.partitions.values())
+
+    def query(self, start_time=0.0, end_time=float('inf'), mask_function=None):
+        # records of flows active in [start_time, end_time], mask_function(columns) narrows the selection
+        with self.lock:
+            partitions = [partition for partition in self.partitions.values() if partition.end_time > start_time]
+            records = [partition.select(mask_function, start_time, end_time) for partition in partitions]
+        if not records:
+            return np.empty(0, dtype=FLOW_RECORD_DTYPE)
+        return np.concatenate(records)
+
+    def query_flow(self, src_ip, dst_ip, src_port, dst_port, protocol, start_time=0.0, end_time=float('inf')):
+        src_ip, dst_ip = ip_to_int(src_ip), ip_to_int(dst_ip)
+        return self.query(start_time, end_time,
+                          lambda columns: (columns['src_ip'] == src_ip) & (columns['dst_ip'] == dst_ip) &
+                                          (columns['src_port'] == src_port) & (columns['dst_port'] == dst_port) &
+                                          (columns['protocol'] == protocol))
+
+    def query_host_pair(self, src_ip, dst_ip, start_time=0.0, end_time=float('inf')):
+        src_ip, dst_ip = ip_to_int(src_ip), ip_to_int(dst_ip)
+        return self.query(start_time, end_time,
+                          lambda columns: (columns['src_ip'] == src_ip) & (columns['dst_ip'] == dst_ip))
+
+
+def ip_to_int(ip_address):
+    return struct.unpack('!I', socket.inet_aton(ip_address))[0]
+
+
+def int_to_ip(ip_address):
+    return socket.inet_ntoa(struct.pack('!I', int(ip_address)))
+
+
+def get_throughputs(records):
+    # bit/s per record, records without duration are skipped
+    durations = records['end_time'] - records['start_time']
+    valid = durations > 0
+    return records['bytes'][valid] * 8.0 / durations[valid]
@@ -0,0 +1,153 @@
+# Copyright 2020-present Christoph Hardegen
+#                        (christoph.hardegen@cs.hs-fulda.de)
+#                        Fulda University of Applied Sciences
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# heavy hitter detection for the flow_forwarding P4 program without per-flow rules
+#
+# the switches count the bytes per flow in a count-min sketch (two register rows indexed by the flow hashes) and keep
+# the flow key of the last packet per cell of the first row; per epoch the registers of every switch are read (one
+# thrift call per register), the stored flow keys are the candidates, their sketch estimate is the minimum of both
+# rows
+#
+# every register is reset directly after it is read: the bytes counted between the read and the reset of a register
+# (one thrift call) are lost, and the rows cover epochs shifted by the calls in between, i.e. the estimate of a flow
+# may miss the bytes of a few milliseconds at the epoch boundaries
+#
+# heavy hitters: flows with at least p4monitor_heavy_hitter_threshold of the bytes of an epoch at a switch, flows are
+# reported once with the maximum estimate of all switches
+
+from time import sleep, time
+
+import numpy as np
+
+from p4monitors.p4monitor import P4Monitor
+from p4monitors.p4flow_store import int_to_ip
+
+from tools.clock import monotonic_ns
+from tools.flow_hash import compute_flow_hashes
+from tools.metrics import REGISTRY
+
+from tools.log.log import get_logger, LogSubsystem
+
+log = get_logger(LogSubsystem.MONITOR)
+
+heavy_hitters_gauge = REGISTRY.gauge('p4monitor_heavy_hitters', 'heavy hitters of the last epoch', ['monitor'])
+sketch_epoch_seconds = REGISTRY.summary('p4monitor_sketch_epoch_seconds', 'time for reading and evaluating the '
+                                                                          'sketches of all switches', ['monitor'])
+
+
+class HeavyHitterMonitor(P4Monitor):
+    P4_SKETCH_ROW_ONE = 'FlowForwardingIngress.sketch_row_one'
+    P4_SKETCH_ROW_TWO = 'FlowForwardingIngress.sketch_row_two'
+    P4_SKETCH_FLOW_ADDRESSES = 'FlowForwardingIngress.sketch_flow_addresses'
+    P4_SKETCH_FLOW_PORTS = 'FlowForwardingIngress.sketch_flow_ports'
+    P4_SKETCH_REGISTERS = [P4_SKETCH_ROW_ONE, P4_SKETCH_ROW_TWO, P4_SKETCH_FLOW_ADDRESSES, P4_SKETCH_FLOW_PORTS]
+
+    def __init__(self, *args, **kwargs):
+        P4Monitor.__init__(self, *args, **kwargs)
+
+        self.epoch = kwargs['p4monitor_heavy_hitter_epoch']
+        self.threshold = kwargs['p4monitor_heavy_hitter_threshold']
+
+        self.heavy_hitters = []
+
+    def run_monitor(self, *args, **kwargs):
+        switches = sorted(self.switches)
+        for switch in switches:
+            register_arrays = self.p4switch_connections_thrift[switch].get_register_arrays()
+            missing_registers = [register for register in self.P4_SKETCH_REGISTERS if register not in register_arrays]
+            if missing_registers:
+                raise HeavyHitterMonitorException('sketch registers {} not found at {} (flow_forwarding P4 program '
+                                                  'required)'.format(', '.join(missing_registers), switch))
+            self._reset_sketch(switch)
+
+        while self.monitor_flag:
+            sleep(self.epoch)
+
+            epoch_start = monotonic_ns()
+            heavy_hitters = dict()  # flow key --> (bytes, switches)
+            for switch in switches:
+                sketch = self._read_and_reset_sketch(switch)
+                for flow_key, flow_bytes in evaluate_sketch(*sketch, threshold=self.threshold):
+                    heavy_hitter = heavy_hitters.setdefault(flow_key, [0, []])
+                    heavy_hitter[0] = max(heavy_hitter[0], flow_bytes)
+                    heavy_hitter[1].append(switch)
+            sketch_epoch_seconds.labels(self.__class__.__name__).observe(monotonic_ns() - epoch_start)
+
+            self.heavy_hitters = sorted(({'src_ip': int_to_ip(flow_key[0]),
+                                          'dst_ip': int_to_ip(flow_key[1]),
+                                          'src_port': flow_key[2],
+                                          'dst_port': flow_key[3],
+                                          'protocol': flow_key[4],
+                                          'bytes': flow_bytes,
+                                          'switches': flow_switches,
+                                          'timestamp': time()}
+                                         for flow_key, (flow_bytes, flow_switches) in heavy_hitters.items()),
+                                        key=lambda x: x['bytes'], reverse=True)
+            heavy_hitters_gauge.labels(self.__class__.__name__).set(len(self.heavy_hitters))
+            for heavy_hitter in self.heavy_hitters:
+                log.info('heavy hitter {src_ip}:{src_port} -> {dst_ip}:{dst_port} ({protocol}): '
+                         '{bytes} bytes'.format(**heavy_hitter))
+
+            self.traffic_generation_event.set()
+
+    def get_heavy_hitters(self):
+        # heavy hitters of the last epoch, descending by bytes
+        return list(self.heavy_hitters)
+
+    def _reset_sketch(self, switch):
+        for register in self.P4_SKETCH_REGISTERS:
+            self.reset_register(switch, register)
+
+    def _read_and_reset_sketch(self, switch):
+        # read and reset back to back per register, bytes are lost only between both calls (see above)
+        sketch = []
+        for register in self.P4_SKETCH_REGISTERS:
+            sketch.append(self.read_register_thrift(switch, register))
+            self.reset_register(switch, register)
+        return sketch
+
+
+def evaluate_sketch(row_one, row_two, flow_addresses, flow_ports, threshold):
+    # (flow key, estimated bytes) of the candidates with at least threshold of the bytes of the sketch
+    epoch_bytes = row_one.sum()
+    candidates = np.flatnonzero((flow_addresses != 0) & (row_one >= threshold * epoch_bytes))
+    if not epoch_bytes or not len(candidates):
+        return []
+
+    src_ips = flow_addresses[candidates] >> np.uint64(32)
+    dst_ips = flow_addresses[candidates] & np.uint64(0xFFFFFFFF)
+    src_ports = flow_ports[candidates] >> np.uint64(24)
+    dst_ports = (flow_ports[candidates] >> np.uint64(8)) & np.uint64(0xFFFF)
+    protocols = flow_ports[candidates] & np.uint64(0xFF)
+
+    flows = []
+    for i, candidate in enumerate(candidates):
+        flow_key = (int(src_ips[i]), int(dst_ips[i]), int(src_ports[i]), int(dst_ports[i]), int(protocols[i]))
+        flow_hash_one, flow_hash_two = compute_flow_hashes(int_to_ip(flow_key[0]), int_to_ip(flow_key[1]),
+                                                           flow_key[2], flow_key[3], flow_key[4])
+        # the stored key is overwritten by every flow of the cell, it is only used if it still hashes to the cell
+        if flow_hash_one != candidate:
+            continue
+        flow_bytes = int(min(row_one[flow_hash_one], row_two[flow_hash_two]))
+        if flow_bytes >= threshold * epoch_bytes:
+            flows.append((flow_key, flow_bytes))
+    return flows
+
+
+class HeavyHitterMonitorException(Exception):
+
+    def __init__(self, message):
+        super(HeavyHitterMonitorException, self).__init__(self.__class__.__name__ + ': ' + message)
@@ -14,24 +14,292 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from p4monitors.p4monitor import P4Monitor
+# INT (in-band network telemetry) collection
+#
+# INT packets carry an IP option (see IPOptionINT/INTData in tools/communication_test/sendrecv_utils.py) with one
+# entry (switch id, egress port, timestamp) per switch hop, the latest hop in front; the sink switches send them to
+# their CPU port where they are collected
+#
+# the receiver thread only extracts the INT stack of a packet (struct), the stacks of an interval are decoded at once
+# (numpy) and aggregated per link (consecutive hops) and per path (first and last hop) in rolling windows of
+# p4monitor_int_window intervals
+#
+# latency_int: mean hop latency of a link (ms) in the window, switch timestamps are taken as one clock (bmv2 switches
+#              of one host, us)
+
+from time import sleep, time
+
+import struct
+import threading
+from collections import deque
+
+import numpy as np
+
+from p4monitors.p4monitor import P4Monitor, PathLinkData
+from p4monitors.p4monitor_cpu import CPUPortConnector
+
+from tools.metrics import REGISTRY
+
+from tools.log.log import get_logger, LogSubsystem
+
+log = get_logger(LogSubsystem.MONITOR)
+
+ETHERNET_HEADER_LENGTH = 14
+IPV4_HEADER_LENGTH = 20
+ETHERTYPE_IPV4 = 0x800
+
+IP_OPTION_END = 0
+IP_OPTION_NOP = 1
+IP_OPTION_INT = 31
+
+# option type, length, count
+INT_OPTION_STRUCTURE = struct.Struct('!BBH')
+# switch id, egress port, timestamp (48 bit)
+INT_HOP_DTYPE = np.dtype([('switch_id', 'u1'), ('egress_port', 'u1'),
+                          ('timestamp_high', '>u2'), ('timestamp_low', '>u4')])
+INT_TIMESTAMP_SCALE = 10 ** 3  # us -> ms
+INT_SWITCH_ID_MAX = 2 ** 8 - 1
+INT_PORT_MAX = 2 ** 8 - 1
+
+int_packets_total = REGISTRY.counter('p4monitor_int_packets_total', 'collected and dropped INT packets',
+                                     ['monitor', 'result'])
+int_hops_total = REGISTRY.counter('p4monitor_int_hops_total', 'decoded INT hop entries', ['monitor'])
 
 
 class INTMonitor(P4Monitor):
+    MAX_INTERVAL_HOPS = 2 ** 20  # hop entries buffered per interval, further INT packets are dropped
 
     def __init__(self, *args, **kwargs):
         P4Monitor.__init__(self, *args, **kwargs)
 
-        raise NotImplementedYetException('INTMonitor with P4-based INT monitoring not implemented yet')
+        self.int_interval = kwargs['p4monitor_int_interval']
+        self.int_window = kwargs['p4monitor_int_window']
+
+        self.links = []  # (sw1, sw2)
+        self.link_lookup = None  # (switch id, egress port) --> link index
+
+        self.cpu_port_connector = None
+
+        self.samples_lock = threading.Lock()
+        self.int_stacks = []
+        self.int_stack_counts = []
+        self.int_hops = 0
+
+        # rolling window per link (interval x link)
+        self.window_position = 0
+        self.window_counts = None
+        self.window_sums = None
+        self.window_maxima = None
+        # rolling window per path, (ingress switch, egress switch) --> (count, sum, max) per interval
+        self.path_window = deque(maxlen=self.int_window)
+
+        self.path_latencies = dict()
 
     def run_monitor(self, *args, **kwargs):
-        pass
+        switches = sorted(self.switches)
+
+        # the INT entries carry 8 bit switch ids and egress ports, links of other switches are not collected
+        switch_ids = dict((switch, int(self.get_switch(switch)['device_id'])) for switch in switches)
+        switches_skipped = sorted(switch for switch, switch_id in switch_ids.items() if switch_id > INT_SWITCH_ID_MAX)
+        if switches_skipped:
+            log.warning('INT of switches {} not collected, their device ids do not fit the INT switch id '
+                        '(max {})'.format(', '.join(switches_skipped), INT_SWITCH_ID_MAX))
+
+        self.links = []
+        link_ports = []
+        for edge in sorted(self.get_all_switch_edges(), key=lambda x: x[:2]):
+            port = self.map_edge_to_switch_port(edge[0], edge[1])
+            if switch_ids[edge[0]] <= INT_SWITCH_ID_MAX and port <= INT_PORT_MAX:
+                self.links.append((edge[0], edge[1]))
+                link_ports.append(port)
+        self.link_lookup = np.full((max([switch_ids[sw1] for sw1, _ in self.links] + [0]) + 1,
+                                    max(link_ports + [0]) + 1), -1, dtype=np.int64)
+        for i, ((sw1, _), port) in enumerate(zip(self.links, link_ports)):
+            self.link_lookup[switch_ids[sw1], port] = i
+
+        self.window_counts = np.zeros((self.int_window, len(self.links)))
+        self.window_sums = np.zeros((self.int_window, len(self.links)))
+        self.window_maxima = np.zeros((self.int_window, len(self.links)))
+
+        # switch ids written into the INT entries (programs with INT support)
+        rule_connector = self.p4controller if self.p4controller else self
+        if rule_connector is self:
+            for p4switch_connection in self.p4switch_connections_gRPC.values():
+                p4switch_connection.master_arbitration_update()
+        try:
+            self._configure_switch_id_table(rule_connector, switches=[switch for switch in switches
+                                                                      if switch not in switches_skipped])
+        except Exception as ex:
+            log.warning('switch ids for INT not configured, INT entries have to carry the device ids '
+                        '({})'.format(ex))
+
+        self.cpu_port_connector = CPUPortConnector(switches, self._receive_int_packet)
+        self.cpu_port_connector.start()
+        log.info('collecting INT of {} links at the CPU ports of {} switches'.format(len(self.links), len(switches)))
+
+        sleep(self.int_interval)
+        while self.monitor_flag:
+            interval_start = time()
+
+            self._evaluate_interval()
+
+            self.traffic_generation_event.set()
+
+            sleep(max(self.int_interval - (time() - interval_start), 0))
+
+    def stop_monitor(self):
+        super(INTMonitor, self).stop_monitor()
+        if self.cpu_port_connector:
+            self.cpu_port_connector.stop()
+
+    def get_path_latencies(self):
+        # (ingress switch, egress switch) --> count, mean and max latency (ms) in the window
+        return dict(self.path_latencies)
+
+    def _receive_int_packet(self, switch, frame, rx_timestamp):
+        int_stack = extract_int_stack(frame)
+        if int_stack is None:
+            return
+        count, stack = int_stack
+        with self.samples_lock:
+            if self.int_hops + count > self.MAX_INTERVAL_HOPS:
+                int_packets_total.labels(self.__class__.__name__, 'dropped').inc()
+                return
+            self.int_stacks.append(stack)
+            self.int_stack_counts.append(count)
+            self.int_hops += count
+        int_packets_total.labels(self.__class__.__name__, 'collected').inc()
+
+    def _evaluate_interval(self):
+        with self.samples_lock:
+            int_stacks, self.int_stacks = self.int_stacks, []
+            int_stack_counts, self.int_stack_counts = self.int_stack_counts, []
+            self.int_hops = 0
+
+        link_counts, link_sums, link_maxima, path_aggregates = aggregate_int_stacks(int_stacks, int_stack_counts,
+                                                                                    self.link_lookup, len(self.links))
+        int_hops_total.labels(self.__class__.__name__).inc(int(sum(int_stack_counts)))
+
+        self.window_position = (self.window_position + 1) % self.int_window
+        self.window_counts[self.window_position] = link_counts
+        self.window_sums[self.window_position] = link_sums
+        self.window_maxima[self.window_position] = link_maxima
+        self.path_window.append(path_aggregates)
+
+        window_counts = self.window_counts.sum(axis=0)
+        window_means = self.window_sums.sum(axis=0) / np.maximum(window_counts, 1) / INT_TIMESTAMP_SCALE
+
+        timestamp = int(round(time())) - self.timestamp_start
+        for i in np.flatnonzero(window_counts):
+            sw1, sw2 = self.links[i]
+            self.update_link_property(sw1=sw1, sw2=sw2,
+                                      property_key=PathLinkData.LATENCY_INT,
+                                      property_value=float(window_means[i]),
+                                      property_history=True,
+                                      property_value_timestamp=timestamp)
+
+        path_latencies = dict()
+        for path_aggregates in self.path_window:
+            for path, (count, latency_sum, latency_max) in path_aggregates.items():
+                aggregate = path_latencies.setdefault(path, [0, 0.0, 0.0])
+                aggregate[0] += count
+                aggregate[1] += latency_sum
+                aggregate[2] = max(aggregate[2], latency_max)
+        self.path_latencies = dict(((self.get_switch_by_id(ingress_id), self.get_switch_by_id(egress_id)),
+                                    {'count': count,
+                                     'mean': latency_sum / count / INT_TIMESTAMP_SCALE,
+                                     'max': latency_max / INT_TIMESTAMP_SCALE})
+                                   for (ingress_id, egress_id), (count, latency_sum, latency_max)
+                                   in path_latencies.items())
+
+        log.debug('INT interval: {} packets, {} hops, {} links, {} paths'.format(len(int_stacks),
+                                                                                 sum(int_stack_counts),
+                                                                                 int(np.count_nonzero(link_counts)),
+                                                                                 len(path_aggregates)))
+
+
+def extract_int_stack(frame):
+    # (hop count, hop entries) of the INT option of an IPv4 frame or None
+    if len(frame) < ETHERNET_HEADER_LENGTH + IPV4_HEADER_LENGTH:
+        return None
+    ethertype, = struct.unpack_from('!H', frame, 12)
+    if ethertype != ETHERTYPE_IPV4:
+        return None
+    version_ihl, = struct.unpack_from('!B', frame, ETHERNET_HEADER_LENGTH)
+    options_end = ETHERNET_HEADER_LENGTH + (version_ihl & 0x0F) * 4
+    offset = ETHERNET_HEADER_LENGTH + IPV4_HEADER_LENGTH
+    if options_end > len(frame):
+        return None
+    while offset < options_end:
+        option_type, = struct.unpack_from('!B', frame, offset)
+        if option_type == IP_OPTION_END:
+            return None
+        if option_type == IP_OPTION_NOP:
+            offset += 1
+            continue
+        if offset + INT_OPTION_STRUCTURE.size > options_end:
+            return None
+        if option_type == IP_OPTION_INT:
+            # the option length is not reliable (see IPOptionINT), the count is
+            _, _, count = INT_OPTION_STRUCTURE.unpack_from(frame, offset)
+            stack_start = offset + INT_OPTION_STRUCTURE.size
+            stack_end = stack_start + count * INT_HOP_DTYPE.itemsize
+            if count == 0 or stack_end > options_end:
+                return None
+            return count, bytes(frame[stack_start:stack_end])
+        option_length, = struct.unpack_from('!B', frame, offset + 1)
+        if option_length < 2:
+            return None
+        offset += option_length
+    return None
+
+
+def aggregate_int_stacks(int_stacks, int_stack_counts, link_lookup, link_number):
+    # count, sum and max of the hop latencies per link (us) as well as (count, sum, max) of the path latencies per
+    # (ingress switch id, egress switch id)
+    link_counts = np.zeros(link_number)
+    link_sums = np.zeros(link_number)
+    link_maxima = np.zeros(link_number)
+    path_aggregates = dict()
+    if not int_stacks:
+        return link_counts, link_sums, link_maxima, path_aggregates
 
-    def _handle_cpu_packet(self, cpu_packet):
-        pass
+    hops = np.frombuffer(b''.join(int_stacks), dtype=INT_HOP_DTYPE)
+    counts = np.array(int_stack_counts, dtype=np.int64)
+    timestamps = (hops['timestamp_high'].astype(np.int64) << 32) | hops['timestamp_low'].astype(np.int64)
 
+    # latest hop in front: entry i + 1 of a stack is the previous switch of entry i
+    packet_ids = np.repeat(np.arange(len(counts)), counts)
+    same_packet = np.flatnonzero(packet_ids[:-1] == packet_ids[1:])
+    previous_hops = same_packet + 1
+    hop_switch_ids = hops['switch_id'][previous_hops].astype(np.int64)
+    hop_ports = hops['egress_port'][previous_hops].astype(np.int64)
+    known = (hop_switch_ids < link_lookup.shape[0]) & (hop_ports < link_lookup.shape[1])
+    link_ids = np.full(len(previous_hops), -1, dtype=np.int64)
+    link_ids[known] = link_lookup[hop_switch_ids[known], hop_ports[known]]
+    hop_latencies = timestamps[same_packet] - timestamps[previous_hops]
+    valid = (link_ids >= 0) & (hop_latencies >= 0)
+    link_ids = link_ids[valid]
+    hop_latencies = hop_latencies[valid]
+    link_counts += np.bincount(link_ids, minlength=link_number)
+    link_sums += np.bincount(link_ids, weights=hop_latencies, minlength=link_number)
+    np.maximum.at(link_maxima, link_ids, hop_latencies)
 
-class NotImplementedYetException(Exception):
+    stack_ends = np.cumsum(counts)
+    stack_starts = stack_ends - counts
+    paths = np.flatnonzero(counts > 1)
+    if len(paths):
+        ingress_hops = stack_ends[paths] - 1
+        egress_hops = stack_starts[paths]
+        path_keys = hops['switch_id'][ingress_hops].astype(np.int64) * 256 + hops['switch_id'][egress_hops]
+        path_latencies = timestamps[egress_hops] - timestamps[ingress_hops]
+        path_keys, path_latencies = path_keys[path_latencies >= 0], path_latencies[path_latencies >= 0]
+        unique_keys, path_ids = np.unique(path_keys, return_inverse=True)
+        path_counts = np.bincount(path_ids)
+        path_sums = np.bincount(path_ids, weights=path_latencies)
+        path_maxima = np.zeros(len(unique_keys))
+        np.maximum.at(path_maxima, path_ids, path_latencies)
+        for key, count, latency_sum, latency_max in zip(unique_keys, path_counts, path_sums, path_maxima):
+            path_aggregates[(int(key) // 256, int(key) % 256)] = (int(count), float(latency_sum), float(latency_max))
 
-    def __init__(self, message):
-        super(NotImplementedYetException, self).__init__(self.__class__.__name__ + ': ' + message)
\ No newline at end of file
+    return link_counts, link_sums, link_maxima, path_aggregates
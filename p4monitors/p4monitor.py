@@ -20,7 +20,7 @@ import networkx as nx
 
 from p4controllers.p4connector import P4Connector
 
-from tools.log.log import log
+from tools.log.log import get_logger, LogSubsystem
 
 import time
 
@@ -34,6 +34,8 @@ from p4topos.p4topo_traffic import TrafficManager
 
 from enum import Enum
 
+log = get_logger(LogSubsystem.MONITOR)
+
 
 class DataRates(Enum):
     KILOBIT = 10 ** 3
@@ -55,6 +57,7 @@ class PathLinkData(Enum):
     LOAD_PORT_COUNTER = 'load_port_counter'
     LOAD_PROBING = 'load_probing'
     LATENCY_PROBING = 'latency_probing'
+    LATENCY_INT = 'latency_int'
 
 
 class PathLinkCriteriaMode(Enum):
@@ -65,6 +68,7 @@ class PathLinkCriteriaMode(Enum):
 class DataSources(Enum):
     PORT_COUTER = 'port_counter'
     PROBING = 'probing'
+    INT = 'int'
 
 
 class P4Monitor(P4Connector):
@@ -88,6 +92,8 @@ class P4Monitor(P4Connector):
         self.p4controller = None
 
         self.topology = nx.DiGraph()
+        # incremented with every topology change, see p4monitor_query.py
+        self.topology_version = 0
 
         self.switches = list()
         self.hosts = list()
@@ -154,15 +160,21 @@ class P4Monitor(P4Connector):
                              'weight_history': OrderedDict(),
                              'load_port_counter': 0.0,
                              'load_port_counter_history': OrderedDict(),
+                             'load_port_counter_updated': 0.0,
+                             'load_port_counter_interval': 0.0,
                              'load_probing': 0.0,
                              'load_probing_history': OrderedDict(),
                              'latency_probing': 0.0,
-                             'latency_probing_history': OrderedDict()}
+                             'latency_probing_history': OrderedDict(),
+                             'latency_int': 0.0,
+                             'latency_int_history': OrderedDict()}
                     props.update({x: port[x] for x in ['bw', 'delay', 'loss']})
                     self.topology.add_edge(sw, peer, **props)
                     if self.topology.nodes[peer]['type'] == 'host':
                         self.topology.add_edge(peer, sw, **props)
 
+        self.topology_version += 1
+
         # _draw_topology_graph(self.topology)
 
     def get_topology_graph(self):
@@ -174,6 +186,7 @@ class P4Monitor(P4Connector):
     def add_node(self, node):
         node_name = node['name']
         self.topology.add_node(node_name, **node)
+        self.topology_version += 1
         if node['type'] == 'switch':
             self.switches.append(node_name)
         if node['type'] == 'host':
@@ -193,10 +206,12 @@ class P4Monitor(P4Connector):
 
     def set_node_property(self, node, node_property, value):
         self.topology.nodes[node][node_property] = value
+        self.topology_version += 1
 
     def set_node_properties(self, node, node_properties):
         for node_property, value in node_properties.items():
             self.topology.nodes[node][node_property] = value
+        self.topology_version += 1
 
     def get_switch(self, switch):
         return self.get_node(switch)
@@ -242,6 +257,7 @@ class P4Monitor(P4Connector):
 
     def add_edge(self, node1, node2, properties):
         self.topology.add_edge(node1, node2, **properties)
+        self.topology_version += 1
 
     def get_all_edges(self):
         return self.topology.edges.data()
@@ -268,10 +284,12 @@ class P4Monitor(P4Connector):
 
     def set_edge_property(self, node1, node2, edge_property, value):
         self.topology[node1][node2][edge_property] = value
+        self.topology_version += 1
 
     def set_edge_properties(self, node1, node2, edge_properties):
         for edge_property, value in edge_properties.items():
             self.topology[node1][node2][edge_property] = value
+        self.topology_version += 1
 
     def update_edge_weight(self, node1, node2,
                            weight_value, weight_key=None,
@@ -284,6 +302,8 @@ class P4Monitor(P4Connector):
         if weight_history:
             self.topology.edges[node1, node2]['weight_history'][weight_timestamp] = weight_value
 
+        self.topology_version += 1
+
     def get_edge_weight(self, node1, node2, weight_key=None, weight_history=False):
         if weight_history:
             return self.topology.edges[node1, node2]['weight_history']
@@ -327,6 +347,7 @@ class P4Monitor(P4Connector):
         if property_history:
             history = '{}_history'.format(property_key)
             self.topology.edges[sw1, sw2][history][property_value_timestamp] = property_value
+            self.topology_version += 1
 
     # get_edge_property(self, node1, node2, edge_property):
     def get_link_property(self, sw1, sw2,
@@ -515,12 +536,15 @@ class P4Monitor(P4Connector):
     def map_switch_port_to_neighbor_node(self, node, port):
         return self.topology.nodes[node]['ports']['data_links'][port]['peer']
 
-    def _configure_switch_id_table(self):
+    def _configure_switch_id_table(self, rule_connector=None, switches=None):
+        rule_connector = rule_connector if rule_connector else self
         for p4switch, p4switch_config in self.get_switches().items():
+            if switches is not None and p4switch not in switches:
+                continue
             switch_id_rule = self.P4_SWITCH_ID_RULE_PATTERN.copy()
             switch_id_rule['action_params'][self.P4_SWITCH_ID_TABLE_ACTION_PARAM] = int(p4switch_config['device_id'])
 
-            self.insert_table_entry(p4switch, switch_id_rule)
+            rule_connector.insert_table_entry(p4switch, switch_id_rule)
 
     def init_csv_output(self, exp_id, data_source, exp_iter):
         output_dir = os.path.join('p4monitors', 'results')
@@ -547,26 +571,3 @@ class P4Monitor(P4Connector):
     def write_csv_output(self, switch_link, timestamp, load_percentage):
         self.csv_writer[switch_link].writerow([timestamp, load_percentage])
         self.output_files[switch_link].flush()
-
-########################################################################################################################
-#
-# from flask import Flask, request
-# import json
-#
-# topo_register_app = Flask(__name__)
-#
-#
-# @topo_register_app.route('/node', methods=['POST'])
-# def register_node():
-#     node = json.loads(request.get_json())['node']
-#     print(node)
-#     return '', 200
-#
-#
-# @topo_register_app.errorhandler(404)
-# def page_not_found():
-#     return "<h1>404</h1><p>BOOM</p>", 404
-#
-#
-# if __name__ == '__main__':
-#     topo_register_app.run(host='0.0.0.0', port=4221, debug=True)
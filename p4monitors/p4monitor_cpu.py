@@ -0,0 +1,108 @@
+# Copyright 2020-present Christoph Hardegen
+#                        (christoph.hardegen@cs.hs-fulda.de)
+#                        Fulda University of Applied Sciences
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# packet-in/packet-out on the CPU ports of the switches for monitors (probing, INT), without scapy: one raw packet
+# socket per CPU port, received frames are handed over as bytes (see the decoders of the monitors)
+
+import errno
+import select
+import socket
+import threading
+import traceback
+
+from tools.clock import monotonic_ns
+
+from tools.log.log import get_logger, LogSubsystem
+
+log = get_logger(LogSubsystem.MONITOR)
+
+ETH_P_ALL = 0x0003
+PACKET_OUTGOING = 4  # see linux/if_packet.h
+
+RECEIVE_BUFFER_SIZE = 2 ** 21
+RECEIVE_BATCH_SIZE = 256
+FRAME_SIZE_MAX = 2048
+SELECT_TIMEOUT = 0.5  # s
+
+
+class CPUPortConnector(object):
+    CPU_PORT_PATTERN = 'cpu-{}'
+
+    def __init__(self, switches, handler):
+        # handler(switch, frame, rx_timestamp) is called from the receiver thread
+        self.handler = handler
+
+        self.sockets = dict()
+        self.switches_by_fileno = dict()
+        for switch in switches:
+            cpu_socket = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+            cpu_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+            cpu_socket.bind((self.CPU_PORT_PATTERN.format(switch), 0))
+            cpu_socket.setblocking(False)
+            self.sockets[switch] = cpu_socket
+            self.switches_by_fileno[cpu_socket.fileno()] = switch
+
+        self.receive_flag = False
+        self.receiver = None
+
+    def start(self):
+        self.receive_flag = True
+        self.receiver = threading.Thread(target=self._receive)
+        self.receiver.daemon = True
+        self.receiver.start()
+
+    def stop(self):
+        self.receive_flag = False
+        if self.receiver:
+            self.receiver.join()
+        for cpu_socket in self.sockets.values():
+            cpu_socket.close()
+
+    def send(self, switch, frames):
+        # packet-out of a batch of frames via the CPU port of a switch
+        cpu_socket = self.sockets[switch]
+        for frame in frames:
+            try:
+                cpu_socket.send(frame)
+            except socket.error as error:
+                if error.errno not in [errno.EAGAIN, errno.ENOBUFS]:
+                    raise
+                log.warning('dropped packet-out on {} ({})'.format(self.CPU_PORT_PATTERN.format(switch), error))
+
+    def _receive(self):
+        sockets = list(self.sockets.values())
+        while self.receive_flag:
+            try:
+                readable, _, _ = select.select(sockets, [], [], SELECT_TIMEOUT)
+            except (select.error, ValueError):
+                break
+            for cpu_socket in readable:
+                switch = self.switches_by_fileno[cpu_socket.fileno()]
+                # drain up to a batch per socket and round, the timestamp is taken per frame
+                for _ in range(RECEIVE_BATCH_SIZE):
+                    try:
+                        frame, address = cpu_socket.recvfrom(FRAME_SIZE_MAX)
+                    except socket.error as error:
+                        if error.errno in [errno.EAGAIN, errno.EWOULDBLOCK]:
+                            break
+                        raise
+                    if address[2] == PACKET_OUTGOING:
+                        continue
+                    try:
+                        self.handler(switch, frame, monotonic_ns())
+                    except Exception:
+                        log.error('handling packet-in of {} failed'.format(switch))
+                        log.error(traceback.format_exc())
@@ -0,0 +1,367 @@
+# Copyright 2020-present Christoph Hardegen
+#                        (christoph.hardegen@cs.hs-fulda.de)
+#                        Fulda University of Applied Sciences
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# read-only HTTP/JSON query service on top of the P4Monitor topology, e.g.
+#
+# python p4runner.py ... --p4monitor_query_port 4221
+#
+# GET /snapshot                                         version and age of the served snapshot
+# GET /nodes[?type=switch|host]                         nodes
+# GET /nodes/<node>                                     node
+# GET /edges[?switches_only=true]                       edges incl. current link metrics
+# GET /edges/<node1>/<node2>                            edge
+# GET /edges/<node1>/<node2>/history?property=<link property>[&since=<ts>][&until=<ts>][&last=<n>]
+# GET /paths/shortest?src=<node>&dst=<node>[&weight=hops|weight|<link property>][&all=true]
+# GET /paths/least_loaded?src=<node>&dst=<node>[&property=<link property>]
+#
+# requests are answered from immutable snapshots of the topology; a new snapshot is built (by a request thread, not
+# the monitor) once the monitor reports a changed topology version and the current snapshot is older than the
+# refresh interval, computed paths are cached per snapshot
+
+import json
+import threading
+import time
+import copy
+import heapq
+from collections import deque
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+
+import networkx as nx
+
+from p4monitors.p4monitor import PathLinkData
+
+from tools.log.log import get_logger, LogSubsystem
+
+log = get_logger(LogSubsystem.MONITOR)
+
+QUERY_ADDRESS = '127.0.0.1'
+SNAPSHOT_REFRESH_INTERVAL = 1.0  # s
+SNAPSHOT_COPY_ATTEMPTS = 10
+PATH_CACHE_SIZE = 4096
+
+HOPS_WEIGHT = 'hops'
+EDGE_METRICS = ['port_id', 'bw', 'delay', 'loss', 'capacity', 'weight'] + [data.value for data in PathLinkData] + \
+               ['load_port_counter_updated', 'load_port_counter_interval']
+
+
+class TopologySnapshot(object):
+
+    def __init__(self, p4monitor):
+        self.version = p4monitor.topology_version
+        self.timestamp = time.time()
+        self.timestamp_start = p4monitor.timestamp_start
+
+        # the monitor keeps writing while the snapshot is taken (e.g. appending to link histories), so the copy is
+        # retried if a container changes during the iteration
+        for attempt in range(SNAPSHOT_COPY_ATTEMPTS):
+            try:
+                self.graph = self._copy_graph(p4monitor.get_topology_graph())
+                break
+            except RuntimeError:
+                if attempt == SNAPSHOT_COPY_ATTEMPTS - 1:
+                    raise
+
+        self.switches = [node for node, data in self.graph.nodes(data=True) if data.get('type') == 'switch']
+        self.hosts = [node for node, data in self.graph.nodes(data=True) if data.get('type') == 'host']
+
+        self.path_cache = dict()
+        self.path_cache_lock = threading.Lock()
+
+    @staticmethod
+    def _copy_graph(topology):
+        graph = nx.DiGraph()
+        for node, data in list(topology.nodes(data=True)):
+            graph.add_node(node, **copy.deepcopy(data))
+        for node1, node2, data in list(topology.edges(data=True)):
+            edge_data = dict()
+            for key, value in list(data.items()):
+                # histories are copied as (timestamp, value) lists
+                edge_data[key] = list(value.items()) if key.endswith('_history') else value
+            graph.add_edge(node1, node2, **edge_data)
+        return graph
+
+    def get_info(self):
+        return {'version': self.version,
+                'timestamp': self.timestamp,
+                'age': time.time() - self.timestamp,
+                'timestamp_start': self.timestamp_start,
+                'switches': len(self.switches),
+                'hosts': len(self.hosts),
+                'edges': self.graph.number_of_edges()}
+
+    def get_nodes(self, node_type=None):
+        return [dict(data, name=node) for node, data in self.graph.nodes(data=True)
+                if node_type is None or data.get('type') == node_type]
+
+    def get_node(self, node):
+        if node not in self.graph:
+            raise P4MonitorQueryException('unknown node {}'.format(node), status=404)
+        return dict(self.graph.nodes[node], name=node)
+
+    def _get_edge_data(self, node1, node2, data):
+        edge = {'node1': node1, 'node2': node2, 'name': data.get('name')}
+        edge.update((key, data[key]) for key in EDGE_METRICS if key in data)
+        if data.get('load_port_counter_updated'):
+            edge['load_port_counter_age'] = time.time() - data['load_port_counter_updated']
+        return edge
+
+    def get_edges(self, switches_only=False):
+        return [self._get_edge_data(node1, node2, data) for node1, node2, data in self.graph.edges(data=True)
+                if not switches_only or (node1 in self.switches and node2 in self.switches)]
+
+    def get_edge(self, node1, node2):
+        if not self.graph.has_edge(node1, node2):
+            raise P4MonitorQueryException('unknown edge {}-{}'.format(node1, node2), status=404)
+        return self._get_edge_data(node1, node2, self.graph.edges[node1, node2])
+
+    def get_edge_history(self, node1, node2, link_property, since=None, until=None, last=None):
+        if not self.graph.has_edge(node1, node2):
+            raise P4MonitorQueryException('unknown edge {}-{}'.format(node1, node2), status=404)
+        history = self.graph.edges[node1, node2].get('{}_history'.format(get_link_property(link_property).value), [])
+        history = [(timestamp, value) for timestamp, value in history
+                   if (since is None or timestamp >= since) and (until is None or timestamp <= until)]
+        if last is not None:
+            history = history[-last:] if last > 0 else []
+        return history
+
+    def _get_cached_path(self, key, function):
+        with self.path_cache_lock:
+            if key in self.path_cache:
+                return self.path_cache[key]
+        path = function()
+        with self.path_cache_lock:
+            if len(self.path_cache) >= PATH_CACHE_SIZE:
+                self.path_cache.clear()
+            self.path_cache[key] = path
+        return path
+
+    def _check_nodes(self, node1, node2):
+        for node in [node1, node2]:
+            if node not in self.graph:
+                raise P4MonitorQueryException('unknown node {}'.format(node), status=404)
+
+    def get_shortest_path(self, node1, node2, weight=HOPS_WEIGHT, all_paths=False):
+        self._check_nodes(node1, node2)
+        if weight == HOPS_WEIGHT:
+            weight_key = None
+        elif weight == 'weight':
+            weight_key = weight
+        else:
+            weight_key = get_link_property(weight).value
+
+        def _compute():
+            try:
+                if all_paths:
+                    return list(nx.all_shortest_paths(self.graph, node1, node2, weight=weight_key, method='dijkstra'))
+                return nx.shortest_path(self.graph, node1, node2, weight=weight_key, method='dijkstra')
+            except nx.NetworkXNoPath:
+                return None
+
+        return self._get_cached_path(('shortest', node1, node2, weight, all_paths), _compute)
+
+    def get_path_less_loaded(self, node1, node2, link_property=PathLinkData.LOAD_PORT_COUNTER.value):
+        # see P4Monitor.get_path_less_loaded (max. link load of the switch links of a path)
+        self._check_nodes(node1, node2)
+        link_property = get_link_property(link_property)
+
+        def _compute():
+            return self._get_path_minimax(node1, node2, link_property.value)
+
+        return self._get_cached_path(('least_loaded', node1, node2, link_property.value), _compute)
+
+    def _get_path_minimax(self, node1, node2, criteria):
+        # bottleneck (minimax) dijkstra instead of enumerating all simple paths, then the path with the fewest hops
+        # among the links within the bottleneck (breadth-first search); as in P4Monitor.get_path_less_loaded only
+        # links between inner nodes count (not the links of node1 and node2)
+        def _get_link_criteria(node, neighbor, data):
+            if node == node1 or neighbor == node2:
+                return float('-inf')
+            return float(data[criteria])
+
+        bottlenecks = {node1: float('-inf')}
+        heap = [(float('-inf'), node1)]
+        visited = set()
+        while heap:
+            path_criteria, node = heapq.heappop(heap)
+            if node in visited:
+                continue
+            visited.add(node)
+            if node == node2:
+                break
+            for neighbor, data in self.graph.adj[node].items():
+                if neighbor in visited:
+                    continue
+                bottleneck = max(path_criteria, _get_link_criteria(node, neighbor, data))
+                if neighbor not in bottlenecks or bottleneck < bottlenecks[neighbor]:
+                    bottlenecks[neighbor] = bottleneck
+                    heapq.heappush(heap, (bottleneck, neighbor))
+
+        if node2 not in visited:
+            return {'path': None, 'load': None}
+        path_criteria = bottlenecks[node2]
+
+        predecessors = {node1: None}
+        queue = deque([node1])
+        while node2 not in predecessors:
+            node = queue.popleft()
+            for neighbor, data in self.graph.adj[node].items():
+                if neighbor not in predecessors and _get_link_criteria(node, neighbor, data) <= path_criteria:
+                    predecessors[neighbor] = node
+                    queue.append(neighbor)
+
+        path = [node2]
+        while predecessors[path[-1]] is not None:
+            path.append(predecessors[path[-1]])
+        return {'path': path[::-1], 'load': path_criteria if path_criteria != float('-inf') else None}
+
+def get_link_property(link_property):
+    try:
+        return PathLinkData(link_property)
+    except ValueError:
+        raise P4MonitorQueryException('unknown link property {} (supported: {})'.format(
+            link_property, ', '.join(data.value for data in PathLinkData)), status=400)
+
+
+class P4MonitorQueryRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = [part for part in url.path.split('/') if part]
+        params = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+        try:
+            snapshot = self.server.p4monitor_query.get_snapshot()
+            self._send_json(200, self._route(snapshot, path, params))
+        except P4MonitorQueryException as ex:
+            self._send_json(ex.status, {'error': ex.message})
+        except Exception as ex:
+            log.error('p4monitor query failed ({}): {}'.format(self.path, ex))
+            self._send_json(500, {'error': str(ex)})
+
+    @staticmethod
+    def _route(snapshot, path, params):
+        if path == ['snapshot']:
+            return snapshot.get_info()
+        if path == ['nodes']:
+            return snapshot.get_nodes(node_type=params.get('type', None))
+        if len(path) == 2 and path[0] == 'nodes':
+            return snapshot.get_node(path[1])
+        if path == ['edges']:
+            return snapshot.get_edges(switches_only=get_bool_param(params, 'switches_only'))
+        if len(path) == 3 and path[0] == 'edges':
+            return snapshot.get_edge(path[1], path[2])
+        if len(path) == 4 and path[0] == 'edges' and path[3] == 'history':
+            return snapshot.get_edge_history(path[1], path[2],
+                                             link_property=get_param(params, 'property'),
+                                             since=get_number_param(params, 'since'),
+                                             until=get_number_param(params, 'until'),
+                                             last=get_number_param(params, 'last', int))
+        if path == ['paths', 'shortest']:
+            return snapshot.get_shortest_path(get_param(params, 'src'), get_param(params, 'dst'),
+                                              weight=params.get('weight', HOPS_WEIGHT),
+                                              all_paths=get_bool_param(params, 'all'))
+        if path == ['paths', 'least_loaded']:
+            return snapshot.get_path_less_loaded(get_param(params, 'src'), get_param(params, 'dst'),
+                                                 link_property=params.get('property',
+                                                                          PathLinkData.LOAD_PORT_COUNTER.value))
+        raise P4MonitorQueryException('unknown resource /{}'.format('/'.join(path)), status=404)
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug('p4monitor query: ' + format % args)
+
+
+def get_param(params, key):
+    if key not in params:
+        raise P4MonitorQueryException('missing parameter {}'.format(key), status=400)
+    return params[key]
+
+
+def get_bool_param(params, key):
+    return params.get(key, 'false').lower() in ['true', '1', 'yes']
+
+
+def get_number_param(params, key, number_type=float):
+    if key not in params:
+        return None
+    try:
+        return number_type(params[key])
+    except ValueError:
+        raise P4MonitorQueryException('parameter {} is not a number ({})'.format(key, params[key]), status=400)
+
+
+class P4MonitorQueryHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class P4MonitorQueryServer(threading.Thread):
+
+    def __init__(self, p4monitor, port, address=QUERY_ADDRESS, refresh_interval=SNAPSHOT_REFRESH_INTERVAL):
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+        self.p4monitor = p4monitor
+        self.refresh_interval = refresh_interval
+
+        self.snapshot = None
+        self.snapshot_lock = threading.Lock()
+
+        self.server = P4MonitorQueryHTTPServer((address, port), P4MonitorQueryRequestHandler)
+        self.server.p4monitor_query = self
+
+    def get_snapshot(self):
+        snapshot = self.snapshot
+        if snapshot is not None and (snapshot.version == self.p4monitor.topology_version or
+                                     time.time() - snapshot.timestamp < self.refresh_interval):
+            return snapshot
+        with self.snapshot_lock:
+            # another request thread may have refreshed the snapshot in the meantime
+            snapshot = self.snapshot
+            if snapshot is None or (snapshot.version != self.p4monitor.topology_version and
+                                    time.time() - snapshot.timestamp >= self.refresh_interval):
+                snapshot = TopologySnapshot(self.p4monitor)
+                self.snapshot = snapshot
+        return snapshot
+
+    def run(self):
+        log.info('serving p4monitor queries on http://{}:{}'.format(*self.server.server_address[:2]))
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class P4MonitorQueryException(Exception):
+
+    def __init__(self, message, status=400):
+        super(P4MonitorQueryException, self).__init__(self.__class__.__name__ + ': ' + message)
+        self.message = message
+        self.status = status
@@ -0,0 +1,137 @@
+# Copyright 2020-present Christoph Hardegen
+#                        (christoph.hardegen@cs.hs-fulda.de)
+#                        Fulda University of Applied Sciences
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# adaptive polling of links with a global read budget
+#
+# every link has a polling interval between min_interval and max_interval: busy links (high utilization or high
+# variation of the utilization, both as exponentially weighted moving averages) are polled at min_interval, idle
+# links at max_interval; if the intervals require more reads per second than the budget, all intervals are stretched
+# by the same factor
+#
+# per tick (min_interval) at most budget * tick reads are performed: the due links are polled in the order of their
+# staleness (time since the last poll / interval), deferred links are the first ones of the next tick so that idle
+# links are rotated through as well; links are (switch, neighbor) tuples, reads per switch (e.g. one wildcard read of
+# flow counters) are counted once per tick for every switch with a polled link
+#
+# the first poll of a link is only the baseline of its counters (utilization None), its utilization is known from
+# the second poll on
+
+import numpy as np
+
+
+class PollingScheduler(object):
+    UTILIZATION_HIGH = 0.5  # utilization for polling at min_interval
+    VARIATION_HIGH = 0.1  # std. deviation of the utilization for polling at min_interval
+    SMOOTHING = 0.3  # weight of the last utilization in the moving averages
+    MIN_TICK = 1.0  # min_interval (tick) below is clamped, 0 would poll without pause
+
+    def __init__(self, links, reads_per_link, min_interval, max_interval, read_budget=0, start=0.0,
+                 reads_per_switch=0):
+        self.links = list(links)
+        self.link_index = dict((link, i) for i, link in enumerate(self.links))
+        self.reads_per_link = reads_per_link
+        self.reads_per_switch = reads_per_switch
+        switches = sorted(set(link[0] for link in self.links))
+        switch_index = dict((switch, i) for i, switch in enumerate(switches))
+        self.link_switches = np.array([switch_index[link[0]] for link in self.links], dtype=np.int64)
+        self.switch_number = len(switches)
+        self.min_interval = max(float(min_interval), self.MIN_TICK)
+        self.max_interval = max(float(max_interval), self.min_interval)
+        self.read_budget = read_budget  # reads per second, 0: unlimited
+
+        link_number = len(self.links)
+        self.utilizations = np.zeros(link_number)
+        self.variances = np.zeros(link_number)
+        self.intervals = np.full(link_number, self.min_interval)  # links start busy until their load is known
+        self.last_polls = np.full(link_number, float(start))
+        self.polled = np.zeros(link_number, dtype=bool)
+
+        self.interval_stretch = 1.0
+        self._update_intervals()
+
+    def get_tick(self):
+        return self.min_interval
+
+    def get_reads_per_tick(self):
+        # 0: unlimited, at least the reads of one link (and its switch)
+        if not self.read_budget:
+            return 0
+        return max(self.reads_per_link + self.reads_per_switch, int(self.read_budget * self.get_tick()))
+
+    def get_due_links(self, now):
+        # (links to be polled in this tick, number of due links deferred because of the read budget)
+        staleness = (now - self.last_polls) / self.intervals
+        due = np.flatnonzero(staleness >= 1.0)
+        due = due[np.argsort(-staleness[due], kind='mergesort')]
+        reads_per_tick = self.get_reads_per_tick()
+        if not reads_per_tick:
+            return [self.links[i] for i in due], 0
+
+        links = []
+        switches = set()
+        reads = 0
+        for i in due:
+            link_reads = self.reads_per_link + (self.reads_per_switch if self.link_switches[i] not in switches else 0)
+            if reads + link_reads > reads_per_tick:
+                break
+            links.append(self.links[i])
+            switches.add(self.link_switches[i])
+            reads += link_reads
+        return links, len(due) - len(links)
+
+    def update(self, link_utilizations, now):
+        # utilization (fraction of the link capacity) of the links polled at now, None for a baseline poll
+        self.last_polls[[self.link_index[link] for link in link_utilizations]] = now
+        link_utilizations = dict((link, utilization) for link, utilization in link_utilizations.items()
+                                 if utilization is not None)
+        if not link_utilizations:
+            self._update_intervals()
+            return
+
+        indices = np.array([self.link_index[link] for link in link_utilizations], dtype=np.int64)
+        utilizations = np.array(list(link_utilizations.values()), dtype=np.float64)
+
+        first = ~self.polled[indices]
+        deviations = utilizations - self.utilizations[indices]
+        self.utilizations[indices] = np.where(first, utilizations,
+                                              self.utilizations[indices] + self.SMOOTHING * deviations)
+        self.variances[indices] = np.where(first, 0.0, (1 - self.SMOOTHING) * (self.variances[indices] +
+                                                                               self.SMOOTHING * deviations ** 2))
+        self.polled[indices] = True
+        self._update_intervals()
+
+    def _update_intervals(self):
+        activity = np.maximum(self.utilizations / self.UTILIZATION_HIGH, np.sqrt(self.variances) / self.VARIATION_HIGH)
+        activity = np.where(self.polled, np.clip(activity, 0.0, 1.0), 1.0)
+        intervals = self.max_interval - activity * (self.max_interval - self.min_interval)
+
+        self.interval_stretch = 1.0
+        if self.read_budget and len(intervals):
+            reads_per_second = (self.reads_per_link / intervals).sum()
+            if self.reads_per_switch:
+                # a switch is read with its most frequently polled link
+                switch_intervals = np.full(self.switch_number, np.inf)
+                np.minimum.at(switch_intervals, self.link_switches, intervals)
+                reads_per_second += (self.reads_per_switch / switch_intervals).sum()
+            self.interval_stretch = max(1.0, reads_per_second / self.read_budget)
+        self.intervals = intervals * self.interval_stretch
+
+    def get_interval(self, link):
+        return float(self.intervals[self.link_index[link]])
+
+    def get_staleness(self, link, now):
+        # seconds since the last poll of a link
+        return now - float(self.last_polls[self.link_index[link]])
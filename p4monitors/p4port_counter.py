@@ -21,7 +21,32 @@ from time import sleep, time
 
 from enum import Enum
 
+import numpy as np
+
 from p4monitors.p4monitor import P4Monitor, DataSources, PathLinkData
+from p4monitors.p4flow_counter import FlowCounterCollector
+from p4monitors.p4polling_scheduler import PollingScheduler
+
+from tools.clock import monotonic, monotonic_ns
+from tools.metrics import REGISTRY
+
+from tools.log.log import get_logger, LogSubsystem
+
+log = get_logger(LogSubsystem.MONITOR)
+
+polling_cycle_seconds = REGISTRY.summary('p4monitor_polling_cycle_seconds', 'duration of a port counter polling cycle',
+                                         ['monitor'])
+polling_cycles_total = REGISTRY.counter('p4monitor_polling_cycles_total', 'completed port counter polling cycles',
+                                        ['monitor'])
+link_load_gauge = REGISTRY.gauge('p4monitor_link_load', 'link load (fraction of the link capacity)',
+                                 ['monitor', 'switch1', 'switch2'])
+link_polling_interval_gauge = REGISTRY.gauge('p4monitor_link_polling_interval_seconds',
+                                             'interval until the next port counter poll of a link',
+                                             ['monitor', 'switch1', 'switch2'])
+polling_links_deferred_total = REGISTRY.counter('p4monitor_polling_links_deferred_total',
+                                                'due link polls deferred because of the read budget', ['monitor'])
+elephant_flows_gauge = REGISTRY.gauge('p4monitor_elephant_flows', 'elephant flows of the last polling cycle',
+                                      ['monitor'])
 
 
 class CounterDirection(Enum):
@@ -46,7 +71,29 @@ class PortCounterMonitor(P4Monitor):
 
         self.port_counters = {}
 
+        # per-flow link loads from the direct counters of the flow forwarding rules (see p4flow_counter.py)
+        self.flow_counter_collector = FlowCounterCollector(self) if kwargs['p4monitor_counter_flows'] else None
+        self.elephant_threshold = kwargs['p4monitor_counter_elephant_threshold']
+        self.link_flow_loads = {}  # (switch, neighbor) --> {flow hash: load}
+        self.switch_elephant_flows = {}  # switch --> elephant flows of its last flow counter read
+        self.elephant_flows = []
+
+        # adaptive polling between p4monitor_counter_min_interval and p4monitor_counter_interval per link
+        self.adaptive_polling = kwargs['p4monitor_counter_adaptive']
+        self.counter_min_interval = kwargs['p4monitor_counter_min_interval']
+        self.counter_read_budget = kwargs['p4monitor_counter_read_budget']
+        self.polling_scheduler = None
+
     def run_monitor(self, *args, **kwargs):
+        if self.flow_counter_collector is not None and not hasattr(self.p4controller, 'forwarding_rules'):
+            log.warning('flow counters require the FlowForwardingController, only port counters are collected')
+            self.flow_counter_collector = None
+        switches_thrift = sorted(sw for sw in self.switches if sw not in self.p4switch_connections_gRPC)
+        if self.flow_counter_collector is not None and switches_thrift:
+            log.warning('flow counters require P4Runtime connections (missing for {}), only port counters are '
+                        'collected'.format(', '.join(switches_thrift)))
+            self.flow_counter_collector = None
+
         for sw in self.switches:
             # sw_conf = self.topology.nodes[sw]
             self.port_counters[sw] = dict()
@@ -62,78 +109,191 @@ class PortCounterMonitor(P4Monitor):
         if self.csv_output:
             self.init_csv_output(self.exp_id, DataSources.PORT_COUTER.value, self.exp_iter)
 
+        if self.adaptive_polling:
+            self._run_adaptive_polling()
+            return
+
         monitoring_i = 0
 
         sleep(self.counter_collection_interval)
         while self.monitor_flag:
+            polling_cycle_start = monotonic_ns()
             for sw in self.switches:
                 for edge in [x for x in self.topology.edges.data() if x[0] == sw and x[1] in self.switches]:
-                    local_port_id = edge[2]['port_id']
-
-                    for counter in [counter.value for counter in CounterDirection]:
-                        # there is only one counter, consider index offset (port 0 not used)
-                        counters = self.get_counters(sw, counter,
-                                                     index=local_port_id - self.PORT_COUNTER_INDEX_OFFSET)[0]
-
-                        byte_count = float(counters.data.byte_count)
-                        # print('byte_count', byte_count)
-
-                        packet_count = float(counters.data.packet_count)
-                        # print('packet_count', packet_count)
-
-                        if counter == self.counter.value:
-                            if self.counter_data == CounterData.BYTE_COUNT:  # byte_count
-
-                                if len(self.port_counters[sw][local_port_id][counter]) != 0:
-                                    last_byte_count = self.port_counters[sw][local_port_id][counter][-1] \
-                                        [CounterData.BYTE_COUNT]
-                                else:
-                                    last_byte_count = 0
-                                # print('last_byte_count', last_byte_count)
-
-                                byte_diff = byte_count - last_byte_count
-                                # print('byte_diff', byte_diff)
-
-                                link_load = byte_diff * 8
-                                link_load /= self.counter_collection_interval
-                                # print('link_load', link_load)
-
-                                # link_capacity = 1.0 * self.TOPOLOGY_DATA_RATE
-                                link_capacity = float(edge[2]['bw']) * self.TOPOLOGY_DATA_RATE.value
-                                # print('link_capacity', link_capacity)
-
-                                load_percentage = link_load / link_capacity
-                                # print('load_percentage', load_percentage)
-                                # if load_percentage > 0: print('load_percentage', load_percentage)
-
-                                timestamp = int(round(time())) - self.timestamp_start
-                                switch = edge[0]
-                                switch_neighbor = edge[1]
-
-                                # self.update_edge_weight(node1=edge[0], node2=edge[1],
-                                #                         weight_key='load_port_counter', weight_value=load_percentage)
-                                # self.update_edge_weight(node1=switch, node2=switch_neighbor,
-                                #                         weight_value=load_percentage,
-                                #                         weight_history=True,
-                                #                         weight_timestamp=timestamp)
-                                self.update_link_property(sw1=switch, sw2=switch_neighbor,
-                                                          property_key=PathLinkData.LOAD_PORT_COUNTER,
-                                                          property_value=load_percentage,
-                                                          property_history=True,
-                                                          property_value_timestamp=timestamp)
-
-                                if self.csv_output:
-                                    self.write_csv_output(switch_link='{}-{}'.format(switch, switch_neighbor),
-                                                          timestamp=timestamp, load_percentage=load_percentage)
-
-                            if self.counter_data == CounterData.PACKET_COUNT:  # packet_count
-                                pass
-
-                        self.port_counters[sw][local_port_id][counter].append({CounterData.PACKET_COUNT: packet_count,
-                                                                               CounterData.BYTE_COUNT: byte_count})
+                    self._poll_link(sw, edge, self.counter_collection_interval, self.counter_collection_interval)
+
+                if self.flow_counter_collector is not None:
+                    self.switch_elephant_flows[sw] = self._collect_flow_counters(sw)
+            self._update_elephant_flows()
 
             monitoring_i += 1
+            polling_cycle_seconds.labels(self.__class__.__name__).observe(monotonic_ns() - polling_cycle_start)
+            polling_cycles_total.labels(self.__class__.__name__).inc()
 
             self.traffic_generation_event.set()
 
             sleep(self.counter_collection_interval)
+
+    def _run_adaptive_polling(self):
+        # per tick only the due links within the read budget are polled (see p4polling_scheduler.py)
+        links = [(edge[0], edge[1]) for edge in self.topology.edges()
+                 if edge[0] in self.switches and edge[1] in self.switches]
+        # the flow counters of a switch are read with one wildcard read per polling cycle of its links
+        self.polling_scheduler = PollingScheduler(links, reads_per_link=len(CounterDirection),
+                                                  min_interval=self.counter_min_interval,
+                                                  max_interval=self.counter_collection_interval,
+                                                  read_budget=self.counter_read_budget, start=monotonic(),
+                                                  reads_per_switch=1 if self.flow_counter_collector else 0)
+        log.info('adaptive polling of {} links: interval {}-{}s, read budget {}/s ({} reads per tick)'.format(
+            len(links), self.polling_scheduler.min_interval, self.polling_scheduler.max_interval,
+            self.counter_read_budget if self.counter_read_budget else 'unlimited',
+            self.polling_scheduler.get_reads_per_tick() or 'unlimited'))
+
+        while self.monitor_flag:
+            sleep(self.polling_scheduler.get_tick())
+
+            now = monotonic()
+            polling_cycle_start = monotonic_ns()
+            links, links_deferred = self.polling_scheduler.get_due_links(now)
+            if links_deferred:
+                polling_links_deferred_total.labels(self.__class__.__name__).inc(links_deferred)
+            if not links:
+                continue
+
+            link_loads = dict()
+            for sw1, sw2 in links:
+                edge = (sw1, sw2, self.topology.edges[sw1, sw2])
+                baseline = not self.port_counters[sw1][edge[2]['port_id']][self.counter.value]
+                load_percentage = self._poll_link(sw1, edge, self.polling_scheduler.get_staleness((sw1, sw2), now),
+                                                  self.polling_scheduler.get_interval((sw1, sw2)))
+                if baseline:
+                    link_loads[(sw1, sw2)] = None
+                else:
+                    link_loads[(sw1, sw2)] = load_percentage if load_percentage is not None else 0.0
+            self.polling_scheduler.update(link_loads, now)
+
+            if self.flow_counter_collector is not None:
+                for sw in set(link[0] for link in links):
+                    self.switch_elephant_flows[sw] = self._collect_flow_counters(sw)
+                self._update_elephant_flows()
+
+            polling_cycle_seconds.labels(self.__class__.__name__).observe(monotonic_ns() - polling_cycle_start)
+            polling_cycles_total.labels(self.__class__.__name__).inc()
+
+            self.traffic_generation_event.set()
+
+    def _poll_link(self, sw, edge, polling_interval, polling_interval_next):
+        # reads the port counters of a link, returns the link load for byte counts (None for packet counts)
+        local_port_id = edge[2]['port_id']
+        load_percentage = None
+
+        for counter in [counter.value for counter in CounterDirection]:
+            # there is only one counter, consider index offset (port 0 not used)
+            counters = self.get_counters(sw, counter,
+                                         index=local_port_id - self.PORT_COUNTER_INDEX_OFFSET)[0]
+
+            byte_count = float(counters.data.byte_count)
+            # print('byte_count', byte_count)
+
+            packet_count = float(counters.data.packet_count)
+            # print('packet_count', packet_count)
+
+            # the first read is only the baseline, the counters are not reset when the monitor starts
+            if counter == self.counter.value and self.port_counters[sw][local_port_id][counter]:
+                if self.counter_data == CounterData.BYTE_COUNT:  # byte_count
+
+                    last_byte_count = self.port_counters[sw][local_port_id][counter][-1][CounterData.BYTE_COUNT]
+                    # print('last_byte_count', last_byte_count)
+
+                    byte_diff = byte_count - last_byte_count
+                    # print('byte_diff', byte_diff)
+
+                    link_load = byte_diff * 8
+                    link_load /= polling_interval
+                    # print('link_load', link_load)
+
+                    # link_capacity = 1.0 * self.TOPOLOGY_DATA_RATE
+                    link_capacity = float(edge[2]['bw']) * self.TOPOLOGY_DATA_RATE.value
+                    # print('link_capacity', link_capacity)
+
+                    load_percentage = link_load / link_capacity
+                    # print('load_percentage', load_percentage)
+                    # if load_percentage > 0: print('load_percentage', load_percentage)
+
+                    timestamp = int(round(time())) - self.timestamp_start
+                    switch = edge[0]
+                    switch_neighbor = edge[1]
+
+                    # self.update_edge_weight(node1=edge[0], node2=edge[1],
+                    #                         weight_key='load_port_counter', weight_value=load_percentage)
+                    # self.update_edge_weight(node1=switch, node2=switch_neighbor,
+                    #                         weight_value=load_percentage,
+                    #                         weight_history=True,
+                    #                         weight_timestamp=timestamp)
+                    self.update_link_property(sw1=switch, sw2=switch_neighbor,
+                                              property_key=PathLinkData.LOAD_PORT_COUNTER,
+                                              property_value=load_percentage,
+                                              property_history=True,
+                                              property_value_timestamp=timestamp)
+                    # staleness of the link load: time of the last poll and interval until the next one
+                    self.set_edge_property(switch, switch_neighbor, 'load_port_counter_updated', time())
+                    self.set_edge_property(switch, switch_neighbor, 'load_port_counter_interval',
+                                           polling_interval_next)
+
+                    link_load_gauge.labels(self.__class__.__name__, switch,
+                                           switch_neighbor).set(load_percentage)
+                    link_polling_interval_gauge.labels(self.__class__.__name__, switch,
+                                                       switch_neighbor).set(polling_interval_next)
+
+                    if self.csv_output:
+                        self.write_csv_output(switch_link='{}-{}'.format(switch, switch_neighbor),
+                                              timestamp=timestamp, load_percentage=load_percentage)
+
+                if self.counter_data == CounterData.PACKET_COUNT:  # packet_count
+                    pass
+
+            self.port_counters[sw][local_port_id][counter].append({CounterData.PACKET_COUNT: packet_count,
+                                                                   CounterData.BYTE_COUNT: byte_count})
+        return load_percentage
+
+    def _update_elephant_flows(self):
+        if self.flow_counter_collector is None:
+            return
+        self.elephant_flows = sorted((elephant_flow for elephant_flows in self.switch_elephant_flows.values()
+                                      for elephant_flow in elephant_flows), key=lambda x: x['load'], reverse=True)
+        elephant_flows_gauge.labels(self.__class__.__name__).set(len(self.elephant_flows))
+
+    def _collect_flow_counters(self, sw):
+        # attributes the rates of the flows of a switch to its links (by egress port), returns the elephant flows
+        forwarding_rules = self.p4controller.forwarding_rules.get(sw, {})
+        flow_hashes, flow_ports, flow_rates = self.flow_counter_collector.collect(sw, forwarding_rules)
+        flow_measured = ~np.isnan(flow_rates)
+
+        elephant_flows = []
+        for edge in [x for x in self.topology.edges.data() if x[0] == sw and x[1] in self.switches]:
+            link_capacity = float(edge[2]['bw']) * self.TOPOLOGY_DATA_RATE.value
+            flows = np.flatnonzero(flow_measured & (flow_ports == int(edge[2]['port_id'])))
+            flow_loads = flow_rates[flows] / link_capacity
+            self.link_flow_loads[(sw, edge[1])] = dict((flow_hashes[flow], float(flow_load))
+                                                       for flow, flow_load in zip(flows, flow_loads))
+
+            for flow, flow_load in zip(flows[flow_loads >= self.elephant_threshold],
+                                       flow_loads[flow_loads >= self.elephant_threshold]):
+                elephant_flow = {'flow_hash': flow_hashes[flow],
+                                 'flow_5_tuple': forwarding_rules[flow_hashes[flow]].get('flow_5_tuple'),
+                                 'switch': sw,
+                                 'switch_neighbor': edge[1],
+                                 'rate': float(flow_rates[flow]),
+                                 'load': float(flow_load)}
+                elephant_flows.append(elephant_flow)
+                log.info('elephant flow {flow_5_tuple} at {switch}-{switch_neighbor}: {load:.3f}'.format(
+                    **elephant_flow))
+        return elephant_flows
+
+    def get_link_flow_loads(self, sw1, sw2):
+        # load (fraction of the link capacity) per flow hash of the last polling cycle
+        return dict(self.link_flow_loads.get((sw1, sw2), {}))
+
+    def get_elephant_flows(self):
+        # flows with at least p4monitor_counter_elephant_threshold of a link capacity, descending by load
+        return list(self.elephant_flows)
@@ -14,30 +14,365 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from p4monitors.p4monitor import P4Monitor
+# link probing for the flow_forwarding P4 program
+#
+# probes are UDP packets with a probe payload; every switch link (sw1 -> sw2) has its own probe flow whose forwarding
+# entries (flow_forwarding_table) send it out of the link port at sw1 and to the CPU port at sw2, so probes need no
+# controller round trip; a loopback flow per switch (CPU port -> CPU port) measures the CPU path overhead, which is
+# subtracted from the link measurements
+#
+# - local_multicast: per round every switch sends the probes of its outgoing links as one batch
+# - eulerian_path: the links are covered by (segments of) an Eulerian circuit of the switch graph, per round one probe
+#                  per segment is sent and forwarded to the next link of the segment when it arrives at a CPU port
+#
+# latency_probing: link latency (ms) without the CPU path overhead
+# load_probing: link utilization estimated from the queueing delay (latency above the minimum latency of the link)
+#               with an M/M/1 model, rho = Wq / (Wq + S) with S the transmission time of an MTU-sized packet
+
+from time import sleep, time
+
+import socket
+import struct
+import threading
+
 from enum import Enum
 
+import numpy as np
+import networkx as nx
+
+from p4monitors.p4monitor import P4Monitor, DataSources, PathLinkData
+from p4monitors.p4monitor_cpu import CPUPortConnector
+
+from tools.clock import monotonic_ns
+from tools.flow_hash import compute_flow_hashes, IP_PROTOCOL_UDP, PROBE_UDP_PORT
+from tools.metrics import REGISTRY
+
+from tools.log.log import get_logger, LogSubsystem
+
+log = get_logger(LogSubsystem.MONITOR)
+
+PROBE_BASE_PORT = 40000
+PROBE_SRC_IP = '10.255.255.1'
+PROBE_DST_IP = '10.255.255.2'
+PROBE_SRC_MAC = '99:99:99:99:99:98'
+PROBE_DST_MAC = 'ff:ff:ff:ff:ff:ff'
+PROBE_TTL = 64
+
+# magic, round, kind, route, hop, tx timestamp (ns)
+PROBE_STRUCTURE = struct.Struct('!IIBHHQ')
+PROBE_MAGIC = 0x50345052  # 'P4PR'
+PROBE_FRAME_SIZE = 64
+
+ETHERNET_HEADER_LENGTH = 14
+IPV4_HEADER_LENGTH = 20
+UDP_HEADER_LENGTH = 8
+CPU_HEADER_LENGTH = 8  # cpu_t, appended by the switch behind the UDP header (see flow_forwarding.p4)
+ETHERTYPE_IPV4 = 0x800
+
+probes_total = REGISTRY.counter('p4monitor_probes_total', 'sent, received and lost probes', ['monitor', 'result'])
+
 
 class ProbingMode(Enum):
     EULERIAN_PATH = 'eulerian_path'
     LOCAL_MULTICAST = 'local_multicast'
 
 
+class ProbeKind(Enum):
+    LINK = 0
+    LOOPBACK = 1
+
+
 class ProbingMonitor(P4Monitor):
+    P4_FORWARDING_TABLE = 'FlowForwardingIngress.flow_forwarding_table'
+    P4_FORWARDING_MATCH1 = 'meta.flow_hash_one'
+    P4_FORWARDING_MATCH2 = 'meta.flow_hash_two'
+    P4_FORWARDING_ACTION = 'FlowForwardingIngress.to_port_action'
+    P4_FORWARDING_ACTION_PARAM = 'port'
+
+    EULERIAN_SEGMENT_LENGTH = 16  # links per probe, limits the impact of a lost probe
+    PROBE_TIMEOUT = 1.0  # s
+    LOAD_PACKET_SIZE = 1500  # bytes
+    QUEUEING_SMOOTHING = 0.5  # EWMA weight of the latest queueing delay
 
     def __init__(self, *args, **kwargs):
         P4Monitor.__init__(self, *args, **kwargs)
 
-        raise NotImplementedYetException('ProbingMonitor with P4-based link/path probing not implemented yet')
+        self.probing_interval = kwargs['p4monitor_probing_interval']
+        self.probing_mode = ProbingMode(kwargs['p4monitor_probing_mode'])
+
+        self.links = []  # (sw1, sw2)
+        self.link_ports = None  # port of sw1 towards sw2
+        self.link_switch_indices = None  # (sw1 index, sw2 index)
+        self.routes = []  # lists of link indices
+        self.link_frames = []
+        self.loopback_frames = []
+
+        self.cpu_port_connector = None
+
+        self.round_lock = threading.Lock()
+        self.round_id = 0
+        self.link_latencies = None  # ns, current round
+        self.loopback_latencies = None  # ns, current round
+
+        self.min_latencies = None
+        self.queueing_delays = None
+        self.transmission_times = None
 
     def run_monitor(self, *args, **kwargs):
-        pass
+        switches = sorted(self.switches)
+        switch_indices = dict((switch, i) for i, switch in enumerate(switches))
+
+        self.links = [(edge[0], edge[1]) for edge in sorted(self.get_all_switch_edges(), key=lambda x: x[:2])]
+        self.link_ports = [self.map_edge_to_switch_port(sw1, sw2) for sw1, sw2 in self.links]
+        self.link_switch_indices = np.array([(switch_indices[sw1], switch_indices[sw2]) for sw1, sw2 in self.links],
+                                            dtype=np.int64).reshape(-1, 2)
+        self.routes = self._compute_routes()
+        log.info('probing {} links of {} switches with {} probe routes ({})'.format(len(self.links), len(switches),
+                                                                                    len(self.routes),
+                                                                                    self.probing_mode.value))
+
+        self.min_latencies = np.full(len(self.links), np.nan)
+        self.queueing_delays = np.zeros(len(self.links))
+        self.transmission_times = np.array([self.LOAD_PACKET_SIZE * 8.0 /
+                                            (float(self.get_edge_property(sw1, sw2, 'bw')) *
+                                             self.TOPOLOGY_DATA_RATE.value) * 10 ** 9 for sw1, sw2 in self.links])
+
+        self._install_probe_entries(switches)
+
+        self.cpu_port_connector = CPUPortConnector(switches, self._receive_probe)
+        self.cpu_port_connector.start()
+
+        if self.csv_output:
+            self.init_csv_output(self.exp_id, DataSources.PROBING.value, self.exp_iter)
+
+        sleep(self.probing_interval)
+        while self.monitor_flag:
+            round_start = time()
+
+            self._start_round(switches)
+            sleep(min(self.PROBE_TIMEOUT, self.probing_interval))
+            self._evaluate_round()
+
+            self.traffic_generation_event.set()
+
+            sleep(max(self.probing_interval - (time() - round_start), 0))
+
+    def stop_monitor(self):
+        super(ProbingMonitor, self).stop_monitor()
+        if self.cpu_port_connector:
+            self.cpu_port_connector.stop()
+
+    def _compute_routes(self):
+        link_indices = dict((link, i) for i, link in enumerate(self.links))
+        if self.probing_mode == ProbingMode.LOCAL_MULTICAST:
+            return [[i] for i in range(len(self.links))]
+
+        # eulerian_path: the switch graph is symmetric (every link in both directions), i.e. every strongly connected
+        # component has an Eulerian circuit; the circuit is split into segments
+        routes = []
+        graph = nx.DiGraph(self.links)
+        for component in nx.strongly_connected_components(graph):
+            subgraph = graph.subgraph(component)
+            if subgraph.number_of_edges() == 0:
+                continue
+            if nx.is_eulerian(subgraph):
+                circuit = [link_indices[link] for link in nx.eulerian_circuit(subgraph)]
+            else:
+                circuit = [link_indices[link] for link in subgraph.edges()]
+                log.warning('switch graph component {} has no Eulerian circuit, links are probed '
+                            'individually'.format(sorted(component)))
+                routes.extend([i] for i in circuit)
+                continue
+            routes.extend(circuit[i:i + self.EULERIAN_SEGMENT_LENGTH]
+                          for i in range(0, len(circuit), self.EULERIAN_SEGMENT_LENGTH))
+        covered = set(i for route in routes for i in route)
+        routes.extend([i] for i in range(len(self.links)) if i not in covered)
+        return routes
+
+    def _install_probe_entries(self, switches):
+        # probe flows are distinguished by the UDP source port, ports whose flow hashes collide at a switch are skipped
+        used_flow_hashes = dict((switch, set()) for switch in switches)
+
+        def _next_probe_flow(port, *flow_switches):
+            while True:
+                flow_hashes = compute_flow_hashes(PROBE_SRC_IP, PROBE_DST_IP, port, PROBE_UDP_PORT)
+                if all(flow_hashes not in used_flow_hashes[switch] for switch in flow_switches):
+                    for switch in flow_switches:
+                        used_flow_hashes[switch].add(flow_hashes)
+                    return port, flow_hashes
+                port += 1
+
+        # entries are written by the controller if there is one (primary P4Runtime client)
+        rule_connector = self.p4controller if self.p4controller else self
+        if rule_connector is self:
+            for p4switch_connection in self.p4switch_connections_gRPC.values():
+                p4switch_connection.master_arbitration_update()
+
+        port = PROBE_BASE_PORT
+        self.link_frames = []
+        for (sw1, sw2), link_port in zip(self.links, self.link_ports):
+            port, flow_hashes = _next_probe_flow(port, sw1, sw2)
+            rule_connector.insert_table_entry(sw1, self._get_probe_entry(flow_hashes, link_port))
+            rule_connector.insert_table_entry(sw2, self._get_probe_entry(flow_hashes,
+                                                                         self.get_switch(sw2)['ports']['cpu_port']))
+            self.link_frames.append(build_probe_frame(port))
+            port += 1
+
+        self.loopback_frames = []
+        for switch in switches:
+            port, flow_hashes = _next_probe_flow(port, switch)
+            rule_connector.insert_table_entry(switch, self._get_probe_entry(flow_hashes,
+                                                                            self.get_switch(switch)['ports']['cpu_port']))
+            self.loopback_frames.append(build_probe_frame(port))
+            port += 1
+
+    def _get_probe_entry(self, flow_hashes, port):
+        return {'table': self.P4_FORWARDING_TABLE,
+                'match': {self.P4_FORWARDING_MATCH1: struct.pack('!H', flow_hashes[0]),
+                          self.P4_FORWARDING_MATCH2: struct.pack('!I', flow_hashes[1])},
+                'action_name': self.P4_FORWARDING_ACTION,
+                'action_params': {self.P4_FORWARDING_ACTION_PARAM: int(port)}}
+
+    def _start_round(self, switches):
+        with self.round_lock:
+            self.round_id = (self.round_id + 1) & 0xFFFFFFFF
+            self.link_latencies = np.full(len(self.links), np.nan)
+            self.loopback_latencies = np.full(len(switches), np.nan)
+            round_id = self.round_id
+
+        # one batch per switch
+        batches = dict((switch, []) for switch in switches)
+        tx_timestamp = monotonic_ns()
+        for i, switch in enumerate(switches):
+            batches[switch].append(pack_probe(self.loopback_frames[i], round_id, ProbeKind.LOOPBACK, i, 0,
+                                              tx_timestamp))
+        for route_id, route in enumerate(self.routes):
+            batches[self.links[route[0]][0]].append(pack_probe(self.link_frames[route[0]], round_id, ProbeKind.LINK,
+                                                               route_id, 0, tx_timestamp))
+        for switch, frames in batches.items():
+            self.cpu_port_connector.send(switch, frames)
+        probes_total.labels(self.__class__.__name__, 'sent').inc(len(switches) + len(self.routes))
+
+    def _receive_probe(self, switch, frame, rx_timestamp):
+        probe = decode_probe(frame)
+        if probe is None:
+            return
+        round_id, kind, route_id, hop, tx_timestamp = probe
+        with self.round_lock:
+            if round_id != self.round_id:
+                return
+            if kind == ProbeKind.LOOPBACK.value:
+                if route_id < len(self.loopback_latencies):
+                    self.loopback_latencies[route_id] = rx_timestamp - tx_timestamp
+                    probes_total.labels(self.__class__.__name__, 'received').inc()
+                return
+            if route_id >= len(self.routes) or hop >= len(self.routes[route_id]):
+                return
+            route = self.routes[route_id]
+            self.link_latencies[route[hop]] = rx_timestamp - tx_timestamp
+        probes_total.labels(self.__class__.__name__, 'received').inc()
+
+        # eulerian_path: forward the probe to the next link of the route
+        if hop + 1 < len(route):
+            next_link = route[hop + 1]
+            self.cpu_port_connector.send(self.links[next_link][0],
+                                         [pack_probe(self.link_frames[next_link], round_id, ProbeKind.LINK,
+                                                     route_id, hop + 1, monotonic_ns())])
+            probes_total.labels(self.__class__.__name__, 'sent').inc()
+
+    def _evaluate_round(self):
+        with self.round_lock:
+            link_latencies = self.link_latencies
+            loopback_latencies = self.loopback_latencies
+
+        # CPU path overhead of a link probe: mean of the loopback latencies of both switches
+        overheads1 = loopback_latencies[self.link_switch_indices[:, 0]]
+        overheads2 = loopback_latencies[self.link_switch_indices[:, 1]]
+        overheads = np.where(np.isnan(overheads1), overheads2,
+                             np.where(np.isnan(overheads2), overheads1, (overheads1 + overheads2) / 2))
+        overheads = np.where(np.isnan(overheads), 0.0, overheads)
+
+        valid = ~np.isnan(link_latencies)
+        latencies = np.maximum(np.where(valid, link_latencies, 0.0) - overheads, 0.0)
+        self.min_latencies = np.where(valid, np.fmin(self.min_latencies, latencies), self.min_latencies)
+        self.queueing_delays = np.where(valid,
+                                        self.QUEUEING_SMOOTHING * (latencies - self.min_latencies) +
+                                        (1 - self.QUEUEING_SMOOTHING) * self.queueing_delays,
+                                        self.queueing_delays)
+        loads = self.queueing_delays / (self.queueing_delays + self.transmission_times)
+
+        lost = int(len(self.links) - np.count_nonzero(valid))
+        if lost:
+            probes_total.labels(self.__class__.__name__, 'lost').inc(lost)
+            log.debug('lost probes of {} links in round {}'.format(lost, self.round_id))
+
+        timestamp = int(round(time())) - self.timestamp_start
+        latencies_ms = latencies / 10 ** 6
+        for i in np.flatnonzero(valid):
+            sw1, sw2 = self.links[i]
+            self.update_link_property(sw1=sw1, sw2=sw2,
+                                      property_key=PathLinkData.LATENCY_PROBING,
+                                      property_value=float(latencies_ms[i]),
+                                      property_history=True,
+                                      property_value_timestamp=timestamp)
+            self.update_link_property(sw1=sw1, sw2=sw2,
+                                      property_key=PathLinkData.LOAD_PROBING,
+                                      property_value=float(loads[i]),
+                                      property_history=True,
+                                      property_value_timestamp=timestamp)
+
+            if self.csv_output:
+                self.write_csv_output(switch_link='{}-{}'.format(sw1, sw2),
+                                      timestamp=timestamp, load_percentage=float(loads[i]))
+
+
+def _ipv4_checksum(header):
+    words = struct.unpack('!{}H'.format(len(header) // 2), header)
+    checksum = sum(words)
+    while checksum >> 16:
+        checksum = (checksum & 0xFFFF) + (checksum >> 16)
+    return ~checksum & 0xFFFF
+
+
+def build_probe_frame(src_port):
+    # frame template of a probe flow, the probe payload is packed per probe (pack_probe)
+    payload_length = PROBE_FRAME_SIZE - ETHERNET_HEADER_LENGTH - IPV4_HEADER_LENGTH - UDP_HEADER_LENGTH
+    ethernet = struct.pack('!6s6sH', mac_to_bytes(PROBE_DST_MAC), mac_to_bytes(PROBE_SRC_MAC), ETHERTYPE_IPV4)
+    ipv4 = struct.pack('!BBHHHBBH4s4s', 0x45, 0, IPV4_HEADER_LENGTH + UDP_HEADER_LENGTH + payload_length, 0, 0,
+                       PROBE_TTL, IP_PROTOCOL_UDP, 0, socket.inet_aton(PROBE_SRC_IP), socket.inet_aton(PROBE_DST_IP))
+    ipv4 = ipv4[:10] + struct.pack('!H', _ipv4_checksum(ipv4)) + ipv4[12:]
+    udp = struct.pack('!HHHH', src_port, PROBE_UDP_PORT, UDP_HEADER_LENGTH + payload_length, 0)
+    return bytearray(ethernet + ipv4 + udp + b'\x00' * payload_length)
+
+
+def pack_probe(frame, round_id, kind, route_id, hop, tx_timestamp):
+    frame = bytearray(frame)
+    PROBE_STRUCTURE.pack_into(frame, ETHERNET_HEADER_LENGTH + IPV4_HEADER_LENGTH + UDP_HEADER_LENGTH,
+                              PROBE_MAGIC, round_id, kind.value, route_id, hop, tx_timestamp)
+    return bytes(frame)
 
-    def _handle_cpu_packet(self, cpu_packet):
-        pass
 
+def decode_probe(frame):
+    # (round, kind, route, hop, tx timestamp) or None for other frames
+    if len(frame) < ETHERNET_HEADER_LENGTH + IPV4_HEADER_LENGTH + UDP_HEADER_LENGTH + PROBE_STRUCTURE.size:
+        return None
+    ethertype, = struct.unpack_from('!H', frame, 12)
+    if ethertype != ETHERTYPE_IPV4:
+        return None
+    version_ihl, = struct.unpack_from('!B', frame, ETHERNET_HEADER_LENGTH)
+    udp_offset = ETHERNET_HEADER_LENGTH + (version_ihl & 0x0F) * 4
+    if len(frame) < udp_offset + UDP_HEADER_LENGTH or \
+            struct.unpack_from('!B', frame, ETHERNET_HEADER_LENGTH + 9)[0] != IP_PROTOCOL_UDP or \
+            struct.unpack_from('!H', frame, udp_offset + 2)[0] != PROBE_UDP_PORT:
+        return None
+    # probes received on a CPU port carry the CPU header in front of the payload
+    for payload_offset in [udp_offset + UDP_HEADER_LENGTH + CPU_HEADER_LENGTH, udp_offset + UDP_HEADER_LENGTH]:
+        if len(frame) >= payload_offset + PROBE_STRUCTURE.size:
+            magic, round_id, kind, route_id, hop, tx_timestamp = PROBE_STRUCTURE.unpack_from(frame, payload_offset)
+            if magic == PROBE_MAGIC:
+                return round_id, kind, route_id, hop, tx_timestamp
+    return None
 
-class NotImplementedYetException(Exception):
 
-    def __init__(self, message):
-        super(NotImplementedYetException, self).__init__(self.__class__.__name__ + ': ' + message)
+def mac_to_bytes(mac):
+    return bytes(bytearray(int(part, 16) for part in mac.split(':')))
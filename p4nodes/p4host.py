@@ -25,6 +25,11 @@ from mininet.node import Host
 
 from tools.log.log import log
 
+import json
+import os
+import socket
+from time import sleep
+
 
 class P4Host(Host):
     IPERF_CLIENT_CMD = 'iperf -B {client_address}:{client_port} -c {server_address} -p {server_port} ' + \
@@ -33,6 +38,10 @@ class P4Host(Host):
     IPERF_SERVER_CMD = 'iperf -s -D -B {server_address} -p {server_port} {protocol}' + \
                        ' 2>&1 > /dev/null &'
 
+    TRAFFIC_AGENT_PATH = 'tools/traffic_agent/traffic_agent.py'
+    TRAFFIC_AGENT_SOCKET = '/tmp/p4traffic-{host}.sock'
+    TRAFFIC_AGENT_STARTUP_TIMEOUT = 10  # seconds
+
     SSHD_START_CMD = '/usr/sbin/sshd -4 -o ListenAddress={server_address}:{port}'
     SSHD_STOP_CMD = ("ps -x | grep /usr/sbin/sshd | "
                      "grep 'ListenAddress={server_address}:{port}' | awk -F ' ' '{{print $1}}' | xargs kill -9")
@@ -61,6 +70,9 @@ class P4Host(Host):
         self.ssh_server_started = False
         self.iperf_server_started = False
 
+        self.traffic_agent = None
+        self.traffic_agent_control = None
+
         self.disable_ipv6()
 
     def _build_host_config(self):
@@ -110,6 +122,7 @@ class P4Host(Host):
     def stop_services(self):
         self.stop_ssh_server()
         self.stop_iperf()
+        self.stop_traffic_agent()
 
     def start_ssh_server(self):
         if not self.ssh_server_started:
@@ -141,6 +154,51 @@ class P4Host(Host):
 
     def stop_iperf(self):
         self.cmd('pkill -9 iperf')
+        self.iperf_server_started = False
+
+    def start_traffic_agent(self, sink_port=5001):
+        if self.traffic_agent is not None:
+            return
+
+        control_socket_path = self.TRAFFIC_AGENT_SOCKET.format(host=self.name)
+        self.traffic_agent = self.popen(['python', os.path.abspath(self.TRAFFIC_AGENT_PATH),
+                                         '--control_socket', control_socket_path,
+                                         '--sink_address', self.ip, '--sink_port', str(sink_port)])
+
+        # unix sockets are not bound to the network namespace of the host
+        for _ in range(self.TRAFFIC_AGENT_STARTUP_TIMEOUT * 10):
+            if os.path.exists(control_socket_path):
+                break
+            sleep(0.1)
+        control_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        control_socket.connect(control_socket_path)
+        self.traffic_agent_control = control_socket.makefile('rw')
+
+    def _send_traffic_agent_command(self, command):
+        self.traffic_agent_control.write(json.dumps(command) + '\n')
+        self.traffic_agent_control.flush()
+        return json.loads(self.traffic_agent_control.readline())
+
+    def send_flow_specs(self, flow_specs):
+        # flow spec: src_ip, src_port, dst_ip, dst_port, protocol (UDP|TCP), rate (bit/s), duration (s)
+        return self._send_traffic_agent_command({'flows': flow_specs})
+
+    def stop_agent_flows(self):
+        if self.traffic_agent is not None:
+            self._send_traffic_agent_command({'command': 'stop_flows'})
+
+    def stop_traffic_agent(self):
+        if self.traffic_agent is None:
+            return
+
+        try:
+            self._send_traffic_agent_command({'command': 'shutdown'})
+            self.traffic_agent_control.close()
+            self.traffic_agent.wait()
+        except (IOError, ValueError):
+            self.traffic_agent.kill()
+        self.traffic_agent = None
+        self.traffic_agent_control = None
 
     def disable_ipv6(self):
         for intf in [intf_ for intf_ in self.intfs.values()]:
@@ -313,6 +313,7 @@ class P4RuntimeSwitch(P4Switch):
                                                                                              self.name))
 
         self.runtime_gRPC_log = switch_params['runtime_gRPC_log'].format(self.name, self.name)
+        self.runtime_gRPC_log_binary = switch_params['runtime_gRPC_log_binary']
 
     def wait_switch_started(self):
         for x in range(P4Switch.WAIT_STARTED_LIMIT):
@@ -343,7 +344,8 @@ class P4RuntimeSwitch(P4Switch):
                                        runtime_conf_file=runtime_conf_file,
                                        p4init=self.p4init,
                                        work_dir=os.getcwd(),
-                                       runtime_gRPC_log=self.runtime_gRPC_log)
+                                       runtime_gRPC_log=self.runtime_gRPC_log,
+                                       runtime_gRPC_log_binary=self.runtime_gRPC_log_binary)
 
         if self.p4init in ['p4runtime_CLI', 'hybrid']:
             super(P4RuntimeSwitch, self).configure()
@@ -352,7 +354,8 @@ class P4RuntimeSwitch(P4Switch):
         super(P4RuntimeSwitch, self)._build_switch_config()
         self.switch_config.update({'runtime_json': self.runtime_file,
                                    'grpc_port': self.grpc_port,
-                                   'runtime_gRPC_log': self.runtime_gRPC_log})
+                                   'runtime_gRPC_log': self.runtime_gRPC_log,
+                                   'runtime_gRPC_log_binary': self.runtime_gRPC_log_binary})
 
 
 def check_listening_on_port(port):
@@ -29,8 +29,7 @@ if __name__ == '__main__':
     ##########
     from tools import modules_installation as minstall
 
-    for module_spec in minstall.python_modules:
-        minstall.install_python_module(python_module=module_spec[0], import_name=module_spec[1], version=module_spec[2])
+    minstall.check_python_modules()
     ##########
 
     import sys
@@ -47,7 +46,7 @@ if __name__ == '__main__':
 from mininet.net import Mininet
 from mininet.cli import CLI
 
-from tools.log.log import log, change_log_level, LOG_LEVEL_DEFAULT
+from tools.log.log import log, change_log_level, change_log_format, LOG_LEVEL_DEFAULT, LOG_FORMAT_DEFAULT
 
 import subprocess
 import traceback
@@ -62,11 +61,13 @@ from p4env import P4Monitors
 from p4env import P4Controllers
 from p4env import P4Switches, P4Hosts
 
-from p4env import P4NetworkRunModes
-
-from p4topos.p4topo_traffic import TrafficManager
+from p4env import P4NetworkRunModes, WarmRunnerCommands
 
 import threading
+import socket
+import shlex
+import time
+import os
 
 
 class P4TopoRunner(object):
@@ -80,124 +81,274 @@ class P4TopoRunner(object):
         self.tp_args = None
         self.tp_params = None
 
+        self.net = None
+        self.management_host = None
+        self.management_switches = []
+        self.host_configs = []
+        self.switch_configs = []
+        self.hosts_file_mappings = []
+
+        self.p4monitor = None
+        self.p4monitor_query_server = None
+        self.p4controller = None
+        self.traffic_manager = None
+
     def run(self, tp_args, tp_params):
         self.tp_args = tp_args
         self.tp_params = tp_params
 
+        run_mode = P4NetworkRunModes(tp_args.run_mode)
+
+        metrics_server = None
+        if tp_args.metrics_port:
+            from tools.metrics import MetricsServer  # the metrics server is loaded only if enabled
+
+            metrics_server = MetricsServer(port=tp_args.metrics_port)
+            metrics_server.start()
+
+        self._start_network()
+
+        if run_mode == P4NetworkRunModes.WARM_EXPERIMENT:
+            self._serve_iterations(tp_args.control_socket)
+        else:
+            self._start_connectors(tp_args, tp_params.TRAFFIC_PROFILE)
+
+            if run_mode == P4NetworkRunModes.EXPERIMENT:
+                self.experiment_event.wait()
+
+            if run_mode == P4NetworkRunModes.CLI:
+                CLI(mininet=self.net)
+
+            self._stop_connectors()
+
+        self._stop_network()
+
+        if metrics_server:
+            metrics_server.stop()
+
+    def _start_network(self):
         log.info('initializing topology...')
         topo = P4Topo(self.topology_json)
 
         log.info('initializing mininet...')
-        net = Mininet(topo=topo, controller=None, autoStaticArp=True)
+        self.net = Mininet(topo=topo, controller=None, autoStaticArp=True)
 
         log.info('starting mininet...')
-        net.start()
+        self.net.start()
 
-        management_host = self.topology_json['management']['host']['name']
-        management_switches = [self.topology_json['management']['switch'][x]['name'] for x in ['switches', 'hosts']]
+        self.management_host = self.topology_json['management']['host']['name']
+        self.management_switches = [self.topology_json['management']['switch'][x]['name'] for x in ['switches',
+                                                                                                    'hosts']]
 
-        for switch in management_switches:
+        for switch in self.management_switches:
             subprocess.call('ovs-ofctl add-flow {switch} action=normal'.format(switch=switch), shell=True)
 
-        run_mode = P4NetworkRunModes(tp_args.run_mode)
-
-        p4monitor_kwargs = {}
-        p4controller_kwargs = {}
-        if run_mode == P4NetworkRunModes.EXPERIMENT:
-            p4monitor_kwargs.update({'exp': tp_args.exp,
-                                     'exp_iter': tp_args.exp_iter})
-            p4controller_kwargs.update({'exp': tp_args.exp,
-                                        'exp_iter': tp_args.exp_iter})
-        if tp_params.P4_MONITOR == P4Monitors.PortCounterMonitor.value:
-            p4monitor_kwargs.update({'p4monitor_counter_interval': tp_args.p4monitor_counter_interval,
-                                     'p4monitor_counter_direction': tp_args.p4monitor_counter_direction,
-                                     'p4monitor_counter_data': tp_args.p4monitor_counter_data})
-        if tp_params.P4_MONITOR == P4Monitors.ProbingMonitor.value:
-            p4monitor_kwargs.update({'p4monitor_probing_interval': tp_args.p4monitor_probing_interval,
-                                     'p4monitor_probing_mode': tp_args.p4monitor_probing_mode})
-        p4monitor = tp_params.P4_MONITOR(**p4monitor_kwargs)
-
-        if tp_params.P4_CONTROLLER == P4Controllers.FlowForwardingController.value:
-            p4controller_kwargs.update({'flow_forwarding_strategy': tp_args.p4controller_flow_forwarding_strategy,
-                                        'flow_forwarding_metric': tp_args.p4controller_flow_forwarding_metric,
-                                        'time_measurement': tp_args.p4controller_time_measurement})
-        p4controller = None
-        if tp_params.P4_CONTROLLER:
-            p4controller = tp_params.P4_CONTROLLER(**p4controller_kwargs)
-            p4monitor.set_p4controller(p4controller)
-            p4controller.set_p4monitor(p4monitor)
-
         log.info('configuring hosts...')
-        host_mappings = []
-        for host in [h for h in net.hosts if h.name != management_host]:
+        for host in self._get_hosts():
             host.configure()
             host_config = host.get_host_config()
-            p4monitor.add_node(host_config)
+            self.host_configs.append(host_config)
             host.start_services()
             host.describe()
 
-            host_mappings.append('{} {}'.format(host_config['mgmt_ip'], host.name))
+            self.hosts_file_mappings.append('{} {}'.format(host_config['mgmt_ip'], host.name))
 
         log.info('configuring switches...')
-        switch_mappings = []
-        for switch in [s for s in net.switches if s.name not in management_switches]:
+        for switch in self._get_switches():
             switch.configure()
             switch_config = switch.get_switch_config()
-            p4monitor.add_switch_connection(switch.name, switch_config)
-            if p4controller:
-                p4controller.add_switch_connection(switch.name, switch_config)
+            self.switch_configs.append(switch_config)
             switch.start_services()
             switch.describe()
 
-            switch_mappings.append('{} {}'.format(switch_config['mgmt_ip'], switch.name))
-
-        p4monitor.build_topology()
-        p4monitor.start()
-
-        if p4controller:
-            p4controller.start()
-
-        traffic_manager = None
-        if tp_params.TRAFFIC_PROFILE:
-            traffic_manager = TrafficManager(traffic_profile=tp_params.TRAFFIC_PROFILE,
-                                             mininet_network=net,
-                                             mininet_runner=self)
-            if isinstance(p4controller, P4Controllers.FlowForwardingController.value):
-                p4controller.set_traffic_manager(traffic_manager)
-            traffic_manager.start()
-
-        manage_hosts_file(host_mappings + switch_mappings, operation='add')
+            self.hosts_file_mappings.append('{} {}'.format(switch_config['mgmt_ip'], switch.name))
 
-        if run_mode == P4NetworkRunModes.EXPERIMENT:
-            self.experiment_event.wait()
+        manage_hosts_file(self.hosts_file_mappings, operation='add')
 
-        if run_mode == P4NetworkRunModes.CLI:
-            CLI(mininet=net)
+    def _stop_network(self):
+        manage_hosts_file(self.hosts_file_mappings, operation='remove')
 
-        manage_hosts_file(host_mappings + switch_mappings, operation='remove')
+        for host in self._get_hosts():
+            host.stop_services()
 
-        p4monitor.stop_monitor()
+        for switch in self._get_switches():
+            switch.stop_services()
 
-        if p4controller:
-            p4controller.stop_controller()
+        self.net.stop()
 
-        p4monitor.shutdown_switch_connections()
-        if p4controller:
-            p4controller.shutdown_switch_connections()
+    def _get_hosts(self):
+        return [host for host in self.net.hosts if host.name != self.management_host]
 
-        if traffic_manager:
-            traffic_manager.stop()
+    def _get_switches(self):
+        return [switch for switch in self.net.switches if switch.name not in self.management_switches]
 
-        for host in [host_ for host_ in net.hosts if host_.name != management_host]:
-            host.stop_services()
+    def _start_connectors(self, tp_args, traffic_profile):
+        tp_params = self.tp_params
+        run_mode = P4NetworkRunModes(tp_args.run_mode)
 
-        for switch in [switch_ for switch_ in net.switches if switch_.name not in management_switches]:
-            switch.stop_services()
+        p4monitor_kwargs = {}
+        p4controller_kwargs = {}
+        if run_mode in [P4NetworkRunModes.EXPERIMENT, P4NetworkRunModes.WARM_EXPERIMENT]:
+            p4monitor_kwargs.update({'exp': tp_args.exp,
+                                     'exp_iter': tp_args.exp_iter})
+            p4controller_kwargs.update({'exp': tp_args.exp,
+                                        'exp_iter': tp_args.exp_iter})
+        if P4Monitors.PortCounterMonitor.is_class(tp_params.P4_MONITOR):
+            p4monitor_kwargs.update({'p4monitor_counter_interval': tp_args.p4monitor_counter_interval,
+                                     'p4monitor_counter_direction': tp_args.p4monitor_counter_direction,
+                                     'p4monitor_counter_data': tp_args.p4monitor_counter_data,
+                                     'p4monitor_counter_flows': tp_args.p4monitor_counter_flows,
+                                     'p4monitor_counter_elephant_threshold':
+                                         tp_args.p4monitor_counter_elephant_threshold,
+                                     'p4monitor_counter_adaptive': tp_args.p4monitor_counter_adaptive,
+                                     'p4monitor_counter_min_interval': tp_args.p4monitor_counter_min_interval,
+                                     'p4monitor_counter_read_budget': tp_args.p4monitor_counter_read_budget})
+        if P4Monitors.ProbingMonitor.is_class(tp_params.P4_MONITOR):
+            p4monitor_kwargs.update({'p4monitor_probing_interval': tp_args.p4monitor_probing_interval,
+                                     'p4monitor_probing_mode': tp_args.p4monitor_probing_mode})
+        if P4Monitors.INTMonitor.is_class(tp_params.P4_MONITOR):
+            p4monitor_kwargs.update({'p4monitor_int_interval': tp_args.p4monitor_int_interval,
+                                     'p4monitor_int_window': tp_args.p4monitor_int_window})
+        if P4Monitors.FlowMonitor.is_class(tp_params.P4_MONITOR):
+            p4monitor_kwargs.update({'p4monitor_flow_partition_duration': tp_args.p4monitor_flow_partition_duration,
+                                     'p4monitor_flow_partitions': tp_args.p4monitor_flow_partitions})
+        if P4Monitors.HeavyHitterMonitor.is_class(tp_params.P4_MONITOR):
+            p4monitor_kwargs.update({'p4monitor_heavy_hitter_epoch': tp_args.p4monitor_heavy_hitter_epoch,
+                                     'p4monitor_heavy_hitter_threshold': tp_args.p4monitor_heavy_hitter_threshold})
+        self.p4monitor = tp_params.P4_MONITOR(**p4monitor_kwargs)
+
+        if P4Controllers.FlowForwardingController.is_class(tp_params.P4_CONTROLLER):
+            p4controller_kwargs.update({'flow_forwarding_strategy': tp_args.p4controller_flow_forwarding_strategy,
+                                        'flow_forwarding_metric': tp_args.p4controller_flow_forwarding_metric,
+                                        'time_measurement': tp_args.p4controller_time_measurement,
+                                        'time_measurement_interval': tp_args.p4controller_time_measurement_interval})
+        self.p4controller = None
+        if tp_params.P4_CONTROLLER:
+            self.p4controller = tp_params.P4_CONTROLLER(**p4controller_kwargs)
+            self.p4monitor.set_p4controller(self.p4controller)
+            self.p4controller.set_p4monitor(self.p4monitor)
+
+        for host_config in self.host_configs:
+            self.p4monitor.add_node(host_config)
+
+        for switch_config in self.switch_configs:
+            self.p4monitor.add_switch_connection(switch_config['name'], switch_config)
+            if self.p4controller:
+                self.p4controller.add_switch_connection(switch_config['name'], switch_config)
+
+        self.p4monitor.build_topology()
+        self.p4monitor.start()
+
+        if tp_args.p4monitor_query_port:
+            from p4monitors.p4monitor_query import P4MonitorQueryServer  # monitor modules are loaded lazily
+
+            self.p4monitor_query_server = P4MonitorQueryServer(p4monitor=self.p4monitor,
+                                                               port=tp_args.p4monitor_query_port)
+            self.p4monitor_query_server.start()
+
+        if self.p4controller:
+            self.p4controller.start()
+
+        self.traffic_manager = None
+        if traffic_profile:
+            from p4topos.p4topo_traffic import TrafficManager  # traffic modules are loaded only with a profile
+
+            self.traffic_manager = TrafficManager(traffic_profile=traffic_profile,
+                                                  mininet_network=self.net,
+                                                  mininet_runner=self,
+                                                  traffic_generator=tp_args.traffic_generator)
+            if P4Controllers.FlowForwardingController.is_class(tp_params.P4_CONTROLLER):
+                self.p4controller.set_traffic_manager(self.traffic_manager)
+            self.traffic_manager.start()
+
+    def _stop_connectors(self):
+        if self.p4monitor_query_server:
+            self.p4monitor_query_server.stop()
+            self.p4monitor_query_server = None
+
+        self.p4monitor.stop_monitor()
+
+        if self.p4controller:
+            self.p4controller.stop_controller()
+
+        self.p4monitor.shutdown_switch_connections()
+        if self.p4controller:
+            self.p4controller.shutdown_switch_connections()
+
+        if self.traffic_manager:
+            self.traffic_manager.stop()
+
+    def _serve_iterations(self, control_socket):
+        # the network is built once, each iteration only restores the initial switch state and runs new
+        # monitor/controller threads and a new traffic manager, commands are JSON lines on a unix socket
+        from p4controllers.p4connector import P4Connector  # runtime modules are loaded only for warm runs
+
+        snapshot_connector = P4Connector()
+        for switch_config in self.switch_configs:
+            snapshot_connector.add_switch_connection(switch_config['name'], switch_config)
+        snapshots = snapshot_connector.take_snapshots()
+
+        iteration_parser = TopologyArgumentParser.create_parser(all_parameters=True)
+
+        if os.path.exists(control_socket):
+            os.remove(control_socket)
+        server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server_socket.bind(control_socket)
+        server_socket.listen(1)
+        log.info('waiting for iteration commands on {}'.format(control_socket))
+
+        try:
+            serving = True
+            while serving:
+                connection, _ = server_socket.accept()
+                connection_file = connection.makefile('rw')
+                for line in connection_file:
+                    command = json.loads(line)
+                    if command['command'] == WarmRunnerCommands.SHUTDOWN.value:
+                        serving = False
+                        response = {'status': 'ok'}
+                    elif command['command'] == WarmRunnerCommands.ITERATION.value:
+                        response = self._run_iteration(iteration_parser, shlex.split(command['args']),
+                                                       snapshot_connector, snapshots)
+                    else:
+                        response = {'status': 'error', 'error': 'unknown command {}'.format(command['command'])}
+                    connection_file.write(json.dumps(response) + '\n')
+                    connection_file.flush()
+                    if not serving:
+                        break
+                connection_file.close()
+                connection.close()
+        finally:
+            server_socket.close()
+            os.remove(control_socket)
+            snapshot_connector.shutdown_switch_connections()
+
+    def _run_iteration(self, iteration_parser, iteration_args, snapshot_connector, snapshots):
+        start_time = time.time()
+        try:
+            tp_args, _ = iteration_parser.parse_known_args(iteration_args)
+            tp_args.run_mode = P4NetworkRunModes.WARM_EXPERIMENT.value
+            traffic_profile = os.path.join(self.tp_params.TRAFFIC_PROFILES_DIR,
+                                           tp_args.traffic_profile) if tp_args.traffic_profile else None
+            log.info('experiment {} iteration {}'.format(tp_args.exp, tp_args.exp_iter))
+
+            snapshot_connector.restore_snapshots(snapshots)
+            for host in self._get_hosts():
+                host.stop_iperf()
+                host.stop_agent_flows()
+
+            self.experiment_event.clear()
+            self._start_connectors(tp_args, traffic_profile)
+            self.experiment_event.wait()
+            self._stop_connectors()
+        except Exception:
+            log.error(traceback.format_exc())
+            return {'status': 'error', 'error': traceback.format_exc()}
 
-        net.stop()
+        return {'status': 'ok', 'duration': time.time() - start_time}
 
     def end_experiment(self):
-        if tp_args.run_mode == P4NetworkRunModes.EXPERIMENT.value:
+        if self.tp_args.run_mode in [P4NetworkRunModes.EXPERIMENT.value, P4NetworkRunModes.WARM_EXPERIMENT.value]:
             self.experiment_event.set()
 
 
@@ -243,15 +394,20 @@ if __name__ == '__main__':
 
         if tp_args.loglevel != LOG_LEVEL_DEFAULT:
             change_log_level(tp_args.loglevel)
+        for subsystem_log_level in tp_args.loglevel_subsystem or []:
+            subsystem, log_level = subsystem_log_level.split(':')
+            change_log_level(log_level, subsystem=subsystem)
+        if tp_args.logformat != LOG_FORMAT_DEFAULT:
+            change_log_format(tp_args.logformat)
 
         if tp_args.p4controller:
-            p4controller_class = getattr(P4Controllers, tp_args.p4controller).value
+            p4controller_class = getattr(P4Controllers, tp_args.p4controller).load()
         else:
             p4controller_class = None
-        p4monitor_class = getattr(P4Monitors, tp_args.p4monitor).value
+        p4monitor_class = getattr(P4Monitors, tp_args.p4monitor).load()
 
-        p4switch_class = getattr(P4Switches, tp_args.switch).value
-        p4host_class = getattr(P4Hosts, tp_args.host).value
+        p4switch_class = getattr(P4Switches, tp_args.switch).load()
+        p4host_class = getattr(P4Hosts, tp_args.host).load()
 
         tp_params = TopologyParameter.get_topology_params(tp_args=tp_args,
                                                           p4switch_class=p4switch_class,
@@ -0,0 +1,932 @@
+# Copyright 2020-present Christoph Hardegen
+#                        (christoph.hardegen@cs.hs-fulda.de)
+#                        Fulda University of Applied Sciences
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# in-process stand-in for simple_switch_grpc to benchmark controllers and monitors without mininet and bmv2,
+# every fake switch serves P4Runtime (gRPC) and the bmv2 runtime services (thrift) on 127.0.0.1
+#
+# python p4runtime/fake_switch.py leaf_spine --leaves 16 --spines 4 \
+#     --p4json build/flow_forwarding/flow_forwarding.json --p4info build/flow_forwarding/flow_forwarding.p4info \
+#     --switch_configs /tmp/fake_switches.json
+#
+# - tables, multicast groups, counters and registers are kept in memory (loaded from the p4info), packets are not
+#   processed, i.e. table entries are stored and read back but never matched
+# - counters grow synthetically with a per cell rate (up to counter_rate bytes/s), writes set a new base value
+# - latency (+ uniform jitter) is injected into every P4Runtime and thrift call
+# - packet-ins can be injected with FakeSwitch.inject_packet_in, packet-outs are counted
+# - thrift covers the calls used by P4Connector and its subclasses (config, counters, registers, exact/default table
+#   entries, multicast, mirroring), further calls fail with an internal error
+
+if __name__ == '__main__':
+    import sys
+    import os
+
+    if os.getcwd() not in sys.path:
+        sys.path.append(os.getcwd())
+
+import os
+import json
+import time
+import random
+import socket
+import hashlib
+import tempfile
+import threading
+from Queue import Queue
+from collections import OrderedDict
+from concurrent import futures
+
+import grpc
+import google.protobuf.text_format
+from p4.v1 import p4runtime_pb2
+from p4.v1 import p4runtime_pb2_grpc
+from p4.config.v1 import p4info_pb2
+
+from thrift.transport import TSocket
+from thrift.transport import TTransport
+from thrift.protocol import TBinaryProtocol
+from thrift.TMultiplexedProcessor import TMultiplexedProcessor
+
+from bm_runtime.standard import Standard
+from bm_runtime.standard.ttypes import BmCounterValue, InvalidCounterOperation, CounterOperationErrorCode, \
+    InvalidRegisterOperation, RegisterOperationErrorCode, InvalidTableOperation, TableOperationErrorCode
+from bm_runtime.simple_pre_lag import SimplePreLAG
+from sswitch_runtime import SimpleSwitch
+
+from p4runtime.runtimeAPI.convert import encode_number, decode_number
+from p4topos.p4topo_generator import TopologyGenerator
+from p4topos import p4topo_synthetic
+
+from tools.clock import monotonic
+from tools.log.log import get_logger, LogSubsystem
+
+log = get_logger(LogSubsystem.RUNTIME)
+
+FAKE_SWITCH_ADDRESS = '127.0.0.1'
+FAKE_SWITCH_CLASS = 'P4RuntimeSwitch'
+FAKE_SWITCH_CPU_PORT_ID = 510
+FAKE_SWITCH_MANAGEMENT_PORT_ID = 9999
+
+GRPC_MAX_WORKERS = 4  # per fake switch, one worker is occupied by the stream channel of each connection
+READ_RESPONSE_BATCH_SIZE = 1000  # entities per ReadResponse
+
+
+class FakeCounterArray(object):
+
+    def __init__(self, size, rates, packet_size):
+        self.size = size
+        self.rates = rates  # bytes/s per cell
+        self.packet_size = packet_size
+        self.cells = dict()  # index --> (base bytes, base packets, base time), only written cells
+
+    def read(self, index, now):
+        byte_count, packet_count, base_time = self.cells.get(index, (0, 0, None))
+        if self.rates is not None:
+            growth = self.rates[index] * (now - (base_time if base_time is not None else 0.0))
+            byte_count += int(growth)
+            packet_count += int(growth / self.packet_size)
+        return byte_count, packet_count
+
+    def write(self, index, byte_count, packet_count, now):
+        self.cells[index] = (byte_count, packet_count, now)
+
+    def reset(self, now):
+        for index in range(self.size):
+            self.cells[index] = (0, 0, now)
+
+
+class FakeSwitchState(object):
+    # device state of one fake switch, shared by the P4Runtime servicer and the thrift handlers
+
+    def __init__(self, p4info_path, p4json_path, latency=0.0, jitter=0.0, counter_rate=0.0, packet_size=1500,
+                 seed=None):
+        self.p4info = p4info_pb2.P4Info()
+        with open(p4info_path, 'r') as p4info_file:
+            google.protobuf.text_format.Merge(p4info_file.read(), self.p4info)
+        with open(p4json_path, 'r') as p4json_file:
+            self.p4json = p4json_file.read()
+        self.p4json_md5 = hashlib.md5(self.p4json).digest()  # see bmpy_utils.get_json_md5
+
+        self.latency = latency
+        self.jitter = jitter
+        self.counter_rate = counter_rate
+        self.packet_size = packet_size
+        self.random = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.time_started = monotonic()
+
+        self.table_ids = set(table.preamble.id for table in self.p4info.tables)
+        self.direct_counter_tables = dict((counter.direct_table_id, counter.preamble.id)
+                                          for counter in self.p4info.direct_counters)
+        self.counter_names = dict()  # name and alias --> counter id
+        self.register_names = dict()  # name and alias --> register id
+        self.table_names = set()
+        for table in self.p4info.tables:
+            self.table_names.update([table.preamble.name, table.preamble.alias])
+        for counter in self.p4info.counters:
+            self.counter_names[counter.preamble.name] = counter.preamble.id
+            self.counter_names[counter.preamble.alias] = counter.preamble.id
+        self.register_bit_widths = dict()
+        for register in self.p4info.registers:
+            self.register_names[register.preamble.name] = register.preamble.id
+            self.register_names[register.preamble.alias] = register.preamble.id
+            self.register_bit_widths[register.preamble.id] = register.type_spec.bitstring.bit.bitwidth
+
+        self.cookie = None
+
+        self.reset()
+
+        self.packet_out_count = 0
+        self.streams = []  # response queues of the open stream channels
+
+    def reset(self):
+        self.tables = dict((table_id, OrderedDict()) for table_id in self.table_ids)  # entry key --> TableEntry
+        self.default_entries = dict()  # table id --> TableEntry
+        self.direct_counters = dict()  # entry key --> (base bytes, base packets, base time, rate)
+        self.multicast_groups = OrderedDict()  # multicast group id --> MulticastGroupEntry
+        self.counters = dict((counter.preamble.id, FakeCounterArray(counter.size, self._rates(counter.size),
+                                                                    self.packet_size))
+                             for counter in self.p4info.counters)
+        self.registers = dict((register.preamble.id, [0] * register.size) for register in self.p4info.registers)
+
+        self.thrift_tables = dict((table_name, dict()) for table_name in self.table_names)  # handle --> entry
+        self.thrift_default_actions = dict()
+        self.thrift_entry_handle = 0
+        self.mc_handle = 0
+        self.mirroring_sessions = dict()
+
+    def _rates(self, size):
+        if not self.counter_rate:
+            return None
+        return [self.random.uniform(0, self.counter_rate) for _ in range(size)]
+
+    def now(self):
+        return monotonic() - self.time_started
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + self.random.uniform(0, self.jitter))
+
+    # P4Runtime entities
+
+    @staticmethod
+    def get_entry_key(table_entry):
+        return (table_entry.table_id,
+                tuple(match.SerializeToString() for match in sorted(table_entry.match, key=lambda x: x.field_id)),
+                table_entry.priority)
+
+    def write_table_entry(self, update_type, table_entry):
+        if table_entry.table_id not in self.table_ids:
+            raise FakeSwitchEntityException('unknown table id ({})'.format(table_entry.table_id),
+                                            grpc.StatusCode.NOT_FOUND)
+
+        if table_entry.is_default_action:
+            if update_type != p4runtime_pb2.Update.MODIFY:
+                raise FakeSwitchEntityException('default entries can only be modified',
+                                                grpc.StatusCode.INVALID_ARGUMENT)
+            self.default_entries[table_entry.table_id] = table_entry
+            return
+
+        entries = self.tables[table_entry.table_id]
+        entry_key = self.get_entry_key(table_entry)
+        if update_type == p4runtime_pb2.Update.INSERT:
+            if entry_key in entries:
+                raise FakeSwitchEntityException('table entry already exists', grpc.StatusCode.ALREADY_EXISTS)
+            entries[entry_key] = table_entry
+            if table_entry.table_id in self.direct_counter_tables:
+                rate = self.random.uniform(0, self.counter_rate) if self.counter_rate else 0.0
+                self.direct_counters[entry_key] = (0, 0, self.now(), rate)
+        elif update_type == p4runtime_pb2.Update.MODIFY:
+            if entry_key not in entries:
+                raise FakeSwitchEntityException('table entry not found', grpc.StatusCode.NOT_FOUND)
+            entries[entry_key] = table_entry
+        elif update_type == p4runtime_pb2.Update.DELETE:
+            if entries.pop(entry_key, None) is None:
+                raise FakeSwitchEntityException('table entry not found', grpc.StatusCode.NOT_FOUND)
+            self.direct_counters.pop(entry_key, None)
+        else:
+            raise FakeSwitchEntityException('unspecified update type', grpc.StatusCode.INVALID_ARGUMENT)
+
+    def read_table_entries(self, table_entry):
+        if table_entry.is_default_action:
+            default_entry = self.default_entries.get(table_entry.table_id)
+            return [default_entry] if default_entry is not None else []
+
+        table_ids = [table_entry.table_id] if table_entry.table_id else sorted(self.table_ids)
+        if table_entry.match:
+            entry = self.tables.get(table_entry.table_id, {}).get(self.get_entry_key(table_entry))
+            return [entry] if entry is not None else []
+        return [entry for table_id in table_ids for entry in self.tables.get(table_id, {}).values()]
+
+    def write_counter_entry(self, counter_entry):
+        counter = self._get_counter(counter_entry.counter_id)
+        now = self.now()
+        indices = [counter_entry.index.index] if counter_entry.HasField('index') else range(counter.size)
+        for index in indices:
+            self._check_index(index, counter.size)
+            counter.write(index, counter_entry.data.byte_count, counter_entry.data.packet_count, now)
+
+    def read_counter_entries(self, counter_entry):
+        counter_ids = [counter_entry.counter_id] if counter_entry.counter_id else sorted(self.counters)
+        now = self.now()
+        counter_entries = []
+        for counter_id in counter_ids:
+            counter = self._get_counter(counter_id)
+            indices = [counter_entry.index.index] if counter_entry.HasField('index') else range(counter.size)
+            for index in indices:
+                self._check_index(index, counter.size)
+                counter_entry_ = p4runtime_pb2.CounterEntry()
+                counter_entry_.counter_id = counter_id
+                counter_entry_.index.index = index
+                counter_entry_.data.byte_count, counter_entry_.data.packet_count = counter.read(index, now)
+                counter_entries.append(counter_entry_)
+        return counter_entries
+
+    def _get_counter(self, counter_id):
+        try:
+            return self.counters[counter_id]
+        except KeyError:
+            raise FakeSwitchEntityException('unknown counter id ({})'.format(counter_id), grpc.StatusCode.NOT_FOUND)
+
+    @staticmethod
+    def _check_index(index, size):
+        if not 0 <= index < size:
+            raise FakeSwitchEntityException('index out of range ({}, size: {})'.format(index, size),
+                                            grpc.StatusCode.OUT_OF_RANGE)
+
+    def write_direct_counter_entry(self, direct_counter_entry):
+        entry_key = self.get_entry_key(direct_counter_entry.table_entry)
+        if entry_key not in self.direct_counters:
+            raise FakeSwitchEntityException('table entry not found', grpc.StatusCode.NOT_FOUND)
+        rate = self.direct_counters[entry_key][3]
+        self.direct_counters[entry_key] = (direct_counter_entry.data.byte_count,
+                                           direct_counter_entry.data.packet_count, self.now(), rate)
+
+    def read_direct_counter_entries(self, direct_counter_entry):
+        now = self.now()
+        direct_counter_entries = []
+        for table_entry in self.read_table_entries(direct_counter_entry.table_entry):
+            entry_key = self.get_entry_key(table_entry)
+            if entry_key not in self.direct_counters:
+                continue
+            byte_count, packet_count, base_time, rate = self.direct_counters[entry_key]
+            growth = rate * (now - base_time)
+            direct_counter_entry_ = p4runtime_pb2.DirectCounterEntry()
+            direct_counter_entry_.table_entry.CopyFrom(table_entry)
+            direct_counter_entry_.data.byte_count = byte_count + int(growth)
+            direct_counter_entry_.data.packet_count = packet_count + int(growth / self.packet_size)
+            direct_counter_entries.append(direct_counter_entry_)
+        return direct_counter_entries
+
+    def write_register_entry(self, register_entry):
+        register = self._get_register(register_entry.register_id)
+        self._check_index(register_entry.index.index, len(register))
+        register[register_entry.index.index] = decode_number(register_entry.data.bitstring)
+
+    def read_register_entries(self, register_entry):
+        register_ids = [register_entry.register_id] if register_entry.register_id else sorted(self.registers)
+        register_entries = []
+        for register_id in register_ids:
+            register = self._get_register(register_id)
+            indices = [register_entry.index.index] if register_entry.HasField('index') else range(len(register))
+            for index in indices:
+                self._check_index(index, len(register))
+                register_entry_ = p4runtime_pb2.RegisterEntry()
+                register_entry_.register_id = register_id
+                register_entry_.index.index = index
+                bit_width = self.register_bit_widths[register_id]
+                register_entry_.data.bitstring = encode_number(register[index] & (2 ** bit_width - 1), bit_width)
+                register_entries.append(register_entry_)
+        return register_entries
+
+    def _get_register(self, register_id):
+        try:
+            return self.registers[register_id]
+        except KeyError:
+            raise FakeSwitchEntityException('unknown register id ({})'.format(register_id),
+                                            grpc.StatusCode.NOT_FOUND)
+
+    def write_multicast_group_entry(self, update_type, multicast_group_entry):
+        group_id = multicast_group_entry.multicast_group_id
+        if update_type == p4runtime_pb2.Update.INSERT:
+            if group_id in self.multicast_groups:
+                raise FakeSwitchEntityException('multicast group already exists', grpc.StatusCode.ALREADY_EXISTS)
+            self.multicast_groups[group_id] = multicast_group_entry
+        elif update_type == p4runtime_pb2.Update.MODIFY:
+            if group_id not in self.multicast_groups:
+                raise FakeSwitchEntityException('multicast group not found', grpc.StatusCode.NOT_FOUND)
+            self.multicast_groups[group_id] = multicast_group_entry
+        elif update_type == p4runtime_pb2.Update.DELETE:
+            if self.multicast_groups.pop(group_id, None) is None:
+                raise FakeSwitchEntityException('multicast group not found', grpc.StatusCode.NOT_FOUND)
+        else:
+            raise FakeSwitchEntityException('unspecified update type', grpc.StatusCode.INVALID_ARGUMENT)
+
+    def read_multicast_group_entries(self, multicast_group_entry):
+        group_id = multicast_group_entry.multicast_group_id
+        if group_id:
+            return [self.multicast_groups[group_id]] if group_id in self.multicast_groups else []
+        return list(self.multicast_groups.values())
+
+    def write_update(self, update):
+        entity = update.entity
+        entity_type = entity.WhichOneof('entity')
+        if entity_type == 'table_entry':
+            self.write_table_entry(update.type, entity.table_entry)
+        elif entity_type == 'packet_replication_engine_entry' and \
+                entity.packet_replication_engine_entry.WhichOneof('type') == 'multicast_group_entry':
+            self.write_multicast_group_entry(update.type, entity.packet_replication_engine_entry.multicast_group_entry)
+        elif update.type != p4runtime_pb2.Update.MODIFY and entity_type in ['counter_entry', 'direct_counter_entry',
+                                                                             'register_entry']:
+            raise FakeSwitchEntityException('{} can only be modified'.format(entity_type),
+                                            grpc.StatusCode.INVALID_ARGUMENT)
+        elif entity_type == 'counter_entry':
+            self.write_counter_entry(entity.counter_entry)
+        elif entity_type == 'direct_counter_entry':
+            self.write_direct_counter_entry(entity.direct_counter_entry)
+        elif entity_type == 'register_entry':
+            self.write_register_entry(entity.register_entry)
+        else:
+            raise FakeSwitchEntityException('unsupported entity ({})'.format(entity_type),
+                                            grpc.StatusCode.UNIMPLEMENTED)
+
+    def read_entities(self, entity):
+        entity_type = entity.WhichOneof('entity')
+        if entity_type == 'table_entry':
+            return [p4runtime_pb2.Entity(table_entry=x) for x in self.read_table_entries(entity.table_entry)]
+        if entity_type == 'counter_entry':
+            return [p4runtime_pb2.Entity(counter_entry=x) for x in self.read_counter_entries(entity.counter_entry)]
+        if entity_type == 'direct_counter_entry':
+            return [p4runtime_pb2.Entity(direct_counter_entry=x)
+                    for x in self.read_direct_counter_entries(entity.direct_counter_entry)]
+        if entity_type == 'register_entry':
+            return [p4runtime_pb2.Entity(register_entry=x) for x in self.read_register_entries(entity.register_entry)]
+        if entity_type == 'packet_replication_engine_entry' and \
+                entity.packet_replication_engine_entry.WhichOneof('type') == 'multicast_group_entry':
+            entities = []
+            for multicast_group_entry in self.read_multicast_group_entries(
+                    entity.packet_replication_engine_entry.multicast_group_entry):
+                entity_ = p4runtime_pb2.Entity()
+                entity_.packet_replication_engine_entry.multicast_group_entry.CopyFrom(multicast_group_entry)
+                entities.append(entity_)
+            return entities
+        raise FakeSwitchEntityException('unsupported entity ({})'.format(entity_type), grpc.StatusCode.UNIMPLEMENTED)
+
+    # stream channel
+
+    def add_stream(self, responses):
+        with self.lock:
+            self.streams.append(responses)
+
+    def remove_stream(self, responses):
+        with self.lock:
+            if responses in self.streams:
+                self.streams.remove(responses)
+
+    def inject_packet_in(self, payload, metadata=None):
+        # metadata: [(metadata id, encoded value), ...]
+        response = p4runtime_pb2.StreamMessageResponse()
+        response.packet.payload = payload
+        for metadata_id, value in metadata or []:
+            packet_metadata = response.packet.metadata.add()
+            packet_metadata.metadata_id = metadata_id
+            packet_metadata.value = value
+        with self.lock:
+            for responses in self.streams:
+                responses.put(response)
+            return len(self.streams)
+
+    # thrift (bmv2 runtime)
+
+    def get_counter_array(self, counter_name, index=None):
+        if counter_name not in self.counter_names:
+            raise InvalidCounterOperation(CounterOperationErrorCode.INVALID_COUNTER_NAME)
+        counter = self.counters[self.counter_names[counter_name]]
+        if index is not None and not 0 <= index < counter.size:
+            raise InvalidCounterOperation(CounterOperationErrorCode.INVALID_INDEX)
+        return counter
+
+    def get_register_array(self, register_name, index=None):
+        if register_name not in self.register_names:
+            raise InvalidRegisterOperation(RegisterOperationErrorCode.INVALID_REGISTER_NAME)
+        register = self.registers[self.register_names[register_name]]
+        if index is not None and not 0 <= index < len(register):
+            raise InvalidRegisterOperation(RegisterOperationErrorCode.INVALID_INDEX)
+        return register
+
+    def get_thrift_table(self, table_name):
+        if table_name not in self.thrift_tables:
+            raise InvalidTableOperation(TableOperationErrorCode.INVALID_TABLE_NAME)
+        return self.thrift_tables[table_name]
+
+    def serialize(self):
+        now = self.now()
+        return json.dumps({'tables': dict((table_id, len(entries)) for table_id, entries in self.tables.items()),
+                           'multicast_groups': list(self.multicast_groups),
+                           'counters': dict((counter_id, [counter.read(index, now) for index in range(counter.size)])
+                                            for counter_id, counter in self.counters.items()),
+                           'registers': self.registers}, sort_keys=True)
+
+
+class FakeP4RuntimeServicer(p4runtime_pb2_grpc.P4RuntimeServicer):
+
+    def __init__(self, state):
+        self.state = state
+
+    def Write(self, request, context):
+        self.state.delay()
+        error = None
+        with self.state.lock:
+            # like bmv2, all valid updates of a batch are applied, the first error is reported
+            for update in request.updates:
+                try:
+                    self.state.write_update(update)
+                except FakeSwitchEntityException as err:
+                    error = error or err
+        if error is not None:
+            context.set_code(error.status_code)
+            context.set_details(str(error))
+        return p4runtime_pb2.WriteResponse()
+
+    def Read(self, request, context):
+        self.state.delay()
+        try:
+            with self.state.lock:
+                entities = [entity_ for entity in request.entities for entity_ in self.state.read_entities(entity)]
+        except FakeSwitchEntityException as err:
+            context.set_code(err.status_code)
+            context.set_details(str(err))
+            return
+
+        for i in range(0, max(len(entities), 1), READ_RESPONSE_BATCH_SIZE):
+            response = p4runtime_pb2.ReadResponse()
+            response.entities.extend(entities[i:i + READ_RESPONSE_BATCH_SIZE])
+            yield response
+
+    def SetForwardingPipelineConfig(self, request, context):
+        self.state.delay()
+        with self.state.lock:
+            if request.config.HasField('p4info'):
+                self.state.p4info.CopyFrom(request.config.p4info)
+            self.state.cookie = request.config.cookie.cookie if request.config.HasField('cookie') else None
+        return p4runtime_pb2.SetForwardingPipelineConfigResponse()
+
+    def GetForwardingPipelineConfig(self, request, context):
+        self.state.delay()
+        response = p4runtime_pb2.GetForwardingPipelineConfigResponse()
+        if request.response_type != p4runtime_pb2.GetForwardingPipelineConfigRequest.COOKIE_ONLY:
+            response.config.p4info.CopyFrom(self.state.p4info)
+        if self.state.cookie is not None:
+            response.config.cookie.cookie = self.state.cookie
+        return response
+
+    def StreamChannel(self, request_iterator, context):
+        responses = Queue()
+        self.state.add_stream(responses)
+        context.add_callback(lambda: responses.put(None))
+
+        def _receive_requests():
+            try:
+                for request in request_iterator:
+                    request_type = request.WhichOneof('update')
+                    if request_type == 'arbitration':  # every client becomes master
+                        response = p4runtime_pb2.StreamMessageResponse()
+                        response.arbitration.CopyFrom(request.arbitration)
+                        response.arbitration.status.code = grpc.StatusCode.OK.value[0]
+                        responses.put(response)
+                    elif request_type == 'packet':
+                        self.state.packet_out_count += 1
+            except grpc.RpcError:
+                pass
+            finally:
+                responses.put(None)
+
+        receiver = threading.Thread(target=_receive_requests)
+        receiver.daemon = True
+        receiver.start()
+
+        try:
+            while True:
+                response = responses.get()
+                if response is None:
+                    break
+                yield response
+        finally:
+            self.state.remove_stream(responses)
+
+
+class FakeStandardHandler(object):
+
+    def __init__(self, state):
+        self.state = state
+
+    def bm_get_config(self):
+        return self.state.p4json
+
+    def bm_get_config_md5(self):
+        return self.state.p4json_md5
+
+    def bm_reset_state(self):
+        with self.state.lock:
+            self.state.reset()
+
+    def bm_serialize_state(self):
+        with self.state.lock:
+            return self.state.serialize()
+
+    def bm_counter_read(self, cxt_id, counter_name, index):
+        with self.state.lock:
+            byte_count, packet_count = self.state.get_counter_array(counter_name, index).read(index, self.state.now())
+        return BmCounterValue(bytes=byte_count, packets=packet_count)
+
+    def bm_counter_write(self, cxt_id, counter_name, index, value):
+        with self.state.lock:
+            self.state.get_counter_array(counter_name, index).write(index, value.bytes, value.packets,
+                                                                    self.state.now())
+
+    def bm_counter_reset_all(self, cxt_id, counter_name):
+        with self.state.lock:
+            self.state.get_counter_array(counter_name).reset(self.state.now())
+
+    def bm_register_read(self, cxt_id, register_name, index):
+        with self.state.lock:
+            return to_thrift_int64(self.state.get_register_array(register_name, index)[index])
+
+    def bm_register_read_all(self, cxt_id, register_name):
+        with self.state.lock:
+            return [to_thrift_int64(value) for value in self.state.get_register_array(register_name)]
+
+    def bm_register_write(self, cxt_id, register_name, index, value):
+        with self.state.lock:
+            self.state.get_register_array(register_name, index)[index] = value
+
+    def bm_register_write_range(self, cxt_id, register_name, start_index, end_index, value):
+        with self.state.lock:
+            register = self.state.get_register_array(register_name, start_index)
+            # the end index is inclusive (as in bmv2)
+            self.state.get_register_array(register_name, end_index)
+            register[start_index:end_index + 1] = [value] * (end_index + 1 - start_index)
+
+    def bm_register_reset(self, cxt_id, register_name):
+        with self.state.lock:
+            register = self.state.get_register_array(register_name)
+            register[:] = [0] * len(register)
+
+    def bm_mt_add_entry(self, cxt_id, table_name, match_key, action_name, action_data, options):
+        with self.state.lock:
+            table = self.state.get_thrift_table(table_name)
+            entry = (repr(match_key), getattr(options, 'priority', None))
+            if entry in [x[0] for x in table.values()]:
+                raise InvalidTableOperation(TableOperationErrorCode.DUPLICATE_ENTRY)
+            self.state.thrift_entry_handle += 1
+            table[self.state.thrift_entry_handle] = (entry, action_name, action_data)
+            return self.state.thrift_entry_handle
+
+    def bm_mt_delete_entry(self, cxt_id, table_name, entry_handle):
+        with self.state.lock:
+            if self.state.get_thrift_table(table_name).pop(entry_handle, None) is None:
+                raise InvalidTableOperation(TableOperationErrorCode.INVALID_HANDLE)
+
+    def bm_mt_set_default_action(self, cxt_id, table_name, action_name, action_data):
+        with self.state.lock:
+            self.state.get_thrift_table(table_name)
+            self.state.thrift_default_actions[table_name] = (action_name, action_data)
+
+    def bm_mt_get_num_entries(self, cxt_id, table_name):
+        with self.state.lock:
+            return len(self.state.get_thrift_table(table_name))
+
+    def bm_mt_clear_entries(self, cxt_id, table_name, reset_default_entry):
+        with self.state.lock:
+            self.state.get_thrift_table(table_name).clear()
+            if reset_default_entry:
+                self.state.thrift_default_actions.pop(table_name, None)
+
+
+class FakeSimplePreLAGHandler(object):
+    # handles only, the replication itself is not modeled
+
+    def __init__(self, state):
+        self.state = state
+
+    def _next_handle(self):
+        with self.state.lock:
+            self.state.mc_handle += 1
+            return self.state.mc_handle
+
+    def bm_mc_mgrp_create(self, cxt_id, mgrp):
+        return self._next_handle()
+
+    def bm_mc_node_create(self, cxt_id, rid, port_map, lag_map):
+        return self._next_handle()
+
+    def bm_mc_mgrp_destroy(self, cxt_id, mgrp_handle):
+        pass
+
+    def bm_mc_node_destroy(self, cxt_id, l1_handle):
+        pass
+
+    def bm_mc_node_associate(self, cxt_id, mgrp_handle, l1_handle):
+        pass
+
+    def bm_mc_node_dissociate(self, cxt_id, mgrp_handle, l1_handle):
+        pass
+
+    def bm_mc_node_update(self, cxt_id, l1_handle, port_map, lag_map):
+        pass
+
+    def bm_mc_set_lag_membership(self, cxt_id, lag_index, port_map):
+        pass
+
+    def bm_mc_get_entries(self, cxt_id):
+        return json.dumps({'mgrps': [], 'l1_handles': [], 'l2_handles': []})
+
+
+class FakeSimpleSwitchHandler(object):
+
+    def __init__(self, state):
+        self.state = state
+
+    def mirroring_session_add(self, mirror_id, config):
+        with self.state.lock:
+            self.state.mirroring_sessions[mirror_id] = config
+
+    def mirroring_session_delete(self, mirror_id):
+        with self.state.lock:
+            self.state.mirroring_sessions.pop(mirror_id, None)
+
+    def mirroring_session_get(self, mirror_id):
+        with self.state.lock:
+            return self.state.mirroring_sessions[mirror_id]
+
+    def get_time_elapsed_us(self):
+        return int(self.state.now() * 10 ** 6)
+
+    def get_time_since_epoch_us(self):
+        return int(time.time() * 10 ** 6)
+
+    def set_egress_queue_depth(self, port_num, depth_pkts):
+        pass
+
+    def set_all_egress_queue_depths(self, depth_pkts):
+        pass
+
+    def set_egress_queue_rate(self, port_num, rate_pps):
+        pass
+
+    def set_all_egress_queue_rates(self, rate_pps):
+        pass
+
+
+class FakeThriftProcessor(TMultiplexedProcessor):
+
+    def __init__(self, state):
+        TMultiplexedProcessor.__init__(self)
+        self.state = state
+        self.registerProcessor('standard', Standard.Processor(FakeStandardHandler(state)))
+        self.registerProcessor('simple_pre_lag', SimplePreLAG.Processor(FakeSimplePreLAGHandler(state)))
+        self.registerProcessor('simple_switch', SimpleSwitch.Processor(FakeSimpleSwitchHandler(state)))
+
+    def process(self, iprot, oprot):
+        self.state.delay()
+        return TMultiplexedProcessor.process(self, iprot, oprot)
+
+
+class FakeSwitch(object):
+
+    def __init__(self, name, device_id, p4info_path, p4json_path, p4program=None, data_links=None,
+                 grpc_port=0, thrift_port=0, log_dir=None, **state_kwargs):
+        self.name = name
+        self.device_id = device_id
+        self.p4info_path = p4info_path
+        self.p4json_path = p4json_path
+        self.p4program = p4program
+        self.data_links = data_links or {}
+        self.log_dir = log_dir or tempfile.gettempdir()
+
+        self.state = FakeSwitchState(p4info_path, p4json_path, **state_kwargs)
+
+        self.grpc_server = grpc.server(futures.ThreadPoolExecutor(max_workers=GRPC_MAX_WORKERS))
+        p4runtime_pb2_grpc.add_P4RuntimeServicer_to_server(FakeP4RuntimeServicer(self.state), self.grpc_server)
+        self.grpc_port = self.grpc_server.add_insecure_port('{}:{}'.format(FAKE_SWITCH_ADDRESS, grpc_port))
+
+        self.thrift_processor = FakeThriftProcessor(self.state)
+        self.thrift_socket = TSocket.TServerSocket(host=FAKE_SWITCH_ADDRESS, port=thrift_port)
+        self.thrift_socket.listen()
+        self.thrift_port = self.thrift_socket.handle.getsockname()[1]
+        self.thrift_thread = None
+
+        self.running = False
+        self.timestamp_started = None
+
+    def start(self):
+        self.running = True
+        self.timestamp_started = time.time()
+        self.grpc_server.start()
+        self.thrift_thread = threading.Thread(target=self._serve_thrift, name='{}-thrift'.format(self.name))
+        self.thrift_thread.daemon = True
+        self.thrift_thread.start()
+
+    def stop(self):
+        self.running = False
+        self.grpc_server.stop(None)
+        self.thrift_socket.close()
+        if self.thrift_thread is not None:
+            self.thrift_thread.join()
+
+    def _serve_thrift(self):
+        while self.running:
+            try:
+                client = self.thrift_socket.accept()
+            except (socket.error, AttributeError, TTransport.TTransportException):
+                break  # server socket closed
+            if client is None:
+                continue
+            client_thread = threading.Thread(target=self._handle_thrift_client, args=(client,))
+            client_thread.daemon = True
+            client_thread.start()
+
+    def _handle_thrift_client(self, client):
+        transport = TTransport.TBufferedTransport(client)
+        protocol = TBinaryProtocol.TBinaryProtocol(transport)
+        try:
+            while self.running:
+                self.thrift_processor.process(protocol, protocol)
+        except TTransport.TTransportException:
+            pass  # client disconnected
+        except Exception as ex:
+            log.error('{}: thrift connection closed ({})'.format(self.name, ex))
+        finally:
+            transport.close()
+
+    def inject_packet_in(self, payload, metadata=None):
+        return self.state.inject_packet_in(payload, metadata)
+
+    def get_switch_config(self):
+        # same layout as P4RuntimeSwitch._build_switch_config
+        return {'name': self.name,
+                'type': 'switch',
+                'class': FAKE_SWITCH_CLASS,
+                'device_id': self.device_id,
+                'mgmt_ip': FAKE_SWITCH_ADDRESS,
+                'mgmt_mac': None,
+                'thrift_port': self.thrift_port,
+                'p4program': self.p4program,
+                'p4init': None,
+                'bmv2_p4json': self.p4json_path,
+                'bmv2_p4info': self.p4info_path,
+                'ports': {'mgmt_port': FAKE_SWITCH_MANAGEMENT_PORT_ID,
+                          'cpu_port': FAKE_SWITCH_CPU_PORT_ID,
+                          'data_links': self.data_links},
+                'nanolog_ipc': None,
+                'notifications_ipc': None,
+                'runtime_thrift_log': os.path.join(self.log_dir, '{}_runtime_thrift.log'.format(self.name)),
+                'timestamp_started': self.timestamp_started,
+                'runtime_json': None,
+                'grpc_port': self.grpc_port,
+                'runtime_gRPC_log': None,
+                'runtime_gRPC_log_binary': False}
+
+
+class FakeNetwork(object):
+    # fake switches and host configs for a links config (see p4topos/p4topo_synthetic.py)
+    SWITCHNAME = 's{}'
+    HOSTNAME = 'h{}'
+    HOST_IP = '10.{}.{}.1'
+    HOST_NETWORK = '10.{}.{}.0/24'
+    HOST_GW = '10.{}.{}.254'
+    HOST_MAC = 'CA:FE:BA:BE:{}:{}'
+    HOST_GW_MAC = 'BA:DE:AF:FE:{}:{}'
+
+    LINK_BANDWIDTH_HOSTS = 10
+    LINK_BANDWIDTH_SWITCHES = 1
+
+    def __init__(self, links, p4info_path, p4json_path, p4program=None, log_dir=None, seed=None, **state_kwargs):
+        links = TopologyGenerator.assign_switch_ports(links)
+        data_links = self.get_data_links(links)
+        self.host_configs = OrderedDict((self.HOSTNAME.format(hlink['host']), self.get_host_config(hlink['host']))
+                                        for hlink in links['host_links'])
+
+        self.switches = OrderedDict()
+        for switch_num in sorted(data_links):
+            switch = self.SWITCHNAME.format(switch_num)
+            self.switches[switch] = FakeSwitch(switch, str(switch_num), p4info_path, p4json_path, p4program=p4program,
+                                               data_links=data_links[switch_num], log_dir=log_dir,
+                                               seed=None if seed is None else seed + switch_num, **state_kwargs)
+
+    @classmethod
+    def get_data_links(cls, links):
+        # switch number --> {port: data link} of a links config with assigned ports
+        data_links = dict()
+        for hlink in links['host_links']:
+            host = cls.HOSTNAME.format(hlink['host'])
+            switch = cls.SWITCHNAME.format(hlink['switch'])
+            data_links.setdefault(hlink['switch'], {})[hlink['switch_port']] = cls._data_link(
+                switch, host, hlink.get('bw', cls.LINK_BANDWIDTH_HOSTS), hlink)
+        for slink in links['switch_links']:
+            switch1 = cls.SWITCHNAME.format(slink['switch1'])
+            switch2 = cls.SWITCHNAME.format(slink['switch2'])
+            bw = slink.get('bw', cls.LINK_BANDWIDTH_SWITCHES)
+            data_links.setdefault(slink['switch1'], {})[slink['switch1_port']] = cls._data_link(switch1, switch2,
+                                                                                                 bw, slink)
+            data_links.setdefault(slink['switch2'], {})[slink['switch2_port']] = cls._data_link(switch2, switch1,
+                                                                                                 bw, slink)
+        return data_links
+
+    @staticmethod
+    def _data_link(switch, peer, bw, link):
+        return {'name': '{}-{}'.format(switch, peer), 'peer': peer, 'bw': bw,
+                'delay': link.get('delay', 0), 'loss': link.get('loss', 0)}
+
+    @classmethod
+    def get_host_config(cls, host_num):
+        # individual host networks (see TopologyParameter)
+        host_ip_bytes = TopologyGenerator.get_ip_bytes(host_num)
+        host_mac_bytes = TopologyGenerator.get_mac_bytes(host_num)
+        return {'name': cls.HOSTNAME.format(host_num),
+                'type': 'host',
+                'class': 'P4Host',
+                'ip': cls.HOST_IP.format(*host_ip_bytes),
+                'ip_': cls.HOST_IP.format(*host_ip_bytes) + '/24',
+                'mac': cls.HOST_MAC.format(*host_mac_bytes),
+                'network': cls.HOST_NETWORK.format(*host_ip_bytes),
+                'gw_ip': cls.HOST_GW.format(*host_ip_bytes),
+                'gw_mac': cls.HOST_GW_MAC.format(*host_mac_bytes),
+                'mgmt_ip': None,
+                'mgmt_ip_': None,
+                'mgmt_mac': None}
+
+    def start(self):
+        for fake_switch in self.switches.values():
+            fake_switch.start()
+
+    def stop(self):
+        for fake_switch in self.switches.values():
+            fake_switch.stop()
+
+    def get_switch_configs(self):
+        return [fake_switch.get_switch_config() for fake_switch in self.switches.values()]
+
+    def get_host_configs(self):
+        return list(self.host_configs.values())
+
+
+class FakeSwitchEntityException(Exception):
+
+    def __init__(self, message, status_code=grpc.StatusCode.INVALID_ARGUMENT):
+        super(FakeSwitchEntityException, self).__init__(self.__class__.__name__ + ': ' + message)
+        self.status_code = status_code
+
+
+def to_thrift_int64(value):
+    # thrift register values are i64 (lower 64 bit of the cell)
+    value &= 2 ** 64 - 1
+    return value - 2 ** 64 if value >= 2 ** 63 else value
+
+
+def create_parser():
+    parser = p4topo_synthetic.create_parser()
+    parser.description = 'fake P4Runtime/thrift switches for a synthetic topology'
+    parser.add_argument('--p4json', type=str, required=True, help='compiled bmv2 JSON of the P4 program')
+    parser.add_argument('--p4info', type=str, required=True, help='compiled p4info (text) of the P4 program')
+    parser.add_argument('--latency', type=float, default=0.0, help='latency per call (s)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='additional uniform latency per call (s)')
+    parser.add_argument('--counter_rate', type=float, default=0.0, help='max. synthetic counter growth (bytes/s)')
+    parser.add_argument('--switch_configs', type=str, default=None,
+                        help='output file for the switch and host configs (JSON)')
+    return parser
+
+
+if __name__ == '__main__':
+    args = create_parser().parse_args()
+    _, topology_args = p4topo_synthetic.get_topology_args(args)
+    links = p4topo_synthetic.SyntheticTopologyGenerator.build(args.type, **topology_args)
+    network = FakeNetwork(links, args.p4info, args.p4json,
+                          p4program=args.p4program[0], seed=args.seed, latency=args.latency, jitter=args.jitter,
+                          counter_rate=args.counter_rate)
+    network.start()
+    print('{} fake switches started'.format(len(network.switches)))
+
+    if args.switch_configs:
+        with open(args.switch_configs, 'w') as switch_configs_file:
+            json.dump({'switches': network.get_switch_configs(), 'hosts': network.get_host_configs()},
+                      switch_configs_file, indent=2)
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        network.stop()
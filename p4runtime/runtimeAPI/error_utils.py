@@ -27,7 +27,9 @@ from google.rpc import status_pb2, code_pb2
 import grpc
 from p4.v1 import p4runtime_pb2
 
-from tools.log.log import log
+from tools.log.log import get_logger, LogSubsystem
+
+log = get_logger(LogSubsystem.RUNTIME)
 
 
 class P4RuntimeErrorFormatException(Exception):
@@ -206,3 +206,16 @@ class P4InfoHelper(object):
             replica_.instance = replica['instance']
             multicast_entry.multicast_group_entry.replicas.extend([replica_])
         return multicast_entry
+
+    def get_register_bit_width(self, register_name):
+        return self.get('registers', name=register_name).type_spec.bitstring.bit.bitwidth
+
+    def get_register_size(self, register_name):
+        return self.get('registers', name=register_name).size
+
+    def build_register_entry(self, register_name, index, value):
+        register_entry = p4runtime_pb2.RegisterEntry()
+        register_entry.register_id = self.get_registers_id(register_name)
+        register_entry.index.index = index
+        register_entry.data.bitstring = encode(int(value), self.get_register_bit_width(register_name))
+        return register_entry
@@ -23,11 +23,19 @@
 
 import json
 import os
+import hashlib
+
+import grpc
+import numpy as np
+from p4.v1 import p4runtime_pb2
 
 import switch
 import helper as p4info_help
+from convert import decode_number
+
+from tools.log.log import get_logger, LogSubsystem
 
-from tools.log.log import log
+log = get_logger(LogSubsystem.RUNTIME)
 
 
 def check_switch_config(switch_config, work_dir):
@@ -46,7 +54,8 @@ def check_switch_config(switch_config, work_dir):
             raise P4RuntimeConfigException('config file {} does not exist'.format(config_file_path))
 
 
-def program_switch(switch_name, switch_addr, device_id, runtime_conf_file, p4init, work_dir, runtime_gRPC_log):
+def program_switch(switch_name, switch_addr, device_id, runtime_conf_file, p4init, work_dir, runtime_gRPC_log,
+                   runtime_gRPC_log_binary=False):
     def table_entry_to_string(flow):
         if 'match' in flow:
             match_str = ['{}={}'.format(mname, str(flow['match'][mname])) for mname in flow['match']]
@@ -78,41 +87,205 @@ def program_switch(switch_name, switch_addr, device_id, runtime_conf_file, p4ini
 
     log.info('connecting to p4runtime server on ' + switch_addr + ' (' + switch_name + ')')
     p4switch = switch.Bmv2SwitchConnection(switch_addr=switch_addr, device_id=device_id,
-                                           runtime_gRPC_log=runtime_gRPC_log)
+                                           runtime_gRPC_log=runtime_gRPC_log,
+                                           runtime_gRPC_log_binary=runtime_gRPC_log_binary)
     try:
         p4switch.master_arbitration_update()
 
-        log.info('applying pipeline config ' + switch_config['bmv2_json'] + ' to ' + switch_name)
         bmv2_json_file = os.path.join(work_dir, switch_config['bmv2_json'])
-        p4switch.set_forwarding_pipeline_config(p4info=p4info_helper.p4info,
-                                                bmv2_json_file=bmv2_json_file)
+        cookie = get_device_config_cookie(p4info_helper, bmv2_json_file)
+        pipeline_changed = p4switch.get_forwarding_pipeline_config_cookie() != cookie
+        if pipeline_changed:
+            log.info('applying pipeline config ' + switch_config['bmv2_json'] + ' to ' + switch_name)
+            p4switch.set_forwarding_pipeline_config(p4info=p4info_helper.p4info,
+                                                    bmv2_json_file=bmv2_json_file,
+                                                    cookie=cookie)
+        else:
+            log.info('pipeline config ' + switch_config['bmv2_json'] + ' already applied to ' + switch_name)
 
+        # entries of the runtime config are the desired state, with a fresh pipeline all entries are inserted
+        table_entries = []
+        group_entries = []
         if p4init in ['p4runtime_API', 'hybrid']:
-            if 'table_entries' in switch_config:
-                table_entries = switch_config['table_entries']
-                log.info('inserting {} table entries'.format(len(table_entries)))
-                for entry in table_entries:
-                    log.info(table_entry_to_string(entry))
-                    insert_table_entry(p4switch, p4info_helper, entry)
-
-                    # if not 'default_action' in entry:
-                    #     delete_table_entry(p4switch, entry, p4info_helper)
-
-            if 'multicast_group_entries' in switch_config:
-                group_entries = switch_config['multicast_group_entries']
-                log.info('inserting {} group entries'.format(len(group_entries)))
-                for entry in group_entries:
-                    log.info(group_entry_to_string(entry))
-                    insert_multicast_group_entry(p4switch, p4info_helper, entry)
-
-                    # if not 'default_action' in entry:
-                    #     delete_multicast_group_entry(p4switch, entry, p4info_helper)
+            table_entries = switch_config.get('table_entries', [])
+            group_entries = switch_config.get('multicast_group_entries', [])
+            for entry in table_entries:
+                log.info(table_entry_to_string(entry))
+            for entry in group_entries:
+                log.info(group_entry_to_string(entry))
+
+        reconcile_switch(p4switch, p4info_helper, table_entries, group_entries, read_state=not pipeline_changed)
     except Exception as ex:
         log.error(ex)
     finally:
         p4switch.shutdown()
 
 
+def get_device_config_cookie(p4info_helper, bmv2_json_file):
+    # identifies the applied pipeline config (p4info and bmv2 JSON) on the switch
+    config_hash = hashlib.md5(p4info_helper.p4info.SerializeToString())
+    with open(bmv2_json_file, 'rb') as json_file:
+        config_hash.update(json_file.read())
+    return int(config_hash.hexdigest()[:16], 16)
+
+
+def _canonical_bytes(value):
+    # the switch returns byte strings in canonical (shortest) form
+    return value.lstrip('\x00') or '\x00'
+
+
+def _canonical_fields(message):
+    return tuple((field.name, _canonical_bytes(value) if isinstance(value, bytes) else value)
+                 for field, value in message.ListFields())
+
+
+def _table_entry_key(table_entry):
+    match_key = tuple(sorted((field_match.field_id, field_match.WhichOneof('field_match'),
+                              _canonical_fields(getattr(field_match, field_match.WhichOneof('field_match'))))
+                             for field_match in table_entry.match))
+    return table_entry.table_id, table_entry.priority, match_key
+
+
+def _table_action_key(table_entry):
+    action = table_entry.action
+    if action.WhichOneof('type') != 'action':
+        return action.SerializeToString()
+    return action.action.action_id, tuple(sorted((param.param_id, _canonical_bytes(param.value))
+                                                 for param in action.action.params))
+
+
+def _multicast_group_key(multicast_group_entry):
+    return tuple(sorted((replica.egress_port, replica.instance) for replica in multicast_group_entry.replicas))
+
+
+def reconcile_switch(p4switch_connection, p4info_helper, table_entries, group_entries, read_state=True):
+    table_entries = [p4info_helper.build_table_entry(table_name=flow['table'],
+                                                     match_fields=flow.get('match'),
+                                                     default_action=flow.get('default_action'),
+                                                     action_name=flow['action_name'],
+                                                     action_params=flow['action_params'],
+                                                     priority=flow.get('priority')) for flow in table_entries]
+    multicast_entries = [p4info_helper.build_multicast_group_entry(rule['multicast_group_id'], rule['replicas'])
+                         for rule in group_entries]
+
+    return reconcile_entries(p4switch_connection, table_entries, multicast_entries, read_state=read_state)
+
+
+def reconcile_entries(p4switch_connection, table_entries, multicast_entries, read_state=True):
+    desired_entries = {}
+    default_entries = []
+    for table_entry in table_entries:
+        if table_entry.is_default_action:
+            default_entries.append(table_entry)
+        else:
+            desired_entries[_table_entry_key(table_entry)] = table_entry
+
+    desired_groups = {}
+    for multicast_entry in multicast_entries:
+        desired_groups[multicast_entry.multicast_group_entry.multicast_group_id] = multicast_entry
+
+    current_entries = {}
+    current_groups = {}
+    if read_state:
+        for table_entry in read_all_table_entries(p4switch_connection):
+            current_entries[_table_entry_key(table_entry)] = table_entry
+        for multicast_entry in read_all_multicast_group_entries(p4switch_connection):
+            current_groups[multicast_entry.multicast_group_entry.multicast_group_id] = multicast_entry
+
+    deletes, modifies, inserts = [], [], []
+    for key, table_entry in current_entries.items():
+        if key not in desired_entries:
+            deletes.append((p4runtime_pb2.Update.DELETE, _build_entity(table_entry=table_entry)))
+    for key, table_entry in desired_entries.items():
+        if key not in current_entries:
+            inserts.append((p4runtime_pb2.Update.INSERT, _build_entity(table_entry=table_entry)))
+        elif _table_action_key(current_entries[key]) != _table_action_key(table_entry):
+            modifies.append((p4runtime_pb2.Update.MODIFY, _build_entity(table_entry=table_entry)))
+    # default entries are not returned by wildcard reads, modifying them is idempotent
+    for table_entry in default_entries:
+        modifies.append((p4runtime_pb2.Update.MODIFY, _build_entity(table_entry=table_entry)))
+
+    for group_id, multicast_entry in current_groups.items():
+        if group_id not in desired_groups:
+            deletes.append((p4runtime_pb2.Update.DELETE, _build_entity(multicast_entry=multicast_entry)))
+    for group_id, multicast_entry in desired_groups.items():
+        if group_id not in current_groups:
+            inserts.append((p4runtime_pb2.Update.INSERT, _build_entity(multicast_entry=multicast_entry)))
+        elif (_multicast_group_key(current_groups[group_id].multicast_group_entry) !=
+              _multicast_group_key(multicast_entry.multicast_group_entry)):
+            modifies.append((p4runtime_pb2.Update.MODIFY, _build_entity(multicast_entry=multicast_entry)))
+
+    log.info('reconciling switch state: {} deletes, {} modifies, {} inserts'.format(len(deletes), len(modifies),
+                                                                                  len(inserts)))
+    # deletes first to free table capacity
+    p4switch_connection.write_updates(deletes + modifies + inserts)
+
+    return len(deletes), len(modifies), len(inserts)
+
+
+def read_all_table_entries(p4switch_connection):
+    table_entries = []
+    for response in p4switch_connection.get_table_entries():
+        for entity in response.entities:
+            table_entries.append(entity.table_entry)
+    return table_entries
+
+
+def read_all_multicast_group_entries(p4switch_connection):
+    multicast_entries = []
+    try:
+        for response in p4switch_connection.get_multicast_group_entries():
+            for entity in response.entities:
+                multicast_entries.append(entity.packet_replication_engine_entry)
+    except grpc.RpcError:
+        log.warning('reading multicast groups failed, assuming no groups on the switch')
+    return multicast_entries
+
+
+def read_all_counter_entries(p4switch_connection, p4info_helper):
+    counter_entries = []
+    for counter in p4info_helper.p4info.counters:
+        for response in p4switch_connection.get_counters(counter.preamble.id):
+            for entity in response.entities:
+                counter_entries.append(entity.counter_entry)
+    return counter_entries
+
+
+def write_counter_entries(p4switch_connection, counter_entries):
+    p4switch_connection.write_updates([(p4runtime_pb2.Update.MODIFY, _build_entity(counter_entry=counter_entry))
+                                       for counter_entry in counter_entries])
+
+
+def read_all_direct_counter_entries(p4switch_connection):
+    direct_counter_entries = []
+    for response in p4switch_connection.get_direct_counters():
+        for entity in response.entities:
+            direct_counter_entries.append(entity.direct_counter_entry)
+    return direct_counter_entries
+
+
+def write_direct_counter_entries(p4switch_connection, direct_counter_entries):
+    p4switch_connection.write_updates([(p4runtime_pb2.Update.MODIFY,
+                                        _build_entity(direct_counter_entry=direct_counter_entry))
+                                       for direct_counter_entry in direct_counter_entries])
+
+
+def _build_entity(table_entry=None, multicast_entry=None, counter_entry=None, register_entry=None,
+                  direct_counter_entry=None):
+    entity = p4runtime_pb2.Entity()
+    if table_entry is not None:
+        entity.table_entry.CopyFrom(table_entry)
+    if multicast_entry is not None:
+        entity.packet_replication_engine_entry.CopyFrom(multicast_entry)
+    if counter_entry is not None:
+        entity.counter_entry.CopyFrom(counter_entry)
+    if register_entry is not None:
+        entity.register_entry.CopyFrom(register_entry)
+    if direct_counter_entry is not None:
+        entity.direct_counter_entry.CopyFrom(direct_counter_entry)
+    return entity
+
+
 # object hook for json library, use str instead of unicode object
 # https://stackoverflow.com/questions/956867/how-to-get-string-objects-instead-of-unicode-from-json
 def json_load_byteified(file_handle):
@@ -221,6 +394,53 @@ def get_counters(p4switch_connection, p4info_helper, counter_name, index=None, s
     return counters
 
 
+def read_register(p4switch_connection, p4info_helper, register_name, index=None):
+    # all cells (one wildcard read) or one cell of a register as numpy array, registers wider than 64 bit as objects
+    register_size = p4info_helper.get_register_size(register_name) if index is None else 1
+    register_dtype = np.uint64 if p4info_helper.get_register_bit_width(register_name) <= 64 else object
+    values = np.zeros(register_size, dtype=register_dtype)
+    index_offset = index if index is not None else 0
+    for result in p4switch_connection.get_register_entries(p4info_helper.get_registers_id(register_name), index):
+        for entity in result.entities:
+            register_entry = entity.register_entry
+            values[register_entry.index.index - index_offset] = decode_number(register_entry.data.bitstring)
+    return values
+
+
+def get_table_entry_key(p4info_helper, flow):
+    # key of the table entry of a rule as in entries read from the switch (see read_direct_counters)
+    table_entry = p4info_helper.build_table_entry(table_name=flow['table'],
+                                                  match_fields=flow.get('match'),
+                                                  priority=flow.get('priority'))
+    return _table_entry_key(table_entry)
+
+
+def read_direct_counters(p4switch_connection, p4info_helper, table_name):
+    # direct counters of all entries of a table (one wildcard read): table entry keys, byte and packet counts
+    entry_keys = []
+    byte_counts = []
+    packet_counts = []
+    for result in p4switch_connection.get_direct_counters(p4info_helper.get_tables_id(table_name)):
+        for entity in result.entities:
+            direct_counter_entry = entity.direct_counter_entry
+            entry_keys.append(_table_entry_key(direct_counter_entry.table_entry))
+            byte_counts.append(direct_counter_entry.data.byte_count)
+            packet_counts.append(direct_counter_entry.data.packet_count)
+    return entry_keys, np.array(byte_counts, dtype=np.int64), np.array(packet_counts, dtype=np.int64)
+
+
+def write_register(p4switch_connection, p4info_helper, register_name, values, index=0):
+    # cells index, index + 1, ... of a register, sent in batches (see SwitchConnection.write_updates)
+    write_register_cells(p4switch_connection, p4info_helper, register_name,
+                         range(index, index + len(values)), values)
+
+
+def write_register_cells(p4switch_connection, p4info_helper, register_name, indices, values):
+    p4switch_connection.write_updates([(p4runtime_pb2.Update.MODIFY, _build_entity(
+        register_entry=p4info_helper.build_register_entry(register_name, index, value)))
+        for index, value in zip(indices, values)])
+
+
 class P4RuntimeConfigException(Exception):
 
     def __init__(self, message):
@@ -22,9 +22,13 @@
 # see https://github.com/p4lang/tutorials/blob/master/utils/p4runtime_lib/bmv2.py   #
 #####################################################################################
 
-from Queue import Queue
+from Queue import Queue, Full
 from abc import abstractmethod
 from datetime import datetime
+import struct
+import sys
+import threading
+import time
 
 import grpc
 from p4.v1 import p4runtime_pb2
@@ -33,19 +37,27 @@ from p4.tmp import p4config_pb2
 
 
 MSG_LOG_MAX_LEN = 2048
+WRITE_BATCH_SIZE = 128
+MSG_LOG_QUEUE_SIZE = 4096
+
+# binary log record: timestamp, length of method name, length of serialized message
+MSG_LOG_RECORD_HEADER = struct.Struct('<dHI')
+# method name of the binary log record with the number of dropped messages (message: decimal string)
+MSG_LOG_DROPPED = 'dropped'
 
 
 class SwitchConnection(object):
 
-    def __init__(self, switch_addr, device_id, runtime_gRPC_log=None, name=None):
+    def __init__(self, switch_addr, device_id, runtime_gRPC_log=None, name=None, runtime_gRPC_log_binary=False):
         self.name = name
         self.switch_addr = switch_addr
         self.device_id = int(device_id)
         self.p4info = None
         self.channel = grpc.insecure_channel(self.switch_addr)
+        self.request_logger = None
         if runtime_gRPC_log is not None:
-            interceptor = GrpcRequestLogger(runtime_gRPC_log)
-            self.channel = grpc.intercept_channel(self.channel, interceptor)
+            self.request_logger = GrpcRequestLogger(runtime_gRPC_log, binary=runtime_gRPC_log_binary)
+            self.channel = grpc.intercept_channel(self.channel, self.request_logger)
         self.client_stub = p4runtime_pb2_grpc.P4RuntimeStub(self.channel)
         self.requests_stream = IterableQueue()
         self.stream_message_response = self.client_stub.StreamChannel(iter(self.requests_stream))
@@ -58,6 +70,8 @@ class SwitchConnection(object):
     def shutdown(self):
         self.requests_stream.close()
         self.stream_message_response.cancel()
+        if self.request_logger is not None:
+            self.request_logger.close()
 
     def master_arbitration_update(self):
         request = p4runtime_pb2.StreamMessageRequest()
@@ -70,7 +84,7 @@ class SwitchConnection(object):
         for response in self.stream_message_response:
             return response  # exactly one
 
-    def set_forwarding_pipeline_config(self, p4info, bmv2_json_file):
+    def set_forwarding_pipeline_config(self, p4info, bmv2_json_file, cookie=None):
         device_config = self.build_device_config(bmv2_json_file)
         request = p4runtime_pb2.SetForwardingPipelineConfigRequest()
         request.election_id.low = 1
@@ -79,10 +93,40 @@ class SwitchConnection(object):
 
         config.p4info.CopyFrom(p4info)
         config.p4_device_config = device_config.SerializeToString()
+        if cookie is not None:
+            config.cookie.cookie = cookie
 
         request.action = p4runtime_pb2.SetForwardingPipelineConfigRequest.VERIFY_AND_COMMIT
         self.client_stub.SetForwardingPipelineConfig(request)
 
+    def get_forwarding_pipeline_config_cookie(self):
+        request = p4runtime_pb2.GetForwardingPipelineConfigRequest()
+        request.device_id = self.device_id
+        request.response_type = p4runtime_pb2.GetForwardingPipelineConfigRequest.COOKIE_ONLY
+
+        try:
+            response = self.client_stub.GetForwardingPipelineConfig(request)
+        except grpc.RpcError:  # no pipeline config applied yet
+            return None
+
+        if not response.config.HasField('cookie'):
+            return None
+        return response.config.cookie.cookie
+
+    def write_updates(self, updates):
+        # updates: list of (update type, entity), sent in batches of WRITE_BATCH_SIZE updates per request
+        for batch_start in range(0, len(updates), WRITE_BATCH_SIZE):
+            request = p4runtime_pb2.WriteRequest()
+            request.device_id = self.device_id
+            request.election_id.low = 1
+
+            for update_type, entity in updates[batch_start:batch_start + WRITE_BATCH_SIZE]:
+                update = request.updates.add()
+                update.type = update_type
+                update.entity.CopyFrom(entity)
+
+            self.client_stub.Write(request)
+
     def write_table_entry(self, table_entry):
         request = p4runtime_pb2.WriteRequest()
         request.device_id = self.device_id
@@ -145,6 +189,20 @@ class SwitchConnection(object):
         for response in self.client_stub.Read(request):
             yield response
 
+    def get_multicast_group_entries(self, multicast_group_id=None):
+        request = p4runtime_pb2.ReadRequest()
+        request.device_id = self.device_id
+        entity = request.entities.add()
+        multicast_group_entry = entity.packet_replication_engine_entry.multicast_group_entry
+
+        if multicast_group_id is not None:
+            multicast_group_entry.multicast_group_id = multicast_group_id
+        else:
+            multicast_group_entry.multicast_group_id = 0
+
+        for response in self.client_stub.Read(request):
+            yield response
+
     def get_counters(self, counter_id=None, index=None):
         request = p4runtime_pb2.ReadRequest()
         request.device_id = self.device_id
@@ -162,28 +220,113 @@ class SwitchConnection(object):
         for response in self.client_stub.Read(request):
             yield response
 
+    def get_direct_counters(self, table_id=None):
+        # without table id the direct counters of all tables are read
+        request = p4runtime_pb2.ReadRequest()
+        request.device_id = self.device_id
+        entity = request.entities.add()
+        direct_counter_entry = entity.direct_counter_entry
+
+        if table_id is not None:
+            direct_counter_entry.table_entry.table_id = table_id
+        else:
+            direct_counter_entry.table_entry.table_id = 0
+
+        for response in self.client_stub.Read(request):
+            yield response
+
+    def get_register_entries(self, register_id=None, index=None):
+        # without index all cells of the register are read (wildcard read)
+        request = p4runtime_pb2.ReadRequest()
+        request.device_id = self.device_id
+        entity = request.entities.add()
+        register_entry = entity.register_entry
+
+        if register_id is not None:
+            register_entry.register_id = register_id
+        else:
+            register_entry.register_id = 0
+
+        if index is not None:
+            register_entry.index.index = index
+
+        for response in self.client_stub.Read(request):
+            yield response
+
 
 class GrpcRequestLogger(grpc.UnaryUnaryClientInterceptor,
                         grpc.UnaryStreamClientInterceptor):
+    # intercepted requests are handed to a background writer, messages are dropped (and counted) if it falls behind
 
-    def __init__(self, log_file):
+    def __init__(self, log_file, binary=False, queue_size=MSG_LOG_QUEUE_SIZE):
         self.log_file = log_file
+        self.binary = binary
+
+        self.messages = Queue(maxsize=queue_size)
+        self.dropped_messages = 0
 
-        with open(self.log_file, 'a') as grpc_interception_file:
-            grpc_interception_file.write('\n\n')
+        self.writer = threading.Thread(target=self._write_messages, name='grpc-log-writer')
+        self.writer.daemon = True
+        self.writer.start()
 
     def log_message(self, method_name, body):
-        with open(self.log_file, 'a') as grpc_interception_file:
-            ts = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-            message = str(body)
-            grpc_interception_file.write('\n[{}] {}\n---\n'.format(ts, method_name))
-            if len(message) < MSG_LOG_MAX_LEN:
-                grpc_interception_file.write(str(body))
-            else:
-                grpc_interception_file.write('log message too long ({} bytes > {} bytes)\n'.format(len(message),
-                                                                                                   MSG_LOG_MAX_LEN))
-            grpc_interception_file.write('---\n')
-            grpc_interception_file.flush()
+        # serialized when intercepted, the caller may modify the message afterwards (e.g. reused request patterns)
+        try:
+            self.messages.put_nowait((time.time(), method_name, body.SerializeToString()))
+        except Full:
+            self.dropped_messages += 1
+
+    def close(self):
+        if self.writer.is_alive():
+            self.messages.put(None)
+            self.writer.join()
+
+    def _write_messages(self):
+        with open(self.log_file, 'ab' if self.binary else 'a') as grpc_interception_file:
+            if not self.binary:
+                grpc_interception_file.write('\n\n')
+
+            while True:
+                message = self.messages.get()
+                if message is None:
+                    break
+
+                if self.binary:
+                    self._write_binary_message(grpc_interception_file, *message)
+                else:
+                    self._write_text_message(grpc_interception_file, *message)
+
+                if self.messages.empty():
+                    grpc_interception_file.flush()
+
+            if self.dropped_messages:
+                if self.binary:
+                    self._write_binary_message(grpc_interception_file, time.time(), MSG_LOG_DROPPED,
+                                               str(self.dropped_messages))
+                else:
+                    grpc_interception_file.write('\n{} log messages dropped\n'.format(self.dropped_messages))
+
+    @staticmethod
+    def _write_text_message(grpc_interception_file, timestamp, method_name, message):
+        ts = datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        grpc_interception_file.write('\n[{}] {}\n---\n'.format(ts, method_name))
+        # the text format is never shorter than the wire format, so oversized messages are not formatted at all
+        message_len = len(message)
+        if message_len < MSG_LOG_MAX_LEN:
+            message = format_request(method_name, message)
+            message_len = len(message)
+        if message_len < MSG_LOG_MAX_LEN:
+            grpc_interception_file.write(message)
+        else:
+            grpc_interception_file.write('log message too long ({} bytes > {} bytes)\n'.format(message_len,
+                                                                                               MSG_LOG_MAX_LEN))
+        grpc_interception_file.write('---\n')
+
+    @staticmethod
+    def _write_binary_message(grpc_interception_file, timestamp, method_name, message):
+        grpc_interception_file.write(MSG_LOG_RECORD_HEADER.pack(timestamp, len(method_name), len(message)))
+        grpc_interception_file.write(method_name)
+        grpc_interception_file.write(message)
 
     def intercept_unary_unary(self, continuation, client_call_details, request):
         self.log_message(client_call_details.method, request)
@@ -194,6 +337,37 @@ class GrpcRequestLogger(grpc.UnaryUnaryClientInterceptor,
         return continuation(client_call_details, request)
 
 
+def format_request(method_name, message):
+    # text format of a serialized request, e.g. /p4.v1.P4Runtime/Write --> p4runtime_pb2.WriteRequest
+    request_cls = getattr(p4runtime_pb2, method_name.split('/')[-1] + 'Request', None)
+    if request_cls is None:
+        return 'unknown request type ({} bytes)\n'.format(len(message))
+    request = request_cls()
+    request.ParseFromString(message)
+    return str(request)
+
+
+def print_binary_grpc_log(log_file, out=sys.stdout):
+    # offline pretty-printer for logs written by GrpcRequestLogger(binary=True)
+    with open(log_file, 'rb') as grpc_interception_file:
+        while True:
+            header = grpc_interception_file.read(MSG_LOG_RECORD_HEADER.size)
+            if len(header) < MSG_LOG_RECORD_HEADER.size:
+                break
+            timestamp, method_name_len, message_len = MSG_LOG_RECORD_HEADER.unpack(header)
+            method_name = grpc_interception_file.read(method_name_len)
+            message = grpc_interception_file.read(message_len)
+
+            if method_name == MSG_LOG_DROPPED:
+                out.write('\n{} log messages dropped\n'.format(message))
+                continue
+
+            ts = datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+            out.write('\n[{}] {}\n---\n'.format(ts, method_name))
+            out.write(format_request(method_name, message))
+            out.write('---\n')
+
+
 class IterableQueue(Queue):
     _sentinel = object()
 
@@ -211,3 +385,10 @@ class Bmv2SwitchConnection(SwitchConnection):
         with open(bmv2_json_file) as json_file:
             device_config.device_data = json_file.read()
         return device_config
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.stderr.write('usage: {} <binary gRPC log file>\n'.format(sys.argv[0]))
+        sys.exit(1)
+    print_binary_grpc_log(sys.argv[1])
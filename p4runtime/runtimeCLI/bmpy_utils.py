@@ -34,15 +34,19 @@ from thrift.protocol import TBinaryProtocol
 from thrift.protocol import TMultiplexedProtocol
 
 
-def check_JSON_md5(client, json_src, out=sys.stdout):
-    def my_print(s):
-        out.write(s)
-
+def get_json_md5(json_src):
     with open(json_src, 'r') as f:
         m = hashlib.md5()
         for L in f:
             m.update(L)
-        md5sum = m.digest()
+        return m.digest()
+
+
+def check_JSON_md5(client, json_src, out=sys.stdout):
+    def my_print(s):
+        out.write(s)
+
+    md5sum = get_json_md5(json_src)
 
     try:
         bm_md5sum = client.bm_get_config_md5()
@@ -28,6 +28,8 @@
 #####################################################################################
 
 import logging
+import threading
+import hashlib
 import traceback
 
 from collections import Counter
@@ -37,6 +39,8 @@ import json
 from functools import wraps
 import bmpy_utils
 
+from tools.log.log import init_file_logger
+
 from bm_runtime.standard import Standard
 from bm_runtime.standard.ttypes import *
 
@@ -102,17 +106,30 @@ def table_error_name(x):
     return TableOperationErrorCode._VALUES_TO_NAMES[x]
 
 
-TABLES = {}
-ACTION_PROFS = {}
-ACTIONS = {}
-METER_ARRAYS = {}
-COUNTER_ARRAYS = {}
-REGISTER_ARRAYS = {}
-CUSTOM_CRC_CALCS = {}
-PARSE_VSETS = {}
+class P4ResourceMap(object):
+    # resources of one P4 program (parsed from its bmv2 JSON), shared by all connections to switches running it
+    def __init__(self, md5sum=None):
+        self.md5sum = md5sum
+
+        self.tables = {}
+        self.action_profs = {}
+        self.actions = {}
+        self.meter_arrays = {}
+        self.counter_arrays = {}
+        self.register_arrays = {}
+        self.custom_crc_calcs = {}
+        self.parse_vsets = {}
+
+        # maps (object type, unique suffix) to object
+        self.suffix_lookup_map = {}
+
+    def get_res(self, res_type, name):
+        return self.suffix_lookup_map.get((res_type, name), None)
+
 
-# maps (object type, unique suffix) to object
-SUFFIX_LOOKUP_MAP = {}
+# resource maps keyed by the md5 sum of the bmv2 JSON
+RESOURCE_MAPS = {}
+RESOURCE_MAPS_LOCK = threading.Lock()
 
 
 class MatchType:
@@ -140,9 +157,10 @@ class MatchType:
 
 
 class Table:
-    def __init__(self, name, id_):
+    def __init__(self, name, id_, res_map):
         self.name = name
         self.id_ = id_
+        self.res_map = res_map
         self.match_type_ = None
         self.actions = {}
         self.key = []
@@ -151,7 +169,7 @@ class Table:
         self.support_timeout = False
         self.action_prof = None
 
-        TABLES[name] = self
+        res_map.tables[name] = self
 
     def num_key_fields(self):
         return len(self.key)
@@ -164,41 +182,41 @@ class Table:
         return '{0:30} [{1}, mk={2}]'.format(self.name, ap_str, self.key_str())
 
     def get_action(self, action_name):
-        key = ResType.action, action_name
-        action = SUFFIX_LOOKUP_MAP.get(key, None)
+        action = self.res_map.get_res(ResType.action, action_name)
         if action is None or action.name not in self.actions:
             return None
         return action
 
 
 class ActionProf:
-    def __init__(self, name, id_):
+    def __init__(self, name, id_, res_map):
         self.name = name
         self.id_ = id_
+        self.res_map = res_map
         self.with_selection = False
         self.actions = {}
         self.ref_cnt = 0
 
-        ACTION_PROFS[name] = self
+        res_map.action_profs[name] = self
 
     def action_prof_str(self):
         return '{0:30} [{1}]'.format(self.name, self.with_selection)
 
     def get_action(self, action_name):
-        key = ResType.action, action_name
-        action = SUFFIX_LOOKUP_MAP.get(key, None)
+        action = self.res_map.get_res(ResType.action, action_name)
         if action is None or action.name not in self.actions:
             return None
         return action
 
 
 class Action:
-    def __init__(self, name, id_):
+    def __init__(self, name, id_, res_map):
         self.name = name
         self.id_ = id_
+        self.res_map = res_map
         self.runtime_data = []
 
-        ACTIONS[name] = self
+        res_map.actions[name] = self
 
     def num_params(self):
         return len(self.runtime_data)
@@ -211,78 +229,86 @@ class Action:
 
 
 class MeterArray:
-    def __init__(self, name, id_):
+    def __init__(self, name, id_, res_map):
         self.name = name
         self.id_ = id_
+        self.res_map = res_map
         self.type_ = None
         self.is_direct = None
         self.size = None
         self.binding = None
         self.rate_count = None
 
-        METER_ARRAYS[name] = self
+        res_map.meter_arrays[name] = self
 
     def meter_str(self):
         return '{0:30} [{1}, {2}]'.format(self.name, self.size, MeterType.to_str(self.type_))
 
 
 class CounterArray:
-    def __init__(self, name, id_):
+    def __init__(self, name, id_, res_map):
         self.name = name
         self.id_ = id_
+        self.res_map = res_map
         self.is_direct = None
         self.size = None
         self.binding = None
 
-        COUNTER_ARRAYS[name] = self
+        res_map.counter_arrays[name] = self
 
     def counter_str(self):
         return '{0:30} [{1}]'.format(self.name, self.size)
 
 
 class RegisterArray:
-    def __init__(self, name, id_):
+    def __init__(self, name, id_, res_map):
         self.name = name
         self.id_ = id_
+        self.res_map = res_map
         self.width = None
         self.size = None
 
-        REGISTER_ARRAYS[name] = self
+        res_map.register_arrays[name] = self
 
     def register_str(self):
         return '{0:30} [{1}]'.format(self.name, self.size)
 
 
 class ParseVSet:
-    def __init__(self, name, id_):
+    def __init__(self, name, id_, res_map):
         self.name = name
         self.id_ = id_
+        self.res_map = res_map
         self.bitwidth = None
 
-        PARSE_VSETS[name] = self
+        res_map.parse_vsets[name] = self
 
     def parse_vset_str(self):
         return '{0:30} [compressed bitwidth:{1}]'.format(self.name, self.bitwidth)
 
 
 def reset_config():
-    TABLES.clear()
-    ACTION_PROFS.clear()
-    ACTIONS.clear()
-    METER_ARRAYS.clear()
-    COUNTER_ARRAYS.clear()
-    REGISTER_ARRAYS.clear()
-    CUSTOM_CRC_CALCS.clear()
-    PARSE_VSETS.clear()
-
-    SUFFIX_LOOKUP_MAP.clear()
+    with RESOURCE_MAPS_LOCK:
+        RESOURCE_MAPS.clear()
 
 
 def load_json_config(standard_client=None, json_path=None):
-    load_json_str(bmpy_utils.get_json_config(standard_client, json_path))
-
-
-def load_json_str(json_str):
+    if json_path:
+        md5sum = bmpy_utils.get_json_md5(json_path)
+    else:
+        assert (standard_client is not None)
+        md5sum = standard_client.bm_get_config_md5()
+
+    # switches running the same program share one resource map, the JSON is fetched and parsed only once
+    with RESOURCE_MAPS_LOCK:
+        res_map = RESOURCE_MAPS.get(md5sum, None)
+        if res_map is None:
+            res_map = load_json_str(bmpy_utils.get_json_config(standard_client, json_path), md5sum)
+            RESOURCE_MAPS[md5sum] = res_map
+    return res_map
+
+
+def load_json_str(json_str, md5sum=None):
     def get_header_type(header_name, j_headers):
         for h in j_headers:
             if h['name'] == header_name:
@@ -299,37 +325,37 @@ def load_json_str(json_str):
                     return bw
         assert 0
 
-    reset_config()
+    res_map = P4ResourceMap(md5sum)
     json_ = json.loads(json_str)
 
     def get_json_key(key):
         return json_.get(key, [])
 
     for j_action in get_json_key('actions'):
-        action = Action(j_action['name'], j_action['id'])
+        action = Action(j_action['name'], j_action['id'], res_map)
         for j_param in j_action['runtime_data']:
             action.runtime_data += [(j_param['name'], j_param['bitwidth'])]
 
     for j_pipeline in get_json_key('pipelines'):
         if 'action_profiles' in j_pipeline:  # new JSON format
             for j_aprof in j_pipeline['action_profiles']:
-                action_prof = ActionProf(j_aprof['name'], j_aprof['id'])
+                action_prof = ActionProf(j_aprof['name'], j_aprof['id'], res_map)
                 action_prof.with_selection = 'selector' in j_aprof
 
         for j_table in j_pipeline['tables']:
-            table = Table(j_table['name'], j_table['id'])
+            table = Table(j_table['name'], j_table['id'], res_map)
             table.match_type = MatchType.from_str(j_table['match_type'])
             table.type_ = TableType.from_str(j_table['type'])
             table.support_timeout = j_table['support_timeout']
             for action in j_table['actions']:
-                table.actions[action] = ACTIONS[action]
+                table.actions[action] = res_map.actions[action]
 
             if table.type_ in {TableType.indirect, TableType.indirect_ws}:
                 if 'action_profile' in j_table:
-                    action_prof = ACTION_PROFS[j_table['action_profile']]
+                    action_prof = res_map.action_profs[j_table['action_profile']]
                 else:  # for backward compatibility
                     assert ('act_prof_name' in j_table)
-                    action_prof = ActionProf(j_table['act_prof_name'], table.id_)
+                    action_prof = ActionProf(j_table['act_prof_name'], table.id_, res_map)
                     action_prof.with_selection = 'selector' in j_table
                 action_prof.actions.update(table.actions)
                 action_prof.ref_cnt += 1
@@ -351,7 +377,7 @@ def load_json_str(json_str):
                 table.key += [(field_name, match_type, bitwidth)]
 
     for j_meter in get_json_key('meter_arrays'):
-        meter_array = MeterArray(j_meter['name'], j_meter['id'])
+        meter_array = MeterArray(j_meter['name'], j_meter['id'], res_map)
         if 'is_direct' in j_meter and j_meter['is_direct']:
             meter_array.is_direct = True
             meter_array.binding = j_meter['binding']
@@ -362,7 +388,7 @@ def load_json_str(json_str):
         meter_array.rate_count = j_meter['rate_count']
 
     for j_counter in get_json_key('counter_arrays'):
-        counter_array = CounterArray(j_counter['name'], j_counter['id'])
+        counter_array = CounterArray(j_counter['name'], j_counter['id'], res_map)
         counter_array.is_direct = j_counter['is_direct']
         if counter_array.is_direct:
             counter_array.binding = j_counter['binding']
@@ -370,19 +396,19 @@ def load_json_str(json_str):
             counter_array.size = j_counter['size']
 
     for j_register in get_json_key('register_arrays'):
-        register_array = RegisterArray(j_register['name'], j_register['id'])
+        register_array = RegisterArray(j_register['name'], j_register['id'], res_map)
         register_array.size = j_register['size']
         register_array.width = j_register['bitwidth']
 
     for j_calc in get_json_key('calculations'):
         calc_name = j_calc['name']
         if j_calc['algo'] == 'crc16_custom':
-            CUSTOM_CRC_CALCS[calc_name] = 16
+            res_map.custom_crc_calcs[calc_name] = 16
         elif j_calc['algo'] == 'crc32_custom':
-            CUSTOM_CRC_CALCS[calc_name] = 32
+            res_map.custom_crc_calcs[calc_name] = 32
 
     for j_parse_vset in get_json_key('parse_vsets'):
-        parse_vset = ParseVSet(j_parse_vset['name'], j_parse_vset['id'])
+        parse_vset = ParseVSet(j_parse_vset['name'], j_parse_vset['id'], res_map)
         parse_vset.bitwidth = j_parse_vset['compressed_bitwidth']
 
     # builds a dictionary mapping (object type, unique suffix) to the object (Table, Action, etc...).
@@ -392,21 +418,23 @@ def load_json_str(json_str):
     # but that can be changed in the future if needed.
     suffix_count = Counter()
     for res_type, res_dict in [
-        (ResType.table, TABLES), (ResType.action_prof, ACTION_PROFS),
-        (ResType.action, ACTIONS), (ResType.meter_array, METER_ARRAYS),
-        (ResType.counter_array, COUNTER_ARRAYS),
-        (ResType.register_array, REGISTER_ARRAYS),
-        (ResType.parse_vset, PARSE_VSETS)]:
+        (ResType.table, res_map.tables), (ResType.action_prof, res_map.action_profs),
+        (ResType.action, res_map.actions), (ResType.meter_array, res_map.meter_arrays),
+        (ResType.counter_array, res_map.counter_arrays),
+        (ResType.register_array, res_map.register_arrays),
+        (ResType.parse_vset, res_map.parse_vsets)]:
         for name, res in res_dict.items():
             suffix = None
             for s in reversed(name.split('.')):
                 suffix = s if suffix is None else s + '.' + suffix
                 key = (res_type, suffix)
-                SUFFIX_LOOKUP_MAP[key] = res
+                res_map.suffix_lookup_map[key] = res
                 suffix_count[key] += 1
     for key, c in suffix_count.items():
         if c > 1:
-            del SUFFIX_LOOKUP_MAP[key]
+            del res_map.suffix_lookup_map[key]
+
+    return res_map
 
 
 class UIn_Error(Exception):
@@ -821,20 +849,8 @@ def hexstr(v):
 
 
 def get_logger(name, log_file, log_level='INFO'):
-    log = logging.getLogger(name + '_runtimeCLI')
-
-    if len(log.handlers) == 0:
-        log.setLevel(log_level)
-
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setLevel(log_level)
-
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(funcName)s:%(lineno)d - %(message)s')
-        file_handler.setFormatter(formatter)
-
-        log.addHandler(file_handler)
-
-    return log
+    return init_file_logger(name + '_runtimeCLI', log_file, log_level,
+                            log_format='%(asctime)s - %(levelname)s - %(funcName)s:%(lineno)d - %(message)s')
 
 
 class RuntimeAPI(object):
@@ -852,29 +868,23 @@ class RuntimeAPI(object):
 
         return services
 
-    @staticmethod
-    def get_tables():
-        return TABLES
+    def get_tables(self):
+        return self.res_map.tables
 
-    @staticmethod
-    def get_action_profs():
-        return ACTION_PROFS
+    def get_action_profs(self):
+        return self.res_map.action_profs
 
-    @staticmethod
-    def get_actions():
-        return ACTIONS
+    def get_actions(self):
+        return self.res_map.actions
 
-    @staticmethod
-    def get_meter_arrays():
-        return METER_ARRAYS
+    def get_meter_arrays(self):
+        return self.res_map.meter_arrays
 
-    @staticmethod
-    def get_counter_arrays():
-        return COUNTER_ARRAYS
+    def get_counter_arrays(self):
+        return self.res_map.counter_arrays
 
-    @staticmethod
-    def get_register_arrays():
-        return REGISTER_ARRAYS
+    def get_register_arrays(self):
+        return self.res_map.register_arrays
 
     def __init__(self, thrift_ip, thrift_port, switch, switch_log_file, pre_type=None, json_path=None):
 
@@ -892,14 +902,15 @@ class RuntimeAPI(object):
         self.client = standard_client
         self.mc_client = mc_client
 
-        load_json_config(standard_client, json_path)
+        self.res_map = load_json_config(standard_client, json_path)
 
     def write_to_log_file(self, message, show=False):
         # self.log_file.write(message + '\n')
         # self.log_file.flush()
         if show:
             print(message)
-        self.logger.info(message)
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(message)
 
     def do_shell(self, line):
         "run a shell command"
@@ -909,10 +920,10 @@ class RuntimeAPI(object):
         # return output
 
     def get_res(self, type_name, name, res_type):
-        key = res_type, name
-        if key not in SUFFIX_LOOKUP_MAP:
+        res = self.res_map.get_res(res_type, name)
+        if res is None:
             raise UIn_ResourceError(type_name, name)
-        return SUFFIX_LOOKUP_MAP[key]
+        return res
 
     @handle_bad_input
     def do_show_tables(self, show=True):
@@ -920,8 +931,8 @@ class RuntimeAPI(object):
         self.write_to_log_file('show_tables')
 
         tables = []
-        for table_name in sorted(TABLES):
-            table_str = TABLES[table_name].table_str()
+        for table_name in sorted(self.res_map.tables):
+            table_str = self.res_map.tables[table_name].table_str()
             tables.append(table_str)
 
             self.write_to_log_file(table_str, show)
@@ -933,8 +944,8 @@ class RuntimeAPI(object):
         self.write_to_log_file('show_actions')
 
         actions = []
-        for action_name in sorted(ACTIONS):
-            action_str = ACTIONS[action_name].action_str()
+        for action_name in sorted(self.res_map.actions):
+            action_str = self.res_map.actions[action_name].action_str()
             actions.append(action_str)
 
             self.write_to_log_file(action_str, show)
@@ -949,7 +960,7 @@ class RuntimeAPI(object):
 
         actions = []
         for action_name in sorted(table.actions):
-            action_str = ACTIONS[action_name].action_str()
+            action_str = self.res_map.actions[action_name].action_str()
             actions.append(action_str)
 
             self.write_to_log_file(action_str, show)
@@ -967,7 +978,7 @@ class RuntimeAPI(object):
 
         actions = []
         for action_name in sorted(table.actions):
-            action_str = ACTIONS[action_name].action_str()
+            action_str = self.res_map.actions[action_name].action_str()
             actions.append(action_str)
 
             self.write_to_log_file(action_str, show)
@@ -1623,7 +1634,14 @@ class RuntimeAPI(object):
             except:
                 raise UIn_Error('not a valid JSON file')
             self.client.bm_load_new_config(json_str)
-            load_json_str(json_str)
+
+            md5sum = hashlib.md5(json_str).digest()
+            with RESOURCE_MAPS_LOCK:
+                res_map = RESOURCE_MAPS.get(md5sum, None)
+                if res_map is None:
+                    res_map = load_json_str(json_str, md5sum)
+                    RESOURCE_MAPS[md5sum] = res_map
+            self.res_map = res_map
 
     @handle_bad_input
     def do_swap_configs(self, line):
@@ -2016,8 +2034,8 @@ class RuntimeAPI(object):
         self.write_to_log_file('show_pvs')
 
         parser_value_sets = []
-        for pvs_name in sorted(PARSE_VSETS):
-            parse_vset_str = PARSE_VSETS[pvs_name].parse_vset_str()
+        for pvs_name in sorted(self.res_map.parse_vsets):
+            parse_vset_str = self.res_map.parse_vsets[pvs_name].parse_vset_str()
             parser_value_sets.append(parse_vset_str)
 
             self.write_to_log_file(parse_vset_str, show)
@@ -2164,7 +2182,8 @@ class RuntimeAPI(object):
         thrift_fn = {16: self.client.bm_set_crc16_custom_parameters,
                      32: self.client.bm_set_crc32_custom_parameters}[crc_width]
 
-        if name not in CUSTOM_CRC_CALCS or CUSTOM_CRC_CALCS[name] != crc_width:
+        custom_crc_calcs = self.res_map.custom_crc_calcs
+        if name not in custom_crc_calcs or custom_crc_calcs[name] != crc_width:
             raise UIn_ResourceError('crc{}_custom'.format(crc_width), name)
         config_args = [conversion_fn(a) for a in [polynomial, initial_remainder, final_xor_value]]
         config_args += [parse_bool(a) for a in [reflect_data, reflect_remainder]]
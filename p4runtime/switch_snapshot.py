@@ -0,0 +1,119 @@
+# Copyright 2020-present Christoph Hardegen
+#                        (christoph.hardegen@cs.hs-fulda.de)
+#                        Fulda University of Applied Sciences
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+import numpy as np
+
+from p4runtime.runtimeAPI import runtime_API
+
+from tools.log.log import get_logger, LogSubsystem
+
+log = get_logger(LogSubsystem.RUNTIME)
+
+
+class P4SwitchSnapshot(object):
+
+    def __init__(self, switch_name):
+        self.switch_name = switch_name
+        self.timestamp = time.time()
+
+        self.table_entries = []  # runtimeAPI
+        self.multicast_group_entries = []  # runtimeAPI
+        self.counter_entries = []  # runtimeAPI
+        self.direct_counter_entries = []  # runtimeAPI
+
+        self.register_arrays = dict()  # runtimeCLI, register name --> list of cell values
+
+
+def take_snapshot(switch_name, p4switch_connection_thrift, p4switch_connection_gRPC=None, p4info_helper=None):
+    # bmv2 loads a serialized state (bm_serialize_state) only at start (simple_switch --restore-state), the state of
+    # a running switch is therefore captured entity by entity
+    snapshot = P4SwitchSnapshot(switch_name)
+
+    for register_name in p4switch_connection_thrift.get_register_arrays():
+        snapshot.register_arrays[register_name] = p4switch_connection_thrift.client.bm_register_read_all(0,
+                                                                                                         register_name)
+
+    if p4switch_connection_gRPC is not None:
+        snapshot.table_entries = runtime_API.read_all_table_entries(p4switch_connection_gRPC)
+        snapshot.multicast_group_entries = runtime_API.read_all_multicast_group_entries(p4switch_connection_gRPC)
+        snapshot.counter_entries = runtime_API.read_all_counter_entries(p4switch_connection_gRPC, p4info_helper)
+        snapshot.direct_counter_entries = runtime_API.read_all_direct_counter_entries(p4switch_connection_gRPC)
+
+    log.info('snapshot of {}: {} table entries, {} multicast groups, {} counter entries, {} direct counter entries, '
+             '{} registers'.format(switch_name, len(snapshot.table_entries), len(snapshot.multicast_group_entries),
+                                   len(snapshot.counter_entries), len(snapshot.direct_counter_entries),
+                                   len(snapshot.register_arrays)))
+
+    return snapshot
+
+
+def restore_snapshot(snapshot, p4switch_connection_thrift, p4switch_connection_gRPC=None, p4info_helper=None):
+    # reset_state (thrift) would bypass the entry store of the p4runtime server, therefore tables and multicast
+    # groups are reconciled via p4runtime, registers and counters are reset and only non-zero values are written
+    if p4switch_connection_gRPC is not None:
+        runtime_API.reconcile_entries(p4switch_connection_gRPC, snapshot.table_entries,
+                                      snapshot.multicast_group_entries, read_state=True)
+
+    for register_name, values in snapshot.register_arrays.items():
+        p4switch_connection_thrift.client.bm_register_reset(0, register_name)
+        _restore_register(register_name, values, p4switch_connection_thrift, p4switch_connection_gRPC, p4info_helper)
+
+    counter_arrays = p4switch_connection_thrift.get_counter_arrays()
+    for counter_name, counter_array in counter_arrays.items():
+        if not counter_array.is_direct:
+            p4switch_connection_thrift.client.bm_counter_reset_all(0, counter_name)
+        elif p4switch_connection_gRPC is None:
+            p4switch_connection_thrift.client.bm_mt_reset_counters(0, counter_array.binding)
+    if p4switch_connection_gRPC is not None:
+        runtime_API.write_counter_entries(p4switch_connection_gRPC,
+                                          [counter_entry for counter_entry in snapshot.counter_entries
+                                           if counter_entry.data.packet_count or counter_entry.data.byte_count])
+        # entries kept by the reconciliation keep their counters, therefore all direct counters are written
+        runtime_API.write_direct_counter_entries(p4switch_connection_gRPC, snapshot.direct_counter_entries)
+
+    log.info('restored snapshot of {} ({:.3f}s old)'.format(snapshot.switch_name, time.time() - snapshot.timestamp))
+
+
+def _restore_register(register_name, values, p4switch_connection_thrift, p4switch_connection_gRPC=None,
+                      p4info_helper=None):
+    # runs of equal non-zero cells with one thrift call each, single cells in batched p4runtime writes
+    if not len(values):
+        return
+    values = np.array(values, dtype=np.int64)
+    run_starts = np.concatenate([[0], np.flatnonzero(np.diff(values)) + 1])
+    run_ends = np.concatenate([run_starts[1:], [len(values)]])
+
+    cells = []
+    for run_start, run_end in zip(run_starts, run_ends):
+        value = int(values[run_start])
+        if not value:
+            continue
+        if run_end - run_start > 1:
+            # the end index of bm_register_write_range is inclusive
+            p4switch_connection_thrift.client.bm_register_write_range(0, register_name, int(run_start),
+                                                                      int(run_end) - 1, value)
+        else:
+            cells.append(int(run_start))
+
+    if p4switch_connection_gRPC is not None and p4info_helper is not None:
+        # the i64 values of thrift as unsigned cell values
+        runtime_API.write_register_cells(p4switch_connection_gRPC, p4info_helper, register_name, cells,
+                                         [int(value) for value in values[cells].view(np.uint64)])
+    else:
+        for index in cells:
+            p4switch_connection_thrift.client.bm_register_write(0, register_name, index, int(values[index]))
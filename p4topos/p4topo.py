@@ -29,8 +29,7 @@ from mininet.node import OVSSwitch
 from mininet.topo import Topo
 from mininet.link import TCIntf
 
-from p4nodes.p4host import P4Host
-from p4nodes.p4switch import P4Switch, P4RuntimeSwitch
+from p4env import P4Hosts, P4Switches
 
 from p4programs.p4compiler import P4Compiler
 from p4topos.p4topo_params import TopologyParameter
@@ -60,7 +59,7 @@ class P4Topo(Topo):
                      addr1=topology_json['management']['host']['mac_hosts'],
                      params1={'ip': topology_json['management']['host']['ip_hosts']})
 
-        host_class = eval(topology_json['host_class'])
+        host_class = getattr(P4Hosts, topology_json['host_class']).load()
         for host, hparams in topology_json['hosts'].items():
             self.addHost(host,
                          cls=host_class,
@@ -81,7 +80,7 @@ class P4Topo(Topo):
                          addr1=hparams['mgmt_mac'],
                          params1={'ip': hparams['mgmt_ip']})
 
-        switch_class = eval(topology_json['switch_class'])
+        switch_class = getattr(P4Switches, topology_json['switch_class']).load()
         tp = TopologyParameter.get_topology_params()
         for switch, switch_params in topology_json['switches'].items():
             p4app = switch_params['p4program']
@@ -27,6 +27,8 @@
 
 import os
 import json
+import hashlib
+from collections import defaultdict
 
 from p4programs.p4compiler import P4Compiler
 
@@ -36,6 +38,77 @@ from tools.log.log import log
 
 
 class TopologyGenerator(object):
+    # part of the input hash, to be increased whenever the structure of the generated topology.json changes
+    TOPOLOGY_GENERATOR_VERSION = 2
+
+    # host and switch numbers up to 9999 fit into two address bytes (switch numbers are limited by the thrift and
+    # gRPC base ports, see TopologyParameter)
+    MAX_HOST_NUM = 9999
+    MAX_SWITCH_NUM = 999
+
+    @staticmethod
+    def get_mac_bytes(num):
+        # decimal digit pairs, e.g. 12 --> 00:12, 1234 --> 12:34
+        return '{:02d}'.format(num // 100), '{:02d}'.format(num % 100)
+
+    @staticmethod
+    def get_ip_bytes(num):
+        # high and low byte, e.g. 12 --> 0.12, 1234 --> 4.210
+        return num // 256, num % 256
+
+    @staticmethod
+    def get_input_hash(tp_params, config_files):
+        def _hash_value(value):
+            if hasattr(value, 'name') and hasattr(value, 'value'):  # enum member
+                return value.name
+            if hasattr(value, '__name__'):  # class
+                return value.__name__
+            return repr(value)
+
+        input_hash = hashlib.sha1(str(TopologyGenerator.TOPOLOGY_GENERATOR_VERSION).encode())
+        tp_params_values = dict((key, value) for key, value in vars(tp_params).items() if key.isupper())
+        input_hash.update(json.dumps(tp_params_values, sort_keys=True, default=_hash_value).encode())
+        for config_file in config_files:
+            input_hash.update(config_file.encode())
+            if config_file and os.path.isfile(config_file):
+                with open(config_file, 'rb') as config_file_:
+                    input_hash.update(config_file_.read())
+        return input_hash.hexdigest()
+
+    @staticmethod
+    def load_cached_topology_json(tp_params, input_hash):
+        if not os.path.isfile(tp_params.TOPOLOGY_FILE_PATH):
+            return None
+        try:
+            with open(tp_params.TOPOLOGY_FILE_PATH, 'r') as topo_file:
+                topo_dict = json.load(topo_file)
+        except ValueError:
+            return None
+        return topo_dict if topo_dict.get('input_hash') == input_hash else None
+
+    @staticmethod
+    def assign_switch_ports(links):
+        # port assignment of the 'auto' link config, host links first
+        links['host_links'].sort(key=lambda x: (x['host'], x['switch']))
+        links['switch_links'].sort(key=lambda x: (x['switch1'], x['switch2']))
+
+        # next free port per switch, switch numbers do not have to be contiguous
+        switch_ports = defaultdict(lambda: 1)
+
+        for hlink in links['host_links']:
+            sw = hlink['switch']
+            hlink['switch_port'] = switch_ports[sw]
+            switch_ports[sw] += 1
+
+        for slink in links['switch_links']:
+            sw1 = slink['switch1']
+            sw2 = slink['switch2']
+            slink['switch1_port'] = switch_ports[sw1]
+            slink['switch2_port'] = switch_ports[sw2]
+            switch_ports[sw1] += 1
+            switch_ports[sw2] += 1
+
+        return links
 
     @staticmethod
     def build_topology_json(tp_params):
@@ -51,41 +124,13 @@ class TopologyGenerator(object):
                     return False
             return True
 
-        def _prepare_switch_ports(links):
-            links['host_links'] = sorted(links['host_links'], key=lambda x: list([x['host'], x['switch']]))
-            links['switch_links'] = sorted(links['switch_links'], key=lambda x: list([x['switch1'], x['switch2']]))
-
-            switches = set()
-            for switch_pair in links['switch_links']:
-                switches.add(switch_pair['switch1'])
-                switches.add(switch_pair['switch2'])
-            for switch in [hlink['switch'] for hlink in links['host_links']]:
-                switches.add(switch)
-            switch_ports = [1 for _ in range(len(switches))]
-
-            for hlink in links['host_links']:
-                sw = hlink['switch']
-                hlink['switch_port'] = switch_ports[sw - 1]
-                switch_ports[sw - 1] += 1
-
-            for slink in links['switch_links']:
-                sw1 = slink['switch1']
-                sw2 = slink['switch2']
-                slink['switch1_port'] = switch_ports[sw1 - 1]
-                slink['switch2_port'] = switch_ports[sw2 - 1]
-                switch_ports[sw1 - 1] += 1
-                switch_ports[sw2 - 1] += 1
-
-            return links
-
-        p4programs = [tp_params.P4_PROGRAM]
-
         topo_dict = {'management': {},
                      'hosts': {},
                      'switches': {},
                      'links': {'host_links': [],
                                'switch_links': []}}
 
+        switches_config = None
         if tp_params.SWITCH_INIT:
             log.info('loading switches config...')
             assert tp_params.SWITCHES_CONFIG_FILE
@@ -93,10 +138,10 @@ class TopologyGenerator(object):
                 raise TopologyConfigException('missing switches config file '
                                               'for topology ({})'.format(tp_params.TOPOLOGY_NAME))
 
-            switches_config = None
             with open(tp_params.SWITCHES_CONFIG_FILE, 'r') as switches_config_file:
                 switches_config = json.load(switches_config_file)
 
+        hosts_config = None
         if tp_params.HOST_INIT:
             log.debug('loading hosts config...')
             assert tp_params.HOSTS_CONFIG_FILE
@@ -104,7 +149,6 @@ class TopologyGenerator(object):
                 raise TopologyConfigException('missing hosts config file '
                                               'for topology ({})'.format(tp_params.TOPOLOGY_NAME))
 
-            hosts_config = None
             with open(tp_params.HOSTS_CONFIG_FILE, 'r') as hosts_config_file:
                 hosts_config = json.load(hosts_config_file)
 
@@ -124,13 +168,22 @@ class TopologyGenerator(object):
         if not os.path.isfile(tp_params.LINKS_CONFIG_FILE):
             raise TopologyConfigException('missing links file for topology ({})'.format(tp_params.TOPOLOGY_NAME))
 
+        input_hash = TopologyGenerator.get_input_hash(tp_params, [tp_params.LINKS_CONFIG_FILE,
+                                                                  tp_params.SWITCHES_CONFIG_FILE or '',
+                                                                  tp_params.HOSTS_CONFIG_FILE or ''])
+        cached_topo_dict = TopologyGenerator.load_cached_topology_json(tp_params, input_hash)
+        if cached_topo_dict is not None:
+            log.info('reusing topology file (unchanged topology config)...')
+            TopologyGenerator.prepare_topology(tp_params, cached_topo_dict)
+            return
+
         with open(tp_params.LINKS_CONFIG_FILE, 'r') as topo_links_file:
             topo_links = json.load(topo_links_file)
 
         if tp_params.LINKS_CONFIG_MODE == 'auto':
-            topo_links = _prepare_switch_ports(topo_links)
+            topo_links = TopologyGenerator.assign_switch_ports(topo_links)
 
-        topo_dict['host_class'] = tp_params.HOST_CLASS.value.__name__
+        topo_dict['host_class'] = tp_params.HOST_CLASS.name
 
         log.info('creating topology...')
         for hlink in topo_links['host_links']:
@@ -138,14 +191,16 @@ class TopologyGenerator(object):
             hostname = tp_params.HOSTNAME.format(host_num)
             host_cmds = hosts_config[str(host_num)][
                 'commands'] if tp_params.HOST_INIT and host_num in hosts_config else []
+            host_ip_bytes = TopologyGenerator.get_ip_bytes(host_num)
+            host_mac_bytes = TopologyGenerator.get_mac_bytes(host_num)
             topo_dict['hosts'][hostname] = {'num': host_num,
-                                            'ip': tp_params.HOST_IP.format(host_num),
-                                            'mac': tp_params.HOST_MAC.format(str(host_num).zfill(2)),
-                                            'network': tp_params.HOST_NETWORK.format(host_num),
-                                            'gw_ip': tp_params.HOST_GW.format(host_num),
-                                            'gw_mac': tp_params.HOST_GW_MAC.format(host_num),
-                                            'mgmt_ip': tp_params.HOST_MANAGEMENT_IP.format(host_num),
-                                            'mgmt_mac': tp_params.HOST_MANAGEMENT_MAC.format(str(host_num).zfill(2)),
+                                            'ip': tp_params.HOST_IP.format(*host_ip_bytes),
+                                            'mac': tp_params.HOST_MAC.format(*host_mac_bytes),
+                                            'network': tp_params.HOST_NETWORK.format(*host_ip_bytes),
+                                            'gw_ip': tp_params.HOST_GW.format(*host_ip_bytes),
+                                            'gw_mac': tp_params.HOST_GW_MAC.format(*host_mac_bytes),
+                                            'mgmt_ip': tp_params.HOST_MANAGEMENT_IP.format(*host_ip_bytes),
+                                            'mgmt_mac': tp_params.HOST_MANAGEMENT_MAC.format(*host_mac_bytes),
                                             'cmd': host_cmds}
 
             sw = {'name': tp_params.SWITCHNAME.format(hlink['switch']),
@@ -172,16 +227,13 @@ class TopologyGenerator(object):
                                             'delay': tp_params.LINK_DELAY_HOSTS,
                                             'loss': tp_params.LINK_LOSS_HOSTS}
 
-        topo_dict['switch_class'] = tp_params.P4_SWITCH_CLASS.value.__name__
+        topo_dict['switch_class'] = tp_params.P4_SWITCH_CLASS.name
         # topo_dict['controller_ip'] = tp_params.CONTROLLER_IP
         # topo_dict['controller_port'] = tp_params.CONTROLLER_PORT
         topo_dict['monitor_class'] = tp_params.P4_MONITOR.__name__
         topo_dict['controller_class'] = tp_params.P4_CONTROLLER.__name__ if tp_params.P4_CONTROLLER else None
 
         topo_dict['traffic_profile'] = tp_params.TRAFFIC_PROFILE
-        if tp_params.TRAFFIC_PROFILE:
-            if not os.path.isdir(tp_params.TRAFFIC_PROFILES_DIR):
-                os.makedirs(tp_params.TRAFFIC_PROFILES_DIR)
 
         thrift_port = tp_params.P4_THRIFT_BASE_PORT
         if tp_params.P4_SWITCH_CLASS == P4Switches.P4RuntimeSwitch:
@@ -190,15 +242,6 @@ class TopologyGenerator(object):
             grpc_port = None
 
         def _prepare_switches(sw):
-            log_path = os.path.join(tp_params.LOG_DIR_PATH, sw)
-            if not os.path.isdir(log_path):
-                os.makedirs(log_path)
-
-            if tp_params.P4_PCAP_DUMP:
-                pcap_path = os.path.join(tp_params.P4_PCAP_DIR_PATH, sw)
-                if not os.path.isdir(pcap_path):
-                    os.makedirs(pcap_path)
-
             sw_num = int(sw[len(tp_params.SWITCHNAME[:-2]):])
             switch_cmds = []
             if tp_params.SWITCH_INIT in ['p4runtime_CLI', 'hybrid']:
@@ -208,8 +251,10 @@ class TopologyGenerator(object):
                     pass
 
             topo_dict['switches'][sw] = {'num': sw_num,
-                                         'mgmt_ip': tp_params.SWITCH_MANAGEMENT_IP.format(sw_num),
-                                         'mgmt_mac': tp_params.SWITCH_MANAGEMENT_MAC.format(str(sw_num).zfill(2)),
+                                         'mgmt_ip': tp_params.SWITCH_MANAGEMENT_IP.format(
+                                             *TopologyGenerator.get_ip_bytes(sw_num)),
+                                         'mgmt_mac': tp_params.SWITCH_MANAGEMENT_MAC.format(
+                                             *TopologyGenerator.get_mac_bytes(sw_num)),
                                          'thrift_port': thrift_port + int(sw_num),
                                          'grpc_port': grpc_port + int(sw_num) if grpc_port else grpc_port,
                                          'cmd': switch_cmds,
@@ -226,6 +271,7 @@ class TopologyGenerator(object):
                                          'log_level': tp_params.P4_LOG_LEVEL,
                                          'runtime_thrift_log': tp_params.P4_RUNTIME_THRIFT_LOG_FILE_PATH.format(sw, sw),
                                          'runtime_gRPC_log': tp_params.P4_RUNTIME_GRPC_LOG_FILE_PATH.format(sw, sw),
+                                         'runtime_gRPC_log_binary': tp_params.P4_RUNTIME_GRPC_LOG_BINARY,
                                          'bmv2_cli_log': tp_params.P4_BMV2_CLI_LOG_FILE_PATH.format(sw, sw),
                                          'log_console': tp_params.P4_LOG_CONSOLE,
                                          'log_flush': tp_params.P4_LOG_FLUSH}
@@ -234,8 +280,7 @@ class TopologyGenerator(object):
             if tp_params.SWITCH_INIT and sw_num in switches_config:
                 try:
                     p4program_ = switches_config[str(sw_num)]['p4program']
-                    if p4program_ != '' and p4program_ not in p4programs:
-                        p4programs.append(p4program_)
+                    if p4program_ != '' and p4program_ != tp_params.P4_PROGRAM:
                         p4program = p4program_
                 except KeyError:
                     pass
@@ -275,6 +320,35 @@ class TopologyGenerator(object):
                                                            'delay': slink.get('delay', tp_params.LINK_DELAY_SWITCHES),
                                                            'loss': slink.get('loss', tp_params.LINK_LOSS_SWITCHES)})
 
+        topo_dict['input_hash'] = input_hash
+
+        TopologyGenerator.prepare_topology(tp_params, topo_dict)
+
+        log.info('saving topology file...')
+        with open(tp_params.TOPOLOGY_FILE_PATH, 'w') as topo_file:
+            json.dump(topo_dict, topo_file, indent=4)
+
+    @staticmethod
+    def prepare_topology(tp_params, topo_dict):
+        # directories, P4 programs and runtime configs of a (generated or reused) topology
+        if tp_params.TRAFFIC_PROFILE:
+            if not os.path.isdir(tp_params.TRAFFIC_PROFILES_DIR):
+                os.makedirs(tp_params.TRAFFIC_PROFILES_DIR)
+
+        p4programs = [tp_params.P4_PROGRAM]
+        for sw, sw_config in topo_dict['switches'].items():
+            log_path = os.path.join(tp_params.LOG_DIR_PATH, sw)
+            if not os.path.isdir(log_path):
+                os.makedirs(log_path)
+
+            if tp_params.P4_PCAP_DUMP:
+                pcap_path = os.path.join(tp_params.P4_PCAP_DIR_PATH, sw)
+                if not os.path.isdir(pcap_path):
+                    os.makedirs(pcap_path)
+
+            if sw_config['p4program'] not in p4programs:
+                p4programs.append(sw_config['p4program'])
+
         log.info('compiling P4 program(s)...')
         for p4program in p4programs:
             P4Compiler.compile_p4program(tp_params.P4_BUILD_DIR_PATH.format(p4app=p4program),
@@ -305,10 +379,6 @@ class TopologyGenerator(object):
                     with open(runtime_file, 'w') as switch_config_file:
                         json.dump(p4_runtime_sw_config, switch_config_file, indent=4)
 
-        log.info('saving topology file...')
-        with open(tp_params.TOPOLOGY_FILE_PATH, 'w') as topo_file:
-            json.dump(topo_dict, topo_file, indent=4)
-
 
 class TopologyConfigException(Exception):
 
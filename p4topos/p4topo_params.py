@@ -63,18 +63,20 @@ class TopologyParameter(object):
             cls.HOSTNAME = 'h{}'
             cls.SWITCHNAME = 's{}'
 
+            # addresses are formatted with two bytes of the host/switch number (see TopologyGenerator.get_mac_bytes
+            # and TopologyGenerator.get_ip_bytes)
             if tp_args.host_network == 'shared':
-                cls.HOST_IP = '10.0.{}.1/16'
-                cls.HOST_MAC = 'CA:FE:BA:BE:00:{}'
-                cls.HOST_NETWORK = '10.0.0.0/16'
+                cls.HOST_IP = '10.{}.{}.1/8'
+                cls.HOST_MAC = 'CA:FE:BA:BE:{}:{}'
+                cls.HOST_NETWORK = '10.0.0.0/8'
                 cls.HOST_GW = '10.0.0.254'
                 cls.HOST_GW_MAC = 'BA:DE:AF:FE:00:00'
             else:  # elif host_network == 'individual':
-                cls.HOST_IP = '10.0.{}.1/24'
-                cls.HOST_MAC = 'CA:FE:BA:BE:00:{}'
-                cls.HOST_NETWORK = '10.0.{}.0/24'
-                cls.HOST_GW = '10.0.{}.254'
-                cls.HOST_GW_MAC = 'BA:DE:AF:FE:00:{}'
+                cls.HOST_IP = '10.{}.{}.1/24'
+                cls.HOST_MAC = 'CA:FE:BA:BE:{}:{}'
+                cls.HOST_NETWORK = '10.{}.{}.0/24'
+                cls.HOST_GW = '10.{}.{}.254'
+                cls.HOST_GW_MAC = 'BA:DE:AF:FE:{}:{}'
 
             cls.LINKS_CONFIG_MODE = tp_args.link_config
             cls.LINKS_CONFIG = 'links_{}.json'.format(tp_args.link_config)
@@ -95,29 +97,29 @@ class TopologyParameter(object):
             cls.LOG_DIR = 'logs'
             cls.LOG_DIR_PATH = os.path.join(cls.LOG_DIR, cls.TOPOLOGY_NAME, tp_args.p4program)
 
-            cls.SWITCH_MANAGEMENT_IP = '10.199.199.{}/24'
-            cls.SWITCH_MANAGEMENT_MAC = 'CA:FE:BA:BE:99:{}'
+            cls.SWITCH_MANAGEMENT_IP = '10.199.{}.{}/16'
+            cls.SWITCH_MANAGEMENT_MAC = 'CA:FE:BA:BF:{}:{}'
             cls.MANAGEMENT_SWITCH_NAME_SWITCHES = 'sroot'
 
             cls.MANAGEMENT_HOST_NAME = 'hroot'
-            cls.MANAGEMENT_HOST_IP_SWITCHES = cls.SWITCH_MANAGEMENT_IP.format(254)
-            cls.MANAGEMENT_HOST_MAC_SWITCHES = cls.SWITCH_MANAGEMENT_MAC.format('FF')
+            cls.MANAGEMENT_HOST_IP_SWITCHES = cls.SWITCH_MANAGEMENT_IP.format(255, 254)
+            cls.MANAGEMENT_HOST_MAC_SWITCHES = cls.SWITCH_MANAGEMENT_MAC.format('FF', 'FF')
 
-            cls.HOST_MANAGEMENT_IP = '172.16.0.{}/24'
-            cls.HOST_MANAGEMENT_MAC = 'DE:AD:BE:EF:99:{}'
+            cls.HOST_MANAGEMENT_IP = '172.16.{}.{}/16'
+            cls.HOST_MANAGEMENT_MAC = 'DE:AD:BE:EF:{}:{}'
             cls.MANAGEMENT_SWITCH_NAME_HOSTS = 'srooth'
 
-            cls.MANAGEMENT_HOST_IP_HOSTS = cls.HOST_MANAGEMENT_IP.format(254)
-            cls.MANAGEMENT_HOST_MAC_HOSTS = cls.HOST_MANAGEMENT_MAC.format('FF')
+            cls.MANAGEMENT_HOST_IP_HOSTS = cls.HOST_MANAGEMENT_IP.format(255, 254)
+            cls.MANAGEMENT_HOST_MAC_HOSTS = cls.HOST_MANAGEMENT_MAC.format('FF', 'FF')
 
-            if p4host_class == P4Hosts.P4Host.value:
+            if P4Hosts.P4Host.is_class(p4host_class):
                 cls.HOST_CLASS = P4Hosts.P4Host
             cls.HOST_INIT = tp_args.host_init
 
             if tp_args.switch_init is 'None':
                 log.info('running p4 switch without initialization')
 
-            if p4switch_class == P4Switches.P4Switch.value:
+            if P4Switches.P4Switch.is_class(p4switch_class):
                 cls.P4_SWITCH_CLASS = P4Switches.P4Switch
                 cls.P4_BMV2_EXEC = 'simple_switch'
                 cls.P4_BMV2_EXEC_PATH = subprocess.check_output('which {}'.format(cls.P4_BMV2_EXEC), shell=True).strip()
@@ -168,6 +170,7 @@ class TopologyParameter(object):
             cls.P4_RUNTIME_FILE_PATH = os.path.join(cls.P4_RUNTIME_DIR_PATH, cls.P4_RUNTIME_FILE)
             cls.P4_RUNTIME_GRPC_LOG_FILE = '{}_runtime_gRPC.log'
             cls.P4_RUNTIME_GRPC_LOG_FILE_PATH = os.path.join(cls.LOG_DIR_PATH, '{}', cls.P4_RUNTIME_GRPC_LOG_FILE)
+            cls.P4_RUNTIME_GRPC_LOG_BINARY = tp_args.runtime_grpc_log_binary
             cls.P4_RUNTIME_THRIFT_LOG_FILE = '{}_runtime_thrift.log'
             cls.P4_RUNTIME_THRIFT_LOG_FILE_PATH = os.path.join(cls.LOG_DIR_PATH, '{}', cls.P4_RUNTIME_THRIFT_LOG_FILE)
             cls.P4_PCAP_DUMP = True
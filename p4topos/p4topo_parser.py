@@ -19,15 +19,9 @@ import os
 import sys
 
 from p4env import P4NetworkRunModes, P4Topologies, P4Hosts, P4Switches, P4SwitchInit, P4Programs, P4Controllers, \
-    P4Monitors, LinkConfig, HostNetwork
+    P4Monitors, LinkConfig, HostNetwork, TrafficGenerators
 
-from p4monitors.p4port_counter import CounterDirection, CounterData
-from p4monitors.p4probing import ProbingMode
-
-from p4controllers.flow_forwarding import FlowForwardingStrategy, \
-    ShortestPathMetrics, ECMPMetrics, PathMetrics, FlowPredictionMetrics
-
-from tools.log.log import LogLevel
+from tools.log.log import LogLevel, LogFormat, LogSubsystem
 
 
 class TopologyArgumentParser(object):
@@ -39,6 +33,17 @@ class TopologyArgumentParser(object):
             print('\t * {}: {}'.format(k, v))
         print('-' * 80)
 
+    @staticmethod
+    def get_topologies():
+        # predefined topologies and topology dirs with a links config (e.g. generated by p4topo_synthetic)
+        topologies = set(p4topology.value for p4topology in P4Topologies)
+        topology_dir = os.path.dirname(os.path.abspath(__file__))
+        for topology in os.listdir(topology_dir):
+            if any(os.path.isfile(os.path.join(topology_dir, topology, 'links_{}.json'.format(mode.value)))
+                   for mode in LinkConfig):
+                topologies.add(topology)
+        return sorted(topologies)
+
     @staticmethod
     def create_parser(all_parameters=False):
         parser = argparse.ArgumentParser()
@@ -48,14 +53,18 @@ class TopologyArgumentParser(object):
                             help='run mode for the P4 network', required=False)
 
         args_parser_tmp, _ = parser.parse_known_args()
-        if args_parser_tmp.run_mode == P4NetworkRunModes.EXPERIMENT.value or all_parameters:
+        if args_parser_tmp.run_mode in [P4NetworkRunModes.EXPERIMENT.value,
+                                        P4NetworkRunModes.WARM_EXPERIMENT.value] or all_parameters:
             parser.add_argument('--exp', type=int, default=42,
                                 help='experiment ID for an flow forwarding experiment', required=False)
             parser.add_argument('--exp_iter', type=int, default=21,
                                 help='experiment run iteration', required=False)
+        if args_parser_tmp.run_mode == P4NetworkRunModes.WARM_EXPERIMENT.value or all_parameters:
+            parser.add_argument('--control_socket', type=str, default='/tmp/p4runner.sock',
+                                help='unix socket for iteration commands in warm experiment mode', required=False)
 
         parser.add_argument('--topology', type=str, default=P4Topologies.DIAMOND_SHAPE.value,
-                            choices=[p4topology.value for p4topology in P4Topologies],
+                            choices=TopologyArgumentParser.get_topologies(),
                             help='name of the P4 topology', required=False)
 
         parser.add_argument('--link_config', type=str, default=LinkConfig.AUTO.value,
@@ -66,16 +75,20 @@ class TopologyArgumentParser(object):
                             choices=[p4program.value for p4program in P4Programs],
                             help='default P4 program that runs on any deployed P4 switch', required=False)
 
-        parser.add_argument('--switch', type=str, default=P4Switches.P4RuntimeSwitch.value.__name__,
-                            choices=[p4switch.value.__name__ for p4switch in P4Switches],
+        parser.add_argument('--switch', type=str, default=P4Switches.P4RuntimeSwitch.name,
+                            choices=[p4switch.name for p4switch in P4Switches],
                             help='type of the deployed P4 switches (class)', required=False)
 
         parser.add_argument('--switch_init', type=str, default=P4SwitchInit.P4RUNTIME_API.value,
                             choices=[mode.value for mode in P4SwitchInit],
                             help='initialization method for deployed P4 switches', required=False)
+        parser.add_argument('--runtime_grpc_log_binary', type=eval, default=False,
+                            choices=[False, True],
+                            help='log P4Runtime requests as serialized protobuf messages (print the log with '
+                                 'python -m p4runtime.runtimeAPI.switch <log file>)', required=False)
 
-        parser.add_argument('--host', type=str, default=P4Hosts.P4Host.value.__name__,
-                            choices=[p4host.value.__name__ for p4host in P4Hosts],
+        parser.add_argument('--host', type=str, default=P4Hosts.P4Host.name,
+                            choices=[p4host.name for p4host in P4Hosts],
                             help='type of the deployed P4 hosts (class)', required=False)
 
         parser.add_argument('--host_init', type=eval, default=False,
@@ -86,14 +99,21 @@ class TopologyArgumentParser(object):
                             choices=[mode.value for mode in HostNetwork],
                             help='addressing mode for P4 hosts (network subnet)', required=False)
 
-        parser.add_argument('--p4monitor', type=str, default=P4Monitors.P4Monitor.value.__name__,
-                            choices=[p4monitor.value.__name__ for p4monitor in P4Monitors],
+        parser.add_argument('--p4monitor', type=str, default=P4Monitors.P4Monitor.name,
+                            choices=[p4monitor.name for p4monitor in P4Monitors],
                             help='P4 monitor (class) for the P4 topology', required=False)
+        parser.add_argument('--p4monitor_query_port', type=int, default=0,
+                            help='serve topology, link metric and path queries of the P4 monitor as HTTP/JSON on '
+                                 'http://127.0.0.1:<port> (0: disabled)', required=False)
 
         args_parser_tmp, _ = parser.parse_known_args()
-        if args_parser_tmp.p4monitor == P4Monitors.PortCounterMonitor.value.__name__ or all_parameters:
+        # monitor and controller options are imported with the selected plugin only (see p4env.P4Plugins)
+        if args_parser_tmp.p4monitor == P4Monitors.PortCounterMonitor.name or all_parameters:
+            from p4monitors.p4port_counter import CounterDirection, CounterData
+
             parser.add_argument('--p4monitor_counter_interval', type=int, default=10,
-                                help='time interval for performing port counter collection', required=False)
+                                help='time interval for performing port counter collection (max. interval for '
+                                     'adaptive polling)', required=False)
             parser.add_argument('--p4monitor_counter_direction', type=str,
                                 default=CounterDirection.TX_PORT_COUNTER.value,
                                 choices=[mode.value for mode in CounterDirection],
@@ -102,19 +122,51 @@ class TopologyArgumentParser(object):
                                 default=CounterData.BYTE_COUNT.value,
                                 choices=[mode.value for mode in CounterData],
                                 help='port counter data to be collected', required=False)
-        if args_parser_tmp.p4monitor == P4Monitors.ProbingMonitor.value.__name__ or all_parameters:
+            parser.add_argument('--p4monitor_counter_flows', type=eval, default=False, choices=[False, True],
+                                help='collect the direct counters of the flow forwarding rules (per-flow link loads, '
+                                     'FlowForwardingController required)', required=False)
+            parser.add_argument('--p4monitor_counter_elephant_threshold', type=float, default=0.1,
+                                help='min. share of a link capacity for elephant flows', required=False)
+            parser.add_argument('--p4monitor_counter_adaptive', type=eval, default=False, choices=[False, True],
+                                help='poll busy links more often than idle links', required=False)
+            parser.add_argument('--p4monitor_counter_min_interval', type=int, default=1,
+                                help='min. time interval for adaptive polling (at least 1s)', required=False)
+            parser.add_argument('--p4monitor_counter_read_budget', type=float, default=0,
+                                help='max. port counter reads per second for adaptive polling (0: unlimited)',
+                                required=False)
+        if args_parser_tmp.p4monitor == P4Monitors.ProbingMonitor.name or all_parameters:
+            from p4monitors.p4probing import ProbingMode
+
             parser.add_argument('--p4monitor_probing_interval', type=int, default=10,
                                 help='time interval for performing link/path probing', required=False)
             parser.add_argument('--p4monitor_probing_mode', type=str, default=ProbingMode.LOCAL_MULTICAST.value,
                                 choices=[mode.value for mode in ProbingMode],
                                 help='strategy for performing link/path probing', required=False)
+        if args_parser_tmp.p4monitor == P4Monitors.INTMonitor.name or all_parameters:
+            parser.add_argument('--p4monitor_int_interval', type=int, default=10,
+                                help='time interval for aggregating collected INT data', required=False)
+            parser.add_argument('--p4monitor_int_window', type=int, default=6,
+                                help='number of intervals of the rolling INT aggregation window', required=False)
+        if args_parser_tmp.p4monitor == P4Monitors.FlowMonitor.name or all_parameters:
+            parser.add_argument('--p4monitor_flow_partition_duration', type=int, default=60,
+                                help='time interval of a flow record partition', required=False)
+            parser.add_argument('--p4monitor_flow_partitions', type=int, default=10,
+                                help='number of flow record partitions kept', required=False)
+        if args_parser_tmp.p4monitor == P4Monitors.HeavyHitterMonitor.name or all_parameters:
+            parser.add_argument('--p4monitor_heavy_hitter_epoch', type=int, default=10,
+                                help='time interval for reading and resetting the flow sketches', required=False)
+            parser.add_argument('--p4monitor_heavy_hitter_threshold', type=float, default=0.05,
+                                help='min. share of the bytes of an epoch for heavy hitters', required=False)
 
         parser.add_argument('--p4controller', type=str, default=None,
-                            choices=[p4controller.value.__name__ for p4controller in P4Controllers],
+                            choices=[p4controller.name for p4controller in P4Controllers],
                             help='P4 controller (class) for the P4 topology', required=False)
 
         args_parser_tmp, _ = parser.parse_known_args()
-        if args_parser_tmp.p4controller == P4Controllers.FlowForwardingController.value.__name__ or all_parameters:
+        if args_parser_tmp.p4controller == P4Controllers.FlowForwardingController.name or all_parameters:
+            from p4controllers.flow_forwarding import FlowForwardingStrategy, \
+                ShortestPathMetrics, ECMPMetrics, PathMetrics, FlowPredictionMetrics
+
             parser.add_argument('--p4controller_flow_forwarding_strategy', type=str,
                                 default=FlowForwardingStrategy.SHORTEST_PATH.value,
                                 choices=[strategy.value for strategy in FlowForwardingStrategy],
@@ -131,6 +183,9 @@ class TopologyArgumentParser(object):
             parser.add_argument('--p4controller_time_measurement', type=eval, default=False,
                                 choices=[False, True],
                                 help='measure elapsed times for flow forwarding controller operations', required=False)
+            parser.add_argument('--p4controller_time_measurement_interval', type=int, default=10,
+                                help='interval (s) for exporting the elapsed time histograms (0: only at shutdown)',
+                                required=False)
 
         choices = None
         try:
@@ -142,9 +197,24 @@ class TopologyArgumentParser(object):
             pass
         parser.add_argument('--traffic_profile', type=str, default=None, choices=choices,
                             help='traffic profile that is applied to and replayed in the P4 topology', required=False)
+        parser.add_argument('--traffic_generator', type=str, default=TrafficGenerators.AGENT.value,
+                            choices=[generator.value for generator in TrafficGenerators],
+                            help='generator for the flows of the traffic profile', required=False)
+
+        parser.add_argument('--metrics_port', type=int, default=0,
+                            help='serve monitor/controller metrics in the prometheus text format on '
+                                 'http://127.0.0.1:<port>/metrics (0: disabled)', required=False)
 
         parser.add_argument('--loglevel', type=str, default=LogLevel.INFO.value,
                             choices=[level.value for level in LogLevel],
                             help='make an educated guess', required=False)
 
+        parser.add_argument('--loglevel_subsystem', type=str, nargs='*', default=None,
+                            help='log level per subsystem ({}), e.g. controller:debug monitor:warning'.format(
+                                ', '.join(subsystem.value for subsystem in LogSubsystem)), required=False)
+
+        parser.add_argument('--logformat', type=str, default=LogFormat.TEXT.value,
+                            choices=[log_format.value for log_format in LogFormat],
+                            help='format of the log records (json: one compact JSON object per line)', required=False)
+
         return parser
@@ -0,0 +1,241 @@
+# Copyright 2020-present Christoph Hardegen
+#                        (christoph.hardegen@cs.hs-fulda.de)
+#                        Fulda University of Applied Sciences
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# synthetic topologies (fat-tree, leaf-spine, random regular) for scale testing, e.g.
+#
+# python p4topos/p4topo_synthetic.py fat_tree --k 4
+# python p4topos/p4topo_synthetic.py leaf_spine --leaves 16 --spines 4 --hosts_per_leaf 4
+# python p4topos/p4topo_synthetic.py random_regular --switches 64 --degree 4 --hosts 64 --seed 42
+#
+# writes p4topos/<name>/links_auto.json, p4topos/<name>/links_static.json and p4init/<name>/<p4program>/*.json,
+# the topology can then be selected with --topology <name>
+
+if __name__ == '__main__':
+    import sys
+    import os
+
+    if os.getcwd() not in sys.path:
+        sys.path.append(os.getcwd())
+
+import os
+import copy
+import json
+import random
+import argparse
+
+from enum import Enum
+
+from p4topos.p4topo_generator import TopologyGenerator
+
+
+class SyntheticTopologies(Enum):
+    FAT_TREE = 'fat_tree'
+    LEAF_SPINE = 'leaf_spine'
+    RANDOM_REGULAR = 'random_regular'
+
+
+class SyntheticTopologyGenerator(object):
+    TOPOLOGY_DIR = 'p4topos'
+    INIT_DIR = 'p4init'
+    LINKS_CONFIG = 'links_{}.json'
+    SWITCHES_CONFIG = 'switches.json'
+    HOSTS_CONFIG = 'hosts.json'
+
+    # host and switch numbers are formatted into two address bytes (see TopologyGenerator.get_mac_bytes)
+    MAX_SWITCHES = TopologyGenerator.MAX_SWITCH_NUM
+    MAX_HOSTS = TopologyGenerator.MAX_HOST_NUM
+
+    RANDOM_REGULAR_ATTEMPTS = 100
+
+    def __init__(self, topology_dir=TOPOLOGY_DIR, init_dir=INIT_DIR):
+        self.topology_dir = topology_dir
+        self.init_dir = init_dir
+
+    @staticmethod
+    def _links(host_switches, switch_pairs):
+        return {'host_links': [{'host': host, 'switch': switch} for host, switch in enumerate(host_switches, 1)],
+                'switch_links': [{'switch1': switch1, 'switch2': switch2} for switch1, switch2 in switch_pairs]}
+
+    @staticmethod
+    def fat_tree(k, hosts_per_edge=None):
+        # k-ary fat-tree, switches numbered edge -> aggregation -> core, hosts are attached to edge switches
+        if k < 2 or k % 2:
+            raise SyntheticTopologyException('fat-tree requires an even k >= 2 (k: {})'.format(k))
+        half_k = k // 2
+        hosts_per_edge = half_k if hosts_per_edge is None else hosts_per_edge
+
+        edge = [[1 + pod * half_k + i for i in range(half_k)] for pod in range(k)]
+        aggregation = [[1 + k * half_k + pod * half_k + i for i in range(half_k)] for pod in range(k)]
+        core = [1 + 2 * k * half_k + i for i in range(half_k * half_k)]
+
+        switch_pairs = []
+        for pod in range(k):
+            for edge_switch in edge[pod]:
+                for aggregation_switch in aggregation[pod]:
+                    switch_pairs.append((edge_switch, aggregation_switch))
+            for i, aggregation_switch in enumerate(aggregation[pod]):
+                for core_switch in core[i * half_k:(i + 1) * half_k]:
+                    switch_pairs.append((aggregation_switch, core_switch))
+
+        host_switches = [edge_switch for pod in edge for edge_switch in pod for _ in range(hosts_per_edge)]
+        return SyntheticTopologyGenerator._links(host_switches, switch_pairs)
+
+    @staticmethod
+    def leaf_spine(leaves, spines, hosts_per_leaf=1):
+        # leaves numbered first, every leaf is connected to every spine
+        switch_pairs = [(leaf, leaves + spine) for leaf in range(1, leaves + 1) for spine in range(1, spines + 1)]
+        host_switches = [leaf for leaf in range(1, leaves + 1) for _ in range(hosts_per_leaf)]
+        return SyntheticTopologyGenerator._links(host_switches, switch_pairs)
+
+    @staticmethod
+    def random_regular(switches, degree, hosts, seed=None):
+        # connected random regular graph (pairing model), hosts are distributed round robin over the switches
+        if switches * degree % 2 or degree >= switches:
+            raise SyntheticTopologyException('no {}-regular graph with {} switches'.format(degree, switches))
+
+        random_ = random.Random(seed)
+        for _ in range(SyntheticTopologyGenerator.RANDOM_REGULAR_ATTEMPTS):
+            stubs = [switch for switch in range(1, switches + 1) for _ in range(degree)]
+            random_.shuffle(stubs)
+            switch_pairs = set()
+            for i in range(0, len(stubs), 2):
+                switch1, switch2 = min(stubs[i], stubs[i + 1]), max(stubs[i], stubs[i + 1])
+                if switch1 == switch2 or (switch1, switch2) in switch_pairs:
+                    break
+                switch_pairs.add((switch1, switch2))
+            else:
+                if SyntheticTopologyGenerator._is_connected(switches, switch_pairs):
+                    host_switches = [1 + host % switches for host in range(hosts)]
+                    return SyntheticTopologyGenerator._links(host_switches, sorted(switch_pairs))
+
+        raise SyntheticTopologyException('no connected {}-regular graph with {} switches found '
+                                         '(attempts: {})'.format(degree, switches,
+                                                                 SyntheticTopologyGenerator.RANDOM_REGULAR_ATTEMPTS))
+
+    @staticmethod
+    def _is_connected(switches, switch_pairs):
+        neighbors = dict((switch, []) for switch in range(1, switches + 1))
+        for switch1, switch2 in switch_pairs:
+            neighbors[switch1].append(switch2)
+            neighbors[switch2].append(switch1)
+        visited = {1}
+        stack = [1]
+        while stack:
+            for neighbor in neighbors[stack.pop()]:
+                if neighbor not in visited:
+                    visited.add(neighbor)
+                    stack.append(neighbor)
+        return len(visited) == switches
+
+    @staticmethod
+    def build(topology_type, **topology_args):
+        topology_type = SyntheticTopologies(topology_type)
+        if topology_type == SyntheticTopologies.FAT_TREE:
+            return SyntheticTopologyGenerator.fat_tree(**topology_args)
+        if topology_type == SyntheticTopologies.LEAF_SPINE:
+            return SyntheticTopologyGenerator.leaf_spine(**topology_args)
+        return SyntheticTopologyGenerator.random_regular(**topology_args)
+
+    @staticmethod
+    def get_switches(links):
+        switches = set(hlink['switch'] for hlink in links['host_links'])
+        for slink in links['switch_links']:
+            switches.add(slink['switch1'])
+            switches.add(slink['switch2'])
+        return sorted(switches)
+
+    def write_topology(self, name, links, p4programs):
+        switches = self.get_switches(links)
+        if len(switches) > self.MAX_SWITCHES or len(links['host_links']) > self.MAX_HOSTS:
+            raise SyntheticTopologyException('topology {} exceeds the address scheme ({} switches, {} hosts, '
+                                             'max. {} switches, {} hosts)'.format(name, len(switches),
+                                                                                 len(links['host_links']),
+                                                                                 self.MAX_SWITCHES, self.MAX_HOSTS))
+
+        topology_path = os.path.join(self.topology_dir, name)
+        if not os.path.isdir(topology_path):
+            os.makedirs(topology_path)
+
+        with open(os.path.join(topology_path, self.LINKS_CONFIG.format('auto')), 'w') as links_file:
+            json.dump(links, links_file, indent=4)
+
+        # static link config with the ports the auto link config results in
+        static_links = TopologyGenerator.assign_switch_ports(copy.deepcopy(links))
+        with open(os.path.join(topology_path, self.LINKS_CONFIG.format('static')), 'w') as links_file:
+            json.dump(static_links, links_file, indent=4)
+
+        # switches without static rules, forwarding is set up by a controller (e.g. flow_forwarding)
+        switches_config = dict((str(switch), {'cli_commands': [], 'p4program': ''}) for switch in switches)
+        hosts_config = dict((str(hlink['host']), {'commands': []}) for hlink in links['host_links'])
+        for p4program in p4programs:
+            init_path = os.path.join(self.init_dir, name, p4program)
+            if not os.path.isdir(init_path):
+                os.makedirs(init_path)
+            with open(os.path.join(init_path, self.SWITCHES_CONFIG), 'w') as switches_config_file:
+                json.dump(switches_config, switches_config_file, indent=2, sort_keys=True)
+            with open(os.path.join(init_path, self.HOSTS_CONFIG), 'w') as hosts_config_file:
+                json.dump(hosts_config, hosts_config_file, indent=2, sort_keys=True)
+
+        print('synthetic topology {}: {} switches, {} hosts, {} switch links'.format(name, len(switches),
+                                                                                    len(links['host_links']),
+                                                                                    len(links['switch_links'])))
+        return topology_path
+
+
+class SyntheticTopologyException(Exception):
+
+    def __init__(self, message):
+        super(SyntheticTopologyException, self).__init__(self.__class__.__name__ + ': ' + message)
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(description='synthetic P4 topologies for scale testing')
+    parser.add_argument('type', type=str, choices=[topology.value for topology in SyntheticTopologies])
+    parser.add_argument('--name', type=str, default=None,
+                        help='topology name (default: derived from type and parameters)')
+    parser.add_argument('--p4program', type=str, nargs='+', default=['flow_forwarding'],
+                        help='P4 program(s) to create (empty) init configs for')
+    parser.add_argument('--k', type=int, default=4, help='fat-tree: number of ports per switch')
+    parser.add_argument('--hosts_per_edge', type=int, default=None, help='fat-tree: hosts per edge switch')
+    parser.add_argument('--leaves', type=int, default=8, help='leaf-spine: number of leaf switches')
+    parser.add_argument('--spines', type=int, default=4, help='leaf-spine: number of spine switches')
+    parser.add_argument('--hosts_per_leaf', type=int, default=1, help='leaf-spine: hosts per leaf switch')
+    parser.add_argument('--switches', type=int, default=16, help='random regular: number of switches')
+    parser.add_argument('--degree', type=int, default=3, help='random regular: switch links per switch')
+    parser.add_argument('--hosts', type=int, default=16, help='random regular: number of hosts')
+    parser.add_argument('--seed', type=int, default=None, help='random regular: seed')
+    return parser
+
+
+def get_topology_args(args):
+    topology_type = SyntheticTopologies(args.type)
+    if topology_type == SyntheticTopologies.FAT_TREE:
+        return 'fat_tree_k{}'.format(args.k), {'k': args.k, 'hosts_per_edge': args.hosts_per_edge}
+    if topology_type == SyntheticTopologies.LEAF_SPINE:
+        return 'leaf_spine_{}x{}'.format(args.leaves, args.spines), {'leaves': args.leaves, 'spines': args.spines,
+                                                                     'hosts_per_leaf': args.hosts_per_leaf}
+    return 'random_regular_{}_{}'.format(args.switches, args.degree), {'switches': args.switches,
+                                                                       'degree': args.degree,
+                                                                       'hosts': args.hosts,
+                                                                       'seed': args.seed}
+
+
+if __name__ == '__main__':
+    args = create_parser().parse_args()
+    topology_name, topology_args = get_topology_args(args)
+    SyntheticTopologyGenerator().write_topology(name=args.name or topology_name,
+                                                links=SyntheticTopologyGenerator.build(args.type, **topology_args),
+                                                p4programs=args.p4program)
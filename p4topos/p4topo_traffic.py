@@ -25,6 +25,11 @@ import yaml
 
 import hashlib
 
+from tools.clock import monotonic
+from tools.traffic_profiles.traffic_profile_format import load_traffic_profile
+
+from p4env import TrafficGenerators
+
 
 class DataRates(Enum):
     KILOBIT = 'k'
@@ -43,11 +48,18 @@ class TrafficManager(threading.Thread):
 
     traffic_generation_event = threading.Event()
 
-    def __init__(self, traffic_profile, mininet_network, mininet_runner):
+    DATA_RATE_FACTORS = {DataRates.KILOBIT: 10 ** 3, DataRates.MEGABIT: 10 ** 6, DataRates.GIGABIT: 10 ** 9}
+
+    def __init__(self, traffic_profile, mininet_network, mininet_runner,
+                 traffic_generator=TrafficGenerators.AGENT.value):
         super(TrafficManager, self).__init__()
 
+        self.traffic_generator = TrafficGenerators(traffic_generator)
+        self.pending_flow_specs = {}  # source host --> flow specs for the traffic agent
+
         self.traffic_profile = self._load_traffic_profile(traffic_profile)
         self.traffic_flag = True
+        self.traffic_stop_event = threading.Event()
 
         self.default_throughput = 10
         self.default_duration = 600
@@ -62,14 +74,16 @@ class TrafficManager(threading.Thread):
 
         self.np_random = None
 
+        self.static_schedule = None
+        if self.traffic_profile.get('type') == TrafficProfiles.STATIC.value:
+            self.static_schedule = self._compile_static_schedule()
+
     def _load_traffic_profile(self, traffic_profile):
-        yaml_content = None
-        with open(traffic_profile, 'r') as yaml_file:
-            try:
-                yaml_content = yaml.safe_load(yaml_file)
-            except:
-                raise yaml.YAMLError('specified traffic profile ({}) is no valid YAML file'.format(traffic_profile))
-        return yaml_content
+        # YAML profiles are compiled on first use (see tools.traffic_profiles.traffic_profile_format)
+        try:
+            return load_traffic_profile(traffic_profile)
+        except yaml.YAMLError:
+            raise yaml.YAMLError('specified traffic profile ({}) is no valid YAML file'.format(traffic_profile))
 
     def run(self):
         traffic_profile_type = TrafficProfiles(self.traffic_profile.pop('type'))
@@ -80,55 +94,71 @@ class TrafficManager(threading.Thread):
         if traffic_profile_type == TrafficProfiles.DYNAMIC:
             self._dynamic_traffic_profile()
 
+    def _compile_static_schedule(self):
+        # flows sorted by start offset and grouped into batches of flows with the same start offset,
+        # client ports (and flow hashes) are assigned in start order like before
+        flow_starts = []
+        flow_specs = [flow_spec for flow_spec in self.traffic_profile.values() if isinstance(flow_spec, dict)]
+        for flow_spec_i, flow_spec in enumerate(flow_specs):
+            for flow in range(flow_spec['num']):
+                flow_starts.append((float(flow_spec['start'][flow]), flow_spec_i, flow, flow_spec))
+        flow_starts.sort(key=lambda flow_start: flow_start[:3])
+
+        schedule = []
+        for flow_counter, (start_offset, _, flow, flow_spec) in enumerate(flow_starts, 1):
+            flow_throughput = flow_spec['throughput'][flow]
+            flow_duration = flow_spec['duration'][flow]
+
+            flow_src = flow_spec['source']
+            flow_dst = flow_spec['destination']
+            client_address = self.mininet_network[flow_src].IP()
+            server_address = self.mininet_network[flow_dst].IP()
+
+            bandwidth = self.default_throughput if flow_throughput == 'default' else flow_throughput
+            bw_unit = self.default_bw_unit if flow_throughput == 'default' else flow_spec['throughput_unit']
+            time = self.default_duration if flow_duration == 'default' else flow_duration
+            protocol = '-u' if flow_spec['protocol'][flow] == 'UDP' else ''
+
+            flow_hash = hashlib.sha1('{}_{}_{}_{}_{}'.format(client_address,
+                                                             server_address,
+                                                             17 if protocol == '-u' else 6,
+                                                             self.IPERF_CLIENT_BASE_PORT + flow_counter,
+                                                             self.IPERF_SERVER_PORT)).hexdigest()
+
+            flow_throughput_unit = DataRates(flow_spec['throughput_unit'])
+
+            flow_args = {'flow_src': flow_src, 'flow_dst': flow_dst,
+                         'client_address': client_address,
+                         'client_port': self.IPERF_CLIENT_BASE_PORT + flow_counter,
+                         'server_address': server_address,
+                         'protocol': protocol,
+                         'bandwidth': bandwidth,
+                         'bw_unit': bw_unit,
+                         'time': time}
+
+            if not schedule or schedule[-1][0] != start_offset:
+                schedule.append((start_offset, []))
+            schedule[-1][1].append((flow_hash, (flow_throughput, flow_throughput_unit), flow_args))
+
+        return schedule
+
     def _static_traffic_profile(self):
-        flow_traffic_i = 0
-        flow_counter = 0
+        start_time = monotonic()
 
-        while self.traffic_flag:
-            for flow_spec_id, flow_spec in self.traffic_profile.items():
-                for flow in range(flow_spec['num']):
-                    if flow_spec['start'][flow] == flow_traffic_i:
-                        flow_counter += 1
-
-                        flow_throughput = flow_spec['throughput'][flow]
-                        flow_duration = flow_spec['duration'][flow]
-
-                        flow_src = flow_spec['source']
-                        flow_dst = flow_spec['destination']
-                        client_address = self.mininet_network[flow_src].IP()
-                        server_address = self.mininet_network[flow_dst].IP()
-
-                        bandwidth = self.default_throughput if flow_throughput == 'default' else flow_throughput
-                        bw_unit = self.default_bw_unit if flow_throughput == 'default' else flow_spec['throughput_unit']
-                        time = self.default_duration if flow_duration == 'default' else flow_duration
-                        protocol = '-u' if flow_spec['protocol'][flow] == 'UDP' else ''
-
-                        flow_hash = hashlib.sha1('{}_{}_{}_{}_{}'.format(client_address,
-                                                                         server_address,
-                                                                         17 if protocol == '-u' else 6,
-                                                                         self.IPERF_CLIENT_BASE_PORT + flow_counter,
-                                                                         self.IPERF_SERVER_PORT)).hexdigest()
-
-                        flow_throughput_unit = DataRates(flow_spec['throughput_unit'])
-
-                        self._add_flow_throughput(flow_hash=flow_hash,
-                                                  flow_throughput=(flow_throughput, flow_throughput_unit))
-
-                        self.mininet_network[flow_dst].start_iperf_server()
-                        self.mininet_network[flow_src].start_iperf_client(client_address=client_address,
-                                                                          client_port=self.IPERF_CLIENT_BASE_PORT + \
-                                                                                      flow_counter,
-                                                                          server_address=server_address,
-                                                                          server_port=self.IPERF_SERVER_PORT,
-                                                                          protocol=protocol,
-                                                                          bandwidth=bandwidth,
-                                                                          bw_unit=bw_unit,
-                                                                          time=time)
-            flow_traffic_i += 1
-            sleep(1)
-            if flow_counter == max([flow_spec['num'] for flow_spec in self.traffic_profile.values()]):
-                sleep(60)
-                self.mininet_runner.end_experiment()
+        for start_offset, flows in self.static_schedule:
+            delay = start_time + start_offset - monotonic()
+            if delay > 0:
+                self.traffic_stop_event.wait(delay)
+            if not self.traffic_flag:
+                return
+
+            for flow_hash, flow_throughput, flow_args in flows:
+                self._add_flow_throughput(flow_hash=flow_hash, flow_throughput=flow_throughput)
+                self._start_flow(**flow_args)
+            self._flush_flows()
+
+        self.traffic_stop_event.wait(60)
+        self.mininet_runner.end_experiment()
 
     def _dynamic_traffic_profile(self):
         flow_batch_size = self.traffic_profile.pop('flow_batch_size')
@@ -185,24 +215,52 @@ class TrafficManager(threading.Thread):
                                                          flow_throughput_prediction=(flow_throughput,
                                                                                      flow_throughput_unit))
 
-                    self.mininet_network[flow_dst].start_iperf_server()
-                    self.mininet_network[flow_src].start_iperf_client(client_address=client_address,
-                                                                      client_port=self.IPERF_CLIENT_BASE_PORT + \
-                                                                                  flow_counter,
-                                                                      server_address=server_address,
-                                                                      server_port=self.IPERF_SERVER_PORT,
-                                                                      protocol=protocol,
-                                                                      bandwidth=bandwidth,
-                                                                      bw_unit=flow_spec['throughput_unit'],
-                                                                      time=time)
+                    self._start_flow(flow_src=flow_src, flow_dst=flow_dst,
+                                     client_address=client_address,
+                                     client_port=self.IPERF_CLIENT_BASE_PORT + flow_counter,
+                                     server_address=server_address,
+                                     protocol=protocol,
+                                     bandwidth=bandwidth,
+                                     bw_unit=flow_spec['throughput_unit'],
+                                     time=time)
 
                 flow_batch_i += 1
+            self._flush_flows()
 
         sleep(60)
         self.mininet_runner.end_experiment()
 
+    def _start_flow(self, flow_src, flow_dst, client_address, client_port, server_address,
+                    protocol, bandwidth, bw_unit, time):
+        if self.traffic_generator == TrafficGenerators.IPERF:
+            self.mininet_network[flow_dst].start_iperf_server()
+            self.mininet_network[flow_src].start_iperf_client(client_address=client_address,
+                                                              client_port=client_port,
+                                                              server_address=server_address,
+                                                              server_port=self.IPERF_SERVER_PORT,
+                                                              protocol=protocol,
+                                                              bandwidth=bandwidth,
+                                                              bw_unit=bw_unit,
+                                                              time=time)
+            return
+
+        self.mininet_network[flow_dst].start_traffic_agent(sink_port=self.IPERF_SERVER_PORT)
+        self.pending_flow_specs.setdefault(flow_src, []).append(
+            {'src_ip': client_address, 'src_port': client_port,
+             'dst_ip': server_address, 'dst_port': self.IPERF_SERVER_PORT,
+             'protocol': 'UDP' if protocol == '-u' else 'TCP',
+             'rate': float(bandwidth) * self.DATA_RATE_FACTORS[DataRates(bw_unit)],
+             'duration': time})
+
+    def _flush_flows(self):
+        for flow_src, flow_specs in self.pending_flow_specs.items():
+            self.mininet_network[flow_src].start_traffic_agent(sink_port=self.IPERF_SERVER_PORT)
+            self.mininet_network[flow_src].send_flow_specs(flow_specs)
+        self.pending_flow_specs = {}
+
     def stop(self):
         self.traffic_flag = False
+        self.traffic_stop_event.set()
 
     def _add_flow_throughput(self, flow_hash, flow_throughput):
         self.flow_throughputs[flow_hash] = flow_throughput
@@ -0,0 +1,356 @@
+# Copyright 2020-present Christoph Hardegen
+#                        (christoph.hardegen@cs.hs-fulda.de)
+#                        Fulda University of Applied Sciences
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# flow setup benchmark for FlowForwardingController against fake switches (see p4runtime/fake_switch.py),
+# run from the repository root
+#
+# python tools/benchmarks/flow_setup_benchmark.py leaf_spine --leaves 4 --spines 2 \
+#     --p4json build/flow_forwarding/flow_forwarding.json --p4info build/flow_forwarding/flow_forwarding.p4info \
+#     --rates 100 500 1000 --flows 2000 --output flow_setup.csv
+#
+# synthetic CPU packets (UDP, CPUHeader with the flow hashes and ECMP result of the flow_forwarding P4 program) are
+# injected at a constant rate into the dispatch path of the controller (P4ControllerCPU._receive_cpu_packet), one
+# dispatcher per ingress switch like the switch level sniffers; per strategy/metric combination and rate:
+#  - setup rate: completed flow setups per second from the first arrival until the queues are drained
+#  - queueing: time between the scheduled arrival and the dispatch of a packet
+#  - latency: time between the scheduled arrival and the completed flow setup
+#  - stages: per stage times of the controller (time measurement histograms)
+#
+# --pcap_dir writes the packets per ingress switch as pcap files instead, e.g. for injecting them into the CPU ports
+# of a running network: tcpreplay --intf1=cpu-s1 --pps=1000 s1.pcap
+
+if __name__ == '__main__':
+    import sys
+    import os
+
+    if os.getcwd() not in sys.path:
+        sys.path.append(os.getcwd())
+
+import os
+import csv
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from Queue import Queue
+from collections import OrderedDict
+
+import numpy as np
+
+from scapy.layers.l2 import Ether
+from scapy.layers.inet import IP, UDP
+from scapy.packet import Raw
+from scapy.utils import wrpcap
+
+from p4controllers.flow_forwarding import FlowForwardingController, CPUHeader, TimeMeasurements, \
+    mapping_flow_routing_strategy_and_metric, time_measure_factory
+from p4monitors.p4monitor import DataRates
+from p4monitors.p4port_counter import PortCounterMonitor, CounterDirection, CounterData
+from p4runtime.fake_switch import FakeNetwork
+from p4topos import p4topo_synthetic
+from tools.clock import monotonic
+from tools.flow_hash import compute_flow_hashes, compute_ecmp_result, IP_PROTOCOL_UDP
+
+FLOW_BASE_PORT = 10000
+FLOW_DST_PORT = 5001
+PAYLOAD = b'\x00' * 32
+
+PERCENTILES = [50, 90, 99]
+
+
+def build_cpu_header(src_ip, dst_ip, src_port, dst_port, ingress_port, ecmp_count):
+    flow_hash_one, flow_hash_two = compute_flow_hashes(src_ip, dst_ip, src_port, dst_port)
+    return CPUHeader(ingress_port=ingress_port,
+                     flow_hash_one=flow_hash_one,
+                     flow_hash_two=flow_hash_two,
+                     ecmp_result=compute_ecmp_result(src_ip, dst_ip, src_port, dst_port, ecmp_count))
+
+
+def build_cpu_packets(p4monitor, num_flows, seed):
+    # [(ingress switch, packet)], one packet per flow with the layers a sniffer on the CPU port would dissect
+    hosts = p4monitor.get_hosts()
+    switches = p4monitor.get_switches()
+    host_pairs = [(host1, host2) for host1 in sorted(hosts) for host2 in sorted(hosts) if host1 != host2]
+    random_ = random.Random(seed)
+
+    packets = []
+    for flow_i in range(num_flows):
+        src_host, dst_host = random_.choice(host_pairs)
+        src_config, dst_config = hosts[src_host], hosts[dst_host]
+        ingress_switch = list(p4monitor.get_neighbors(src_host))[0]
+        ecmp_count = max(switches[ingress_switch]['ports']['data_links'].keys()) - 1
+        src_port = FLOW_BASE_PORT + flow_i % (2 ** 16 - FLOW_BASE_PORT)
+
+        cpu_header = build_cpu_header(src_config['ip'], dst_config['ip'], src_port, FLOW_DST_PORT,
+                                      ingress_port=p4monitor.map_edge_to_switch_port(ingress_switch, src_host),
+                                      ecmp_count=max(ecmp_count, 1))
+        packet = Ether(src=src_config['mac'], dst=src_config['gw_mac']) / \
+            IP(src=src_config['ip'], dst=dst_config['ip'], proto=IP_PROTOCOL_UDP) / \
+            UDP(sport=src_port, dport=FLOW_DST_PORT) / cpu_header / Raw(PAYLOAD)
+
+        packet = Ether(str(packet))
+        packet.sniffed_on = FlowForwardingController.P4_SWITCH_CPU_PORT_PATTERN.format(ingress_switch)
+        packets.append((ingress_switch, packet))
+    return packets
+
+
+class BenchmarkFlowForwardingController(FlowForwardingController):
+    # CPU packets are injected by the benchmark, reassembled packets are not sent
+
+    def _run_cpu_port_handler(self, sniff_filter=None):
+        self._add_cpu_mirrors()
+
+    def _stop_cpu_port_handler(self):
+        pass
+
+    @time_measure_factory(TimeMeasurements.PACKET_SENDING)
+    def _send_packet(self, packet, intf):
+        pass
+
+
+class FlowPredictions(object):
+    # stands in for the traffic manager, every flow gets the same throughput prediction
+
+    def __init__(self, throughput, throughput_unit):
+        self.flow_throughput_prediction = ([throughput, 0, throughput], throughput_unit)
+
+    def get_flow_throughput_prediction(self, flow_hash):
+        return self.flow_throughput_prediction
+
+
+def percentiles(values, prefix, scale=1.0):
+    result = OrderedDict()
+    for percentile in PERCENTILES:
+        result['{}_p{}'.format(prefix, percentile)] = float(np.percentile(values, percentile)) * scale \
+            if len(values) else None
+    result['{}_max'.format(prefix)] = float(np.max(values)) * scale if len(values) else None
+    return result
+
+
+def histogram_percentiles(histogram, prefix, scale=1.0):
+    # stage times are recorded as latency histograms (ns)
+    return OrderedDict(('{}_{}'.format(prefix, key), value) for key, value in
+                       histogram.get_summary(scale=scale).items() if key not in ['count', 'mean'])
+
+
+def start_connectors(network, strategy, metric, run_monitor, counter_interval):
+    p4monitor = PortCounterMonitor(p4monitor_counter_interval=counter_interval,
+                                   p4monitor_counter_direction=CounterDirection.TX_PORT_COUNTER.value,
+                                   p4monitor_counter_data=CounterData.BYTE_COUNT.value,
+                                   p4monitor_counter_flows=False,
+                                   p4monitor_counter_elephant_threshold=0.1,
+                                   p4monitor_counter_adaptive=False,
+                                   p4monitor_counter_min_interval=1,
+                                   p4monitor_counter_read_budget=0)
+    p4controller = BenchmarkFlowForwardingController(flow_forwarding_strategy=strategy,
+                                                     flow_forwarding_metric=metric,
+                                                     time_measurement=True,
+                                                     time_measurement_interval=0)
+    p4monitor.set_p4controller(p4controller)
+    p4controller.set_p4monitor(p4monitor)
+    p4controller.set_traffic_manager(FlowPredictions(throughput=1, throughput_unit=DataRates.MEGABIT))
+
+    for host_config in network.get_host_configs():
+        p4monitor.add_node(host_config)
+    for switch_config in network.get_switch_configs():
+        p4monitor.add_switch_connection(switch_config['name'], switch_config)
+        p4controller.add_switch_connection(switch_config['name'], switch_config)
+    p4monitor.build_topology()
+
+    if run_monitor:
+        p4monitor.daemon = True
+        p4monitor.start()
+    p4controller.run_controller()
+    return p4monitor, p4controller
+
+
+def stop_connectors(p4monitor, p4controller):
+    p4monitor.monitor_flag = False
+    p4controller.stop_controller()
+    p4controller.shutdown_switch_connections()
+    p4monitor.shutdown_switch_connections()
+
+
+def inject_packets(p4controller, packets, rate):
+    # open loop: packets are queued at their scheduled arrival regardless of the progress of the dispatchers
+    queues = dict((switch, Queue()) for switch in set(switch for switch, _ in packets))
+    queueing = []
+    latencies = []
+    max_queue = [0]
+    lock = threading.Lock()
+
+    def _dispatch(queue):
+        while True:
+            item = queue.get()
+            if item is None:
+                break
+            scheduled, packet = item
+            dispatched = monotonic()
+            p4controller._receive_cpu_packet(packet)
+            completed = monotonic()
+            with lock:
+                queueing.append(dispatched - scheduled)
+                latencies.append(completed - scheduled)
+
+    dispatchers = [threading.Thread(target=_dispatch, args=(queue,)) for queue in queues.values()]
+    for dispatcher in dispatchers:
+        dispatcher.start()
+
+    start_time = monotonic()
+    for packet_i, (switch, packet) in enumerate(packets):
+        scheduled = start_time + float(packet_i) / rate
+        delay = scheduled - monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        queues[switch].put((scheduled, packet))
+        max_queue[0] = max(max_queue[0], queues[switch].qsize())
+
+    for queue in queues.values():
+        queue.put(None)
+    for dispatcher in dispatchers:
+        dispatcher.join()
+    duration = monotonic() - start_time
+
+    return duration, queueing, latencies, max_queue[0]
+
+
+def run_benchmark(links, strategy, metric, rate, args):
+    log_dir = tempfile.mkdtemp(prefix='p4flow_setup_benchmark_')
+    network = FakeNetwork(links, args.p4info, args.p4json, p4program=args.p4program, log_dir=log_dir, seed=args.seed,
+                          latency=args.latency, jitter=args.jitter, counter_rate=args.counter_rate)
+    network.start()
+    try:
+        p4monitor, p4controller = start_connectors(network, strategy, metric, args.run_monitor, args.counter_interval)
+        packets = build_cpu_packets(p4monitor, args.flows + 1, args.seed)
+
+        result = OrderedDict([('strategy', strategy), ('metric', metric), ('offered_rate', rate)])
+
+        # the first flow warms up the connections and sorts out strategy/metric combinations that are not implemented
+        p4controller._receive_cpu_packet(packets[0][1])
+        if not p4controller.time_measures.get_count(TimeMeasurements.FLOW_FORWARDING.value):
+            result['status'] = 'unsupported'
+            stop_connectors(p4monitor, p4controller)
+            return result
+        p4controller.time_measures.reset()
+
+        duration, queueing, latencies, max_queue = inject_packets(p4controller, packets[1:], rate)
+        time_measures = p4controller.time_measures.get_total_snapshot()
+        stop_connectors(p4monitor, p4controller)
+
+        flow_setups = time_measures[TimeMeasurements.FLOW_FORWARDING.value].total_count
+        result.update([('status', 'ok'),
+                       ('flows', len(packets) - 1),
+                       ('flow_setups', flow_setups),
+                       ('duration_s', duration),
+                       ('setup_rate', flow_setups / duration),
+                       ('max_queue', max_queue)])
+        result.update(percentiles(queueing, 'queueing_ms', scale=1000))
+        result.update(percentiles(latencies, 'latency_ms', scale=1000))
+        for measurement in TimeMeasurements:
+            result.update(histogram_percentiles(time_measures[measurement.value], '{}_us'.format(measurement.value),
+                                                scale=1000.0))
+        return result
+    finally:
+        network.stop()
+        shutil.rmtree(log_dir)
+
+
+def write_pcaps(links, args):
+    log_dir = tempfile.mkdtemp(prefix='p4flow_setup_benchmark_')
+    network = FakeNetwork(links, args.p4info, args.p4json, p4program=args.p4program, log_dir=log_dir)
+    network.start()
+    try:
+        p4monitor = PortCounterMonitor(p4monitor_counter_interval=args.counter_interval,
+                                       p4monitor_counter_direction=CounterDirection.TX_PORT_COUNTER.value,
+                                       p4monitor_counter_data=CounterData.BYTE_COUNT.value,
+                                       p4monitor_counter_flows=False,
+                                       p4monitor_counter_elephant_threshold=0.1,
+                                       p4monitor_counter_adaptive=False,
+                                       p4monitor_counter_min_interval=1,
+                                       p4monitor_counter_read_budget=0)
+        for host_config in network.get_host_configs():
+            p4monitor.add_node(host_config)
+        for switch_config in network.get_switch_configs():
+            p4monitor.add_switch_connection(switch_config['name'], switch_config)
+        p4monitor.build_topology()
+        packets = build_cpu_packets(p4monitor, args.flows, args.seed)
+        p4monitor.shutdown_switch_connections()
+    finally:
+        network.stop()
+        shutil.rmtree(log_dir)
+
+    if not os.path.isdir(args.pcap_dir):
+        os.makedirs(args.pcap_dir)
+    for switch in sorted(set(switch for switch, _ in packets)):
+        wrpcap(os.path.join(args.pcap_dir, '{}.pcap'.format(switch)),
+               [packet for switch_, packet in packets if switch_ == switch])
+    print('{} packets written to {}'.format(len(packets), args.pcap_dir))
+
+
+def get_combinations(strategies):
+    return [(strategy, metric.value) for strategy, metrics in sorted(mapping_flow_routing_strategy_and_metric.items())
+            if not strategies or strategy in strategies for metric in metrics]
+
+
+def create_parser():
+    parser = p4topo_synthetic.create_parser()
+    parser.description = 'flow setup benchmark for FlowForwardingController (fake switches)'
+    parser.set_defaults(leaves=4, spines=2)
+    parser.add_argument('--p4json', type=str, required=True, help='compiled bmv2 JSON of flow_forwarding')
+    parser.add_argument('--p4info', type=str, required=True, help='compiled p4info (text) of flow_forwarding')
+    parser.add_argument('--strategies', type=str, nargs='+', default=None,
+                        choices=sorted(mapping_flow_routing_strategy_and_metric),
+                        help='flow forwarding strategies (default: all, with all metrics)')
+    parser.add_argument('--rates', type=float, nargs='+', default=[100.0], help='offered flow arrival rates (1/s)')
+    parser.add_argument('--flows', type=int, default=1000, help='number of flows per run')
+    parser.add_argument('--latency', type=float, default=0.0, help='fake switch latency per call (s)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='fake switch jitter per call (s)')
+    parser.add_argument('--counter_rate', type=float, default=0.0, help='fake switch counter growth (bytes/s)')
+    parser.add_argument('--run_monitor', action='store_true', help='run the port counter monitor during the runs')
+    parser.add_argument('--counter_interval', type=float, default=1.0, help='port counter monitor interval (s)')
+    parser.add_argument('--pcap_dir', type=str, default=None,
+                        help='only write the CPU packets per ingress switch as pcap files')
+    parser.add_argument('--output', type=str, default=None, help='CSV file for the results')
+    return parser
+
+
+if __name__ == '__main__':
+    args = create_parser().parse_args()
+    args.p4program = args.p4program[0]
+    _, topology_args = p4topo_synthetic.get_topology_args(args)
+
+    if args.pcap_dir:
+        write_pcaps(p4topo_synthetic.SyntheticTopologyGenerator.build(args.type, **topology_args), args)
+        sys.exit(0)
+
+    rows = []
+    for strategy, metric in get_combinations(args.strategies):
+        for rate in args.rates:
+            # port assignment modifies the links, every run gets a fresh network
+            links = p4topo_synthetic.SyntheticTopologyGenerator.build(args.type, **topology_args)
+            rows.append(run_benchmark(links, strategy, metric, rate, args))
+            print(', '.join('{}: {}'.format(k, round(v, 3) if isinstance(v, float) else v)
+                            for k, v in rows[-1].items()))
+
+    rows = [row for row in rows if row['status'] == 'ok']
+    if args.output and rows:
+        with open(args.output, 'w') as output_file:
+            csv_writer = csv.DictWriter(output_file, fieldnames=list(rows[-1].keys()))
+            csv_writer.writeheader()
+            for row in rows:
+                csv_writer.writerow(row)
@@ -0,0 +1,297 @@
+# Copyright 2020-present Christoph Hardegen
+#                        (christoph.hardegen@cs.hs-fulda.de)
+#                        Fulda University of Applied Sciences
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# scale benchmark for synthetic topologies (see p4topos/p4topo_synthetic.py), run from the repository root
+#
+# python tools/benchmarks/topology_scale_benchmark.py fat_tree --sizes 2 4 6
+# python tools/benchmarks/topology_scale_benchmark.py leaf_spine --sizes 8 16 32 64 --spines 4 --output scale.csv
+#
+# per topology size (fat-tree: k, leaf-spine: leaves, random regular: switches) and in a separate process:
+#  - generation: time for building and writing the topology files
+#  - graph: time and memory for adding the nodes to a P4Monitor and P4Monitor.build_topology
+#  - paths: time of FlowForwardingController._determine_path per strategy/metric combination for host pairs (ECMP
+#    with the flow hash of the CPU header as computed by the switch)
+#  - startup (--startup_cmd): time until a warm experiment runner serves its control socket (network, switches,
+#    controller and monitor started) and the memory of its process tree, needs root, mininet and bmv2
+
+if __name__ == '__main__':
+    import sys
+    import os
+
+    if os.getcwd() not in sys.path:
+        sys.path.append(os.getcwd())
+
+import os
+import csv
+import sys
+import copy
+import json
+import time
+import random
+import shutil
+import socket
+import argparse
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from collections import OrderedDict
+
+from p4topos.p4topo_synthetic import SyntheticTopologies, SyntheticTopologyGenerator
+from p4topos.p4topo_generator import TopologyGenerator
+
+STARTUP_CONTROL_SOCKET = '/tmp/p4runner-benchmark.sock'
+STARTUP_TIMEOUT = 1800  # seconds
+
+FLOW_SRC_PORT = 10000
+FLOW_DST_PORT = 5001
+
+PATH_COMBINATIONS = ['shortest_path:hops', 'ecmp:hash', 'path_property:load_port_counter',
+                     'flow_prediction:throughput']
+
+
+def get_topology_args(topology_type, size, args):
+    topology_type = SyntheticTopologies(topology_type)
+    if topology_type == SyntheticTopologies.FAT_TREE:
+        return 'fat_tree_k{}'.format(size), {'k': size, 'hosts_per_edge': args.hosts_per_switch}
+    if topology_type == SyntheticTopologies.LEAF_SPINE:
+        return 'leaf_spine_{}x{}'.format(size, args.spines), {'leaves': size, 'spines': args.spines,
+                                                              'hosts_per_leaf': args.hosts_per_switch or 1}
+    return 'random_regular_{}_{}'.format(size, args.degree), {'switches': size, 'degree': args.degree,
+                                                              'hosts': args.hosts or size, 'seed': args.seed}
+
+
+def build_monitor(links):
+    # P4Monitor as started by the runner (nodes of the switch and host configs, then build_topology), without
+    # switch connections
+    from p4monitors.p4port_counter import PortCounterMonitor, CounterDirection, CounterData
+    from p4runtime.fake_switch import FakeNetwork
+
+    links = TopologyGenerator.assign_switch_ports(copy.deepcopy(links))
+    data_links = FakeNetwork.get_data_links(links)
+
+    p4monitor = PortCounterMonitor(p4monitor_counter_interval=1.0,
+                                   p4monitor_counter_direction=CounterDirection.TX_PORT_COUNTER.value,
+                                   p4monitor_counter_data=CounterData.BYTE_COUNT.value,
+                                   p4monitor_counter_flows=False,
+                                   p4monitor_counter_elephant_threshold=0.1,
+                                   p4monitor_counter_adaptive=False,
+                                   p4monitor_counter_min_interval=1,
+                                   p4monitor_counter_read_budget=0)
+    for hlink in links['host_links']:
+        p4monitor.add_node(FakeNetwork.get_host_config(hlink['host']))
+    for switch_num in sorted(data_links):
+        p4monitor.add_node({'name': FakeNetwork.SWITCHNAME.format(switch_num),
+                            'type': 'switch',
+                            'ports': {'data_links': data_links[switch_num]}})
+    p4monitor.build_topology()
+    return p4monitor
+
+
+def measure_paths(p4monitor, combinations, num_pairs, seed):
+    from p4controllers.flow_forwarding import FlowForwardingController
+    from p4monitors.p4monitor import DataRates
+    from tools.benchmarks.flow_setup_benchmark import FlowPredictions, build_cpu_header, percentiles
+    from tools.clock import monotonic
+    from tools.flow_hash import IP_PROTOCOL_UDP
+
+    hosts = p4monitor.get_hosts()
+    switches = p4monitor.get_switches()
+    host_pairs = [(host1, host2) for host1 in sorted(hosts) for host2 in sorted(hosts) if host1 != host2]
+    random.Random(seed).shuffle(host_pairs)
+    host_pairs = host_pairs[:num_pairs]
+
+    flows = []
+    for pair_i, (src_host, dst_host) in enumerate(host_pairs):
+        src_ip, dst_ip = hosts[src_host]['ip'], hosts[dst_host]['ip']
+        src_port = FLOW_SRC_PORT + pair_i
+        ingress_switch = list(p4monitor.get_neighbors(src_host))[0]
+        ecmp_count = max(switches[ingress_switch]['ports']['data_links'].keys()) - 1
+        flows.append(({'src_ip': src_ip, 'dst_ip': dst_ip, 'protocol': IP_PROTOCOL_UDP,
+                       'src_port': src_port, 'dst_port': FLOW_DST_PORT},
+                      build_cpu_header(src_ip, dst_ip, src_port, FLOW_DST_PORT,
+                                       ingress_port=p4monitor.map_edge_to_switch_port(ingress_switch, src_host),
+                                       ecmp_count=max(ecmp_count, 1))))
+
+    result = OrderedDict([('path_pairs', len(host_pairs))])
+    for combination in combinations:
+        strategy, metric = combination.split(':')
+        p4controller = FlowForwardingController(flow_forwarding_strategy=strategy,
+                                                flow_forwarding_metric=metric,
+                                                time_measurement=False,
+                                                time_measurement_interval=0)
+        p4controller.set_p4monitor(p4monitor)
+        p4controller.set_traffic_manager(FlowPredictions(throughput=1, throughput_unit=DataRates.MEGABIT))
+
+        durations = []
+        path_hops = 0
+        for flow_5_tuple, cpu_header in flows:
+            start_time = monotonic()
+            path = p4controller._determine_path(p4controller, flow_5_tuple, cpu_header)
+            durations.append(monotonic() - start_time)
+            path_hops += len(path) - 1 if path else 0
+
+        prefix = '{}_{}'.format(strategy, metric)
+        result.update(percentiles(durations, '{}_ms'.format(prefix), scale=1000))
+        result['{}_mean_hops'.format(prefix)] = float(path_hops) / len(flows) if flows else 0.0
+    return result
+
+
+def get_process_tree_rss(pid):
+    # resident memory (kB) of a process and all its descendants
+    children = {}
+    for proc_pid in [proc_pid for proc_pid in os.listdir('/proc') if proc_pid.isdigit()]:
+        try:
+            with open('/proc/{}/stat'.format(proc_pid), 'r') as stat_file:
+                ppid = int(stat_file.read().rsplit(')', 1)[1].split()[1])
+        except (IOError, OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(proc_pid))
+
+    rss = 0
+    pids = [pid]
+    while pids:
+        pid_ = pids.pop()
+        pids.extend(children.get(pid_, []))
+        try:
+            with open('/proc/{}/status'.format(pid_), 'r') as status_file:
+                for line in status_file:
+                    if line.startswith('VmRSS:'):
+                        rss += int(line.split()[1])
+        except (IOError, OSError):
+            pass
+    return rss
+
+
+def measure_startup(startup_cmd, topology_name):
+    if os.path.exists(STARTUP_CONTROL_SOCKET):
+        os.remove(STARTUP_CONTROL_SOCKET)
+    cmd = startup_cmd.format(topology=topology_name) + ' --run_mode warm_experiment --control_socket {}'.format(
+        STARTUP_CONTROL_SOCKET)
+
+    with open(os.devnull, 'w') as dev_null:
+        start_time = time.time()
+        runner = subprocess.Popen(cmd, shell=True, stdout=dev_null, stderr=dev_null)
+        while not os.path.exists(STARTUP_CONTROL_SOCKET):
+            if runner.poll() is not None or time.time() - start_time > STARTUP_TIMEOUT:
+                runner.kill()
+                return {'startup_s': None, 'startup_rss_mb': None}
+            time.sleep(0.1)
+        startup_duration = time.time() - start_time
+        startup_rss = get_process_tree_rss(runner.pid)
+
+        control_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        control_socket.connect(STARTUP_CONTROL_SOCKET)
+        control_file = control_socket.makefile('rw')
+        control_file.write(json.dumps({'command': 'shutdown'}) + '\n')
+        control_file.flush()
+        control_file.readline()
+        control_file.close()
+        control_socket.close()
+        runner.wait()
+
+    return {'startup_s': startup_duration, 'startup_rss_mb': startup_rss / 1024.0}
+
+
+def run_benchmark(topology_type, size, args, results):
+    topology_name, topology_args = get_topology_args(topology_type, size, args)
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # files are written to the repository only if the topology is started
+    if args.startup_cmd:
+        generator = SyntheticTopologyGenerator()
+        tmp_dir = None
+    else:
+        tmp_dir = tempfile.mkdtemp(prefix='p4topo_benchmark_')
+        generator = SyntheticTopologyGenerator(topology_dir=os.path.join(tmp_dir, 'p4topos'),
+                                               init_dir=os.path.join(tmp_dir, 'p4init'))
+
+    try:
+        start_time = time.time()
+        links = SyntheticTopologyGenerator.build(topology_type, **topology_args)
+        generator.write_topology(topology_name, links, p4programs=[args.p4program])
+        generation_duration = time.time() - start_time
+
+        start_time = time.time()
+        p4monitor = build_monitor(links)
+        graph_duration = time.time() - start_time
+        rss_graph = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        result = OrderedDict([('topology', topology_name),
+                              ('size', size),
+                              ('switches', len(SyntheticTopologyGenerator.get_switches(links))),
+                              ('hosts', len(links['host_links'])),
+                              ('switch_links', len(links['switch_links'])),
+                              ('generation_ms', generation_duration * 1000),
+                              ('graph_ms', graph_duration * 1000),
+                              ('graph_rss_mb', (rss_graph - rss_start) / 1024.0)])
+
+        result.update(measure_paths(p4monitor, args.combinations, args.pairs, args.seed))
+
+        if args.startup_cmd:
+            result.update(measure_startup(args.startup_cmd, topology_name))
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir)
+
+    results.put(result)
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(description='scale benchmark for synthetic P4 topologies')
+    parser.add_argument('type', type=str, choices=[topology.value for topology in SyntheticTopologies])
+    parser.add_argument('--sizes', type=int, nargs='+', required=True,
+                        help='fat-tree: k, leaf-spine: number of leaves, random regular: number of switches')
+    parser.add_argument('--spines', type=int, default=4, help='leaf-spine: number of spine switches')
+    parser.add_argument('--degree', type=int, default=3, help='random regular: switch links per switch')
+    parser.add_argument('--hosts', type=int, default=None, help='random regular: number of hosts (default: size)')
+    parser.add_argument('--hosts_per_switch', type=int, default=None,
+                        help='fat-tree: hosts per edge switch, leaf-spine: hosts per leaf')
+    parser.add_argument('--seed', type=int, default=42, help='seed for random topologies and host pairs')
+    parser.add_argument('--pairs', type=int, default=100, help='number of host pairs for path computations')
+    parser.add_argument('--combinations', type=str, nargs='+', default=PATH_COMBINATIONS,
+                        help='flow forwarding strategy:metric combinations for path computations '
+                             '(default: {})'.format(' '.join(PATH_COMBINATIONS)))
+    parser.add_argument('--p4program', type=str, default='flow_forwarding')
+    parser.add_argument('--startup_cmd', type=str, default=None,
+                        help="p4runner command for measuring the startup, e.g. 'python p4runner.py "
+                             "--topology {topology} --p4program flow_forwarding "
+                             "--p4controller FlowForwardingController'")
+    parser.add_argument('--output', type=str, default=None, help='CSV file for the results')
+    return parser
+
+
+if __name__ == '__main__':
+    args = create_parser().parse_args()
+
+    rows = []
+    for size in args.sizes:
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=run_benchmark, args=(args.type, size, args, results))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            print('benchmark failed for size {} (exit code: {})'.format(size, process.exitcode))
+            continue
+        rows.append(results.get())
+        print(', '.join('{}: {}'.format(k, round(v, 3) if isinstance(v, float) else v) for k, v in rows[-1].items()))
+
+    if args.output and rows:
+        with open(args.output, 'w') as output_file:
+            csv_writer = csv.DictWriter(output_file, fieldnames=list(rows[-1].keys()))
+            csv_writer.writeheader()
+            for row in rows:
+                csv_writer.writerow(row)
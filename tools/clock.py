@@ -0,0 +1,47 @@
+# Copyright 2020-present Christoph Hardegen
+#                        (christoph.hardegen@cs.hs-fulda.de)
+#                        Fulda University of Applied Sciences
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# monotonic clock, python 2.7 has no time.monotonic so clock_gettime is called via ctypes (linux only)
+
+import ctypes
+import ctypes.util
+import os
+import time
+
+CLOCK_MONOTONIC = 1
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+if hasattr(time, 'monotonic_ns'):
+    monotonic = time.monotonic
+    monotonic_ns = time.monotonic_ns
+else:
+    _librt = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c'), use_errno=True)
+    _clock_gettime = _librt.clock_gettime
+    _clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+
+    def monotonic_ns():
+        timespec = _Timespec()
+        if _clock_gettime(CLOCK_MONOTONIC, ctypes.pointer(timespec)) != 0:
+            errno_ = ctypes.get_errno()
+            raise OSError(errno_, os.strerror(errno_))
+        return timespec.tv_sec * 1000000000 + timespec.tv_nsec
+
+    def monotonic():
+        return monotonic_ns() / 1e9
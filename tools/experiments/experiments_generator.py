@@ -23,8 +23,7 @@ if __name__ == '__main__':
     ##########
     from tools import modules_installation as minstall
 
-    for module_spec in minstall.python_modules:
-        minstall.install_python_module(python_module=module_spec[0], import_name=module_spec[1], version=module_spec[2])
+    minstall.check_python_modules()
     ##########
 
 from p4topos.p4topo_parser import TopologyArgumentParser
@@ -51,6 +50,9 @@ def get_supported_params_and_default_args(args):
 
 def complete_experiment_params(experiment_params, args):
     for param_key, param_value in get_supported_params_and_default_args(args=args).items():
+        # unset defaults (e.g. loglevel_subsystem) are not passed, a list would be a multi-valued parameter
+        if param_value is None:
+            continue
         if param_key not in ['exp',
                              'traffic_profile',
                              'p4controller_flow_forwarding_metric'] and param_key not in experiment_params:
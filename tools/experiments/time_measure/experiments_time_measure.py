@@ -14,30 +14,48 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import sys
 import os
+
+sys.path.append(os.path.join(os.pardir, os.pardir, os.pardir))
+
 import csv
-import numpy as np
+import json
+from collections import OrderedDict
+
+from tools.histogram import LatencyHistogram
 
 TIME_MEASURE_FILE = 'time_measure.csv'
+TIME_MEASURE_HISTOGRAMS_FILE = 'time_measure_histograms.json'
 TIME_MEASURE_INPUT_DIR = 'input'
 TIME_MEASURE_OUTPUT_DIR = 'output'
+TIME_MEASURE_HEADER = ['scope', 'strategy', 'metric', 'stage', 'count', 'mean_us', 'p50_us', 'p90_us', 'p99_us',
+                       'max_us']
+TIME_MEASURE_SCALE = 1000.0  # ns -> us
 
 AGGREGATED_ITERATION_ID = 9999
 
 
 def process_results(input_dir):
+    # the per stage histograms of all iterations are merged (instead of averaging per iteration means/medians)
     for exp in [x for x in os.listdir(input_dir) if os.path.isdir(os.path.join(input_dir, x))]:
-        aggregated_time_measures = None
-        for exp_iter in os.listdir(os.path.join(input_dir, exp)):
-            output_file = os.path.join(input_dir, exp, exp_iter, TIME_MEASURE_FILE)
-            with open(output_file, 'r') as csv_file:
-                output_file_data = np.array(next(csv.reader(csv_file))).astype(np.float)
-
-            if aggregated_time_measures is None:
-                aggregated_time_measures = output_file_data
-            else:
-                aggregated_time_measures = np.vstack((aggregated_time_measures, output_file_data))
-        aggregated_time_measures = np.mean(np.atleast_2d(aggregated_time_measures), axis=0)
+        aggregated_histograms = OrderedDict()  # (strategy, metric, stage) --> histogram
+        for exp_iter in sorted(os.listdir(os.path.join(input_dir, exp))):
+            histograms_file_path = os.path.join(input_dir, exp, exp_iter, TIME_MEASURE_HISTOGRAMS_FILE)
+            if not os.path.isfile(histograms_file_path):
+                print('no time measure histograms for experiment {} (iteration: {})'.format(exp, exp_iter))
+                continue
+            with open(histograms_file_path, 'r') as histograms_file:
+                histograms_data = json.load(histograms_file)
+
+            for histograms_entry in histograms_data:
+                for stage, histogram_dict in sorted(histograms_entry['histograms'].items()):
+                    key = (histograms_entry['strategy'], histograms_entry['metric'], stage)
+                    histogram = LatencyHistogram.from_dict(histogram_dict)
+                    if key in aggregated_histograms:
+                        aggregated_histograms[key].merge(histogram)
+                    else:
+                        aggregated_histograms[key] = histogram
 
         out_dir = os.path.join(TIME_MEASURE_OUTPUT_DIR, str(exp), str(AGGREGATED_ITERATION_ID))
         try:
@@ -47,7 +65,22 @@ def process_results(input_dir):
 
         with open(os.path.join(out_dir, TIME_MEASURE_FILE), 'w') as csv_file:
             csv_writer = csv.writer(csv_file)
-            csv_writer.writerow(aggregated_time_measures)
+            csv_writer.writerow(TIME_MEASURE_HEADER)
+            for (strategy, metric, stage), histogram in aggregated_histograms.items():
+                if not histogram.total_count:
+                    continue
+                csv_writer.writerow(['total', strategy, metric, stage] +
+                                    list(histogram.get_summary(scale=TIME_MEASURE_SCALE).values()))
+
+        # same schema as the files of the iterations: [{strategy, metric, histograms: {stage: histogram}}]
+        histograms_entries = OrderedDict()  # (strategy, metric) --> entry
+        for (strategy, metric, stage), histogram in aggregated_histograms.items():
+            histograms_entry = histograms_entries.setdefault((strategy, metric), {'strategy': strategy,
+                                                                                  'metric': metric,
+                                                                                  'histograms': {}})
+            histograms_entry['histograms'][stage] = histogram.to_dict()
+        with open(os.path.join(out_dir, TIME_MEASURE_HISTOGRAMS_FILE), 'w') as histograms_file:
+            json.dump(list(histograms_entries.values()), histograms_file)
 
 
 if __name__ == '__main__':
@@ -17,7 +17,6 @@
 import os
 import sys
 import csv
-import yaml
 import numpy as np
 import re
 
@@ -29,6 +28,7 @@ if __name__ == '__main__':
         sys.path.append('../../../')
 
 from p4topos.p4topo_parser import TopologyArgumentParser
+from tools.traffic_profiles.traffic_profile_format import load_traffic_profile_metadata
 import pickle
 import gzip
 
@@ -146,8 +146,8 @@ def read_command_params(command_file):
             result[args.exp]['flow_replay_seed'] = []
 
             for traffic_profile_file in traffic_profile_files:
-                with open(os.path.join(TRAFFIC_PROFILES_DIR, traffic_profile_file), 'r') as yaml_file:
-                    yaml_content = yaml.safe_load(yaml_file)
+                # header of the compiled profile, the flow throughputs are not read
+                yaml_content = load_traffic_profile_metadata(os.path.join(TRAFFIC_PROFILES_DIR, traffic_profile_file))
                 result[args.exp]['replay_num_flows'].append(yaml_content[1]['num'])
                 result[args.exp]['replay_flow_batch_size'].append(yaml_content['flow_batch_size'])
                 result[args.exp]['flow_replay_seed'].append(yaml_content['seed'])
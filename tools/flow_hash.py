@@ -0,0 +1,71 @@
+# Copyright 2020-present Christoph Hardegen
+#                        (christoph.hardegen@cs.hs-fulda.de)
+#                        Fulda University of Applied Sciences
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# flow hashes as computed by the switches (flow_forwarding.p4), e.g. for installing forwarding entries of flows
+# that do not take the CPU path
+
+import socket
+import struct
+import zlib
+
+# see p4programs/flow_forwarding/include/preambel.p4 and FlowForwardingController
+BLOOM_FILTER_ENTRIES = 4096
+ECMP_BASE = 2
+
+IP_PROTOCOL_UDP = 17
+
+# destination port of the probes of the ProbingMonitor, excluded from the CPU port sniffers of controllers as well as
+# from the sketch and the flow export of flow_forwarding.p4 (PROBE_UDP_PORT of include/preambel.p4)
+PROBE_UDP_PORT = 54321
+
+
+def _crc16_table():
+    # bmv2 crc16 (CRC-16/ARC: polynomial 0x8005 reflected, init 0, no final xor)
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+CRC16_TABLE = _crc16_table()
+
+
+def crc16(data):
+    crc = 0
+    for byte in bytearray(data):
+        crc = (crc >> 8) ^ CRC16_TABLE[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def crc32(data):
+    return zlib.crc32(data) & 0xFFFFFFFF
+
+
+def compute_flow_hashes(src_ip, dst_ip, src_port, dst_port, protocol=IP_PROTOCOL_UDP):
+    # field list of compute_flow_hashes_action (flow_forwarding.p4), bmv2 computes base + hash % max
+    flow_data = socket.inet_aton(src_ip) + socket.inet_aton(dst_ip) + struct.pack('!HHB', src_port, dst_port,
+                                                                                  protocol)
+    return crc16(flow_data) % BLOOM_FILTER_ENTRIES, crc32(flow_data) % BLOOM_FILTER_ENTRIES
+
+
+def compute_ecmp_result(src_ip, dst_ip, src_port, dst_port, ecmp_count, protocol=IP_PROTOCOL_UDP):
+    # field list of compute_ecmp_result_action (flow_forwarding.p4)
+    ecmp_data = socket.inet_aton(src_ip) + socket.inet_aton(dst_ip) + struct.pack('!BHH', protocol, src_port,
+                                                                                  dst_port)
+    return ECMP_BASE + crc32(ecmp_data) % ecmp_count
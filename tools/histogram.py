@@ -0,0 +1,180 @@
+# Copyright 2020-present Christoph Hardegen
+#                        (christoph.hardegen@cs.hs-fulda.de)
+#                        Fulda University of Applied Sciences
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# log-linear latency histograms (HDR-style) for nanosecond values
+#
+# values below 2^SUB_BUCKET_BITS get their own bucket, above every power of two is split into 2^(SUB_BUCKET_BITS-1)
+# linear sub-buckets, i.e. the relative error of a reported value is below 2^-(SUB_BUCKET_BITS-1) (< 1.6% for 7 bits)
+# independent of the magnitude; histograms with the same number of sub-bucket bits are merged by adding the counts
+
+import threading
+from collections import OrderedDict
+
+from tools.clock import monotonic_ns
+
+SUB_BUCKET_BITS = 7
+PERCENTILES = [50, 90, 99]
+
+
+class LatencyHistogram(object):
+
+    def __init__(self, sub_bucket_bits=SUB_BUCKET_BITS):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.sub_bucket_half_count = self.sub_bucket_count >> 1
+
+        self.counts = dict()  # bucket index --> count
+        self.total_count = 0
+        self.total_sum = 0
+        self.min = None
+        self.max = None
+
+    def _get_index(self, value):
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits
+        return self.sub_bucket_count + (shift - 1) * self.sub_bucket_half_count + \
+            (value >> shift) - self.sub_bucket_half_count
+
+    def _get_highest_value(self, index):
+        # highest value that falls into the bucket
+        if index < self.sub_bucket_count:
+            return index
+        shift = (index - self.sub_bucket_count) // self.sub_bucket_half_count + 1
+        sub_bucket = (index - self.sub_bucket_count) % self.sub_bucket_half_count + self.sub_bucket_half_count
+        return ((sub_bucket + 1) << shift) - 1
+
+    def record(self, value, count=1):
+        value = max(int(value), 0)
+        index = self._get_index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.total_count += count
+        self.total_sum += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, histogram):
+        if histogram.sub_bucket_bits != self.sub_bucket_bits:
+            raise HistogramException('histograms with different sub-bucket bits cannot be merged '
+                                     '({}, {})'.format(self.sub_bucket_bits, histogram.sub_bucket_bits))
+        for index, count in histogram.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.total_count += histogram.total_count
+        self.total_sum += histogram.total_sum
+        if histogram.min is not None and (self.min is None or histogram.min < self.min):
+            self.min = histogram.min
+        if histogram.max is not None and (self.max is None or histogram.max > self.max):
+            self.max = histogram.max
+        return self
+
+    def get_value_at_percentile(self, percentile):
+        if not self.total_count:
+            return None
+        count_at_percentile = max(int(percentile / 100.0 * self.total_count + 0.5), 1)
+        count = 0
+        for index in sorted(self.counts):
+            count += self.counts[index]
+            if count >= count_at_percentile:
+                return min(self._get_highest_value(index), self.max)
+        return self.max
+
+    def get_mean(self):
+        return float(self.total_sum) / self.total_count if self.total_count else None
+
+    def get_summary(self, scale=1.0):
+        # count, mean, percentiles and max, values divided by scale (e.g. 1000 for microseconds)
+        summary = OrderedDict([('count', self.total_count),
+                               ('mean', self.get_mean() / scale if self.total_count else None)])
+        for percentile in PERCENTILES:
+            value = self.get_value_at_percentile(percentile)
+            summary['p{}'.format(percentile)] = value / scale if value is not None else None
+        summary['max'] = self.max / scale if self.max is not None else None
+        return summary
+
+    def reset(self):
+        self.counts = dict()
+        self.total_count = 0
+        self.total_sum = 0
+        self.min = None
+        self.max = None
+
+    def copy(self):
+        return LatencyHistogram(self.sub_bucket_bits).merge(self)
+
+    def to_dict(self):
+        return {'sub_bucket_bits': self.sub_bucket_bits,
+                'counts': sorted(self.counts.items()),
+                'sum': self.total_sum,
+                'min': self.min,
+                'max': self.max}
+
+    @staticmethod
+    def from_dict(histogram_dict):
+        histogram = LatencyHistogram(histogram_dict['sub_bucket_bits'])
+        histogram.counts = dict((int(index), count) for index, count in histogram_dict['counts'])
+        histogram.total_count = sum(histogram.counts.values())
+        histogram.total_sum = histogram_dict['sum']
+        histogram.min = histogram_dict['min']
+        histogram.max = histogram_dict['max']
+        return histogram
+
+
+class LatencyHistograms(object):
+    # one histogram per stage, the interval histograms are reset with every interval snapshot
+
+    def __init__(self, stages, sub_bucket_bits=SUB_BUCKET_BITS):
+        self.lock = threading.Lock()
+        self.total = OrderedDict((stage, LatencyHistogram(sub_bucket_bits)) for stage in stages)
+        self.interval = OrderedDict((stage, LatencyHistogram(sub_bucket_bits)) for stage in stages)
+
+    def record(self, stage, value):
+        with self.lock:
+            self.total[stage].record(value)
+            self.interval[stage].record(value)
+
+    def get_count(self, stage):
+        return self.total[stage].total_count
+
+    def get_interval_snapshot(self):
+        with self.lock:
+            snapshot = OrderedDict((stage, histogram.copy()) for stage, histogram in self.interval.items())
+            for histogram in self.interval.values():
+                histogram.reset()
+        return snapshot
+
+    def get_total_snapshot(self):
+        with self.lock:
+            return OrderedDict((stage, histogram.copy()) for stage, histogram in self.total.items())
+
+    def reset(self):
+        with self.lock:
+            for histogram in list(self.total.values()) + list(self.interval.values()):
+                histogram.reset()
+
+
+def measure_ns(function, *args, **kwargs):
+    # function result and elapsed monotonic time (ns)
+    start_timestamp = monotonic_ns()
+    function_result = function(*args, **kwargs)
+    return function_result, monotonic_ns() - start_timestamp
+
+
+class HistogramException(Exception):
+
+    def __init__(self, message):
+        super(HistogramException, self).__init__(self.__class__.__name__ + ': ' + message)
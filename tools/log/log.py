@@ -14,11 +14,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import atexit
+import json
 import logging
+import threading
 import mininet.log as mn_log
 
+from Queue import Queue
 from enum import Enum
 
+try:
+    from logging.handlers import QueueHandler, QueueListener
+except ImportError:  # not available before python 3.2
+    QueueHandler = None
+    QueueListener = None
+
 
 class LogLevel(Enum):
     INFO = 'info'
@@ -28,36 +38,171 @@ class LogLevel(Enum):
     ERROR = 'error'
 
 
+class LogFormat(Enum):
+    TEXT = 'text'
+    JSON = 'json'
+
+
+class LogSubsystem(Enum):
+    CONTROLLER = 'controller'
+    MONITOR = 'monitor'
+    RUNTIME = 'runtime'
+
+
 LOG_LEVEL_DEFAULT = LogLevel.INFO.value
+LOG_FORMAT_DEFAULT = LogFormat.TEXT.value
 LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(pathname)s - %(funcName)s:%(lineno)d - %(message)s'
 LOG_FORMAT_MININET = '%(message)s'
 
 log = None
 file_handler = None
 console_handler = None
-
-
-def init_logger(name):
-    global log, file_handler, console_handler
+log_listener = None
+
+
+class JSONLinesFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {'ts': round(record.created, 6),
+                 'name': record.name,
+                 'level': record.levelname,
+                 'func': record.funcName,
+                 'line': record.lineno,
+                 'msg': record.getMessage()}
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, separators=(',', ':'))
+
+
+if QueueHandler is None:
+    class QueueHandler(logging.Handler):
+        # hands records to a QueueListener instead of formatting and writing them in the calling thread
+
+        def __init__(self, queue):
+            logging.Handler.__init__(self)
+            self.queue = queue
+
+        def prepare(self, record):
+            # merge arguments and exception information so that the record can be handled in another thread
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+            return record
+
+        def emit(self, record):
+            try:
+                self.queue.put_nowait(self.prepare(record))
+            except Exception:
+                self.handleError(record)
+
+    class QueueListener(object):
+        _sentinel = None
+
+        def __init__(self, queue, *handlers, **kwargs):
+            self.queue = queue
+            self.handlers = handlers
+            self.respect_handler_level = kwargs.get('respect_handler_level', False)
+            self._thread = None
+
+        def start(self):
+            self._thread = threading.Thread(target=self._monitor, name='log-listener')
+            self._thread.daemon = True
+            self._thread.start()
+
+        def handle(self, record):
+            for handler in self.handlers:
+                if not self.respect_handler_level or record.levelno >= handler.level:
+                    handler.handle(record)
+
+        def _monitor(self):
+            while True:
+                record = self.queue.get()
+                if record is self._sentinel:
+                    break
+                self.handle(record)
+
+        def stop(self):
+            if self._thread is not None:
+                self.queue.put(self._sentinel)
+                self._thread.join()
+                self._thread = None
+
+
+def _get_formatter(log_format):
+    if log_format == LogFormat.JSON.value:
+        return JSONLinesFormatter()
+    return logging.Formatter(LOG_FORMAT)
+
+
+def init_logger(name, log_format=LOG_FORMAT_DEFAULT):
+    global log, file_handler, console_handler, log_listener
     log_level = mn_log.LEVELS[LOG_LEVEL_DEFAULT]
 
     log = logging.getLogger(name + '.log')
 
     log.setLevel(log_level)
 
+    # handler levels are not respected by the listener, records are filtered by the (subsystem) loggers only
     file_handler = logging.FileHandler(name + '.log')
     file_handler.setLevel(log_level)
 
     console_handler = logging.StreamHandler()
     console_handler.setLevel(log_level)
 
-    formatter = logging.Formatter(LOG_FORMAT)
+    formatter = _get_formatter(log_format)
 
     file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
 
-    log.addHandler(file_handler)
-    log.addHandler(console_handler)
+    # records are written by a background thread, logging calls only enqueue them
+    log_queue = Queue()
+    log.addHandler(QueueHandler(log_queue))
+
+    log_listener = QueueListener(log_queue, file_handler, console_handler)
+    log_listener.start()
+    atexit.register(stop_logger)
+
+
+def stop_logger():
+    global log_listener
+
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+
+
+def get_logger(subsystem):
+    # subsystem loggers propagate to the main logger, their level can be changed independently
+    if isinstance(subsystem, LogSubsystem):
+        subsystem = subsystem.value
+    if log is None:
+        return logging.getLogger(subsystem)
+    return log.getChild(subsystem)
+
+
+def init_file_logger(name, log_file, log_level='INFO', log_format='%(message)s'):
+    file_logger = logging.getLogger(name)
+
+    if len(file_logger.handlers) == 0:
+        file_logger.setLevel(log_level)
+        file_logger.propagate = False
+
+        file_logger_handler = logging.FileHandler(log_file)
+        file_logger_handler.setLevel(log_level)
+        file_logger_handler.setFormatter(logging.Formatter(log_format))
+
+        file_logger_queue = Queue()
+        file_logger.addHandler(QueueHandler(file_logger_queue))
+
+        file_logger_listener = QueueListener(file_logger_queue, file_logger_handler)
+        file_logger_listener.start()
+        atexit.register(file_logger_listener.stop)
+
+    return file_logger
 
 
 class FileHandlerNoNewline(logging.FileHandler, mn_log.StreamHandlerNoNewline):
@@ -80,9 +225,13 @@ def customize_mininet_logger(name):
     mn_log.lg.setLogLevel(LOG_LEVEL_DEFAULT)
 
 
-def change_log_level(log_level):
+def change_log_level(log_level, subsystem=None):
     global log, file_handler, console_handler
 
+    if subsystem is not None:
+        get_logger(subsystem).setLevel(mn_log.LEVELS[log_level])
+        return
+
     mn_log.lg.setLogLevel(log_level)
 
     log_level = mn_log.LEVELS[log_level]
@@ -90,3 +239,12 @@ def change_log_level(log_level):
     log.setLevel(log_level)
     file_handler.setLevel(log_level)
     console_handler.setLevel(log_level)
+
+
+def change_log_format(log_format):
+    global file_handler, console_handler
+
+    formatter = _get_formatter(log_format)
+
+    file_handler.setFormatter(formatter)
+    console_handler.setFormatter(formatter)
@@ -0,0 +1,292 @@
+# Copyright 2020-present Christoph Hardegen
+#                        (christoph.hardegen@cs.hs-fulda.de)
+#                        Fulda University of Applied Sciences
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# runtime metrics (counters, gauges, latency summaries) of monitor and controller internals, served in the prometheus
+# text format (https://prometheus.io/docs/instrumenting/exposition_formats/), e.g.
+#
+# python p4runner.py ... --metrics_port 9100
+# curl http://127.0.0.1:9100/metrics
+#
+# updating a metric is a lock protected addition, everything else (rendering, percentiles, function gauges such as
+# queue depths or table sizes) is only done when the endpoint is scraped
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from enum import Enum
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from tools.clock import monotonic_ns
+from tools.histogram import LatencyHistogram
+
+from tools.log.log import get_logger, LogSubsystem
+
+log = get_logger(LogSubsystem.RUNTIME)
+
+METRICS_ADDRESS = '127.0.0.1'
+METRICS_PATH = '/metrics'
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+SUMMARY_QUANTILES = [50, 90, 99]
+SUMMARY_SCALE = 1e9  # ns -> s
+
+
+class MetricTypes(Enum):
+    COUNTER = 'counter'
+    GAUGE = 'gauge'
+    SUMMARY = 'summary'
+
+
+class CounterChild(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def get_samples(self, name):
+        return [(name, (), self.value)]
+
+
+class GaugeChild(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        with self.lock:
+            self.value = value
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+
+    def set_function(self, function):
+        # evaluated on scrape only, e.g. for queue depths or table sizes
+        self.function = function
+
+    def get_samples(self, name):
+        return [(name, (), self.function() if self.function else self.value)]
+
+
+class SummaryChild(object):
+    # latencies in ns, exported in seconds
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histogram = LatencyHistogram()
+
+    def observe(self, value_ns):
+        with self.lock:
+            self.histogram.record(value_ns)
+
+    @contextmanager
+    def time(self):
+        start_timestamp = monotonic_ns()
+        try:
+            yield
+        finally:
+            self.observe(monotonic_ns() - start_timestamp)
+
+    def get_samples(self, name):
+        with self.lock:
+            histogram = self.histogram.copy()
+        samples = []
+        for quantile in SUMMARY_QUANTILES:
+            value = histogram.get_value_at_percentile(quantile)
+            samples.append((name, (('quantile', str(quantile / 100.0)),),
+                            value / SUMMARY_SCALE if value is not None else float('nan')))
+        samples.append((name + '_sum', (), histogram.total_sum / SUMMARY_SCALE))
+        samples.append((name + '_count', (), histogram.total_count))
+        return samples
+
+
+class Metric(object):
+    CHILD_CLASSES = {MetricTypes.COUNTER: CounterChild,
+                     MetricTypes.GAUGE: GaugeChild,
+                     MetricTypes.SUMMARY: SummaryChild}
+
+    def __init__(self, name, documentation, metric_type, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.label_names = tuple(label_names)
+
+        self.lock = threading.Lock()
+        self.children = OrderedDict()  # label values --> child
+
+    def labels(self, *label_values):
+        label_values = tuple(str(label_value) for label_value in label_values)
+        child = self.children.get(label_values, None)
+        if child is None:
+            if len(label_values) != len(self.label_names):
+                raise MetricsException('metric {} expects labels {} (values: {})'.format(self.name, self.label_names,
+                                                                                         label_values))
+            with self.lock:
+                child = self.children.setdefault(label_values, self.CHILD_CLASSES[self.metric_type]())
+        return child
+
+    def remove(self, *label_values):
+        with self.lock:
+            self.children.pop(tuple(str(label_value) for label_value in label_values), None)
+
+    # metrics without labels
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def set_function(self, function):
+        self.labels().set_function(function)
+
+    def observe(self, value_ns):
+        self.labels().observe(value_ns)
+
+    def time(self):
+        return self.labels().time()
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation.replace('\\', r'\\').replace('\n', r'\n')),
+                 '# TYPE {} {}'.format(self.name, self.metric_type.value)]
+        with self.lock:
+            children = list(self.children.items())
+        for label_values, child in children:
+            for sample_name, sample_labels, sample_value in child.get_samples(self.name):
+                labels = list(zip(self.label_names, label_values)) + list(sample_labels)
+                lines.append('{}{} {}'.format(sample_name, format_labels(labels), format_value(sample_value)))
+        return lines
+
+
+class MetricsRegistry(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = OrderedDict()
+
+    def _get_metric(self, name, documentation, metric_type, label_names):
+        with self.lock:
+            metric = self.metrics.get(name, None)
+            if metric is None:
+                metric = Metric(name, documentation, metric_type, label_names)
+                self.metrics[name] = metric
+            elif metric.metric_type != metric_type or metric.label_names != tuple(label_names):
+                raise MetricsException('metric {} is already registered as {} with labels {}'.format(
+                    name, metric.metric_type.value, metric.label_names))
+        return metric
+
+    def counter(self, name, documentation, label_names=()):
+        return self._get_metric(name, documentation, MetricTypes.COUNTER, label_names)
+
+    def gauge(self, name, documentation, label_names=()):
+        return self._get_metric(name, documentation, MetricTypes.GAUGE, label_names)
+
+    def summary(self, name, documentation, label_names=()):
+        return self._get_metric(name, documentation, MetricTypes.SUMMARY, label_names)
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"'))
+                          for key, value in labels) + '}'
+
+
+def format_value(value):
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, float):
+        if value != value:
+            return 'NaN'
+        if value in (float('inf'), float('-inf')):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] != METRICS_PATH:
+            self.send_error(404)
+            return
+        try:
+            body = self.server.registry.render().encode('utf-8')
+        except Exception as ex:
+            log.error('rendering metrics failed: {}'.format(ex))
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', METRICS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug('metrics request: ' + format % args)
+
+
+class MetricsServer(threading.Thread):
+
+    def __init__(self, port, address=METRICS_ADDRESS, registry=REGISTRY):
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+        self.server = HTTPServer((address, port), MetricsRequestHandler)
+        self.server.registry = registry
+
+    def run(self):
+        log.info('serving metrics on http://{}:{}{}'.format(self.server.server_address[0],
+                                                             self.server.server_address[1], METRICS_PATH))
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsException(Exception):
+
+    def __init__(self, message):
+        super(MetricsException, self).__init__(self.__class__.__name__ + ': ' + message)
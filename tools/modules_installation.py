@@ -1,4 +1,7 @@
 import sys, subprocess
+import os
+import json
+import hashlib
 
 python_modules = [('networkx', None, None),
                   ('numpy', None, None),
@@ -12,8 +15,47 @@ python_modules = [('networkx', None, None),
                   #########################
                   ('scapy', None, '2.4.3')]  # asynchronous sniffing supported since scapy v2.4.3
 
+# verified modules of the last check, valid as long as interpreter, module list and site-packages are unchanged
+MODULES_MANIFEST_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.python_modules_manifest.json')
+
+
+def _get_site_packages_dirs():
+    try:
+        import site
+        site_packages_dirs = list(site.getsitepackages())
+        site_packages_dirs.append(site.getusersitepackages())
+    except AttributeError:  # site module of virtualenv (python 2)
+        from distutils.sysconfig import get_python_lib
+        site_packages_dirs = [get_python_lib()]
+    return sorted(set(site_packages_dirs))
+
+
+def get_environment_key(modules=None):
+    modules = python_modules if modules is None else modules
+    key = hashlib.md5()
+    key.update(sys.executable.encode())
+    key.update(sys.version.encode())
+    key.update(json.dumps(modules).encode())
+    for site_packages_dir in _get_site_packages_dirs():
+        if os.path.isdir(site_packages_dir):
+            key.update('{}:{}'.format(site_packages_dir, os.stat(site_packages_dir).st_mtime).encode())
+    return key.hexdigest()
+
+
+def _get_python_module_version(python_module, import_name=None):
+    try:
+        return sys.modules[python_module if import_name is None else import_name].__version__
+    except:
+        pass
+    try:
+        import pkg_resources
+        return pkg_resources.get_distribution(python_module).version
+    except:
+        return subprocess.check_output('pip freeze | grep {}'.format(python_module), shell=True).split('==')[1].strip()
+
 
 def install_python_module(python_module, import_name=None, version=None):
+    # True if the module is available (in the requested version), installed before if missing
     try:
         import pip
         from pip import main as pip_install
@@ -25,12 +67,49 @@ def install_python_module(python_module, import_name=None, version=None):
         importlib.import_module(python_module if import_name is None else import_name)
 
         if version is not None:
-            try:
-                python_module_version = sys.modules[python_module if import_name is None else import_name].__version__
-            except:
-                python_module_version = subprocess.check_output('pip freeze | grep {}'.format(python_module), shell=True).split('==')[1].strip()
+            python_module_version = _get_python_module_version(python_module, import_name)
             if python_module_version != version:
                 raise ImportError
     except ImportError:
         print('pip: installing missing module ({})'.format(python_module))
-        pip_install(['install', python_module if version is None else '{}=={}'.format(python_module, version), '-qqq'])
+        if pip_install(['install', python_module if version is None else '{}=={}'.format(python_module, version),
+                        '-qqq']):
+            print('pip: installing module failed ({})'.format(python_module))
+            return False
+    return True
+
+
+def _read_modules_manifest():
+    try:
+        with open(MODULES_MANIFEST_FILE, 'r') as manifest_file:
+            return json.load(manifest_file)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def check_python_modules(modules=None):
+    # probes (and installs) the modules only if the environment changed since the last successful check
+    modules = python_modules if modules is None else modules
+    if _read_modules_manifest().get('environment') == get_environment_key(modules):
+        return
+
+    modules_installed = [install_python_module(python_module=module_spec[0], import_name=module_spec[1],
+                                               version=module_spec[2]) for module_spec in modules]
+
+    manifest = {'environment': get_environment_key(modules),  # after installations, they change site-packages
+                'python': sys.executable,
+                'modules': {}}
+    for python_module, import_name, _ in modules:
+        try:
+            manifest['modules'][python_module] = _get_python_module_version(python_module, import_name)
+        except:
+            manifest['modules'][python_module] = None
+
+    # the next start probes again unless every module is installed and its version known
+    if not all(modules_installed) or None in manifest['modules'].values():
+        return
+    try:
+        with open(MODULES_MANIFEST_FILE, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    except (IOError, OSError):
+        pass
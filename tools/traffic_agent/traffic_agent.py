@@ -0,0 +1,220 @@
+# Copyright 2020-present Christoph Hardegen
+#                        (christoph.hardegen@cs.hs-fulda.de)
+#                        Fulda University of Applied Sciences
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# traffic agent that runs once inside a host namespace (see P4Host.start_traffic_agent), it receives batches of
+# flow specs as JSON lines over a unix socket and generates all flows paced from a single event loop
+#
+# {"flows": [{"src_ip": "10.0.1.1", "src_port": 60001, "dst_ip": "10.0.2.1", "dst_port": 5100,
+#             "protocol": "UDP", "rate": 1000000, "duration": 60, "delay": 0}]}
+# {"command": "stop_flows"} | {"command": "shutdown"}
+
+import argparse
+import errno
+import heapq
+import json
+import os
+import select
+import socket
+import time
+
+PAYLOAD_SIZE = 1470  # bytes
+SINK_BUFFER_SIZE = 65535
+MAX_BURST = 64  # packets per flow and event loop iteration
+
+now = getattr(time, 'monotonic', time.time)
+
+
+class PacedFlow(object):
+
+    def __init__(self, flow_spec, start_time):
+        self.flow_spec = flow_spec
+        self.protocol = flow_spec.get('protocol', 'UDP')
+        self.interval = PAYLOAD_SIZE * 8.0 / float(flow_spec['rate'])
+        self.next_send = start_time + float(flow_spec.get('delay', 0))
+        self.end = self.next_send + float(flow_spec['duration'])
+        self.socket = None
+        self.connected = False
+
+    def open(self):
+        if self.protocol == 'UDP':
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        else:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.flow_spec['src_ip'], int(self.flow_spec['src_port'])))
+        self.socket.setblocking(False)
+        error = self.socket.connect_ex((self.flow_spec['dst_ip'], int(self.flow_spec['dst_port'])))
+        self.connected = self.protocol == 'UDP' or error == 0
+
+    def send(self, payload, current_time):
+        # sends all packets that are due, at most MAX_BURST to keep the event loop responsive
+        if self.socket is None:
+            self.open()
+        burst = 0
+        while self.next_send <= current_time and burst < MAX_BURST:
+            try:
+                self.socket.send(payload)
+                self.connected = True
+            except socket.error as err:
+                if err.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOTCONN, errno.EINPROGRESS,
+                                     errno.ECONNREFUSED, errno.ENOBUFS):
+                    raise
+            self.next_send += self.interval
+            burst += 1
+        if self.next_send < current_time - 1:  # too far behind, do not catch up with a burst
+            self.next_send = current_time
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+
+class TrafficAgent(object):
+
+    def __init__(self, control_socket_path, sink_address=None, sink_port=None):
+        self.control_socket_path = control_socket_path
+        self.payload = b'\x00' * PAYLOAD_SIZE
+
+        self.flows = []  # heap of (next send time, flow id, flow)
+        self.flow_id = 0
+
+        self.running = True
+
+        self.readers = {}  # socket --> handler
+
+        if os.path.exists(control_socket_path):
+            os.remove(control_socket_path)
+        self.control_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.control_socket.bind(control_socket_path)
+        self.control_socket.listen(8)
+        self.readers[self.control_socket] = self._accept_control_connection
+
+        if sink_address:
+            udp_sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            udp_sink.bind((sink_address, sink_port))
+            self.readers[udp_sink] = self._drain_udp
+
+            tcp_sink = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            tcp_sink.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            tcp_sink.bind((sink_address, sink_port))
+            tcp_sink.listen(128)
+            self.readers[tcp_sink] = self._accept_tcp_connection
+
+        self.control_buffers = {}
+
+    def _accept_control_connection(self, control_socket):
+        connection, _ = control_socket.accept()
+        self.control_buffers[connection] = b''
+        self.readers[connection] = self._read_control_connection
+
+    def _read_control_connection(self, connection):
+        data = connection.recv(SINK_BUFFER_SIZE)
+        if not data:
+            self._close_reader(connection)
+            self.control_buffers.pop(connection, None)
+            return
+        self.control_buffers[connection] += data
+        while b'\n' in self.control_buffers[connection]:
+            line, self.control_buffers[connection] = self.control_buffers[connection].split(b'\n', 1)
+            response = self._handle_command(json.loads(line.decode()))
+            connection.sendall((json.dumps(response) + '\n').encode())
+
+    def _handle_command(self, command):
+        current_time = now()
+        if 'flows' in command:
+            for flow_spec in command['flows']:
+                flow = PacedFlow(flow_spec, current_time)
+                self.flow_id += 1
+                heapq.heappush(self.flows, (flow.next_send, self.flow_id, flow))
+            return {'status': 'ok', 'flows': len(command['flows']), 'active_flows': len(self.flows)}
+
+        if command.get('command') == 'stop_flows':
+            for _, _, flow in self.flows:
+                flow.close()
+            self.flows = []
+            return {'status': 'ok'}
+
+        if command.get('command') == 'shutdown':
+            self.running = False
+            return {'status': 'ok'}
+
+        return {'status': 'error', 'error': 'unknown command'}
+
+    @staticmethod
+    def _drain_udp(udp_sink):
+        udp_sink.recv(SINK_BUFFER_SIZE)
+
+    def _accept_tcp_connection(self, tcp_sink):
+        connection, _ = tcp_sink.accept()
+        connection.setblocking(False)
+        self.readers[connection] = self._drain_tcp
+
+    def _drain_tcp(self, connection):
+        try:
+            if not connection.recv(SINK_BUFFER_SIZE):
+                self._close_reader(connection)
+        except socket.error:
+            self._close_reader(connection)
+
+    def _close_reader(self, reader):
+        self.readers.pop(reader, None)
+        reader.close()
+
+    def _send_due_packets(self):
+        current_time = now()
+        while self.flows and self.flows[0][0] <= current_time:
+            _, flow_id, flow = heapq.heappop(self.flows)
+            if current_time >= flow.end:
+                flow.close()
+                continue
+            try:
+                flow.send(self.payload, current_time)
+            except socket.error:
+                flow.close()
+                continue
+            heapq.heappush(self.flows, (flow.next_send, flow_id, flow))
+
+    def run(self):
+        while self.running:
+            timeout = 1.0
+            if self.flows:
+                timeout = max(0.0, min(timeout, self.flows[0][0] - now()))
+            readable, _, _ = select.select(list(self.readers.keys()), [], [], timeout)
+            for reader in readable:
+                if reader in self.readers:
+                    self.readers[reader](reader)
+            self._send_due_packets()
+
+        for _, _, flow in self.flows:
+            flow.close()
+        for reader in list(self.readers.keys()):
+            reader.close()
+        os.remove(self.control_socket_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--control_socket', type=str, required=True,
+                        help='unix socket for receiving flow specs')
+    parser.add_argument('--sink_address', type=str, default=None,
+                        help='address for receiving (and discarding) UDP/TCP traffic')
+    parser.add_argument('--sink_port', type=int, default=5100,
+                        help='port for receiving (and discarding) UDP/TCP traffic')
+    args = parser.parse_args()
+
+    TrafficAgent(control_socket_path=args.control_socket,
+                 sink_address=args.sink_address, sink_port=args.sink_port).run()
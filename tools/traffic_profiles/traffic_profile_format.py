@@ -0,0 +1,161 @@
+# Copyright 2020-present Christoph Hardegen
+#                        (christoph.hardegen@cs.hs-fulda.de)
+#                        Fulda University of Applied Sciences
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# compiled traffic profile format, YAML stays the authoring format
+#
+# <profile>.npz: 'metadata'               -> JSON header (uint8), profile fields and flow specs without throughputs
+#                'throughput_<spec index>' -> structured array (throughput, class, median) of a flow spec
+#
+# the compiled file is written next to the YAML file and rebuilt whenever the md5 of the YAML file changes
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import yaml
+
+COMPILED_PROFILE_VERSION = 1
+COMPILED_PROFILE_EXTENSION = '.npz'
+
+THROUGHPUT_DTYPE = np.dtype([('throughput', '<f8'), ('class', '<i4'), ('median', '<f8')])
+THROUGHPUT_ARRAY = 'throughput_{}'
+
+
+def get_compiled_profile_path(traffic_profile_path):
+    return os.path.splitext(traffic_profile_path)[0] + COMPILED_PROFILE_EXTENSION
+
+
+def get_file_md5(file_path):
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as profile_file:
+        for chunk in iter(lambda: profile_file.read(1 << 16), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def _is_throughput_triples(throughput):
+    # dynamic profiles: [[throughput, class, median], ...], static profiles keep their per flow values in the header
+    return isinstance(throughput, list) and len(throughput) > 0 and \
+           all(isinstance(triple, (list, tuple)) and len(triple) == 3 for triple in throughput)
+
+
+def save_compiled_traffic_profile(traffic_profile, compiled_profile_path, source_md5=None):
+    metadata = {'version': COMPILED_PROFILE_VERSION, 'source_md5': source_md5, 'fields': {}, 'flow_specs': []}
+    arrays = {}
+
+    for key, value in traffic_profile.items():
+        if not isinstance(value, dict):
+            metadata['fields'][key] = value
+            continue
+
+        flow_spec = dict(value)
+        if _is_throughput_triples(flow_spec.get('throughput')):
+            throughput = np.array([tuple(triple) for triple in flow_spec.pop('throughput')], dtype=THROUGHPUT_DTYPE)
+            arrays[THROUGHPUT_ARRAY.format(len(metadata['flow_specs']))] = throughput
+            flow_spec['throughput'] = None
+        metadata['flow_specs'].append([key, flow_spec])
+
+    arrays['metadata'] = np.frombuffer(json.dumps(metadata).encode('utf-8'), dtype=np.uint8)
+
+    # np.savez appends '.npz' to names without the extension, write to a file object to keep the given path
+    tmp_path = compiled_profile_path + '.tmp'
+    with open(tmp_path, 'wb') as compiled_file:
+        np.savez(compiled_file, **arrays)
+    os.rename(tmp_path, compiled_profile_path)
+
+
+def _load_compiled_metadata(compiled_profile):
+    return json.loads(compiled_profile['metadata'].tobytes().decode('utf-8'))
+
+
+def load_compiled_traffic_profile(compiled_profile_path, source_md5=None):
+    # returns None if the compiled profile is missing, outdated or unreadable
+    if not os.path.isfile(compiled_profile_path):
+        return None
+
+    try:
+        with np.load(compiled_profile_path, allow_pickle=False) as compiled_profile:
+            metadata = _load_compiled_metadata(compiled_profile)
+            if metadata['version'] != COMPILED_PROFILE_VERSION:
+                return None
+            if source_md5 is not None and metadata['source_md5'] != source_md5:
+                return None
+
+            traffic_profile = dict(metadata['fields'])
+            for flow_spec_i, (key, flow_spec) in enumerate(metadata['flow_specs']):
+                if flow_spec['throughput'] is None:
+                    # tolist converts the whole array at once, the flow replay pops single entries from the list
+                    flow_spec['throughput'] = [list(triple) for triple in
+                                               compiled_profile[THROUGHPUT_ARRAY.format(flow_spec_i)].tolist()]
+                traffic_profile[key] = flow_spec
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+
+    return traffic_profile
+
+
+def compile_traffic_profile(traffic_profile_path):
+    with open(traffic_profile_path, 'r') as yaml_file:
+        traffic_profile = yaml.safe_load(yaml_file)
+
+    compiled_profile_path = get_compiled_profile_path(traffic_profile_path)
+    try:
+        save_compiled_traffic_profile(traffic_profile, compiled_profile_path,
+                                      source_md5=get_file_md5(traffic_profile_path))
+    except (IOError, OSError, TypeError):
+        # read-only profile directory or values without a JSON representation, the YAML content is used as is
+        pass
+
+    return traffic_profile
+
+
+def load_traffic_profile(traffic_profile_path):
+    # loads a YAML or compiled traffic profile, YAML files are compiled on first use
+    if traffic_profile_path.endswith(COMPILED_PROFILE_EXTENSION):
+        traffic_profile = load_compiled_traffic_profile(traffic_profile_path)
+        if traffic_profile is None:
+            raise IOError('specified traffic profile ({}) is no valid compiled profile'.format(traffic_profile_path))
+        return traffic_profile
+
+    traffic_profile = load_compiled_traffic_profile(get_compiled_profile_path(traffic_profile_path),
+                                                    source_md5=get_file_md5(traffic_profile_path))
+    if traffic_profile is None:
+        traffic_profile = compile_traffic_profile(traffic_profile_path)
+    return traffic_profile
+
+
+def load_traffic_profile_metadata(traffic_profile_path):
+    # profile fields and flow specs without reading the throughputs, falls back to (and compiles) the YAML content
+    compiled_profile_path = get_compiled_profile_path(traffic_profile_path)
+    source_md5 = get_file_md5(traffic_profile_path)
+
+    metadata = None
+    if os.path.isfile(compiled_profile_path):
+        try:
+            with np.load(compiled_profile_path, allow_pickle=False) as compiled_profile:
+                metadata = _load_compiled_metadata(compiled_profile)
+        except (IOError, OSError, ValueError, KeyError):
+            metadata = None
+
+    if metadata is None or metadata['version'] != COMPILED_PROFILE_VERSION or metadata['source_md5'] != source_md5:
+        return compile_traffic_profile(traffic_profile_path)
+
+    traffic_profile = dict(metadata['fields'])
+    for key, flow_spec in metadata['flow_specs']:
+        traffic_profile[key] = flow_spec
+    return traffic_profile
@@ -23,24 +23,23 @@ if __name__ == '__main__':
     ##########
     from tools import modules_installation as minstall
 
-    for module_spec in minstall.python_modules:
-        minstall.install_python_module(python_module=module_spec[0], import_name=module_spec[1], version=module_spec[2])
+    minstall.check_python_modules()
     ##########
 
 import shutil
+import argparse
+import multiprocessing
 
 from enum import Enum
 
 import numpy as np
-from sklearn.preprocessing import minmax_scale
 
 import yaml
 
 import random
 
-import matplotlib.pyplot as plt
-
 from traffic_profiles_data import traffic_profiles
+from traffic_profile_format import save_compiled_traffic_profile, get_compiled_profile_path, get_file_md5
 
 
 class FlowDistribution(Enum):
@@ -61,6 +60,19 @@ class DataRates(Enum):
     GIGABIT = 'g'
 
 
+def minmax_scale(values, feature_range):
+    # same arithmetic as sklearn.preprocessing.minmax_scale for 1d data (constant data is scaled to the lower bound)
+    values = np.asarray(values, dtype=np.float64)
+    if values.size == 0:
+        return values
+    data_min = np.min(values)
+    data_range = np.max(values) - data_min
+    if data_range == 0.0:
+        data_range = 1.0
+    scale = (feature_range[1] - feature_range[0]) / data_range
+    return values * scale + (feature_range[0] - data_min * scale)
+
+
 class TrafficProfileGenerator(object):
     YAML_FILE_DIR = 'profiles'
     YAML_FILE = '{}_{}.yaml'
@@ -101,11 +113,14 @@ class TrafficProfileGenerator(object):
                                                            DEFAULT_VALUES['number_classes'] + 1),
                            'prediction_error_rate': 1.0 - DEFAULT_VALUES['prediction_accuracy']})
 
-    def __init__(self):
+    def __init__(self, plot=False):
         self.np_random = None
+        self.plot = plot
+        self.traffic_profile_seed = None
 
     def generate_traffic_profile(self, traffic_profile_name, traffic_profile_seed, traffic_profile_data):
         random.seed(traffic_profile_seed)
+        self.traffic_profile_seed = traffic_profile_seed
 
         self.np_random = np.random.RandomState(seed=traffic_profile_seed)
 
@@ -140,10 +155,15 @@ class TrafficProfileGenerator(object):
                                             'duration': flow_data_i['flow_duration'],
                                             'duration_unit': flow_data_i['flow_duration_unit']}})
 
-        with open(os.path.join(self.YAML_FILE_DIR, self.YAML_FILE.format(traffic_profile_name,
-                                                                         traffic_profile_seed)), 'w') as yaml_file:
+        yaml_file_path = os.path.join(self.YAML_FILE_DIR, self.YAML_FILE.format(traffic_profile_name,
+                                                                                traffic_profile_seed))
+        with open(yaml_file_path, 'w') as yaml_file:
             yaml.dump(traffic_profile, yaml_file, default_flow_style=False)
 
+        # compiled profile, loaded by the traffic manager instead of parsing the YAML file
+        save_compiled_traffic_profile(traffic_profile, get_compiled_profile_path(yaml_file_path),
+                                      source_md5=get_file_md5(yaml_file_path))
+
     def _merge_traffic_profile_data_with_defaults(self, traffic_profile_data):
         for k, v in self.DEFAULT_VALUES.items():
             for i in range(len(traffic_profile_data['flow_data'])):
@@ -173,68 +193,63 @@ class TrafficProfileGenerator(object):
     def _generate_flow_throughputs(self, traffic_profile_name, traffic_profile_subprofile_id, traffic_profile_flows):
         print('### traffic profile: {}'.format(traffic_profile_name))
 
-        flow_throughputs = []
         throughputs = []
         if FlowDistribution(traffic_profile_flows['flow_distribution_mode']) == FlowDistribution.STATIC:
             for i, flow_num in enumerate(traffic_profile_flows['classes_distribution']):
-                throughputs_ = []
-                for x in range(flow_num):
-                    random_number = self.np_random.random_sample(size=1)[0]
-                    # random_number = self.np.random.random(size=1)[0]
-                    throughputs_.append(random_number)
+                # one draw per class yields the same random stream as one draw per flow
+                throughputs_ = self.np_random.random_sample(size=flow_num)
 
-                throughputs_ = minmax_scale(throughputs_,
-                                            feature_range=(traffic_profile_flows['class_boundaries'][i] + 0.001,
-                                                           traffic_profile_flows['class_boundaries'][i + 1] - 0.001))
-                throughputs += list(throughputs_)
+                throughputs.append(minmax_scale(throughputs_,
+                                                feature_range=(traffic_profile_flows['class_boundaries'][i] + 0.001,
+                                                               traffic_profile_flows['class_boundaries'][i + 1] - 0.001)))
 
                 # throughputs += list(self.np_random.uniform(size=flow_num_,
                 #                                            low=traffic_profile_data['class_boundaries'][i],
                 #                                            high=traffic_profile_data['class_boundaries'][i + 1]))
-                # throughputs += list(np.random.uniform(size=flow_num_,
-                #                                       low=traffic_profile_data['class_boundaries'][i],
-                #                                       high=traffic_profile_data['class_boundaries'][i + 1]))
+            throughputs = np.concatenate(throughputs) if throughputs else np.empty(0)
         else:
             if FlowDistribution(traffic_profile_flows['flow_distribution_mode']) == FlowDistribution.RANDOM:
                 throughputs = [random.random() for _ in range(traffic_profile_flows['number_flows'])]
 
             if FlowDistribution(traffic_profile_flows['flow_distribution_mode']) == FlowDistribution.EVEN:
                 throughputs = self.np_random.uniform(size=traffic_profile_flows['number_flows'])
-                # throughputs = np.random.uniform(size=traffic_profile_data['number_flows'])
 
             if FlowDistribution(traffic_profile_flows['flow_distribution_mode']) == FlowDistribution.EXPONENTIAL:
                 throughputs = self.np_random.standard_exponential(size=traffic_profile_flows['number_flows'])
                 # throughputs = self.np_random.exponential(scale=1, size=traffic_profile_data['number_flows'])
-                # throughputs = np.random.standard_exponential(size=traffic_profile_data['number_flows'])
 
             throughputs = minmax_scale(throughputs,
-                                       feature_range=(traffic_profile_flows['link_bandwidth_lower_limit'] + 0.001,
-                                                      traffic_profile_flows['link_bandwidth_upper_limit'] - 0.001))
-
-        classes = np.digitize(throughputs, traffic_profile_flows['class_boundaries']) - 1
-        for i, class_ in enumerate(classes):
-            class_ = int(class_)
-            median_class_throughput = (traffic_profile_flows['class_boundaries'][class_] +
-                                       traffic_profile_flows['class_boundaries'][class_ + 1]) / 2
-            flow_throughputs.append([float(throughputs[i]), class_, float(median_class_throughput)])
-
-        # self.plot_flow_throughput_class_distribution(traffic_profile_name,
-        #                                              traffic_profile_subprofile_id,
-        #                                              traffic_profile_seed,
-        #                                              classes,
-        #                                              traffic_profile_flows['number_classes'],
-        #                                              traffic_profile_flows['number_flows'])
-
-        print('classes boundaries: {}'.format(traffic_profile_flows['class_boundaries']))
+                                       feature_range=(traffic_profile_flows['link_bw_lower_limit'] + 0.001,
+                                                      traffic_profile_flows['link_bw_upper_limit'] - 0.001))
+
+        class_boundaries = np.asarray(traffic_profile_flows['class_boundaries'])
+        number_classes = traffic_profile_flows['number_classes']
+
+        classes = np.digitize(throughputs, class_boundaries) - 1
+        median_class_throughputs = (class_boundaries[classes] + class_boundaries[classes + 1]) / 2
+        flow_throughputs = [[float(throughput), int(class_), float(median_class_throughput)]
+                            for throughput, class_, median_class_throughput in
+                            zip(throughputs, classes, median_class_throughputs)]
+
+        if self.plot:
+            self.plot_flow_throughput_class_distribution(traffic_profile_name,
+                                                         traffic_profile_subprofile_id,
+                                                         self.traffic_profile_seed,
+                                                         classes,
+                                                         number_classes,
+                                                         traffic_profile_flows['number_flows'])
+
+        class_loads = np.bincount(classes, weights=throughputs, minlength=number_classes)
+        class_median_loads = np.bincount(classes, weights=median_class_throughputs, minlength=number_classes)
+
+        print('classes boundaries: {}'.format(class_boundaries))
         print('flow distribution (classes): {}'.format(np.bincount(classes)))
-        print('flow load (sum flow throughputs): {}'.format(np.sum(np.array([x[0] for x in flow_throughputs]))))
-        for class_ in range(traffic_profile_flows['number_classes']):
-            sum_real = np.sum(np.array([x[0] for x in flow_throughputs if x[1] == class_]))
-            print('sum flow load (class {}, real): {}'.format(class_, sum_real))
-            sum_median = np.sum(np.array([x[2] for x in flow_throughputs if x[1] == class_]))
-            print('sum flow load (class {}, median): {}'.format(class_, sum_median))
+        print('flow load (sum flow throughputs): {}'.format(np.sum(throughputs)))
+        for class_ in range(number_classes):
+            print('sum flow load (class {}, real): {}'.format(class_, class_loads[class_]))
+            print('sum flow load (class {}, median): {}'.format(class_, class_median_loads[class_]))
         print('sum flow load (median per classes, before error application): '
-              '{}'.format(np.sum(np.array([x[2] for x in flow_throughputs]))))
+              '{}'.format(np.sum(median_class_throughputs)))
         # flow_throughputs = self._apply_prediction_error(flow_throughputs=flow_throughputs,
         #                                                 traffic_profile_data=traffic_profile_data)
         print('sum flow load (median per classes, after error application): '
@@ -268,6 +283,8 @@ class TrafficProfileGenerator(object):
                                                 traffic_profile_subprofile_id,
                                                 traffic_profile_seed,
                                                 classes, num_classes, num_flows):
+        import matplotlib.pyplot as plt  # plotting stack only if plots are requested
+
         plt.rc('text', usetex=True)
         plt.rc('font', family='serif')
 
@@ -317,16 +334,41 @@ class TrafficProfileGenerator(object):
                 shutil.rmtree(traffic_profile_path)
 
 
+def _generate_traffic_profile(generation_args):
+    traffic_profile_name, traffic_profile_seed, traffic_profile_data, plot = generation_args
+    traffic_profile_generator = TrafficProfileGenerator(plot=plot)
+    traffic_profile_generator.generate_traffic_profile(traffic_profile_name=traffic_profile_name,
+                                                       traffic_profile_seed=traffic_profile_seed,
+                                                       traffic_profile_data=traffic_profile_data)
+    return traffic_profile_name, traffic_profile_seed
+
+
 if __name__ == '__main__':
-    traffic_profile_generator = TrafficProfileGenerator()
-    traffic_profile_generator.clear_traffic_profiles_directory()
-    for i, traffic_profile in enumerate(traffic_profiles.items()):
-        traffic_profile_name = traffic_profile[0]
-        traffic_profile_data = traffic_profile[1]
-        for traffic_profile_seed in traffic_profile_data['seeds']:
-            traffic_profile_generator.generate_traffic_profile(traffic_profile_name=traffic_profile_name,
-                                                               traffic_profile_seed=traffic_profile_seed,
-                                                               traffic_profile_data=traffic_profile_data)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                        help='number of processes for generating the (traffic profile, seed) combinations')
+    parser.add_argument('--plot', action='store_true',
+                        help='plot the flow throughput class distribution of each traffic profile')
+    args = parser.parse_args()
+
+    TrafficProfileGenerator().clear_traffic_profiles_directory()
+
+    # each (traffic profile, seed) combination has its own random state, the results do not depend on the order
+    generation_args = [(traffic_profile_name, traffic_profile_seed, traffic_profile_data, args.plot)
+                       for traffic_profile_name, traffic_profile_data in traffic_profiles.items()
+                       for traffic_profile_seed in traffic_profile_data['seeds']]
+
+    if args.processes > 1 and len(generation_args) > 1 and not args.plot:
+        pool = multiprocessing.Pool(processes=min(args.processes, len(generation_args)))
+        try:
+            generated = pool.map(_generate_traffic_profile, generation_args)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        generated = [_generate_traffic_profile(generation_args_) for generation_args_ in generation_args]
+
+    print('### generated traffic profiles: {}'.format(len(generated)))
 
 
 class TrafficProfileGenerationException(Exception):